@@ -52,7 +52,7 @@ try:
     COMMANDS = get_supported_features()
 except Exception as e:
     print_error(f"⚠️ Error detecting commands: {e}")
-    COMMANDS = ["netarmageddon", "dhcp", "arp", "traffic", "deauth"]
+    COMMANDS = ["netarmageddon", "dhcp", "arp", "traffic", "analyze", "merge", "bench", "deauth"]
 
 # Process README
 readme_text = README_FILE.read_text(encoding="utf-8")
@@ -1,4 +1,5 @@
 import argparse
+import json
 import logging
 import os
 import signal
@@ -6,15 +7,27 @@ import sys
 import time
 from typing import List
 
+from netarmageddon.core.capture_analyzer import CaptureAnalyzer
+from netarmageddon.core.capture_bench import (
+    compare_results,
+    report_bench,
+    report_regressions,
+    run_benchmarks,
+)
+from netarmageddon.core.capture_merge import merge_captures, report_merge
+from netarmageddon.core.stats_page import watch_stats
 from netarmageddon.core.traffic import TrafficLogger
 from netarmageddon.utils.config_loader import ConfigLoader
 
 from .core import ARPKeepAlive, DHCPExhaustion, Interceptor
 from .utils.banners import (
+    get_analyze_banner,
+    get_bench_banner,
     get_arp_banner,
     get_deauth_banner,
     get_dhcp_banner,
     get_general_banner,
+    get_merge_banner,
     get_traffic_banner,
 )
 from .utils.output_manager import (
@@ -113,7 +126,13 @@ def parse_option_range(option_str: str) -> List[int]:
 
 def main() -> None:
     """Command-line interface entry point."""
-    check_root_privileges()
+    # Offline analysis and merging only touch files, bench skips its live part without root
+    # and `traffic --stats` only reads a stats page; every other command opens raw sockets.
+    watching = sys.argv[1:2] == ["traffic"] and any(
+        arg == "--stats" or arg.startswith("--stats=") for arg in sys.argv[2:]
+    )
+    if sys.argv[1:2] not in (["analyze"], ["merge"], ["bench"]) and not watching:
+        check_root_privileges()
     configure_logging()
 
     parser = argparse.ArgumentParser(
@@ -164,6 +183,20 @@ def main() -> None:
         default=ConfigLoader.get("attacks", "dhcp", "default_client_src", default=[]),
         help=f"Comma-separated list of {BLUE}MAC addresses{RESET} to cycle through",
     )
+    dhcp_parser.add_argument(
+        "--track",
+        type=lambda value: _strtobool(value),
+        metavar="BOOL",
+        default=ConfigLoader.get("attacks", "dhcp", "default_track", default=False),
+        help="Match OFFER/NAK replies to the DISCOVERs and report server latency at the end",
+    )
+    dhcp_parser.add_argument(
+        "--response-timeout",
+        type=float,
+        metavar="SECONDS",
+        default=ConfigLoader.get("attacks", "dhcp", "default_response_timeout", default=3.0),
+        help="Seconds a DISCOVER may wait for its OFFER before it counts as unanswered",
+    )
 
     # ── ARP subcommand ────────────────────────────────────────────────────────
     arp_parser = subparsers.add_parser(
@@ -225,6 +258,26 @@ def main() -> None:
             f"When set, --num-devices is ignored."
         ),
     )
+    arp_parser.add_argument(
+        "--measure",
+        type=lambda value: _strtobool(value),
+        metavar="BOOL",
+        default=ConfigLoader.get("attacks", "arp", "default_measure", default=False),
+        help="Announce once, then probe each device once to measure how long the gateway keeps it",
+    )
+    arp_parser.add_argument(
+        "--probe-rate",
+        type=float,
+        metavar="PPS",
+        default=ConfigLoader.get("attacks", "arp", "default_probe_rate", default=1.0),
+        help="Retention probes per second (one device each, fractions allowed)",
+    )
+    arp_parser.add_argument(
+        "--gateway",
+        default=ConfigLoader.get("attacks", "arp", "default_gateway", default=None),
+        metavar="IP",
+        help="Gateway whose ARP table is measured (default: the default route's gateway)",
+    )
 
     # ── Traffic subcommand ────────────────────────────────────────────────────
     traffic_parser = subparsers.add_parser(
@@ -233,13 +286,21 @@ def main() -> None:
         description=get_traffic_banner(),
         formatter_class=ColorfulHelpFormatter,
     )
-    traffic_parser.add_argument(
+    traffic_source = traffic_parser.add_mutually_exclusive_group(required=True)
+    traffic_source.add_argument(
         "-i",
         "--interface",
-        required=True,
         default=ConfigLoader.get("attacks", "traffic", "default_interface", default="lo"),
         help=f"Network interface ({BLUE}e.g. eth0{RESET})",
     )
+    traffic_source.add_argument(
+        "-r", "--read", metavar="FILE", help="Replay a pcap/pcapng file instead of capturing live"
+    )
+    traffic_source.add_argument(
+        "--stats",
+        metavar="FILE",
+        help="Watch the stats page of a running capture (see --stats-page) instead of capturing",
+    )
     traffic_parser.add_argument(
         "-f",
         "--filter",
@@ -249,7 +310,6 @@ def main() -> None:
     traffic_parser.add_argument(
         "-o",
         "--output",
-        required=True,
         default=ConfigLoader.get(
             "attacks", "traffic", "default_output_file", default="capture.pcap"
         ),
@@ -284,6 +344,345 @@ def main() -> None:
         default=ConfigLoader.get("attacks", "traffic", "default_promisc", default=True),
         help="Promiscuous mode (true/false, yes/no, 1/0)",
     )
+    traffic_parser.add_argument(
+        "-C",
+        "--rotate-size",
+        type=int,
+        metavar="MB",
+        default=ConfigLoader.get("attacks", "traffic", "default_rotate_size", default=0),
+        help="Start a new output file every MB megabytes (0=off)",
+    )
+    traffic_parser.add_argument(
+        "-G",
+        "--rotate-seconds",
+        type=int,
+        metavar="SECONDS",
+        default=ConfigLoader.get("attacks", "traffic", "default_rotate_seconds", default=0),
+        help="Start a new output file every SECONDS seconds (0=off)",
+    )
+    traffic_parser.add_argument(
+        "-W",
+        "--rotate-files",
+        type=int,
+        metavar="N",
+        default=ConfigLoader.get("attacks", "traffic", "default_rotate_files", default=0),
+        help=f"Ring buffer size: keep only the newest N rotated files ({BLUE}0=keep all{RESET})",
+    )
+    traffic_parser.add_argument(
+        "-B",
+        "--buffer-size",
+        type=int,
+        metavar="KiB",
+        default=ConfigLoader.get("attacks", "traffic", "default_buffer_size", default=0),
+        help="Kernel capture buffer size in KiB (0=libpcap default)",
+    )
+    traffic_parser.add_argument(
+        "--immediate-mode",
+        type=lambda value: _strtobool(value),
+        metavar="BOOL",
+        default=ConfigLoader.get("attacks", "traffic", "default_immediate_mode", default=False),
+        help="Deliver packets as soon as they arrive (true/false, yes/no, 1/0)",
+    )
+    traffic_parser.add_argument(
+        "--timeout",
+        type=int,
+        metavar="MS",
+        default=ConfigLoader.get("attacks", "traffic", "default_timeout", default=1000),
+        help="Packet buffer timeout in milliseconds",
+    )
+    traffic_parser.add_argument(
+        "--writer-buffer",
+        type=int,
+        metavar="KiB",
+        default=ConfigLoader.get("attacks", "traffic", "default_writer_buffer", default=0),
+        help="Queue between capture and disk writer in KiB (0=8 MiB)",
+    )
+    traffic_parser.add_argument(
+        "--writer-block",
+        type=lambda value: _strtobool(value),
+        metavar="BOOL",
+        default=ConfigLoader.get("attacks", "traffic", "default_writer_block", default=False),
+        help="Wait for the disk writer when its queue is full instead of dropping packets",
+    )
+    traffic_parser.add_argument(
+        "-z",
+        "--compress",
+        choices=["auto", "none", "gzip", "zstd"],
+        default=ConfigLoader.get("attacks", "traffic", "default_compress", default="auto"),
+        help="Compress the output file (auto = by .gz/.zst extension)",
+    )
+    traffic_parser.add_argument(
+        "--compress-level",
+        type=int,
+        metavar="N",
+        default=ConfigLoader.get("attacks", "traffic", "default_compress_level", default=0),
+        help="gzip 1-9 / zstd 1-22 compression level (0=library default)",
+    )
+    traffic_parser.add_argument(
+        "--format",
+        choices=["auto", "pcap", "pcapng"],
+        default=ConfigLoader.get("attacks", "traffic", "default_format", default="auto"),
+        help="Output file format (auto = pcapng for a .pcapng file name)",
+    )
+    traffic_parser.add_argument(
+        "--nanosecond",
+        type=lambda value: _strtobool(value),
+        metavar="BOOL",
+        default=ConfigLoader.get("attacks", "traffic", "default_nanosecond", default=False),
+        help="Record nanosecond instead of microsecond timestamps",
+    )
+    traffic_parser.add_argument(
+        "--tstamp-type",
+        metavar="TYPE",
+        default=ConfigLoader.get("attacks", "traffic", "default_tstamp_type", default=""),
+        help="Timestamp source: host, host_lowprec, host_hiprec, adapter, adapter_unsynced",
+    )
+    traffic_parser.add_argument(
+        "--replay-speed",
+        type=float,
+        metavar="X",
+        default=ConfigLoader.get("attacks", "traffic", "default_replay_speed", default=0.0),
+        help="Pace --read at X times the original timing (0=as fast as possible)",
+    )
+    traffic_parser.add_argument(
+        "--index",
+        type=int,
+        metavar="SECONDS",
+        default=ConfigLoader.get("attacks", "traffic", "default_index", default=0),
+        help="Write a <output>.idx time/flow index with SECONDS buckets (0=off)",
+    )
+    traffic_parser.add_argument(
+        "--flows",
+        metavar="FILE",
+        default=ConfigLoader.get("attacks", "traffic", "default_flow_file", default=""),
+        help="Export per-flow packet/byte counters to a CSV file (with -o '' instead of a pcap)",
+    )
+    traffic_parser.add_argument(
+        "--flow-max",
+        type=int,
+        metavar="N",
+        default=ConfigLoader.get("attacks", "traffic", "default_flow_max", default=0),
+        help="Flow table size limit (0=65536)",
+    )
+    traffic_parser.add_argument(
+        "--flow-idle",
+        type=int,
+        metavar="SECONDS",
+        default=ConfigLoader.get("attacks", "traffic", "default_flow_idle", default=0),
+        help="Evict and export flows idle for SECONDS (0=keep until the end)",
+    )
+    traffic_parser.add_argument(
+        "--flow-interval",
+        type=int,
+        metavar="SECONDS",
+        default=ConfigLoader.get("attacks", "traffic", "default_flow_interval", default=0),
+        help="Export updated flows every SECONDS (0=only at the end)",
+    )
+    traffic_parser.add_argument(
+        "--sample",
+        choices=["none", "count", "budget", "flow"],
+        default=ConfigLoader.get("attacks", "traffic", "default_sample", default="none"),
+        help="Write only some matched packets: 1 in N, N per second or 1 in N flows",
+    )
+    traffic_parser.add_argument(
+        "--sample-rate",
+        type=int,
+        metavar="N",
+        default=ConfigLoader.get("attacks", "traffic", "default_sample_rate", default=0),
+        help="N for --sample (recorded in pcapng output)",
+    )
+    traffic_parser.add_argument(
+        "--headers-only",
+        type=lambda value: _strtobool(value),
+        metavar="BOOL",
+        default=ConfigLoader.get("attacks", "traffic", "default_headers_only", default=False),
+        help="Set the snapshot length to the link/IP/transport headers of the link type",
+    )
+    traffic_parser.add_argument(
+        "--fanout",
+        type=int,
+        metavar="N",
+        default=ConfigLoader.get("attacks", "traffic", "default_fanout", default=0),
+        help="Capture with N worker threads, each writing its own _w<N> shard (Linux)",
+    )
+    traffic_parser.add_argument(
+        "--fanout-mode",
+        choices=["hash", "cpu"],
+        default=ConfigLoader.get("attacks", "traffic", "default_fanout_mode", default="hash"),
+        help="Spread packets over the workers by flow hash or by receiving CPU",
+    )
+    traffic_parser.add_argument(
+        "--fanout-pin",
+        type=lambda value: _strtobool(value),
+        metavar="BOOL",
+        default=ConfigLoader.get("attacks", "traffic", "default_fanout_pin", default=False),
+        help="Pin each fanout worker to its own CPU",
+    )
+    traffic_parser.add_argument(
+        "--stats-page",
+        metavar="FILE",
+        default=ConfigLoader.get("attacks", "traffic", "default_stats_page", default=""),
+        help="Publish live counters to this memory-mapped file for --stats watchers",
+    )
+
+    # ── Analyze subcommand ────────────────────────────────────────────────────
+    analyze_parser = subparsers.add_parser(
+        "analyze",
+        help=f"{GREEN}▤ Summarise a PCAP file (rates, gaps, protocols){RESET}",
+        description=get_analyze_banner(),
+        formatter_class=ColorfulHelpFormatter,
+    )
+    analyze_parser.add_argument(
+        "file",
+        metavar="FILE",
+        help=f"Uncompressed pcap/pcapng capture ({BLUE}e.g. capture.pcap{RESET})",
+    )
+    analyze_parser.add_argument(
+        "-t",
+        "--interval",
+        type=float,
+        metavar="SECONDS",
+        default=ConfigLoader.get("attacks", "analyze", "default_interval", default=1.0),
+        help="Bin width of the packet/bit rate time series",
+    )
+    analyze_parser.add_argument(
+        "-s",
+        "--series",
+        metavar="FILE",
+        default=ConfigLoader.get("attacks", "analyze", "default_series", default=""),
+        help=f"Also write the rate time series as CSV ({BLUE}start,pps,bps{RESET})",
+    )
+    analyze_parser.add_argument(
+        "-j",
+        "--json",
+        action="store_true",
+        default=ConfigLoader.get("attacks", "analyze", "default_json", default=False),
+        help="Print the summary as JSON instead of text",
+    )
+
+    # ── Merge subcommand ──────────────────────────────────────────────────────
+    merge_parser = subparsers.add_parser(
+        "merge",
+        help=f"{GREEN}⧉ Merge rotated/sharded PCAP files by timestamp{RESET}",
+        description=get_merge_banner(),
+        formatter_class=ColorfulHelpFormatter,
+    )
+    merge_parser.add_argument(
+        "files",
+        nargs="+",
+        metavar="FILE",
+        help=f"pcap/pcapng captures, optionally gzip ({BLUE}e.g. out_w*.pcap{RESET})",
+    )
+    merge_parser.add_argument(
+        "-o", "--output", required=True, help="Merged capture (.gz for gzip)", metavar="FILE"
+    )
+    merge_parser.add_argument(
+        "--format",
+        choices=["auto", "pcap", "pcapng"],
+        default=ConfigLoader.get("attacks", "merge", "default_format", default="auto"),
+        help="Output file format (auto=pcapng for .pcapng names)",
+    )
+    merge_parser.add_argument(
+        "--nanosecond",
+        type=lambda value: _strtobool(value),
+        metavar="BOOL",
+        default=ConfigLoader.get("attacks", "merge", "default_nanosecond", default=None),
+        help="Nanosecond timestamps (default: when any input has them)",
+    )
+    merge_parser.add_argument(
+        "--dedup",
+        type=lambda value: _strtobool(value),
+        metavar="BOOL",
+        default=ConfigLoader.get("attacks", "merge", "default_dedup", default=False),
+        help="Drop frames identical to the frame written just before them",
+    )
+    merge_parser.add_argument(
+        "--dedup-window",
+        type=float,
+        metavar="SECONDS",
+        default=ConfigLoader.get("attacks", "merge", "default_dedup_window", default=0.001),
+        help="Longest gap between two frames --dedup treats as one",
+    )
+
+    # ── Bench subcommand ──────────────────────────────────────────────────────
+    bench_parser = subparsers.add_parser(
+        "bench",
+        help=f"{GREEN}⏱ Benchmark the capture backend (throughput, drops, CPU){RESET}",
+        description=get_bench_banner(),
+        formatter_class=ColorfulHelpFormatter,
+    )
+    bench_parser.add_argument(
+        "-o",
+        "--output",
+        metavar="FILE",
+        default=ConfigLoader.get("attacks", "bench", "default_output", default="bench.json"),
+        help="JSON results file",
+    )
+    bench_parser.add_argument(
+        "-n",
+        "--packets",
+        type=int,
+        metavar="N",
+        default=ConfigLoader.get("attacks", "bench", "default_packets", default=500000),
+        help="Packets in the generated capture replayed offline",
+    )
+    bench_parser.add_argument(
+        "--frame-size",
+        type=int,
+        metavar="BYTES",
+        default=ConfigLoader.get("attacks", "bench", "default_frame_size", default=128),
+        help="Size of the generated Ethernet/IPv4/UDP frames",
+    )
+    bench_parser.add_argument(
+        "--rounds",
+        type=int,
+        metavar="N",
+        default=ConfigLoader.get("attacks", "bench", "default_rounds", default=3),
+        help="Offline replays per mode; the fastest one counts",
+    )
+    bench_parser.add_argument(
+        "--live",
+        type=lambda value: _strtobool(value),
+        metavar="BOOL",
+        default=ConfigLoader.get("attacks", "bench", "default_live", default=True),
+        help="Also capture live traffic on a temporary veth pair (root)",
+    )
+    bench_parser.add_argument(
+        "--rates",
+        type=lambda value: [int(rate) for rate in value.split(",")],
+        metavar="PPS[,PPS...]",
+        default=ConfigLoader.get(
+            "attacks", "bench", "default_rates", default=[10000, 50000, 100000, 200000, 400000]
+        ),
+        help="Send rates of the live sweep",
+    )
+    bench_parser.add_argument(
+        "--step-seconds",
+        type=float,
+        metavar="SECONDS",
+        default=ConfigLoader.get("attacks", "bench", "default_step_seconds", default=2.0),
+        help="Sending time per live rate",
+    )
+    bench_parser.add_argument(
+        "--modes",
+        type=lambda value: [mode for mode in value.split(",") if mode],
+        metavar="NAME[,NAME...]",
+        default=ConfigLoader.get("attacks", "bench", "default_modes", default=[]),
+        help="Only these backend modes (default: all)",
+    )
+    bench_parser.add_argument(
+        "--baseline",
+        metavar="FILE",
+        default=ConfigLoader.get("attacks", "bench", "default_baseline", default=""),
+        help="Results of an earlier run; exit with 1 on regressions",
+    )
+    bench_parser.add_argument(
+        "--tolerance",
+        type=float,
+        metavar="FRACTION",
+        default=ConfigLoader.get("attacks", "bench", "default_tolerance", default=0.1),
+        help="Change against --baseline that counts as a regression",
+    )
 
     # ── Deauth subcommand ─────────────────────────────────────────────────────
     deauth_parser = subparsers.add_parser(
@@ -400,6 +799,8 @@ def main() -> None:
                 num_devices=args.num_devices,
                 request_options=args.request_options,
                 client_src=args.client_src,
+                track_responses=args.track,
+                response_timeout=args.response_timeout,
             )
             signal.signal(signal.SIGINT, lambda sig, frame: attack.user_abort())
             attack.start()
@@ -415,27 +816,99 @@ def main() -> None:
                 interval=args.interval,
                 cycles=args.cycles,
                 target_macs=args.target_macs,
+                measure=args.measure,
+                probe_rate=args.probe_rate,
+                gateway=args.gateway,
             )
             signal.signal(signal.SIGINT, lambda sig, frame: attack.user_abort())
             attack.start()
             while attack.running:
                 time.sleep(0.5)
 
+        elif args.command == "traffic" and args.stats:
+            watch_stats(args.stats)
+
         elif args.command == "traffic":
             attack = TrafficLogger(
-                interface=args.interface,
+                interface="" if args.read else args.interface,
                 bpf_filter=args.filter,
                 output_file=args.output,
                 duration=args.duration,
                 count=args.count,
                 snaplen=args.snaplen,
                 promisc=args.promisc,
+                rotate_size=args.rotate_size,
+                rotate_seconds=args.rotate_seconds,
+                rotate_files=args.rotate_files,
+                buffer_size=args.buffer_size,
+                immediate_mode=args.immediate_mode,
+                timeout_ms=args.timeout,
+                writer_buffer=args.writer_buffer,
+                writer_block=args.writer_block,
+                compression=args.compress,
+                compression_level=args.compress_level,
+                file_format=args.format,
+                nanosecond=args.nanosecond,
+                tstamp_type=args.tstamp_type,
+                input_file=args.read or "",
+                replay_speed=args.replay_speed,
+                index_bucket=args.index,
+                flow_file=args.flows,
+                flow_max=args.flow_max,
+                flow_idle=args.flow_idle,
+                flow_interval=args.flow_interval,
+                sampling=args.sample,
+                sample_rate=args.sample_rate,
+                headers_only=args.headers_only,
+                fanout=args.fanout,
+                fanout_mode=args.fanout_mode,
+                fanout_pin=args.fanout_pin,
+                stats_file=args.stats_page,
             )
             signal.signal(signal.SIGINT, lambda sig, frame: attack.user_abort())
             attack.start()
             while attack.running:
                 time.sleep(0.5)
 
+        elif args.command == "analyze":
+            analyzer = CaptureAnalyzer(args.file)
+            if args.json:
+                print(json.dumps(analyzer.summary(args.interval), indent=2))
+            else:
+                analyzer.report(args.interval)
+            if args.series:
+                analyzer.write_series(args.series, args.interval)
+
+        elif args.command == "merge":
+            result = merge_captures(
+                args.files,
+                args.output,
+                file_format=args.format,
+                nanosecond=args.nanosecond,
+                dedup=args.dedup,
+                dedup_window=args.dedup_window,
+            )
+            report_merge(result, args.output)
+
+        elif args.command == "bench":
+            results = run_benchmarks(
+                args.output,
+                packets=args.packets,
+                frame_len=args.frame_size,
+                rounds=args.rounds,
+                live=args.live,
+                rates=args.rates,
+                step_seconds=args.step_seconds,
+                modes=args.modes,
+            )
+            report_bench(results, args.output)
+            if args.baseline:
+                with open(args.baseline) as baseline_file:
+                    regressions = compare_results(json.load(baseline_file), results, args.tolerance)
+                report_regressions(regressions, args.baseline)
+                if regressions:
+                    exit(1)
+
         elif args.command == "deauth":
             attack = Interceptor(
                 net_iface=args.net_iface,
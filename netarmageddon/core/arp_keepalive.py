@@ -2,13 +2,17 @@ import random
 import re
 import threading
 import time
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 
-from scapy.all import sendp
 from scapy.arch import get_if_list
-from scapy.layers.l2 import ARP, Ether
+from scapy.layers.l2 import ARP, Ether, getmacbyip
 from scapy.packet import Packet
 
+from netarmageddon.core.arp_retention import ARPRetentionProbe
+from netarmageddon.core.l2_sender import L2Sender
+from netarmageddon.core.pacer import Pacer
+from netarmageddon.utils.network_tools import get_default_gateway, validate_ip
+
 from netarmageddon.utils.output_manager import (
     BOLD,
     BRIGHT_CYAN,
@@ -33,7 +37,8 @@ _MAC_RE = re.compile(r"^([0-9A-Fa-f]{2}:){5}[0-9A-Fa-f]{2}$")
 class ARPKeepAlive:
     """Maintain fake devices in a router's ARP table."""
 
-    MAX_PPS: int = 100  # Safety limit for packets per second
+    MAX_PPS: int = L2Sender.MAX_PPS  # Safety limit, enforced by L2Sender
+    PROBE_SETTLE: float = 2.0  # Seconds to wait for the gateway after the last probe
 
     def __init__(
         self,
@@ -44,6 +49,9 @@ class ARPKeepAlive:
         interval: float = 5.0,
         cycles: int = 1,
         target_macs: Optional[List[str]] = None,
+        measure: bool = False,
+        probe_rate: float = 1.0,
+        gateway: Optional[str] = None,
     ) -> None:
         self.interface = interface
         self.base_ip = base_ip
@@ -53,7 +61,14 @@ class ARPKeepAlive:
         self.running = False
         self.thread: Optional[threading.Thread] = None
         self._stopped = False
+        self._stop_event = threading.Event()  # interrupts the slow probe pacing at stop()
         self.start_time = time.time()
+        self.measure = measure
+        self.probe_rate = probe_rate
+        self.gateway = gateway or ""
+        self.retention: Optional[ARPRetentionProbe] = None
+        self.sender = L2Sender(interface)
+        self.pacer: Optional[Pacer] = None
 
         # When target_macs is provided, they define both the MACs and the
         # device count; num_devices is ignored in that case.
@@ -69,6 +84,8 @@ class ARPKeepAlive:
         self._validate_ip()
         if not self.target_macs:
             self._validate_mac_prefix()
+        if measure:
+            self._validate_measurement()
 
         HEAD("⬡  ARP Keep-Alive — Configuration")
         CMD(f"  {'Interface':<20} {BRIGHT_CYAN}{interface}{RESET}")
@@ -80,6 +97,11 @@ class ARPKeepAlive:
             CMD(f"  {'MAC Prefix':<20} {BRIGHT_CYAN}{mac_prefix}:xx:xx:xx{RESET}")
         CMD(f"  {'Interval':<20} {BRIGHT_CYAN}{interval}s between cycles{RESET}")
         CMD(f"  {'Cycles':<20} {BRIGHT_CYAN}{cycles}{RESET}")
+        if measure:
+            CMD(
+                f"  {'Retention probes':<20} {BRIGHT_CYAN}{probe_rate:g} pps via gateway "
+                f"{self.gateway} (replaces the cycles){RESET}"
+            )
         CMD(THIN_DELIM)
 
     def _validate_target_macs(self, macs: List[str]) -> None:
@@ -117,11 +139,22 @@ class ARPKeepAlive:
             raise ValueError("Use format like 'de:ad:00'")
         INFO("MAC prefix format validated")
 
+    def _validate_measurement(self) -> None:
+        DEBUG("Validating retention measurement settings")
+        if self.probe_rate <= 0:
+            ERROR(f"Invalid probe rate: {self.probe_rate}")
+            raise ValueError("probe_rate must be positive")
+        if self.num_devices > 254:
+            ERROR(f"Too many devices for one /24: {self.num_devices}")
+            raise ValueError("Retention measurement supports up to 254 devices")
+        self.gateway = self.gateway or get_default_gateway() or ""
+        if not validate_ip(self.gateway):
+            ERROR(f"Invalid or missing gateway: {self.gateway or '(none found)'}")
+            raise ValueError("Retention measurement needs the gateway IP (e.g. '192.168.1.1')")
+        INFO("Retention measurement settings validated")
+
     def _rate_limit(self, pps: int) -> int:
-        if pps > self.MAX_PPS:
-            WARNING(f"Rate capped: {pps} → {self.MAX_PPS} pps (safety limit)")
-            return self.MAX_PPS
-        return pps
+        return int(L2Sender.rate_limit(pps))
 
     def _generate_mac(self, ip_suffix: int) -> str:
         """Return MAC address for this device slot.
@@ -141,17 +174,17 @@ class ARPKeepAlive:
         )
         return mac
 
-    def _generate_arp_packet(self, ip_suffix: int) -> Packet:
+    def _generate_arp_packet(self, ip_suffix: int, mac: Optional[str] = None) -> Packet:
         ip = f"{self.base_ip}{ip_suffix}"
-        mac = self._generate_mac(ip_suffix)
+        mac = mac or self._generate_mac(ip_suffix)
         return Ether(src=mac, dst="ff:ff:ff:ff:ff:ff") / ARP(op=1, hwsrc=mac, psrc=ip, pdst=ip)
 
     def _send_arp_announcements(self) -> None:
         try:
             INFO("🚀 Starting ARP keep-alive attack")
             pps = max(1, self.num_devices)
-            allowed_pps = self._rate_limit(pps)
-            delay = 1.0 / allowed_pps if allowed_pps > 0 else 0
+            self.pacer = Pacer(pps)
+            allowed_pps = self.pacer.pps
 
             INFO(
                 f"  Rate: {BOLD}{BRIGHT_YELLOW}{allowed_pps}{RESET} pps  |  "
@@ -166,14 +199,16 @@ class ARPKeepAlive:
                     f"  Cycle {BOLD}{BRIGHT_YELLOW}{cycle}{RESET}"
                     f"/{BRIGHT_WHITE}{self.cycles}{RESET}"
                 )
+                self.pacer.start_burst()
 
                 for i in range(1, self.num_devices + 1):
                     if not self.running:
                         break
 
                     pkt = self._generate_arp_packet(i)
+                    self.pacer.wait()
                     try:
-                        sendp(pkt, iface=self.interface, verbose=False)
+                        self.sender.send(pkt)
                         bar = make_progress_bar(i, self.num_devices)
                         CLEAR()
                         INFO(
@@ -185,7 +220,6 @@ class ARPKeepAlive:
                         ERROR(f"Permission error: {e}")
                         self.stop()
                         return
-                    time.sleep(delay)
 
                 INFO("")  # newline after progress bar
 
@@ -196,13 +230,65 @@ class ARPKeepAlive:
         finally:
             self.stop()
 
+    def _measure_retention(self) -> None:
+        try:
+            gateway_mac = getmacbyip(self.gateway)
+            if not gateway_mac:
+                ERROR(f"Gateway {self.gateway} did not answer ARP on {self.interface}")
+                return
+            self.retention = ARPRetentionProbe(
+                self.interface, self.base_ip, self.num_devices, self.gateway, gateway_mac
+            )
+            self.retention.start()
+
+            # Announce every device once, then leave the entries alone except for one probe
+            INFO("🚀 Starting ARP retention measurement")
+            macs = {i: self._generate_mac(i) for i in range(1, self.num_devices + 1)}
+            self.pacer = Pacer(max(1, self.num_devices))
+            for i, mac in macs.items():
+                pkt = self._generate_arp_packet(i, mac)
+                if not self.running or not self.pacer.wait(self._stop_event):
+                    return
+                self.sender.send(pkt)
+                self.retention.announced(i, mac, time.time())
+
+            probes = Pacer(self.probe_rate)
+            INFO(
+                f"  Probing one device every {BOLD}{BRIGHT_YELLOW}{1 / probes.pps:.1f}s{RESET}"
+                f"  |  ages up to {BOLD}{BRIGHT_WHITE}{self.num_devices / probes.pps:.0f}s{RESET}"
+            )
+            for i, mac in macs.items():
+                pkt = self.retention.probe_packet(i, mac)
+                if not self.running or not probes.wait(self._stop_event):
+                    return
+                self.sender.send(pkt)
+                self.retention.probed(i, time.time())
+                bar = make_progress_bar(i, self.num_devices)
+                CLEAR()
+                INFO(
+                    f"  Probing {bar}  "
+                    f"{BRIGHT_CYAN}{i}{RESET}/{BRIGHT_WHITE}{self.num_devices}{RESET}",
+                    end="\r",
+                )
+            INFO("")
+            self._stop_event.wait(self.PROBE_SETTLE)
+        except PermissionError as e:
+            ERROR(f"Permission error: {e}")
+        finally:
+            self.stop()
+
+    def get_retention(self) -> Optional[Dict[str, Any]]:
+        """Retention measurement results (see ARPRetentionProbe.get_stats), None when the
+        measurement did not run."""
+        return self.retention.get_stats() if self.retention else None
+
     def start(self) -> None:
         if not self.running:
             DEBUG("Spawning ARP thread")
             self.running = True
-            self.thread = threading.Thread(
-                target=self._send_arp_announcements, name="ARPKeepAliveThread"
-            )
+            self._stop_event.clear()
+            target = self._measure_retention if self.measure else self._send_arp_announcements
+            self.thread = threading.Thread(target=target, name="ARPKeepAliveThread")
             self.thread.start()
 
     def stop(self) -> None:
@@ -210,12 +296,19 @@ class ARPKeepAlive:
             return
         DEBUG("Initiating ARP shutdown")
         self.running = False
+        self._stop_event.set()
 
         if self.thread and self.thread.is_alive():
             if threading.current_thread() is not self.thread:
                 self.thread.join(timeout=5)
                 if self.thread.is_alive():
                     WARNING("ARP thread shutdown delayed")
+        self.sender.close()
+        if self.pacer:
+            self.pacer.report()
+        if self.retention:
+            self.retention.stop()
+            self.retention.report()
 
         duration = time.time() - self.start_time
         INFO(f"  Total duration: {BOLD}{BRIGHT_WHITE}{duration:.1f}s{RESET}")
@@ -0,0 +1,259 @@
+"""ARP table retention measurement for the ARP keep-alive devices.
+
+After the devices are announced once, each device slot is probed exactly once, slot by
+slot at a low rate, so every slot is probed at a different age of its entry. The probe is
+an ICMP echo request from the device's IP to the gateway. Answering it makes the gateway
+look the device up in its ARP table without refreshing the entry:
+
+- an entry it still holds is used directly: the echo reply, or a unicast ARP request
+  that re-checks a stale entry, goes to the device's MAC (retained)
+- an entry it dropped has to be resolved again with a broadcast ARP request (evicted)
+
+:class:`ARPRetentionProbe` watches the gateway's ARP requests and replies and its ICMP
+replies for the simulated IPs through a kernel-filtered socket. It keeps per-slot times
+(announced, probed, last seen, evicted) in arrays indexed by device slot. Slots of the
+same age bucket together into a retention/eviction curve: the share of entries still
+held by entry age.
+"""
+
+import threading
+import time
+from ipaddress import IPv4Address
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import scapy.all  # noqa: F401  (sets conf.L2socket for the platform)
+from scapy.config import conf
+from scapy.layers.inet import ICMP, IP
+from scapy.layers.l2 import Ether
+from scapy.packet import Packet
+
+from netarmageddon.utils.output_manager import (
+    BOLD,
+    BRIGHT_CYAN,
+    BRIGHT_WHITE,
+    BRIGHT_YELLOW,
+    CMD,
+    DEBUG,
+    INFO,
+    RESET,
+    WARNING,
+)
+
+ETHER_LEN = 14
+ETH_P_IP = b"\x08\x00"
+ETH_P_ARP = b"\x08\x06"
+ARP_REQUEST = 1
+ARP_REPLY = 2
+ARP_OP = ETHER_LEN + 6  # offsets of the Ethernet/IPv4 ARP fields
+ARP_SPA = ETHER_LEN + 14
+ARP_TPA = ETHER_LEN + 24
+ARP_END = ETHER_LEN + 28
+IP_PROTO = ETHER_LEN + 9
+IP_SRC = ETHER_LEN + 12
+IP_DST = ETHER_LEN + 16
+ICMP_PROTO = 1
+ICMP_ECHO_REPLY = 0
+BROADCAST = b"\xff" * 6
+
+
+class ARPRetentionProbe:
+    """Probe state and gateway replies for device slots 1..``num_devices`` of ``base_ip``.
+
+    ``bins`` is the number of age buckets of the retention curve.
+    """
+
+    POLL_INTERVAL: float = 0.2  # receive thread wake-up interval to notice stop()
+
+    def __init__(
+        self,
+        interface: str,
+        base_ip: str,
+        num_devices: int,
+        gateway: str,
+        gateway_mac: str,
+        bins: int = 10,
+    ) -> None:
+        self.interface = interface
+        self.base_ip = base_ip
+        self.num_devices = num_devices
+        self.gateway = gateway
+        self.gateway_mac = gateway_mac
+        self.bins = bins
+        self.running = False
+        self.thread: Optional[threading.Thread] = None
+        self._prefix = IPv4Address(f"{base_ip}0").packed[:3]
+        self._gateway = IPv4Address(gateway).packed
+        self._macs: List[bytes] = [b""] * (num_devices + 1)
+        # Indexed by device slot (index 0 unused); NaN until it happens
+        self.announced_at = np.full(num_devices + 1, np.nan)
+        self.probed_at = np.full(num_devices + 1, np.nan)
+        self.last_seen = np.full(num_devices + 1, np.nan)
+        self.evicted_at = np.full(num_devices + 1, np.nan)
+        self._socket: Optional[Any] = None
+
+    @property
+    def bpf_filter(self) -> str:
+        return f"arp or (icmp and src host {self.gateway})"
+
+    def announced(self, slot: int, mac: str, at: float) -> None:
+        self._macs[slot] = bytes.fromhex(mac.replace(":", ""))
+        self.announced_at[slot] = at
+
+    def probe_packet(self, slot: int, mac: str) -> Packet:
+        """The echo request from device ``slot`` to the gateway."""
+        return (
+            Ether(src=mac, dst=self.gateway_mac)
+            / IP(src=f"{self.base_ip}{slot}", dst=self.gateway)
+            / ICMP(type="echo-request", id=slot, seq=1)
+        )
+
+    def probed(self, slot: int, at: float) -> None:
+        self.probed_at[slot] = at
+
+    def _slot(self, ip: bytes) -> int:
+        if ip[:3] != self._prefix or not 1 <= ip[3] <= self.num_devices:
+            return 0
+        return ip[3]
+
+    def handle_frame(self, frame: bytes, received_at: float) -> None:
+        """Account for one frame from the gateway (called by the receive thread)."""
+        ethertype = frame[12:14]
+        if ethertype == ETH_P_ARP and len(frame) >= ARP_END:
+            if frame[ARP_SPA : ARP_SPA + 4] != self._gateway:
+                return
+            slot = self._slot(frame[ARP_TPA:ARP_END])
+            op = int.from_bytes(frame[ARP_OP : ARP_OP + 2], "big")
+            if not slot or op not in (ARP_REQUEST, ARP_REPLY):
+                return
+            if op == ARP_REQUEST and frame[:6] == BROADCAST:
+                # Resolving from scratch: the entry is gone
+                if np.isnan(self.evicted_at[slot]):
+                    self.evicted_at[slot] = received_at
+                return
+        elif ethertype == ETH_P_IP and len(frame) > ETHER_LEN + 20:
+            header = (frame[ETHER_LEN] & 0x0F) * 4
+            if frame[IP_PROTO] != ICMP_PROTO or frame[IP_SRC : IP_SRC + 4] != self._gateway:
+                return
+            if len(frame) <= ETHER_LEN + header or frame[ETHER_LEN + header] != ICMP_ECHO_REPLY:
+                return
+            slot = self._slot(frame[IP_DST : IP_DST + 4])
+            if not slot:
+                return
+        else:
+            return
+        # Sent straight to the device's MAC: the gateway still holds the entry
+        if frame[:6] == self._macs[slot]:
+            self.last_seen[slot] = received_at
+
+    def start(self) -> None:
+        """Open the filtered socket (needs libpcap to compile the filter) and start receiving."""
+        if self.running:
+            return
+        self._socket = conf.L2socket(iface=self.interface, filter=self.bpf_filter)
+        self.running = True
+        self.thread = threading.Thread(
+            target=self._receive_loop, name="ARPRetentionThread", daemon=True
+        )
+        self.thread.start()
+        DEBUG(f"Watching gateway {self.gateway} on {self.interface} ({self.bpf_filter})")
+
+    def _receive_loop(self) -> None:
+        sock = self._socket
+        while self.running and sock is not None:
+            if not sock.select([sock], self.POLL_INTERVAL):
+                continue
+            try:
+                _, frame, ts = sock.recv_raw()
+            except OSError as e:
+                WARNING(f"ARP retention capture failed: {e}")
+                break
+            if frame:
+                self.handle_frame(frame, float(ts) if ts else time.time())
+
+    def stop(self) -> None:
+        if not self.running:
+            return
+        self.running = False
+        if self.thread and self.thread.is_alive() and threading.current_thread() is not self.thread:
+            self.thread.join(timeout=self.POLL_INTERVAL + 1)
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Probe outcomes per slot and the retention curve.
+
+        A probed slot is ``retained`` when the gateway reached the device's MAC directly
+        after the probe, ``evicted`` when it broadcast for the IP instead (eviction wins if
+        both happened), otherwise ``no_response``. ``curve`` buckets the probed slots by
+        entry age at the probe (seconds since the announcement) into ``bins`` intervals
+        with the retained share of those that got an answer. ``first_eviction_age`` and
+        ``last_retained_age`` bracket the router's timeout.
+        """
+        probed = ~np.isnan(self.probed_at)
+        age = self.probed_at - self.announced_at
+        # NaN compares False: a slot never seen or evicted after its probe counts as neither
+        with np.errstate(invalid="ignore"):
+            evicted = probed & (self.evicted_at >= self.probed_at)
+            retained = probed & ~evicted & (self.last_seen >= self.probed_at)
+        answered = retained | evicted
+        stats: Dict[str, Any] = {
+            "probed": int(probed.sum()),
+            "retained": int(retained.sum()),
+            "evicted": int(evicted.sum()),
+            "no_response": int((probed & ~answered).sum()),
+            "first_eviction_age": float(age[evicted].min()) if evicted.any() else None,
+            "last_retained_age": float(age[retained].max()) if retained.any() else None,
+            "curve": [],
+        }
+        if not probed.any():
+            return stats
+        ages = age[probed]
+        edges = np.linspace(ages.min(), ages.max(), self.bins + 1)
+        index = np.clip(np.searchsorted(edges, age, side="right") - 1, 0, self.bins - 1)
+        for b in range(self.bins):
+            in_bin = probed & (index == b)
+            if not in_bin.any():
+                continue
+            held, dropped = int((in_bin & retained).sum()), int((in_bin & evicted).sum())
+            stats["curve"].append(
+                {
+                    "age_start": float(edges[b]),
+                    "age_end": float(edges[b + 1]),
+                    "probed": int(in_bin.sum()),
+                    "retained": held,
+                    "evicted": dropped,
+                    "retained_share": held / (held + dropped) if held + dropped else None,
+                }
+            )
+        return stats
+
+    def report(self) -> None:
+        """Print the probe outcomes and the retention curve."""
+        stats = self.get_stats()
+        if not stats["probed"]:
+            return
+        INFO(
+            f"  Retention: {BOLD}{BRIGHT_CYAN}{stats['retained']}{RESET} retained / "
+            f"{BRIGHT_YELLOW}{stats['evicted']}{RESET} evicted / {stats['no_response']} "
+            f"no response of {BRIGHT_WHITE}{stats['probed']}{RESET} probed entries"
+        )
+        for point in stats["curve"]:
+            share = point["retained_share"]
+            bar = "-" if share is None else "█" * round(share * 20)
+            CMD(
+                f"    age {point['age_start']:7.1f}-{point['age_end']:7.1f}s  "
+                f"{point['retained']:>3}/{point['retained'] + point['evicted']:<3} {bar}"
+            )
+        if stats["first_eviction_age"] is not None:
+            INFO(
+                f"  First eviction at an age of {BOLD}{stats['first_eviction_age']:.1f}s{RESET}"
+                + (
+                    f", entries retained up to {stats['last_retained_age']:.1f}s"
+                    if stats["last_retained_age"] is not None
+                    else ""
+                )
+            )
+        elif stats["retained"]:
+            INFO(f"  No eviction up to an age of {stats['last_retained_age']:.1f}s")
@@ -0,0 +1,429 @@
+"""Offline analysis of capture files without a Python object per packet.
+
+The capture is memory-mapped, the record offsets are found by the C backend and every
+record header and the few packet header fields the protocol breakdown needs are gathered
+into NumPy arrays. Summarising a capture then costs a handful of array operations instead
+of the minutes and gigabytes ``scapy.rdpcap`` spends on building every packet.
+"""
+
+import os
+import re
+import struct
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+from netarmageddon.core.capture_index import PCAP_RECORD, PCAPNG_EPB, PCAPNG_EPB_TYPE
+from netarmageddon.core.mapper import COMPRESSED_SUFFIXES
+from netarmageddon.core.mapper import _lib as _traffic_lib
+from netarmageddon.utils.output_manager import BOLD, BRIGHT_CYAN, BRIGHT_WHITE, INFO, RESET
+
+PCAP_MAGIC_USEC = 0xA1B2C3D4
+PCAP_MAGIC_NSEC = 0xA1B23C4D
+PCAP_HEADER = struct.Struct("=IHHiIII")  # magic, major, minor, thiszone, sigfigs, snaplen, type
+PCAPNG_SHB_TYPE = 0x0A0D0D0A
+PCAPNG_IDB_TYPE = 1
+PCAPNG_BYTE_ORDER = 0x1A2B3C4D
+PCAPNG_BLOCK = struct.Struct("=II")  # type, total length
+PCAPNG_IDB = struct.Struct("=IIHHI")  # type, total length, linktype, reserved, snaplen
+PCAPNG_OPTION = struct.Struct("=HH")  # code, length
+PCAPNG_IF_TSRESOL = 9
+PCAPNG_OPT_COMMENT = 1
+# Written by the capture engine into the interface comment of sampled pcapng captures.
+SAMPLING_COMMENT = re.compile(rb"sampling=(count|budget|flow) rate=(\d+)")
+
+LINKTYPE_ETHERNET = 1
+ETH_HEADER_LEN = 14
+ETH_P_IP = 0x0800
+ETH_P_ARP = 0x0806
+ETH_P_IPV6 = 0x86DD
+ETH_P_8021Q = 0x8100
+VLAN_TAG_LEN = 4
+IP_PROTOCOLS = {1: "icmp", 6: "tcp", 17: "udp", 58: "icmpv6"}
+ARP_OPS = {1: "request", 2: "reply"}
+BOOTP_PORTS = (67, 68)
+BOOTP_COOKIE = 0x63825363
+BOOTP_COOKIE_OFFSET = 236  # from the start of the BOOTP header
+DHCP_MESSAGE_TYPE = 53
+DHCP_MESSAGE_TYPES = {
+    1: "discover",
+    2: "offer",
+    3: "request",
+    4: "decline",
+    5: "ack",
+    6: "nak",
+    7: "release",
+    8: "inform",
+}
+
+NSEC_PER_SEC = 1_000_000_000
+
+# One row per packet; `offset` is where the packet bytes start in the file.
+RECORD_DTYPE = np.dtype(
+    [("timestamp_ns", "<i8"), ("caplen", "<u4"), ("length", "<u4"), ("offset", "<u8")]
+)
+
+
+class CaptureAnalyzer:
+    """Packet rates, inter-arrival times and protocol counts of one capture file.
+
+    Reads uncompressed pcap (microsecond or nanosecond) and pcapng files in the byte order
+    of this machine, i.e. what :class:`~netarmageddon.core.traffic.TrafficLogger` writes.
+    Compressed captures cannot be memory-mapped and raise ValueError; decompress them
+    first. A record cut short by an unclean stop is ignored.
+
+    Sampled pcapng captures (``TrafficLogger(sampling=...)``) carry their sampling mode and
+    rate, exposed as :attr:`sampling` and :attr:`sample_rate`. All counts describe the
+    packets in the file; :attr:`scale` and the ``estimated_*`` summary values extrapolate
+    to the traffic that was sampled from.
+    """
+
+    def __init__(self, path: str) -> None:
+        suffix = os.path.splitext(path)[1]
+        if COMPRESSED_SUFFIXES.get(suffix, "none") != "none":
+            raise ValueError(f"cannot memory-map compressed captures, decompress first: {path}")
+        self.path = path
+        self.pcapng = False
+        self.nanosecond = False
+        self.linktype = 0
+        self.sampling = "none"
+        self.sample_rate = 0
+
+        data: np.ndarray = np.zeros(0, dtype=np.uint8)
+        if os.path.getsize(path) > 0:
+            data = np.memmap(path, dtype=np.uint8, mode="r")
+        self._data = data
+        start, ns_per_unit = self._parse_header()
+
+        count = _traffic_lib.traffic_scan_records(
+            data.ctypes.data, data.size, start, self.pcapng, None, 0
+        )
+        headers = np.empty(count, dtype=np.uint64)
+        _traffic_lib.traffic_scan_records(
+            data.ctypes.data, data.size, start, self.pcapng, headers.ctypes.data, count
+        )
+
+        self.records = np.empty(count, dtype=RECORD_DTYPE)
+        if self.pcapng:
+            # Field offsets as in PCAPNG_EPB / PCAP_RECORD.
+            ts_units = self._u32(headers + 12, "<") << np.uint64(32) | self._u32(headers + 16, "<")
+            self.records["timestamp_ns"] = ts_units.astype(np.int64) * ns_per_unit
+            self.records["caplen"] = self._u32(headers + 20, "<")
+            self.records["length"] = self._u32(headers + 24, "<")
+            self.records["offset"] = headers + np.uint64(PCAPNG_EPB.size)
+        else:
+            ts_sec = self._u32(headers, "<").astype(np.int64)
+            ts_frac = self._u32(headers + 4, "<").astype(np.int64)
+            self.records["timestamp_ns"] = ts_sec * NSEC_PER_SEC + ts_frac * ns_per_unit
+            self.records["caplen"] = self._u32(headers + 8, "<")
+            self.records["length"] = self._u32(headers + 12, "<")
+            self.records["offset"] = headers + np.uint64(PCAP_RECORD.size)
+
+    def _parse_header(self) -> Tuple[int, int]:
+        """Read the file header; returns the offset of the first record and ns per tick."""
+        data = self._data
+        if data.size < PCAPNG_BLOCK.size:
+            raise ValueError(f"{self.path}: not a capture file")
+        magic = PCAPNG_BLOCK.unpack_from(data)[0]
+        if magic in (PCAP_MAGIC_USEC, PCAP_MAGIC_NSEC):
+            if data.size < PCAP_HEADER.size:
+                raise ValueError(f"{self.path}: truncated pcap header")
+            self.nanosecond = magic == PCAP_MAGIC_NSEC
+            self.linktype = PCAP_HEADER.unpack_from(data)[6] & 0xFFFF
+            return PCAP_HEADER.size, 1 if self.nanosecond else 1000
+        if magic != PCAPNG_SHB_TYPE:
+            raise ValueError(f"{self.path}: not a pcap or pcapng file in native byte order")
+        if data.size < PCAPNG_BLOCK.size + 4 or (
+            PCAPNG_BLOCK.unpack_from(data, PCAPNG_BLOCK.size)[0] != PCAPNG_BYTE_ORDER
+        ):
+            raise ValueError(f"{self.path}: not a pcapng file in native byte order")
+        self.pcapng = True
+
+        # Records are timestamped in units of the first interface; TrafficLogger writes one.
+        tsresol = 6
+        pos = 0
+        while pos + PCAPNG_BLOCK.size <= data.size:
+            kind, total_len = PCAPNG_BLOCK.unpack_from(data, pos)
+            if total_len < PCAPNG_BLOCK.size or pos + total_len > data.size:
+                break
+            if kind == PCAPNG_IDB_TYPE and total_len >= PCAPNG_IDB.size:
+                self.linktype = PCAPNG_IDB.unpack_from(data, pos)[2]
+                options = self._idb_options(pos + PCAPNG_IDB.size, pos + total_len - 4)
+                if PCAPNG_IF_TSRESOL in options:
+                    tsresol = options[PCAPNG_IF_TSRESOL][0]
+                    if tsresol & 0x80:
+                        raise ValueError(
+                            f"{self.path}: binary timestamp resolutions are unsupported"
+                        )
+                sampled = SAMPLING_COMMENT.search(options.get(PCAPNG_OPT_COMMENT, b""))
+                if sampled:
+                    self.sampling = sampled.group(1).decode()
+                    self.sample_rate = int(sampled.group(2))
+                break
+            if kind == PCAPNG_EPB_TYPE:
+                break
+            pos += total_len
+        if tsresol > 9:
+            raise ValueError(f"{self.path}: unsupported timestamp resolution 10^-{tsresol}")
+        self.nanosecond = tsresol == 9
+        return 0, 10 ** (9 - tsresol)
+
+    def _idb_options(self, pos: int, end: int) -> Dict[int, bytes]:
+        """Non-empty options of an interface description block by code (first of each)."""
+        options: Dict[int, bytes] = {}
+        while pos + PCAPNG_OPTION.size <= end:
+            code, length = PCAPNG_OPTION.unpack_from(self._data, pos)
+            if code == 0:
+                break
+            value = pos + PCAPNG_OPTION.size
+            if length and value + length <= end:
+                options.setdefault(code, self._data[value : value + length].tobytes())
+            pos = value + (length + 3) // 4 * 4
+        return options
+
+    def _u32(self, pos: np.ndarray, order: str) -> np.ndarray:
+        """Gather the 4-byte unsigned integers at absolute file offsets ``pos``."""
+        return self._field(pos, 4, order)
+
+    def _field(self, pos: np.ndarray, size: int, order: str = ">") -> np.ndarray:
+        """Gather ``size``-byte unsigned integers at absolute file offsets ``pos``."""
+        pos = pos.astype(np.int64)
+        value = np.zeros(pos.shape, dtype=np.uint64)
+        for i in range(size):
+            shift = 8 * (size - 1 - i if order == ">" else i)
+            value |= self._data[pos + i].astype(np.uint64) << np.uint64(shift)
+        return value
+
+    def _packet_field(
+        self, rel: np.ndarray, size: int, where: Optional[np.ndarray] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Big-endian field at ``rel`` bytes into every packet (or only those ``where``).
+
+        Returns the values and a mask of the packets whose captured bytes hold the field;
+        other packets read 0.
+        """
+        valid = rel + size <= self.records["caplen"].astype(np.int64)
+        if where is not None:
+            valid &= where
+        pos = np.where(valid, self.records["offset"].astype(np.int64) + rel, 0)
+        return np.where(valid, self._field(pos, size), 0), valid
+
+    @property
+    def packets(self) -> int:
+        return int(self.records.size)
+
+    @property
+    def scale(self) -> Optional[float]:
+        """Factor from counts in the file to the sampled traffic, None when unknown.
+
+        1-in-N packet and flow sampling scale by N. A per-second budget keeps a varying
+        share of each second, so it cannot be scaled back.
+        """
+        if self.sampling in ("count", "flow"):
+            return float(self.sample_rate)
+        if self.sampling == "budget":
+            return None
+        return 1.0
+
+    @property
+    def timestamps(self) -> np.ndarray:
+        """Packet timestamps in seconds (float64)."""
+        return self.records["timestamp_ns"] / NSEC_PER_SEC
+
+    def rate_series(self, interval: float = 1.0) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Packets and bits per second in consecutive ``interval``-second bins.
+
+        Returns ``(bin_start, pps, bps)``; bins start at the earliest packet and empty bins
+        are included, so the arrays form an evenly spaced time series.
+        """
+        if interval <= 0:
+            raise ValueError("interval must be positive")
+        if not self.packets:
+            empty = np.zeros(0)
+            return empty, empty, empty
+        interval_ns = max(int(interval * NSEC_PER_SEC), 1)
+        timestamps = self.records["timestamp_ns"]
+        first = int(timestamps.min())
+        bins = (timestamps - first) // interval_ns
+        pps = np.bincount(bins) / interval
+        bps = np.bincount(bins, weights=self.records["length"] * 8.0) / interval
+        bin_start = (first + np.arange(pps.size) * interval_ns) / NSEC_PER_SEC
+        return bin_start, pps, bps
+
+    def inter_arrival(self) -> Dict[str, float]:
+        """Statistics of the gaps between consecutive packets in file order, in seconds.
+
+        A negative minimum means the capture holds packets out of timestamp order.
+        """
+        gaps = np.diff(self.records["timestamp_ns"]) / NSEC_PER_SEC
+        if not gaps.size:
+            return dict.fromkeys(("mean", "std", "min", "p50", "p90", "p99", "max"), 0.0)
+        p50, p90, p99 = np.percentile(gaps, [50, 90, 99])
+        return {
+            "mean": float(gaps.mean()),
+            "std": float(gaps.std()),
+            "min": float(gaps.min()),
+            "p50": float(p50),
+            "p90": float(p90),
+            "p99": float(p99),
+            "max": float(gaps.max()),
+        }
+
+    def protocol_counts(self) -> Dict[str, Dict[str, int]]:
+        """Packet counts by EtherType, IP protocol, ARP operation and DHCP message type.
+
+        Fields are read at fixed offsets of Ethernet captures (one 802.1Q tag is skipped,
+        IPv6 extension headers are not), and the DHCP message type only when option 53 is
+        the first option, as DHCP clients and servers in practice send it. Other link
+        types only report totals.
+        """
+        counts: Dict[str, Dict[str, int]] = {"ethertype": {}, "ip_proto": {}, "arp": {}, "dhcp": {}}
+        if self.linktype != LINKTYPE_ETHERNET or not self.packets:
+            return counts
+
+        ethertype, _ = self._packet_field(np.int64(12), 2)
+        vlan = ethertype == ETH_P_8021Q
+        l3 = np.where(vlan, ETH_HEADER_LEN + VLAN_TAG_LEN, ETH_HEADER_LEN).astype(np.int64)
+        inner, _ = self._packet_field(l3 - 2, 2, vlan)
+        ethertype = np.where(vlan, inner, ethertype)
+        ipv4 = ethertype == ETH_P_IP
+        ipv6 = ethertype == ETH_P_IPV6
+        arp = ethertype == ETH_P_ARP
+        counts["ethertype"] = {
+            "ipv4": int(ipv4.sum()),
+            "ipv6": int(ipv6.sum()),
+            "arp": int(arp.sum()),
+            "other": int((~(ipv4 | ipv6 | arp)).sum()),
+        }
+
+        proto4, has4 = self._packet_field(l3 + 9, 1, ipv4)
+        proto6, has6 = self._packet_field(l3 + 6, 1, ipv6)
+        proto = np.where(has4, proto4, proto6)
+        has_proto = has4 | has6
+        known = np.zeros(self.packets, dtype=bool)
+        for number, name in IP_PROTOCOLS.items():
+            matches = has_proto & (proto == number)
+            known |= matches
+            if matches.any():
+                counts["ip_proto"][name] = int(matches.sum())
+        if (has_proto & ~known).any():
+            counts["ip_proto"]["other"] = int((has_proto & ~known).sum())
+
+        op, has_op = self._packet_field(l3 + 6, 2, arp)
+        for number, name in ARP_OPS.items():
+            counts["arp"][name] = int((has_op & (op == number)).sum())
+        counts["arp"]["other"] = int((has_op & ~np.isin(op, list(ARP_OPS))).sum())
+
+        # IPv4/UDP to or from the BOOTP ports, first fragment only.
+        udp = has4 & (proto4 == 17)
+        frag, _ = self._packet_field(l3 + 6, 2, udp)
+        udp &= (frag & 0x1FFF) == 0
+        ihl, _ = self._packet_field(l3, 1, udp)
+        l4 = l3 + (ihl.astype(np.int64) & 0x0F) * 4
+        sport, has_ports = self._packet_field(l4, 2, udp)
+        dport, _ = self._packet_field(l4 + 2, 2, udp)
+        bootp = has_ports & np.isin(sport, BOOTP_PORTS) & np.isin(dport, BOOTP_PORTS)
+        options = l4 + 8 + BOOTP_COOKIE_OFFSET + 4
+        cookie, has_cookie = self._packet_field(options - 4, 4, bootp)
+        dhcp = has_cookie & (cookie == BOOTP_COOKIE)
+        option, has_option = self._packet_field(options, 3, dhcp)
+        typed = has_option & (option >> np.uint64(8) == (DHCP_MESSAGE_TYPE << 8 | 1))
+        message = option & np.uint64(0xFF)
+        for number, name in DHCP_MESSAGE_TYPES.items():
+            counts["dhcp"][name] = int((typed & (message == number)).sum())
+        known = typed & np.isin(message, list(DHCP_MESSAGE_TYPES))
+        counts["dhcp"]["other"] = int((bootp & ~known).sum())
+        return counts
+
+    def summary(self, interval: float = 1.0) -> Dict[str, Any]:
+        """Everything :meth:`report` prints, as plain Python values (JSON-serialisable)."""
+        _, pps, bps = self.rate_series(interval)
+        timestamps = self.records["timestamp_ns"]
+        first = int(timestamps.min()) / NSEC_PER_SEC if self.packets else 0.0
+        last = int(timestamps.max()) / NSEC_PER_SEC if self.packets else 0.0
+        duration = last - first
+        total_bytes = int(self.records["length"].sum(dtype=np.uint64))
+        scale = self.scale
+        return {
+            "file": self.path,
+            "format": "pcapng" if self.pcapng else "pcap",
+            "linktype": self.linktype,
+            "nanosecond": self.nanosecond,
+            "packets": self.packets,
+            "bytes": total_bytes,
+            "captured_bytes": int(self.records["caplen"].sum(dtype=np.uint64)),
+            "first": first,
+            "last": last,
+            "duration": duration,
+            "interval": interval,
+            "avg_pps": self.packets / duration if duration > 0 else 0.0,
+            "avg_bps": total_bytes * 8 / duration if duration > 0 else 0.0,
+            "peak_pps": float(pps.max()) if pps.size else 0.0,
+            "peak_bps": float(bps.max()) if bps.size else 0.0,
+            "inter_arrival": self.inter_arrival(),
+            "protocols": self.protocol_counts(),
+            "sampling": {"mode": self.sampling, "rate": self.sample_rate, "scale": scale},
+            "estimated_packets": self.packets * scale if scale is not None else None,
+            "estimated_bytes": total_bytes * scale if scale is not None else None,
+        }
+
+    def write_series(self, path: str, interval: float = 1.0) -> None:
+        """Write the rate time series as CSV: ``start,pps,bps`` per bin."""
+        bin_start, pps, bps = self.rate_series(interval)
+        np.savetxt(
+            path,
+            np.column_stack([bin_start, pps, bps]),
+            fmt=["%.9f", "%.3f", "%.3f"],
+            delimiter=",",
+            header="start,pps,bps",
+            comments="",
+        )
+
+    def report(self, interval: float = 1.0) -> None:
+        """Print the summary of the capture."""
+        summary = self.summary(interval)
+        INFO(f"📊 Capture analysis → {BOLD}{BRIGHT_CYAN}{self.path}{RESET}")
+        INFO(
+            f"  Format: {BOLD}{BRIGHT_WHITE}{summary['format']}{RESET}"
+            f" (linktype {summary['linktype']},"
+            f" {'nanosecond' if self.nanosecond else 'microsecond'} timestamps)"
+        )
+        INFO(f"  Packets: {BOLD}{BRIGHT_WHITE}{summary['packets']:,}{RESET}")
+        if self.sampling != "none":
+            estimate = (
+                f"~{summary['estimated_packets']:,.0f} packets /"
+                f" {summary['estimated_bytes']:,.0f} bytes before sampling"
+                if self.scale is not None
+                else "counts are not scaled"
+            )
+            INFO(
+                f"  Sampling: {BOLD}{BRIGHT_WHITE}{self.sampling}{RESET}"
+                f" rate {self.sample_rate:,} ({estimate})"
+            )
+        INFO(f"  Bytes on the wire: {BOLD}{BRIGHT_WHITE}{summary['bytes']:,}{RESET}")
+        INFO(f"  Duration: {BOLD}{BRIGHT_WHITE}{summary['duration']:.3f}s{RESET}")
+        INFO(
+            f"  Rate: {BOLD}{BRIGHT_WHITE}{summary['avg_pps']:,.1f}{RESET} pps /"
+            f" {BOLD}{BRIGHT_WHITE}{summary['avg_bps'] / 1e6:,.3f}{RESET} Mbit/s average,"
+            f" {BOLD}{BRIGHT_WHITE}{summary['peak_pps']:,.1f}{RESET} pps /"
+            f" {BOLD}{BRIGHT_WHITE}{summary['peak_bps'] / 1e6:,.3f}{RESET} Mbit/s peak"
+            f" ({interval:g}s bins)"
+        )
+        gaps = summary["inter_arrival"]
+        INFO(
+            "  Inter-arrival: "
+            + ", ".join(
+                f"{key} {BOLD}{BRIGHT_WHITE}{gaps[key] * 1e6:,.1f}µs{RESET}"
+                for key in ("mean", "p50", "p90", "p99", "max")
+            )
+        )
+        for group, counts in summary["protocols"].items():
+            shown = {name: count for name, count in counts.items() if count}
+            if shown:
+                INFO(
+                    f"  {group}: "
+                    + ", ".join(
+                        f"{name} {BOLD}{BRIGHT_WHITE}{count:,}{RESET}"
+                        for name, count in shown.items()
+                    )
+                )
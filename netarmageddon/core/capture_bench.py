@@ -0,0 +1,534 @@
+"""Throughput and drop benchmarks of the capture backend (``libtraffic.so``).
+
+Every backend mode (file format, compression, headers-only, sampling, index, flow table,
+writer policy, immediate mode, fanout) is measured in up to two phases:
+
+* offline: a generated pcap is replayed at full speed (``replay_speed=0``) through the
+  whole capture path. It needs no root or network and is steady enough to compare
+  across commits;
+* live: a separate process sends frames over a veth pair at a sweep of rates while the
+  peer is captured, giving the drop rate at each rate and the highest rate captured
+  without loss. It needs root to create the pair.
+
+CPU per packet is the user plus system time of this process (every capture thread) over
+the packets captured; the live sender runs in its own process and is not counted.
+Results are written as JSON, and :func:`compare_results` lists the regressions of one run
+against an earlier one.
+"""
+
+import ctypes
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import socket
+import struct
+import subprocess
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+from netarmageddon.core.mapper import (
+    COMPRESSION,
+    FILE_FORMATS,
+    SAMPLING,
+    TrafficCaptureConfig,
+    TrafficCaptureStats,
+    create_capture_handle,
+)
+from netarmageddon.core.mapper import _lib as _traffic_lib
+from netarmageddon.utils.output_manager import (
+    BOLD,
+    BRIGHT_CYAN,
+    BRIGHT_WHITE,
+    BRIGHT_YELLOW,
+    INFO,
+    RESET,
+    SUCCESS,
+    WARNING,
+)
+
+BENCH_VERSION = 1  # JSON layout version
+DEFAULT_PACKETS = 500_000
+DEFAULT_FRAME_LEN = 128
+DEFAULT_ROUNDS = 3  # offline runs per mode; the fastest one counts
+DEFAULT_RATES = (10_000, 50_000, 100_000, 200_000, 400_000)
+DEFAULT_STEP_SECONDS = 2.0
+DEFAULT_TOLERANCE = 0.1
+LOSS_THRESHOLD = 0.001  # a live rate is sustained when at most this share is lost
+SENDER_SHORTFALL = 0.9  # a step reaching less of its target rate was sender-limited
+VETH_PAIR = ("nabench0", "nabench1")  # sender end, capture end
+BENCH_PORT = 9  # discard
+BENCH_FILTER = f"udp dst port {BENCH_PORT}"
+SNAPLEN = 65535
+FLOW_VARIANTS = 1024  # distinct source ports, so flow hashing and fanout see many flows
+SETTLE_SECONDS = 0.2  # between starting a live capture and sending
+DRAIN_SECONDS = 1.2  # after sending, so the kernel retires the last ring block
+START = 1_700_000_000
+ETHERTYPE_IPV4 = 0x0800
+IPPROTO_UDP = 17
+ETH_HEADER_LEN = 14
+IP_HEADER_LEN = 20
+UDP_HEADER_LEN = 8
+MIN_FRAME_LEN = ETH_HEADER_LEN + IP_HEADER_LEN + UDP_HEADER_LEN
+PCAP_HEADER = struct.Struct("<IHHiIII")
+PCAP_RECORD = struct.Struct("<IIII")
+PCAP_MAGIC_USEC = 0xA1B2C3D4
+LINKTYPE_ETHERNET = 1
+USEC_PER_SEC = 1_000_000
+NSEC_PER_SEC = 1_000_000_000
+BYTES_PER_MB = 1_000_000
+
+
+class Mode(NamedTuple):
+    name: str
+    options: Dict[str, Any]  # TrafficCaptureConfig fields
+    suffix: str = ".pcap"  # output file name suffix
+    offline: bool = True  # benchmarked by replay
+    live: bool = False  # benchmarked on the veth pair
+    flows: bool = False  # also writes a flow table
+
+
+MODES = (
+    Mode("pcap", {}, live=True),
+    Mode("pcapng", {"format": FILE_FORMATS["pcapng"]}, ".pcapng", live=True),
+    Mode("gzip", {"compression": COMPRESSION["gzip"]}, ".pcap.gz", live=True),
+    Mode("zstd", {"compression": COMPRESSION["zstd"]}, ".pcap.zst"),
+    Mode("headers-only", {"headers_only": True}, live=True),
+    Mode("sampled", {"sampling": SAMPLING["count"], "sample_rate": 10}),
+    Mode("index", {"index_bucket_seconds": 1}),
+    Mode("flows", {}, flows=True),
+    Mode("writer-block", {"writer_block": True}),
+    Mode("immediate", {"immediate_mode": True}, offline=False, live=True),
+    Mode("fanout-2", {"fanout_workers": 2}, offline=False, live=True),
+)
+
+
+def _checksum(header: bytes) -> int:
+    total = sum(struct.unpack(f"!{len(header) // 2}H", header))
+    while total >> 16:
+        total = (total & 0xFFFF) + (total >> 16)
+    return ~total & 0xFFFF
+
+
+def bench_frames(frame_len: int = DEFAULT_FRAME_LEN) -> List[bytes]:
+    """Ethernet/IPv4/UDP frames of ``frame_len`` bytes to BENCH_PORT, one per flow."""
+    if frame_len < MIN_FRAME_LEN:
+        raise ValueError(f"frame_len must be >= {MIN_FRAME_LEN}")
+    ip_len = frame_len - ETH_HEADER_LEN
+    ether = b"\x02\x00\x00\x00\x00\x02" + b"\x02\x00\x00\x00\x00\x01"
+    ether += struct.pack("!H", ETHERTYPE_IPV4)
+    payload = bytes(ip_len - IP_HEADER_LEN - UDP_HEADER_LEN)
+    frames = []
+    for i in range(FLOW_VARIANTS):
+        ip = struct.pack(
+            "!BBHHHBBH4s4s",
+            0x45,
+            0,
+            ip_len,
+            i,
+            0,
+            64,
+            IPPROTO_UDP,
+            0,
+            bytes([10, 0, 0, 1]),
+            bytes([10, 0, 0, 2]),
+        )
+        ip = ip[:10] + struct.pack("!H", _checksum(ip)) + ip[12:]
+        udp = struct.pack("!HHHH", 1024 + i, BENCH_PORT, ip_len - IP_HEADER_LEN, 0)
+        frames.append(ether + ip + udp + payload)
+    return frames
+
+
+def write_bench_pcap(path: str, packets: int, frame_len: int = DEFAULT_FRAME_LEN) -> None:
+    """Write ``packets`` bench frames 1 µs apart as a microsecond pcap."""
+    frames = bench_frames(frame_len)
+    with open(path, "wb") as out:
+        out.write(PCAP_HEADER.pack(PCAP_MAGIC_USEC, 2, 4, 0, 0, SNAPLEN, LINKTYPE_ETHERNET))
+        for i in range(packets):
+            out.write(
+                PCAP_RECORD.pack(START + i // USEC_PER_SEC, i % USEC_PER_SEC, frame_len, frame_len)
+            )
+            out.write(frames[i % FLOW_VARIANTS])
+
+
+def _config(mode: Mode, out_dir: str, **fields: Any) -> TrafficCaptureConfig:
+    cfg = TrafficCaptureConfig(
+        interface=b"",
+        bpf_filter=BENCH_FILTER.encode(),
+        output_file=os.path.join(out_dir, mode.name + mode.suffix).encode(),
+        snaplen=SNAPLEN,
+        tstamp_type=b"",
+        input_file=b"",
+        flow_file=b"",
+    )
+    if mode.flows:
+        cfg.flow_file = os.path.join(out_dir, mode.name + ".csv").encode()
+    for name, value in {**mode.options, **fields}.items():
+        setattr(cfg, name, value)
+    return cfg
+
+
+def _stats(handle: int) -> Dict[str, int]:
+    stats = TrafficCaptureStats()
+    _traffic_lib.traffic_get_stats(handle, ctypes.byref(stats))
+    return {name: getattr(stats, name) for name, _ in TrafficCaptureStats._fields_}
+
+
+def _cpu_seconds() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _disk_bytes(out_dir: str) -> int:
+    """Bytes written to ``out_dir`` by the last run, which is then emptied."""
+    total = 0
+    for name in os.listdir(out_dir):
+        path = os.path.join(out_dir, name)
+        total += os.path.getsize(path)
+        os.remove(path)
+    return total
+
+
+def _error(handle: int) -> str:
+    err = _traffic_lib.traffic_get_last_error(handle)
+    return err.decode() if err else "unknown"
+
+
+def run_offline(
+    mode: Mode, source: str, out_dir: str, rounds: int = DEFAULT_ROUNDS
+) -> Dict[str, Any]:
+    """Replay ``source`` through ``mode`` as fast as possible; the fastest round counts."""
+    runs = []
+    handle = create_capture_handle()
+    try:
+        for _ in range(rounds):
+            cfg = _config(mode, out_dir, input_file=source.encode(), replay_speed=0.0)
+            cpu = _cpu_seconds()
+            began = time.perf_counter()
+            ret = _traffic_lib.traffic_capture_start(handle, ctypes.byref(cfg))
+            seconds = time.perf_counter() - began
+            cpu = _cpu_seconds() - cpu
+            disk = _disk_bytes(out_dir)
+            if ret != 0:
+                return {"mode": mode.name, "error": _error(handle)}
+            stats = _stats(handle)
+            packets = stats["ps_recv"]
+            dropped = stats["writer_drops"] + stats["stream_drops"]
+            runs.append(
+                {
+                    "mode": mode.name,
+                    "packets": packets,
+                    "packets_written": stats["packets_written"],
+                    "seconds": seconds,
+                    "pps": packets / seconds if seconds > 0 else 0.0,
+                    "disk_bytes_per_second": disk / seconds if seconds > 0 else 0.0,
+                    "cpu_ns_per_packet": cpu * NSEC_PER_SEC / packets if packets else 0.0,
+                    "drop_rate": dropped / packets if packets else 0.0,
+                }
+            )
+    finally:
+        _traffic_lib.traffic_capture_destroy(handle)
+    return max(runs, key=lambda run: run["pps"])
+
+
+def _send_frames(
+    interface: str, frames: List[bytes], rate: int, seconds: float, results: Any
+) -> None:
+    """Sender process: send ``frames`` round-robin on ``interface`` at ``rate`` per second."""
+    sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW)
+    sock.bind((interface, 0))
+    sent = failed = 0
+    start = now = time.perf_counter()
+    while now - start < seconds:
+        due = int((now - start) * rate) + 1
+        while sent + failed < due:
+            try:
+                sock.send(frames[(sent + failed) % len(frames)])
+                sent += 1
+            except OSError:  # ENOBUFS: the device queue is full
+                failed += 1
+        now = time.perf_counter()
+    sock.close()
+    results.put((sent, now - start))
+
+
+@contextmanager
+def veth_pair(names: Tuple[str, str] = VETH_PAIR) -> Iterator[Tuple[str, str]]:
+    """Create and bring up a veth pair for the duration of the block."""
+    subprocess.run(
+        ["ip", "link", "add", names[0], "type", "veth", "peer", "name", names[1]],
+        check=True,
+        capture_output=True,
+    )
+    try:
+        for name in names:
+            subprocess.run(["ip", "link", "set", name, "up"], check=True, capture_output=True)
+        yield names
+    finally:
+        subprocess.run(["ip", "link", "del", names[0]], capture_output=True)
+
+
+def run_live_step(
+    mode: Mode,
+    pair: Tuple[str, str],
+    out_dir: str,
+    frames: List[bytes],
+    rate: int,
+    seconds: float = DEFAULT_STEP_SECONDS,
+) -> Dict[str, Any]:
+    """Capture ``pair[1]`` in ``mode`` while ``pair[0]`` sends ``rate`` frames/s."""
+    handle = create_capture_handle()
+    cfg = _config(mode, out_dir, interface=pair[1].encode(), promisc=True)
+    result: List[int] = []
+    capture = threading.Thread(
+        target=lambda: result.append(_traffic_lib.traffic_capture_start(handle, ctypes.byref(cfg))),
+        name="BenchCaptureThread",
+    )
+    context = multiprocessing.get_context("fork")
+    queue = context.Queue()
+    sender = context.Process(
+        target=_send_frames, args=(pair[0], frames, rate, seconds, queue), daemon=True
+    )
+    try:
+        cpu = _cpu_seconds()
+        capture.start()
+        time.sleep(SETTLE_SECONDS)
+        sender.start()
+        sent, send_seconds = queue.get(timeout=seconds + 10)
+        sender.join()
+        time.sleep(DRAIN_SECONDS)
+        _traffic_lib.traffic_capture_stop(handle)
+        capture.join()
+        cpu = _cpu_seconds() - cpu
+        disk = _disk_bytes(out_dir)
+        if result != [0]:
+            return {"rate": rate, "error": _error(handle)}
+        stats = _stats(handle)
+    finally:
+        if sender.is_alive():
+            sender.kill()
+        _traffic_lib.traffic_capture_destroy(handle)
+
+    # Sampled-out packets reached the capture; only what never made it is lost.
+    captured = stats["packets_written"] + stats["sampled_out"]
+    sent_pps = sent / send_seconds if send_seconds > 0 else 0.0
+    return {
+        "rate": rate,
+        "sent": sent,
+        "sent_pps": sent_pps,
+        "sender_limited": sent_pps < rate * SENDER_SHORTFALL,
+        "captured": captured,
+        "kernel_drops": stats["ps_drop"] + stats["ps_ifdrop"],
+        "writer_drops": stats["writer_drops"],
+        "drop_rate": max(sent - captured, 0) / sent if sent else 0.0,
+        "disk_bytes_per_second": disk / send_seconds if send_seconds > 0 else 0.0,
+        "cpu_ns_per_packet": cpu * NSEC_PER_SEC / captured if captured else 0.0,
+    }
+
+
+def run_live(
+    mode: Mode,
+    pair: Tuple[str, str],
+    out_dir: str,
+    frames: List[bytes],
+    rates: Sequence[int] = DEFAULT_RATES,
+    seconds: float = DEFAULT_STEP_SECONDS,
+) -> Dict[str, Any]:
+    """Sweep ``rates`` in ``mode``; the highest sent rate within LOSS_THRESHOLD is sustained."""
+    steps = []
+    for rate in rates:
+        step = run_live_step(mode, pair, out_dir, frames, rate, seconds)
+        steps.append(step)
+        if "error" in step:
+            return {"mode": mode.name, "error": step["error"], "steps": steps}
+    sustained = [step["sent_pps"] for step in steps if step["drop_rate"] <= LOSS_THRESHOLD]
+    return {"mode": mode.name, "max_sustainable_pps": max(sustained, default=0.0), "steps": steps}
+
+
+def _commit() -> Optional[str]:
+    try:
+        result = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return result.stdout.strip()
+
+
+def run_benchmarks(
+    output: str,
+    packets: int = DEFAULT_PACKETS,
+    frame_len: int = DEFAULT_FRAME_LEN,
+    rounds: int = DEFAULT_ROUNDS,
+    live: bool = True,
+    rates: Sequence[int] = DEFAULT_RATES,
+    step_seconds: float = DEFAULT_STEP_SECONDS,
+    modes: Optional[Sequence[str]] = None,
+) -> Dict[str, Any]:
+    """Run the offline and (as root) live benchmarks and write the results to ``output``."""
+    known = {mode.name for mode in MODES}
+    unknown = sorted(set(modes or ()) - known)
+    if unknown:
+        raise ValueError(f"unknown modes {', '.join(unknown)}; known: {', '.join(sorted(known))}")
+    if packets <= 0 or rounds <= 0 or step_seconds <= 0 or any(rate <= 0 for rate in rates):
+        raise ValueError("packets, rounds, rates and step_seconds must be positive")
+    selected = [mode for mode in MODES if not modes or mode.name in modes]
+    results: Dict[str, Any] = {
+        "version": BENCH_VERSION,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "commit": _commit(),
+        "host": {
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "python": platform.python_version(),
+        },
+        "settings": {
+            "packets": packets,
+            "frame_len": frame_len,
+            "rounds": rounds,
+            "rates": list(rates),
+            "step_seconds": step_seconds,
+        },
+    }
+
+    workdir = tempfile.mkdtemp(prefix="netarmageddon-bench-")
+    out_dir = os.path.join(workdir, "out")
+    os.mkdir(out_dir)
+    try:
+        source = os.path.join(workdir, "bench.pcap")
+        write_bench_pcap(source, packets, frame_len)
+        results["offline"] = [
+            run_offline(mode, source, out_dir, rounds) for mode in selected if mode.offline
+        ]
+        live_modes = [mode for mode in selected if mode.live]
+        if not live or not live_modes:
+            results["live"] = {"skipped": "disabled"}
+        elif os.geteuid() != 0:
+            results["live"] = {"skipped": "needs root to create a veth pair"}
+        else:
+            frames = bench_frames(frame_len)
+            try:
+                with veth_pair() as pair:
+                    results["live"] = {
+                        "interface": pair[1],
+                        "modes": [
+                            run_live(mode, pair, out_dir, frames, rates, step_seconds)
+                            for mode in live_modes
+                        ],
+                    }
+            except subprocess.CalledProcessError as e:
+                results["live"] = {"skipped": f"cannot create a veth pair: {e.stderr.strip()}"}
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    with open(output, "w") as out:
+        json.dump(results, out, indent=2)
+    return results
+
+
+def _change(old: float, new: float) -> float:
+    return (new - old) / old if old else 0.0
+
+
+def compare_results(
+    baseline: Dict[str, Any], current: Dict[str, Any], tolerance: float = DEFAULT_TOLERANCE
+) -> List[str]:
+    """Regressions of ``current`` against ``baseline`` beyond ``tolerance`` (a fraction).
+
+    Offline pps and live max sustainable pps regress when they fall by more than
+    ``tolerance``, CPU per packet when it rises by more, and the offline drop rate when it
+    rises by more than LOSS_THRESHOLD. Modes missing from either run or failed in one are
+    skipped.
+    """
+    regressions = []
+    old_offline = {r["mode"]: r for r in baseline.get("offline", []) if "error" not in r}
+    for new in current.get("offline", []):
+        old = old_offline.get(new["mode"])
+        if old is None or "error" in new:
+            continue
+        pps = _change(old["pps"], new["pps"])
+        if pps < -tolerance:
+            regressions.append(
+                f"offline {new['mode']}: {old['pps']:,.0f} → {new['pps']:,.0f} pps ({pps:+.1%})"
+            )
+        cpu = _change(old["cpu_ns_per_packet"], new["cpu_ns_per_packet"])
+        if cpu > tolerance:
+            regressions.append(
+                f"offline {new['mode']}: {old['cpu_ns_per_packet']:,.0f} → "
+                f"{new['cpu_ns_per_packet']:,.0f} ns CPU per packet ({cpu:+.1%})"
+            )
+        if new["drop_rate"] > old["drop_rate"] + LOSS_THRESHOLD:
+            regressions.append(
+                f"offline {new['mode']}: drop rate {old['drop_rate']:.2%} → {new['drop_rate']:.2%}"
+            )
+    old_live = {r["mode"]: r for r in baseline.get("live", {}).get("modes", []) if "error" not in r}
+    for new in current.get("live", {}).get("modes", []):
+        old = old_live.get(new["mode"])
+        if old is None or "error" in new:
+            continue
+        pps = _change(old["max_sustainable_pps"], new["max_sustainable_pps"])
+        if pps < -tolerance:
+            regressions.append(
+                f"live {new['mode']}: {old['max_sustainable_pps']:,.0f} → "
+                f"{new['max_sustainable_pps']:,.0f} pps sustained ({pps:+.1%})"
+            )
+    return regressions
+
+
+def report_bench(results: Dict[str, Any], output: str) -> None:
+    """Print the results of :func:`run_benchmarks`."""
+    settings = results["settings"]
+    INFO(
+        f"  Offline replay of {BOLD}{BRIGHT_WHITE}{settings['packets']:,}{RESET} "
+        f"{settings['frame_len']}-byte frames, best of {settings['rounds']}:"
+    )
+    for result in results["offline"]:
+        if "error" in result:
+            WARNING(f"{result['mode']}: {result['error']}")
+            continue
+        INFO(
+            f"    {result['mode']:<13} {BOLD}{BRIGHT_YELLOW}{result['pps']:>12,.0f}{RESET} pps  "
+            f"{result['disk_bytes_per_second'] / BYTES_PER_MB:>8.1f} MB/s  "
+            f"{result['cpu_ns_per_packet']:>7,.0f} ns CPU/packet  "
+            f"drops {result['drop_rate']:.2%}"
+        )
+    live = results["live"]
+    if "skipped" in live:
+        INFO(f"  Live capture skipped: {live['skipped']}")
+    else:
+        INFO(f"  Live capture on {BOLD}{BRIGHT_CYAN}{live['interface']}{RESET}:")
+        for result in live["modes"]:
+            if "error" in result:
+                WARNING(f"{result['mode']}: {result['error']}")
+                continue
+            sweep = ", ".join(
+                f"{step['sent_pps']:,.0f}{'*' if step['sender_limited'] else ''} "
+                f"→ {step['drop_rate']:.2%}"
+                for step in result["steps"]
+            )
+            INFO(
+                f"    {result['mode']:<13} {BOLD}{BRIGHT_YELLOW}"
+                f"{result['max_sustainable_pps']:>12,.0f}{RESET} pps sustained  "
+                f"(pps → drops: {sweep})"
+            )
+        INFO("    * the sender fell short of the target rate")
+    SUCCESS(f"Benchmark results → {BOLD}{BRIGHT_CYAN}{output}{RESET}")
+
+
+def report_regressions(regressions: List[str], baseline: str) -> None:
+    """Print the outcome of :func:`compare_results` against *baseline*."""
+    if not regressions:
+        SUCCESS(f"No regressions against {BOLD}{BRIGHT_CYAN}{baseline}{RESET}")
+        return
+    for regression in regressions:
+        WARNING(f"Regression: {regression}")
+    WARNING(f"{len(regressions)} regression(s) against {baseline}")
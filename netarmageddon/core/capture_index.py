@@ -0,0 +1,194 @@
+"""Reader for the ``<capture>.idx`` sidecar written next to indexed captures.
+
+The sidecar maps coarse time buckets and flows to offsets in the capture file, so a time
+window or a single conversation can be read without scanning the whole capture. Its layout
+is documented in ``traffic_c/sidecar.h``.
+"""
+
+import bisect
+import gzip
+import ipaddress
+import os
+import struct
+from typing import BinaryIO, Dict, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+from netarmageddon.core.mapper import COMPRESSED_SUFFIXES
+from netarmageddon.core.mapper import _lib as _traffic_lib
+
+INDEX_SUFFIX = ".idx"
+INDEX_MAGIC = b"NAIX"
+INDEX_VERSION = 1
+# sidecar_header_t: magic, version, tsresol, format, linktype, bucket_seconds, reserved.
+INDEX_HEADER = struct.Struct("=4sHBBIII")
+# sidecar_entry_t: type, reserved, a, b, c, d.
+INDEX_ENTRY = struct.Struct("=IIQQQQ")
+ENTRY_TIME = 1
+ENTRY_FLOW = 2
+ENTRY_END = 3
+
+FORMAT_PCAPNG = 2  # traffic_format_t
+PCAP_RECORD = struct.Struct("=IIII")  # ts_sec, ts_frac, caplen, len
+PCAPNG_EPB = struct.Struct("=IIIIIII")  # type, total_len, if_id, ts_high, ts_low, caplen, len
+PCAPNG_EPB_TYPE = 6
+
+FNV_OFFSET = 0xCBF29CE484222325
+FNV_PRIME = 0x100000001B3
+MASK_64 = (1 << 64) - 1
+
+Address = Union[str, ipaddress.IPv4Address, ipaddress.IPv6Address]
+
+
+class FlowSpan(NamedTuple):
+    first_offset: int
+    last_offset: int
+    packets: int
+
+
+def _fnv1a(value: int, data: bytes) -> int:
+    for byte in data:
+        value = ((value ^ byte) * FNV_PRIME) & MASK_64
+    return value
+
+
+def _address_bytes(address: Address) -> bytes:
+    ip = ipaddress.ip_address(address)
+    if ip.version == 4:
+        return ipaddress.IPv6Address(f"::ffff:{ip}").packed
+    return ip.packed
+
+
+def flow_hash(proto: int, src: Address, sport: int, dst: Address, dport: int) -> int:
+    """Hash of a 5-tuple as stored in FLOW entries; both directions hash the same.
+
+    Mirrors ``flow_hash()`` in ``traffic_c/flow.c``. Use port 0 for protocols other than
+    TCP, UDP and SCTP.
+    """
+    ends = sorted([(_address_bytes(src), sport), (_address_bytes(dst), dport)])
+    value = _fnv1a(FNV_OFFSET, bytes([proto]))
+    for address, port in ends:
+        value = _fnv1a(value, address + port.to_bytes(2, "big"))
+    return value or 1
+
+
+class CaptureIndex:
+    """Seek into a capture through its ``.idx`` sidecar.
+
+    Offsets in the sidecar refer to the uncompressed capture, so gzip captures are read
+    through :class:`gzip.GzipFile` (seeking decompresses up to the offset); zstd captures
+    are not supported. A sidecar cut short by an unclean stop still holds every time bucket
+    flushed before the stop but no flow entries: :attr:`complete` is then False and
+    :meth:`iter_flow` falls back to scanning the file.
+    """
+
+    def __init__(self, capture_path: str) -> None:
+        self.capture_path = capture_path
+        self.time_buckets: List[Tuple[int, int, int]] = []  # (start, offset, packet number)
+        self.flows: Dict[int, FlowSpan] = {}
+        self.packets = 0
+        self.unindexed_packets = 0
+        self.complete = False
+
+        with open(capture_path + INDEX_SUFFIX, "rb") as index:
+            data = index.read()
+        if len(data) < INDEX_HEADER.size:
+            raise ValueError(f"{capture_path}{INDEX_SUFFIX}: truncated header")
+        magic, version, tsresol, file_format, linktype, bucket_seconds, _ = (
+            INDEX_HEADER.unpack_from(data)
+        )
+        if magic != INDEX_MAGIC or version != INDEX_VERSION:
+            raise ValueError(f"{capture_path}{INDEX_SUFFIX}: not a version 1 capture index")
+        self.nanosecond = tsresol == 9
+        self.pcapng = file_format == FORMAT_PCAPNG
+        self.linktype = linktype
+        self.bucket_seconds = bucket_seconds
+
+        # A partial trailing entry (unclean stop) is ignored.
+        end = len(data) - (len(data) - INDEX_HEADER.size) % INDEX_ENTRY.size
+        for kind, _, a, b, c, d in INDEX_ENTRY.iter_unpack(data[INDEX_HEADER.size : end]):
+            if kind == ENTRY_TIME:
+                self.time_buckets.append((a, b, c))
+            elif kind == ENTRY_FLOW:
+                self.flows[a] = FlowSpan(b, c, d)
+            elif kind == ENTRY_END:
+                self.unindexed_packets, self.packets = b, c
+                self.complete = True
+        self._bucket_starts = [start for start, _, _ in self.time_buckets]
+
+    def offset_for_time(self, timestamp: float) -> Optional[int]:
+        """File offset of the first packet of the bucket holding ``timestamp``.
+
+        Returns the first bucket for earlier timestamps and None for an empty capture.
+        """
+        if not self.time_buckets:
+            return None
+        pos = max(bisect.bisect_right(self._bucket_starts, int(timestamp)) - 1, 0)
+        return self.time_buckets[pos][1]
+
+    def iter_time_range(self, start: float, end: float) -> Iterator[Tuple[float, bytes]]:
+        """Yield ``(timestamp, packet)`` for packets with ``start <= timestamp < end``."""
+        offset = self.offset_for_time(start)
+        if offset is None:
+            return
+        for _, timestamp, packet in self._iter_records(offset):
+            if timestamp >= end:
+                break
+            if timestamp >= start:
+                yield timestamp, packet
+
+    def iter_flow(
+        self, proto: int, src: Address, sport: int, dst: Address, dport: int
+    ) -> Iterator[Tuple[float, bytes]]:
+        """Yield ``(timestamp, packet)`` for both directions of one conversation."""
+        wanted = flow_hash(proto, src, sport, dst, dport)
+        span = self.flows.get(wanted)
+        if span is not None:
+            first, last = span.first_offset, span.last_offset
+        elif self.complete and not self.unindexed_packets:
+            return
+        elif self.time_buckets:
+            first, last = self.time_buckets[0][1], -1
+        else:
+            return
+        for offset, timestamp, packet in self._iter_records(first):
+            if last >= 0 and offset > last:
+                break
+            if _traffic_lib.traffic_flow_hash(self.linktype, packet, len(packet)) == wanted:
+                yield timestamp, packet
+
+    def _open_capture(self) -> BinaryIO:
+        suffix = os.path.splitext(self.capture_path)[1]
+        compression = COMPRESSED_SUFFIXES.get(suffix, "none")
+        if compression == "gzip":
+            return gzip.open(self.capture_path, "rb")  # type: ignore[return-value]
+        if compression != "none":
+            raise ValueError(f"cannot seek in {compression} captures: {self.capture_path}")
+        return open(self.capture_path, "rb")
+
+    def _iter_records(self, offset: int) -> Iterator[Tuple[int, float, bytes]]:
+        """Yield ``(offset, timestamp, packet)`` from ``offset`` to the end of the file."""
+        scale = 1e-9 if self.nanosecond else 1e-6
+        with self._open_capture() as capture:
+            capture.seek(offset)
+            while True:
+                if self.pcapng:
+                    header = capture.read(PCAPNG_EPB.size)
+                    if len(header) < PCAPNG_EPB.size:
+                        return
+                    kind, total_len, _, ts_high, ts_low, caplen, _ = PCAPNG_EPB.unpack(header)
+                    body = capture.read(total_len - PCAPNG_EPB.size)
+                    if len(body) < total_len - PCAPNG_EPB.size:
+                        return
+                    if kind == PCAPNG_EPB_TYPE:
+                        timestamp = ((ts_high << 32) | ts_low) * scale
+                        yield offset, timestamp, body[:caplen]
+                    offset += total_len
+                else:
+                    header = capture.read(PCAP_RECORD.size)
+                    if len(header) < PCAP_RECORD.size:
+                        return
+                    ts_sec, ts_frac, caplen, _ = PCAP_RECORD.unpack(header)
+                    packet = capture.read(caplen)
+                    if len(packet) < caplen:
+                        return
+                    yield offset, ts_sec + ts_frac * scale, packet
+                    offset += PCAP_RECORD.size + caplen
@@ -0,0 +1,381 @@
+"""Streaming timestamp merge of several capture files into one.
+
+Rotated or per-interface captures are merged with a k-way heap merge: each input is read
+record by record and only the next packet of every input is held in memory, so merging
+does not depend on the size of the captures. Inputs are expected to be in timestamp order
+each (as captured); packets that are not are written where they are met and counted.
+"""
+
+import gzip
+import heapq
+import os
+import struct
+from typing import BinaryIO, Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+from netarmageddon.core.capture_analyzer import (
+    PCAP_MAGIC_NSEC,
+    PCAP_MAGIC_USEC,
+    PCAPNG_BYTE_ORDER,
+    PCAPNG_IDB_TYPE,
+    PCAPNG_IF_TSRESOL,
+    PCAPNG_SHB_TYPE,
+)
+from netarmageddon.core.capture_index import PCAPNG_EPB_TYPE
+from netarmageddon.core.mapper import COMPRESSED_SUFFIXES, FILE_FORMATS
+from netarmageddon.utils.output_manager import (
+    BOLD,
+    BRIGHT_CYAN,
+    BRIGHT_WHITE,
+    INFO,
+    RESET,
+    SUCCESS,
+    WARNING,
+)
+
+NSEC_PER_SEC = 1_000_000_000
+NSEC_PER_USEC = 1_000
+IO_BUFFER = 1 << 20  # per-file read/write buffer
+MAX_BLOCK_LEN = 1 << 26  # larger pcapng blocks are taken as corruption
+DEDUP_WINDOW = 0.001  # seconds; identical frames further apart are kept
+PCAPNG_OPT_ENDOFOPT = 0
+DEFAULT_SNAPLEN = 262144
+
+
+class Packet(NamedTuple):
+    timestamp_ns: int
+    length: int  # on the wire
+    data: bytes
+
+
+class MergeResult(NamedTuple):
+    files: int
+    packets_read: int
+    packets_written: int
+    duplicates: int  # identical consecutive frames dropped
+    out_of_order: int  # packets older than the one before them in their own input
+
+
+class CaptureReader:
+    """Sequential reader of one pcap or pcapng capture, in either byte order.
+
+    gzip captures are read through :mod:`gzip`; zstd ones are not supported. Simple packet
+    blocks carry no timestamp and are skipped, as is a record cut short at the end.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.linktype = -1
+        self.snaplen = 0
+        self.nanosecond = False
+        self.out_of_order = 0
+        self._order = "<"
+        self._pcapng = False
+        self._interfaces: List[Tuple[int, int, int]] = []  # (linktype, snaplen, units/s)
+        self._file = self._open()
+        try:
+            self._read_header()
+        except Exception:
+            self.close()
+            raise
+
+    def close(self) -> None:
+        self._file.close()
+
+    def _open(self) -> BinaryIO:
+        compression = COMPRESSED_SUFFIXES.get(os.path.splitext(self.path)[1], "none")
+        if compression == "gzip":
+            return gzip.open(self.path, "rb")  # type: ignore[return-value]
+        if compression != "none":
+            raise ValueError(f"cannot read {compression} captures: {self.path}")
+        return open(self.path, "rb", buffering=IO_BUFFER)
+
+    def _read_header(self) -> None:
+        head = self._file.read(8)
+        if len(head) < 8:
+            raise ValueError(f"{self.path}: not a capture file")
+        for order in "<>":
+            magic = struct.unpack(order + "I", head[:4])[0]
+            if magic in (PCAP_MAGIC_USEC, PCAP_MAGIC_NSEC):
+                rest = self._file.read(16)
+                if len(rest) < 16:
+                    raise ValueError(f"{self.path}: truncated pcap header")
+                self._order = order
+                self.nanosecond = magic == PCAP_MAGIC_NSEC
+                self.snaplen, network = struct.unpack(order + "8xII", rest)
+                self.linktype = network & 0xFFFF
+                return
+        if struct.unpack("<I", head[:4])[0] != PCAPNG_SHB_TYPE:
+            raise ValueError(f"{self.path}: not a pcap or pcapng file")
+        self._pcapng = True
+        self._read_shb(head)
+        # Interface blocks precede the packets that refer to them.
+        while not self._interfaces:
+            block = self._read_block()
+            if block is None:
+                return  # no interface: an empty capture
+            self._handle_block(*block)
+
+    def _read_shb(self, head: bytes) -> None:
+        """Parse the section header whose first 8 bytes are ``head``; sets the byte order."""
+        magic = self._file.read(4)
+        if len(magic) < 4:
+            raise ValueError(f"{self.path}: truncated section header")
+        for order in "<>":
+            if struct.unpack(order + "I", magic)[0] == PCAPNG_BYTE_ORDER:
+                self._order = order
+                break
+        else:
+            raise ValueError(f"{self.path}: bad pcapng byte-order magic")
+        total_len = struct.unpack(self._order + "I", head[4:8])[0]
+        if total_len < 28 or total_len > MAX_BLOCK_LEN or total_len % 4:
+            raise ValueError(f"{self.path}: bad section header length {total_len}")
+        self._file.read(total_len - 12)
+        self._interfaces = []  # interface ids are per section
+
+    def _read_block(self) -> Optional[Tuple[int, bytes]]:
+        """Next block as ``(type, body)`` without the length fields; None at the end."""
+        while True:
+            head = self._file.read(8)
+            if len(head) < 8:
+                return None
+            if struct.unpack("<I", head[:4])[0] == PCAPNG_SHB_TYPE:
+                self._read_shb(head)
+                continue
+            kind, total_len = struct.unpack(self._order + "II", head)
+            if total_len < 12 or total_len > MAX_BLOCK_LEN or total_len % 4:
+                raise ValueError(f"{self.path}: bad block length {total_len}")
+            body = self._file.read(total_len - 8)
+            if len(body) < total_len - 8:
+                return None
+            return kind, body[:-4]
+
+    def _handle_block(self, kind: int, body: bytes) -> Optional[Packet]:
+        order = self._order
+        if kind == PCAPNG_IDB_TYPE and len(body) >= 8:
+            linktype, _, snaplen = struct.unpack_from(order + "HHI", body)
+            units = 10**6
+            pos = 8
+            while pos + 4 <= len(body):
+                code, length = struct.unpack_from(order + "HH", body, pos)
+                if code == PCAPNG_OPT_ENDOFOPT:
+                    break
+                if code == PCAPNG_IF_TSRESOL and length >= 1:
+                    tsresol = body[pos + 4]
+                    units = 2 ** (tsresol & 0x7F) if tsresol & 0x80 else 10**tsresol
+                pos += 4 + (length + 3) // 4 * 4
+            if self.linktype < 0:
+                self.linktype = linktype
+            self.snaplen = max(self.snaplen, snaplen)
+            self.nanosecond |= units > 10**6
+            self._interfaces.append((linktype, snaplen, units))
+        elif kind == PCAPNG_EPB_TYPE and len(body) >= 20:
+            if_id, ts_high, ts_low, caplen, length = struct.unpack_from(order + "IIIII", body)
+            if if_id >= len(self._interfaces):
+                raise ValueError(f"{self.path}: packet of undeclared interface {if_id}")
+            linktype, _, units = self._interfaces[if_id]
+            if linktype != self.linktype:
+                raise ValueError(f"{self.path}: interfaces of different link types")
+            timestamp_ns = (ts_high << 32 | ts_low) * NSEC_PER_SEC // units
+            return Packet(timestamp_ns, length, body[20 : 20 + caplen])
+        return None
+
+    def __iter__(self) -> Iterator[Packet]:
+        previous = 0
+        try:
+            for packet in self._pcapng_packets() if self._pcapng else self._pcap_packets():
+                if packet.timestamp_ns < previous:
+                    self.out_of_order += 1
+                previous = packet.timestamp_ns
+                yield packet
+        finally:
+            self.close()
+
+    def _pcap_packets(self) -> Iterator[Packet]:
+        record = struct.Struct(self._order + "IIII")
+        frac_ns = 1 if self.nanosecond else NSEC_PER_USEC
+        read = self._file.read
+        while True:
+            header = read(record.size)
+            if len(header) < record.size:
+                return
+            ts_sec, ts_frac, caplen, length = record.unpack(header)
+            data = read(caplen)
+            if len(data) < caplen:
+                return
+            yield Packet(ts_sec * NSEC_PER_SEC + ts_frac * frac_ns, length, data)
+
+    def _pcapng_packets(self) -> Iterator[Packet]:
+        while True:
+            block = self._read_block()
+            if block is None:
+                return
+            packet = self._handle_block(*block)
+            if packet is not None:
+                yield packet
+
+
+class CaptureWriter:
+    """Native byte order pcap or pcapng output with one interface; gzip for a .gz name."""
+
+    def __init__(
+        self, path: str, pcapng: bool, linktype: int, snaplen: int, nanosecond: bool
+    ) -> None:
+        compression = COMPRESSED_SUFFIXES.get(os.path.splitext(path)[1], "none")
+        if compression not in ("none", "gzip"):
+            raise ValueError(f"cannot write {compression} captures: {path}")
+        self.pcapng = pcapng
+        self.nanosecond = nanosecond
+        self._raw = open(path, "wb", buffering=IO_BUFFER)
+        self._file: BinaryIO = self._raw
+        if compression == "gzip":
+            self._file = gzip.GzipFile(fileobj=self._raw, mode="wb")  # type: ignore[assignment]
+        if pcapng:
+            shb = struct.pack("=IIIHHqI", PCAPNG_SHB_TYPE, 28, PCAPNG_BYTE_ORDER, 1, 0, -1, 28)
+            tsresol = struct.pack("=HHB3x", PCAPNG_IF_TSRESOL, 1, 9 if nanosecond else 6)
+            options = tsresol + struct.pack("=HH", PCAPNG_OPT_ENDOFOPT, 0)
+            idb_len = 16 + len(options) + 4
+            self._file.write(shb)
+            self._file.write(
+                struct.pack("=IIHHI", PCAPNG_IDB_TYPE, idb_len, linktype, 0, snaplen)
+                + options
+                + struct.pack("=I", idb_len)
+            )
+        else:
+            magic = PCAP_MAGIC_NSEC if nanosecond else PCAP_MAGIC_USEC
+            self._file.write(struct.pack("=IHHiIII", magic, 2, 4, 0, 0, snaplen, linktype))
+
+    def write(self, packet: Packet) -> None:
+        caplen = len(packet.data)
+        if self.pcapng:
+            ticks = packet.timestamp_ns if self.nanosecond else packet.timestamp_ns // NSEC_PER_USEC
+            padding = -caplen % 4
+            total_len = 32 + caplen + padding
+            self._file.write(
+                struct.pack(
+                    "=IIIIIII",
+                    PCAPNG_EPB_TYPE,
+                    total_len,
+                    0,
+                    ticks >> 32,
+                    ticks & 0xFFFFFFFF,
+                    caplen,
+                    packet.length,
+                )
+            )
+            self._file.write(packet.data)
+            self._file.write(b"\0" * padding + struct.pack("=I", total_len))
+        else:
+            ts_sec, ts_ns = divmod(packet.timestamp_ns, NSEC_PER_SEC)
+            ts_frac = ts_ns if self.nanosecond else ts_ns // NSEC_PER_USEC
+            self._file.write(struct.pack("=IIII", ts_sec, ts_frac, caplen, packet.length))
+            self._file.write(packet.data)
+
+    def close(self) -> None:
+        self._file.close()
+        if self._file is not self._raw:
+            self._raw.close()
+
+
+def resolve_format(path: str, file_format: str = "auto") -> str:
+    """Output format for ``path``: "auto" picks pcapng for a .pcapng(.gz) name."""
+    if file_format not in FILE_FORMATS:
+        raise ValueError(f"file_format must be one of {', '.join(FILE_FORMATS)}")
+    if file_format != "auto":
+        return file_format
+    base, suffix = os.path.splitext(path)
+    if suffix not in COMPRESSED_SUFFIXES:
+        base = path
+    return "pcapng" if base.endswith(".pcapng") else "pcap"
+
+
+def merge_captures(
+    inputs: Sequence[str],
+    output: str,
+    file_format: str = "auto",
+    nanosecond: Optional[bool] = None,
+    dedup: bool = False,
+    dedup_window: float = DEDUP_WINDOW,
+) -> MergeResult:
+    """Merge ``inputs`` by timestamp into ``output`` and return the counts.
+
+    Every input stays open for the whole merge. All inputs must share a link type.
+    Timestamps keep nanosecond resolution when ``nanosecond`` is True, or when it is None
+    and any input has it; microsecond output truncates. With ``dedup``, a frame that is
+    byte-identical to the frame written just before it, and at most ``dedup_window``
+    seconds later, is dropped (the same packet seen by two captures). Packets with equal
+    timestamps keep the order of ``inputs``.
+    """
+    if not inputs:
+        raise ValueError("nothing to merge")
+    if dedup_window < 0:
+        raise ValueError("dedup_window must be >= 0")
+    if os.path.abspath(output) in {os.path.abspath(path) for path in inputs}:
+        raise ValueError(f"output {output} is also an input")
+    pcapng = resolve_format(output, file_format) == "pcapng"
+
+    readers: List[CaptureReader] = []
+    try:
+        for path in inputs:
+            readers.append(CaptureReader(path))
+        linktypes: Dict[int, str] = {}
+        for reader in readers:
+            if reader.linktype >= 0:
+                linktypes.setdefault(reader.linktype, reader.path)
+        if len(linktypes) > 1:
+            raise ValueError(
+                "inputs of different link types: "
+                + ", ".join(f"{path} ({linktype})" for linktype, path in linktypes.items())
+            )
+        if nanosecond is None:
+            nanosecond = any(reader.nanosecond for reader in readers)
+        snaplen = max(reader.snaplen for reader in readers) or DEFAULT_SNAPLEN
+        linktype = next(iter(linktypes), 1)
+    except Exception:
+        for reader in readers:
+            reader.close()
+        raise
+
+    writer = CaptureWriter(output, pcapng, linktype, snaplen, nanosecond)
+    window_ns = int(dedup_window * NSEC_PER_SEC)
+    read = written = duplicates = 0
+    last: Optional[Packet] = None
+    try:
+        for packet in heapq.merge(*readers, key=lambda packet: packet.timestamp_ns):
+            read += 1
+            if (
+                dedup
+                and last is not None
+                and packet.timestamp_ns - last.timestamp_ns <= window_ns
+                and packet.length == last.length
+                and packet.data == last.data
+            ):
+                duplicates += 1
+                continue
+            writer.write(packet)
+            written += 1
+            last = packet
+    finally:
+        writer.close()
+        for reader in readers:
+            reader.close()
+    out_of_order = sum(reader.out_of_order for reader in readers)
+    return MergeResult(len(readers), read, written, duplicates, out_of_order)
+
+
+def report_merge(result: MergeResult, output: str) -> None:
+    """Print the counts of a finished merge."""
+    SUCCESS(
+        f"Merged {BOLD}{BRIGHT_WHITE}{result.files}{RESET} captures → "
+        f"{BOLD}{BRIGHT_CYAN}{output}{RESET}"
+    )
+    INFO(
+        f"  Packets: {BOLD}{BRIGHT_WHITE}{result.packets_written:,}{RESET} written "
+        f"of {result.packets_read:,} read"
+    )
+    if result.duplicates:
+        INFO(f"  Duplicates dropped: {BOLD}{BRIGHT_WHITE}{result.duplicates:,}{RESET}")
+    if result.out_of_order:
+        WARNING(
+            f"{result.out_of_order:,} packets were out of timestamp order within their own "
+            "input; the output is only as ordered as its inputs"
+        )
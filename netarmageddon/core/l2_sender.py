@@ -0,0 +1,100 @@
+"""Layer 2 frame sender shared by the DHCP and ARP modules.
+
+scapy's ``sendp(pkt, iface=...)`` opens a raw socket, resolves the interface, sends one
+frame and closes the socket again, on every call. An :class:`L2Sender` opens one socket
+when a run starts and keeps it until :meth:`L2Sender.close`, counting the frames that
+went out and the send calls the kernel refused. It is also the one place that enforces
+the packets-per-second safety limit: :meth:`L2Sender.rate_limit` caps requested rates and
+:meth:`L2Sender.send` never sends two frames closer together than ``1 / MAX_PPS``.
+"""
+
+import threading
+import time
+from typing import Any, Optional, Union
+
+import scapy.all  # noqa: F401  (sets conf.L2socket for the platform)
+from scapy.config import conf
+from scapy.packet import Packet
+
+from netarmageddon.utils.output_manager import DEBUG, WARNING
+
+NO_PROTOCOL = 0  # bind without an EtherType: send only, nothing queued for receive
+
+
+class L2Sender:
+    """One layer 2 socket on ``interface``, opened lazily and reused for every frame.
+
+    :meth:`close` ends a run; the next :meth:`send` or :meth:`open` starts another one on a
+    fresh socket.
+    """
+
+    MAX_PPS: int = 100  # Safety limit for packets per second, shared by all senders
+
+    def __init__(self, interface: str) -> None:
+        self.interface = interface
+        self.sent = 0
+        self.errors = 0
+        self.last_error: Optional[str] = None
+        self._socket: Optional[Any] = None
+        self._last_send: Optional[float] = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def rate_limit(cls, pps: float) -> float:
+        if pps > cls.MAX_PPS:
+            WARNING(f"Rate capped: {pps} → {cls.MAX_PPS} pps (safety limit)")
+            return cls.MAX_PPS
+        return pps
+
+    def open(self) -> None:
+        """Open the socket if it is not open yet (PermissionError without root)."""
+        with self._lock:
+            if self._socket is None:
+                DEBUG(f"Opening L2 socket on {self.interface}")
+                self._socket = conf.L2socket(iface=self.interface, type=NO_PROTOCOL)
+
+    def send(self, frame: Union[bytes, Packet]) -> bool:
+        """Send one frame, waiting first if the last one went out less than 1 / MAX_PPS ago.
+
+        Returns False when the kernel refused the frame; the error is counted in
+        ``errors`` and kept in ``last_error``. PermissionError is raised, as no later
+        frame would fare better.
+        """
+        self.open()
+        if self._last_send is not None:
+            wait = self._last_send + 1.0 / self.MAX_PPS - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+        self._last_send = time.monotonic()
+        try:
+            with self._lock:
+                if self._socket is None:  # closed by stop() while this frame waited
+                    raise OSError("sender closed")
+                self._socket.send(frame)
+        except PermissionError:
+            raise
+        except OSError as e:
+            self.errors += 1
+            self.last_error = str(e)
+            DEBUG(f"Send failed on {self.interface}: {e}")
+            return False
+        self.sent += 1
+        return True
+
+    def close(self) -> None:
+        """Close the socket; safe to call more than once."""
+        with self._lock:
+            if self._socket is None:
+                return
+            self._socket.close()
+            self._socket = None
+        DEBUG(f"Closed L2 socket on {self.interface}: {self.sent} sent, {self.errors} errors")
+        if self.errors:
+            WARNING(f"{self.errors} frame(s) refused by {self.interface} (last: {self.last_error})")
+
+    def __enter__(self) -> "L2Sender":
+        self.open()
+        return self
+
+    def __exit__(self, exc_type: object, exc_val: object, exc_tb: object) -> None:
+        self.close()
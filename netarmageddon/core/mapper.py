@@ -1,10 +1,13 @@
-import argparse
 import ctypes
 import logging
 import os
+import struct
 
 logger = logging.getLogger(__name__)
 
+BYTES_PER_MB = 1_000_000
+BYTES_PER_KIB = 1024
+
 _lib = ctypes.CDLL(os.path.join(os.path.dirname(__file__), "traffic_c", "libtraffic.so"))
 
 
@@ -17,30 +20,166 @@ class TrafficCaptureConfig(ctypes.Structure):
         ("max_packets", ctypes.c_int),
         ("snaplen", ctypes.c_int),
         ("promisc", ctypes.c_bool),
+        ("rotate_bytes", ctypes.c_longlong),
+        ("rotate_seconds", ctypes.c_int),
+        ("rotate_max_files", ctypes.c_int),
+        ("buffer_size", ctypes.c_int),
+        ("immediate_mode", ctypes.c_bool),
+        ("timeout_ms", ctypes.c_int),
+        ("writer_buffer_size", ctypes.c_longlong),
+        ("writer_block", ctypes.c_bool),
+        ("compression", ctypes.c_int),
+        ("compression_level", ctypes.c_int),
+        ("format", ctypes.c_int),
+        ("nanosecond", ctypes.c_bool),
+        ("tstamp_type", ctypes.c_char_p),
+        ("input_file", ctypes.c_char_p),
+        ("replay_speed", ctypes.c_double),
+        ("index_bucket_seconds", ctypes.c_int),
+        ("flow_file", ctypes.c_char_p),
+        ("flow_max", ctypes.c_int),
+        ("flow_idle_seconds", ctypes.c_int),
+        ("flow_export_seconds", ctypes.c_int),
+        ("sampling", ctypes.c_int),
+        ("sample_rate", ctypes.c_int),
+        ("headers_only", ctypes.c_bool),
+        ("fanout_workers", ctypes.c_int),
+        ("fanout_mode", ctypes.c_int),
+        ("fanout_pin", ctypes.c_bool),
+        ("stats_file", ctypes.c_char_p),
+    ]
+
+
+class TrafficCaptureStats(ctypes.Structure):
+    _fields_ = [
+        ("ps_recv", ctypes.c_ulonglong),
+        ("ps_drop", ctypes.c_ulonglong),
+        ("ps_ifdrop", ctypes.c_ulonglong),
+        ("packets_written", ctypes.c_ulonglong),
+        ("bytes_written", ctypes.c_ulonglong),
+        ("stream_drops", ctypes.c_ulonglong),
+        ("writer_queued_bytes", ctypes.c_ulonglong),
+        ("writer_peak_bytes", ctypes.c_ulonglong),
+        ("writer_overflows", ctypes.c_ulonglong),
+        ("writer_drops", ctypes.c_ulonglong),
+        ("flows_active", ctypes.c_ulonglong),
+        ("flows_evicted", ctypes.c_ulonglong),
+        ("flow_overflows", ctypes.c_ulonglong),
+        ("filter_swaps", ctypes.c_ulonglong),
+        ("filter_compiles", ctypes.c_ulonglong),
+        ("sampled_out", ctypes.c_ulonglong),
+        ("stop_latency_ns", ctypes.c_ulonglong),
+        ("files_rotated", ctypes.c_ulonglong),
+        ("writer_buffer_size", ctypes.c_ulonglong),
     ]
 
 
-_lib.traffic_capture_start.argtypes = [ctypes.POINTER(TrafficCaptureConfig)]
+# statspage.h: the memory-mapped stats file of a capture, header then body.
+STATSPAGE_MAGIC = b"NAST"
+STATSPAGE_VERSION = 1
+STATSPAGE_PATH_SIZE = 256
+# statspage_state_t values by name.
+STATSPAGE_STATES = {"starting": 0, "running": 1, "finished": 2, "failed": 3}
+
+
+class StatsPageHeader(ctypes.Structure):
+    _fields_ = [
+        ("magic", ctypes.c_char * 4),
+        ("version", ctypes.c_uint16),
+        ("header_len", ctypes.c_uint16),
+        ("size", ctypes.c_uint32),
+        ("seq", ctypes.c_uint32),
+        ("pid", ctypes.c_uint64),
+        ("started_ns", ctypes.c_uint64),
+    ]
+
+
+class StatsPageBody(ctypes.Structure):
+    _fields_ = [
+        ("updated_ns", ctypes.c_uint64),
+        ("updates", ctypes.c_uint64),
+        ("state", ctypes.c_uint32),
+        ("workers", ctypes.c_uint32),
+        ("stream_queued_bytes", ctypes.c_uint64),
+        ("stream_buffer_size", ctypes.c_uint64),
+        ("current_file", ctypes.c_char * STATSPAGE_PATH_SIZE),
+        ("stats", TrafficCaptureStats),
+    ]
+
+
+# traffic_compression_t values by name; "auto" picks gzip/zstd from a .gz/.zst extension.
+COMPRESSION = {"auto": 0, "none": 1, "gzip": 2, "zstd": 3}
+COMPRESSED_SUFFIXES = {".gz": "gzip", ".zst": "zstd"}
+# traffic_format_t values by name; "auto" picks pcapng for a .pcapng file name.
+FILE_FORMATS = {"auto": 0, "pcap": 1, "pcapng": 2}
+# traffic_sampling_t values by name; "count" and "flow" keep 1 in N, "budget" N per second.
+SAMPLING = {"none": 0, "count": 1, "budget": 2, "flow": 3}
+# traffic_fanout_mode_t values by name: spread packets over workers by flow hash or by CPU.
+FANOUT_MODES = {"hash": 0, "cpu": 1}
+
+
+# traffic_stream_record_t: ts_sec, ts_usec, caplen, len (a pcap record header).
+STREAM_RECORD = struct.Struct("=IIII")
+
+
+# traffic_capture_t * is opaque on the Python side.
+_lib.traffic_capture_create.argtypes = []
+_lib.traffic_capture_create.restype = ctypes.c_void_p
+_lib.traffic_capture_destroy.argtypes = [ctypes.c_void_p]
+_lib.traffic_capture_destroy.restype = None
+_lib.traffic_capture_start.argtypes = [ctypes.c_void_p, ctypes.POINTER(TrafficCaptureConfig)]
 _lib.traffic_capture_start.restype = ctypes.c_int
-_lib.traffic_capture_stop.argtypes = []
+_lib.traffic_capture_stop.argtypes = [ctypes.c_void_p]
 _lib.traffic_capture_stop.restype = None
-_lib.traffic_get_last_error.argtypes = []
+_lib.traffic_capture_rearm.argtypes = [ctypes.c_void_p]
+_lib.traffic_capture_rearm.restype = None
+_lib.traffic_capture_set_filter.argtypes = [
+    ctypes.c_void_p,
+    ctypes.c_char_p,
+    ctypes.c_int,
+    ctypes.c_char_p,
+    ctypes.c_size_t,
+]
+_lib.traffic_capture_set_filter.restype = ctypes.c_int
+_lib.traffic_get_last_error.argtypes = [ctypes.c_void_p]
 _lib.traffic_get_last_error.restype = ctypes.c_char_p
+_lib.traffic_get_stats.argtypes = [ctypes.c_void_p, ctypes.POINTER(TrafficCaptureStats)]
+_lib.traffic_get_stats.restype = ctypes.c_int
+_lib.traffic_get_worker_stats.argtypes = [
+    ctypes.c_void_p,
+    ctypes.c_int,
+    ctypes.POINTER(TrafficCaptureStats),
+]
+_lib.traffic_get_worker_stats.restype = ctypes.c_int
+_lib.traffic_stream_open.argtypes = [ctypes.c_void_p, ctypes.c_size_t]
+_lib.traffic_stream_open.restype = ctypes.c_void_p
+_lib.traffic_stream_acquire.argtypes = [
+    ctypes.c_void_p,
+    ctypes.POINTER(ctypes.c_size_t),
+    ctypes.POINTER(ctypes.c_size_t),
+    ctypes.c_int,
+]
+_lib.traffic_stream_acquire.restype = ctypes.c_int
+_lib.traffic_stream_release.argtypes = [ctypes.c_void_p, ctypes.c_size_t]
+_lib.traffic_stream_release.restype = None
+_lib.traffic_flow_hash.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+_lib.traffic_flow_hash.restype = ctypes.c_uint64
+_lib.traffic_headers_snaplen.argtypes = [ctypes.c_int]
+_lib.traffic_headers_snaplen.restype = ctypes.c_int
+_lib.traffic_scan_records.argtypes = [
+    ctypes.c_void_p,
+    ctypes.c_size_t,
+    ctypes.c_size_t,
+    ctypes.c_bool,
+    ctypes.c_void_p,
+    ctypes.c_size_t,
+]
+_lib.traffic_scan_records.restype = ctypes.c_size_t
 
 
-def start_capture_from_args(args: argparse.Namespace) -> None:
-    cfg = TrafficCaptureConfig(
-        interface=args.interface.encode(),
-        bpf_filter=args.filter.encode(),
-        output_file=args.output.encode(),
-        duration=args.duration,
-        max_packets=args.count,
-        snaplen=args.snaplen,
-        promisc=bool(args.promisc),
-    )
-    logger.info("start capturing from args")
-    ret = _lib.traffic_capture_start(ctypes.byref(cfg))
-    if ret != 0:
-        err = _lib.traffic_get_last_error()
-        msg = err.decode() if err else "unknown"
-        raise RuntimeError(f"Capture failed: {msg}")
+def create_capture_handle() -> int:
+    """Allocate a capture context; release it with ``_lib.traffic_capture_destroy``."""
+    handle = _lib.traffic_capture_create()
+    if not handle:
+        raise MemoryError("traffic_capture_create failed")
+    return handle
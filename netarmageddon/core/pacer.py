@@ -0,0 +1,145 @@
+"""Deadline-based packet pacing for the DHCP and ARP send loops.
+
+Sleeping a fixed ``1 / pps`` after every packet adds the time spent building, sending and
+printing to each gap, so the real rate always falls short of the configured one and drifts
+with the load. A :class:`Pacer` schedules packet ``n`` of a burst at ``start + n / pps`` on
+the monotonic clock instead: overheads are absorbed by the next sleep rather than
+accumulated. A loop that falls more than one slot behind is re-anchored to the current
+time rather than allowed to catch up in a burst, so the rate never exceeds ``MAX_PPS``.
+
+The gaps between packets are folded into streaming statistics as they happen (count,
+running mean and variance, maximum, and a fixed-size reservoir sample for percentiles),
+so memory stays constant however long a run lasts. :meth:`Pacer.get_stats` reports the
+rate achieved and the jitter of the gaps (their deviation from ``1 / pps``).
+"""
+
+import random
+import threading
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from netarmageddon.core.l2_sender import L2Sender
+from netarmageddon.utils.output_manager import BOLD, BRIGHT_WHITE, BRIGHT_YELLOW, INFO, RESET
+
+MS_PER_SEC = 1000.0
+JITTER_KEYS = (
+    "jitter_mean_ms",
+    "jitter_std_ms",
+    "jitter_p50_ms",
+    "jitter_p90_ms",
+    "jitter_p99_ms",
+    "jitter_max_ms",
+)
+
+
+class Pacer:
+    """Paces packets at ``pps`` (capped at ``L2Sender.MAX_PPS``) on absolute deadlines."""
+
+    RESERVOIR_SIZE: int = 1024  # jitter samples kept for the percentiles
+
+    def __init__(self, pps: float) -> None:
+        if pps <= 0:
+            raise ValueError("pps must be positive")
+        self.pps = L2Sender.rate_limit(pps)
+        self.interval = 1.0 / self.pps
+        self.sent = 0
+        self.slipped = 0  # slots missed by more than one interval and re-anchored
+        self._next: Optional[float] = None
+        self._last: Optional[float] = None
+        self._burst_time = 0.0  # time covered by the gaps, bursts excluded
+        # Jitter of the gaps (seconds): Welford's running mean/variance, maximum and a
+        # uniform reservoir sample (algorithm R)
+        self._gaps = 0
+        self._jitter_mean = 0.0
+        self._jitter_m2 = 0.0
+        self._jitter_max = 0.0
+        self._reservoir: List[float] = []
+        self._random = random.Random()
+
+    def start_burst(self) -> None:
+        """Start a new burst: the next packet goes out at once and the pause before it is
+        not counted as a gap (e.g. between ARP cycles)."""
+        self._next = None
+        self._last = None
+
+    def wait(self, stop: Optional[threading.Event] = None) -> bool:
+        """Block until the next packet is due, then count it as sent.
+
+        With ``stop``, returns False as soon as it is set (nothing is counted), so slow
+        rates do not hold up a shutdown.
+        """
+        now = time.monotonic()
+        if self._next is None:
+            self._next = now
+        elif now < self._next:
+            if stop is None:
+                time.sleep(self._next - now)
+            elif stop.wait(self._next - now):
+                return False
+            now = time.monotonic()
+        elif now - self._next > self.interval:
+            self.slipped += 1
+            self._next = now
+        if self._last is not None:
+            gap = now - self._last
+            self._burst_time += gap
+            self._add_jitter(abs(gap - self.interval))
+        self._last = now
+        self._next += self.interval
+        self.sent += 1
+        return True
+
+    def _add_jitter(self, jitter: float) -> None:
+        self._gaps += 1
+        delta = jitter - self._jitter_mean
+        self._jitter_mean += delta / self._gaps
+        self._jitter_m2 += delta * (jitter - self._jitter_mean)
+        self._jitter_max = max(self._jitter_max, jitter)
+        if len(self._reservoir) < self.RESERVOIR_SIZE:
+            self._reservoir.append(jitter)
+        else:
+            slot = self._random.randrange(self._gaps)
+            if slot < self.RESERVOIR_SIZE:
+                self._reservoir[slot] = jitter
+
+    def get_stats(self) -> Dict[str, float]:
+        """Achieved rate and gap jitter (ms) over the packets sent so far.
+
+        Mean, standard deviation and maximum cover every gap; the percentiles are estimated
+        from a reservoir of ``RESERVOIR_SIZE`` gaps (exact up to that many).
+        """
+        stats = {
+            "target_pps": float(self.pps),
+            "sent": float(self.sent),
+            "slipped": float(self.slipped),
+            "achieved_pps": self._gaps / self._burst_time if self._burst_time > 0 else 0.0,
+        }
+        if not self._gaps:
+            stats.update(dict.fromkeys(JITTER_KEYS, 0.0))
+            return stats
+        p50, p90, p99 = np.percentile(np.asarray(self._reservoir) * MS_PER_SEC, [50, 90, 99])
+        stats.update(
+            {
+                "jitter_mean_ms": self._jitter_mean * MS_PER_SEC,
+                "jitter_std_ms": (self._jitter_m2 / self._gaps) ** 0.5 * MS_PER_SEC,
+                "jitter_p50_ms": float(p50),
+                "jitter_p90_ms": float(p90),
+                "jitter_p99_ms": float(p99),
+                "jitter_max_ms": self._jitter_max * MS_PER_SEC,
+            }
+        )
+        return stats
+
+    def report(self) -> None:
+        """Print the achieved rate and jitter, when at least two packets went out."""
+        if self.sent < 2:
+            return
+        stats = self.get_stats()
+        INFO(
+            f"  Achieved: {BOLD}{BRIGHT_YELLOW}{stats['achieved_pps']:.1f}{RESET} pps "
+            f"(target {self.pps:g})  |  jitter p50 {stats['jitter_p50_ms']:.2f} ms, "
+            f"p99 {stats['jitter_p99_ms']:.2f} ms, max "
+            f"{BRIGHT_WHITE}{stats['jitter_max_ms']:.2f}{RESET} ms"
+        )
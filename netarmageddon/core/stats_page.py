@@ -0,0 +1,166 @@
+"""Reader for the memory-mapped stats page a capture publishes (``stats_file``).
+
+The C backend rewrites the page every time it publishes its counters, under a sequence
+lock (see ``traffic_c/statspage.h``). :class:`StatsPageReader` maps the file once; every
+:meth:`StatsPageReader.read` after that is plain memory access, no system call, so a
+watcher can sample a busy capture as often as it likes without disturbing it.
+"""
+
+import ctypes
+import mmap
+import os
+import struct
+import time
+from typing import Any, Dict, Optional
+
+from netarmageddon.core.mapper import (
+    BYTES_PER_KIB,
+    STATSPAGE_MAGIC,
+    STATSPAGE_STATES,
+    StatsPageBody,
+    StatsPageHeader,
+    TrafficCaptureStats,
+)
+from netarmageddon.utils.output_manager import (
+    BOLD,
+    BRIGHT_CYAN,
+    BRIGHT_WHITE,
+    BRIGHT_YELLOW,
+    ERROR,
+    INFO,
+    RESET,
+    SUCCESS,
+)
+
+SEQ = struct.Struct("=I")
+SEQ_OFFSET = StatsPageHeader.seq.offset
+HEADER_SIZE = ctypes.sizeof(StatsPageHeader)
+BODY_SIZE = ctypes.sizeof(StatsPageBody)
+READ_RETRIES = 10_000  # torn copies tolerated before read() gives up on a stuck writer
+NS_PER_SEC = 1_000_000_000
+STATE_NAMES = {value: name for name, value in STATSPAGE_STATES.items()}
+DONE_STATES = ("finished", "failed")
+
+
+class StatsPageReader:
+    """A stats page mapped read-only. Use as a context manager or call :meth:`close`."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        with open(path, "rb") as page_file:
+            try:
+                self._map = mmap.mmap(page_file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:  # an empty file cannot be mapped
+                raise ValueError(f"{path}: not a stats page") from None
+        header = StatsPageHeader.from_buffer_copy(self._map[:HEADER_SIZE].ljust(HEADER_SIZE, b"\0"))
+        if header.magic != STATSPAGE_MAGIC or header.header_len < HEADER_SIZE:
+            self._map.close()
+            raise ValueError(f"{path}: not a stats page")
+        self.version = header.version
+        # Fields are only appended, so a newer writer's page starts with the body we know
+        # and an older one's is a prefix of it (the missing counters read as 0).
+        self._body_start = header.header_len
+        self._body_end = min(header.size, len(self._map))
+
+    def read(self) -> Dict[str, Any]:
+        """A consistent snapshot of the page: the page fields plus every capture counter.
+
+        Copies the body between two reads of the sequence number and retries while the
+        writer is in the middle of an update. Raises RuntimeError when no consistent copy
+        turns up within READ_RETRIES attempts (a writer that died mid-update).
+        """
+        page = self._map
+        for _ in range(READ_RETRIES):
+            seq = SEQ.unpack_from(page, SEQ_OFFSET)[0]
+            if seq & 1:
+                continue
+            header = page[:HEADER_SIZE]
+            raw = page[self._body_start : self._body_end]
+            if SEQ.unpack_from(page, SEQ_OFFSET)[0] == seq:
+                break
+        else:
+            raise RuntimeError(f"{self.path}: no consistent copy of the stats page")
+
+        head = StatsPageHeader.from_buffer_copy(header)
+        body = StatsPageBody.from_buffer_copy(raw.ljust(BODY_SIZE, b"\0"))
+        snapshot: Dict[str, Any] = {
+            "version": head.version,
+            "pid": head.pid,
+            "started_ns": head.started_ns,
+            "updated_ns": body.updated_ns,
+            "updates": body.updates,
+            "state": STATE_NAMES.get(body.state, str(body.state)),
+            "workers": body.workers,
+            "stream_queued_bytes": body.stream_queued_bytes,
+            "stream_buffer_size": body.stream_buffer_size,
+            "current_file": body.current_file.decode("utf-8", "replace"),
+        }
+        for name, _ in TrafficCaptureStats._fields_:
+            snapshot[name] = getattr(body.stats, name)
+        return snapshot
+
+    def close(self) -> None:
+        self._map.close()
+
+    def __enter__(self) -> "StatsPageReader":
+        return self
+
+    def __exit__(self, exc_type: object, exc_val: object, exc_tb: object) -> None:
+        self.close()
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass  # exists, owned by someone else
+    return True
+
+
+def _occupancy(used: int, size: int) -> str:
+    return f"{used / size:.0%}" if size else "-"
+
+
+def watch_stats(path: str, interval: float = 1.0, samples: Optional[int] = None) -> None:
+    """Print one line per ``interval`` from the stats page at ``path``.
+
+    Rates come from the page's own update timestamps, so the watcher needs no clock of its
+    own. Returns when the capture finished or failed, its process is gone, or after
+    ``samples`` lines.
+    """
+    with StatsPageReader(path) as reader:
+        last = reader.read()
+        INFO(
+            f"Watching {BOLD}{BRIGHT_CYAN}{path}{RESET} "
+            f"(pid {last['pid']}, stats page v{reader.version})"
+        )
+        shown = 0
+        while last["state"] not in DONE_STATES and (samples is None or shown < samples):
+            time.sleep(interval)
+            stats = reader.read()
+            if stats["updates"] == last["updates"] and not _alive(stats["pid"]):
+                ERROR(f"The capture process {stats['pid']} exited without finishing {path}")
+                return
+            elapsed = (stats["updated_ns"] - last["updated_ns"]) / NS_PER_SEC
+            pps = (stats["ps_recv"] - last["ps_recv"]) / elapsed if elapsed > 0 else 0.0
+            drops = stats["ps_drop"] + stats["ps_ifdrop"] + stats["writer_drops"]
+            INFO(
+                f"  {stats['state']}: {BOLD}{BRIGHT_YELLOW}{pps:,.0f}{RESET} pps  |  "
+                f"written {BRIGHT_CYAN}{stats['packets_written']:,}{RESET} "
+                f"({stats['bytes_written'] // BYTES_PER_KIB:,} KiB)  |  "
+                f"queue {_occupancy(stats['writer_queued_bytes'], stats['writer_buffer_size'])}  |  "
+                f"drops {BRIGHT_WHITE}{drops:,}{RESET}  |  "
+                f"files rotated {stats['files_rotated']:,}  |  "
+                f"{BRIGHT_CYAN}{stats['current_file'] or '(no file)'}{RESET}"
+            )
+            last = stats
+            shown += 1
+    if last["state"] == "failed":
+        ERROR(f"The capture behind {path} failed")
+    elif last["state"] == "finished":
+        SUCCESS(
+            f"Capture finished: {BOLD}{BRIGHT_WHITE}{last['packets_written']:,}{RESET} packets "
+            f"written, {last['ps_drop'] + last['ps_ifdrop']:,} dropped in the kernel"
+        )
@@ -1,11 +1,25 @@
 import ctypes
+import os
 import threading
 import time
-from typing import Optional
+import weakref
+from typing import Dict, Iterator, List, Optional, Tuple
 
 from scapy.arch import get_if_list
 
-from netarmageddon.core.mapper import TrafficCaptureConfig
+from netarmageddon.core.mapper import (
+    BYTES_PER_KIB,
+    BYTES_PER_MB,
+    COMPRESSED_SUFFIXES,
+    COMPRESSION,
+    FANOUT_MODES,
+    FILE_FORMATS,
+    SAMPLING,
+    STREAM_RECORD,
+    TrafficCaptureConfig,
+    TrafficCaptureStats,
+    create_capture_handle,
+)
 from netarmageddon.core.mapper import _lib as _traffic_lib
 from netarmageddon.utils.output_manager import (
     HEAD,
@@ -28,6 +42,11 @@ from netarmageddon.utils.output_manager import (
 class TrafficLogger:
     """Traffic capture implementation using the libpcap C backend."""
 
+    STATS_INTERVAL: float = 1.0  # Seconds between live stats lines
+    STREAM_POLL_MS: int = 200  # iter_batches() wake-up interval while the ring is empty
+    FILTER_ERROR_SIZE: int = 256  # set_filter() error message buffer
+    NS_PER_MS: int = 1_000_000
+
     def __init__(
         self,
         interface: str,
@@ -37,6 +56,34 @@ class TrafficLogger:
         count: int,
         snaplen: int,
         promisc: bool,
+        rotate_size: int = 0,
+        rotate_seconds: int = 0,
+        rotate_files: int = 0,
+        buffer_size: int = 0,
+        immediate_mode: bool = False,
+        timeout_ms: int = 0,
+        stream_buffer: int = 0,
+        writer_buffer: int = 0,
+        writer_block: bool = False,
+        compression: str = "auto",
+        compression_level: int = 0,
+        file_format: str = "auto",
+        nanosecond: bool = False,
+        tstamp_type: str = "",
+        input_file: str = "",
+        replay_speed: float = 0.0,
+        index_bucket: int = 0,
+        flow_file: str = "",
+        flow_max: int = 0,
+        flow_idle: int = 0,
+        flow_interval: int = 0,
+        sampling: str = "none",
+        sample_rate: int = 0,
+        headers_only: bool = False,
+        fanout: int = 0,
+        fanout_mode: str = "hash",
+        fanout_pin: bool = False,
+        stats_file: str = "",
     ) -> None:
         self.interface = interface
         self.bpf_filter = bpf_filter
@@ -45,22 +92,101 @@ class TrafficLogger:
         self.count = count
         self.snaplen = snaplen
         self.promisc = promisc
+        self.rotate_size = rotate_size
+        self.rotate_seconds = rotate_seconds
+        self.rotate_files = rotate_files
+        self.buffer_size = buffer_size
+        self.immediate_mode = immediate_mode
+        self.timeout_ms = timeout_ms
+        self.stream_buffer = stream_buffer
+        self.writer_buffer = writer_buffer
+        self.writer_block = writer_block
+        self.compression = compression
+        self.compression_level = compression_level
+        self.file_format = file_format
+        self.nanosecond = nanosecond
+        self.tstamp_type = tstamp_type
+        self.input_file = input_file
+        self.replay_speed = replay_speed
+        self.index_bucket = index_bucket
+        self.flow_file = flow_file
+        self.flow_max = flow_max
+        self.flow_idle = flow_idle
+        self.flow_interval = flow_interval
+        self.sampling = sampling
+        self.sample_rate = sample_rate
+        self.headers_only = headers_only
+        self.fanout = fanout
+        self.fanout_mode = fanout_mode
+        self.fanout_pin = fanout_pin
+        self.stats_file = stats_file
+        self._stream: Optional[memoryview] = None
         self.running = False
         self.capture_thread: Optional[threading.Thread] = None
-        self.timer_thread: Optional[threading.Thread] = None
+        self.stats_thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()  # wakes the stats thread at stop()
         self._stopped = False
         self.start_time = time.time()
 
-        self._validate_interface()
+        if input_file:
+            self._validate_input()
+        else:
+            self._validate_interface()
+        self._validate_rotation()
+        self._validate_tuning()
+        self._validate_stream()
+        self._validate_compression()
+        self._validate_flows()
+        self._validate_sampling()
+        self._validate_fanout()
+
+        # One backend context per instance, so loggers on different interfaces can capture
+        # concurrently. Freed when the logger is garbage collected.
+        self._handle = create_capture_handle()
+        weakref.finalize(self, _traffic_lib.traffic_capture_destroy, self._handle)
 
         HEAD("◈  Traffic Capture — Configuration")
-        CMD(f"  {'Interface':<20} {BRIGHT_CYAN}{interface}{RESET}")
+        if input_file:
+            CMD(f"  {'Input file':<20} {BRIGHT_CYAN}{input_file}{RESET}")
+            CMD(f"  {'Replay speed':<20} {BRIGHT_CYAN}{self._replay_summary()}{RESET}")
+        else:
+            CMD(f"  {'Interface':<20} {BRIGHT_CYAN}{interface}{RESET}")
         CMD(f"  {'BPF Filter':<20} {BRIGHT_CYAN}{bpf_filter or '(none)'}{RESET}")
-        CMD(f"  {'Output file':<20} {BRIGHT_CYAN}{output_file}{RESET}")
+        output_label = output_file or ("(stream only)" if stream_buffer else "(none)")
+        CMD(f"  {'Output file':<20} {BRIGHT_CYAN}{output_label}{RESET}")
         CMD(f"  {'Duration':<20} {BRIGHT_CYAN}{f'{duration}s' if duration else 'unlimited'}{RESET}")
         CMD(f"  {'Max packets':<20} {BRIGHT_CYAN}{count if count else 'unlimited'}{RESET}")
-        CMD(f"  {'Snap length':<20} {BRIGHT_CYAN}{snaplen} bytes{RESET}")
+        snaplen_label = f"{snaplen} bytes{', headers only' if headers_only else ''}"
+        CMD(f"  {'Snap length':<20} {BRIGHT_CYAN}{snaplen_label}{RESET}")
+        if sampling != "none":
+            CMD(f"  {'Sampling':<20} {BRIGHT_CYAN}{self._sampling_summary()}{RESET}")
+        if self.fanning_out:
+            CMD(f"  {'Fanout':<20} {BRIGHT_CYAN}{self._fanout_summary()}{RESET}")
         CMD(f"  {'Promiscuous':<20} {BRIGHT_GREEN if promisc else BRIGHT_YELLOW}{promisc}{RESET}")
+        if self.rotating:
+            CMD(f"  {'Rotation':<20} {BRIGHT_CYAN}{self._rotation_summary()}{RESET}")
+        buffer_label = f"{buffer_size} KiB" if buffer_size else "default"
+        CMD(f"  {'Kernel buffer':<20} {BRIGHT_CYAN}{buffer_label}{RESET}")
+        CMD(
+            f"  {'Immediate mode':<20} "
+            f"{BRIGHT_GREEN if immediate_mode else BRIGHT_YELLOW}{immediate_mode}{RESET}"
+        )
+        CMD(f"  {'Buffer timeout':<20} {BRIGHT_CYAN}{timeout_ms or 1000} ms{RESET}")
+        if output_file:
+            writer_label = f"{writer_buffer} KiB" if writer_buffer else "8192 KiB"
+            policy = "block" if writer_block else "drop"
+            CMD(f"  {'Writer queue':<20} {BRIGHT_CYAN}{writer_label}, {policy} when full{RESET}")
+            CMD(f"  {'Compression':<20} {BRIGHT_CYAN}{self._compression_summary()}{RESET}")
+            CMD(f"  {'File format':<20} {BRIGHT_CYAN}{self.resolved_format}{RESET}")
+            index_label = f"{index_bucket}s buckets" if index_bucket else "off"
+            CMD(f"  {'Index sidecar':<20} {BRIGHT_CYAN}{index_label}{RESET}")
+        CMD(f"  {'Timestamps':<20} {BRIGHT_CYAN}{self._timestamp_summary()}{RESET}")
+        if stream_buffer:
+            CMD(f"  {'Stream buffer':<20} {BRIGHT_CYAN}{stream_buffer} KiB{RESET}")
+        if flow_file:
+            CMD(f"  {'Flow summary':<20} {BRIGHT_CYAN}{flow_file} ({self._flow_summary()}){RESET}")
+        if stats_file:
+            CMD(f"  {'Stats page':<20} {BRIGHT_CYAN}{stats_file}{RESET}")
         CMD(THIN_DELIM)
 
     def _validate_interface(self) -> None:
@@ -71,35 +197,374 @@ class TrafficLogger:
             raise ValueError(f"Interface '{self.interface}' not found")
         INFO(f"Interface {BOLD}{BRIGHT_CYAN}{self.interface}{RESET} validated")
 
+    def _validate_input(self) -> None:
+        DEBUG(f"Validating input file: {self.input_file}")
+        if not os.path.isfile(self.input_file):
+            ERROR(f"Input file '{self.input_file}' not found!")
+            raise ValueError(f"Input file '{self.input_file}' not found")
+        if self.replay_speed < 0:
+            ERROR(f"Invalid replay_speed: {self.replay_speed}")
+            raise ValueError("replay_speed must be >= 0")
+        INFO(f"Input file {BOLD}{BRIGHT_CYAN}{self.input_file}{RESET} validated")
+
+    def _validate_rotation(self) -> None:
+        for name in ("rotate_size", "rotate_seconds", "rotate_files"):
+            if getattr(self, name) < 0:
+                ERROR(f"Invalid {name}: {getattr(self, name)}")
+                raise ValueError(f"{name} must be >= 0")
+        if self.rotate_files and not self.rotating:
+            ERROR("rotate_files needs rotate_size or rotate_seconds")
+            raise ValueError("rotate_files requires rotate_size or rotate_seconds")
+
+    def _validate_tuning(self) -> None:
+        for name in ("buffer_size", "timeout_ms", "writer_buffer"):
+            if getattr(self, name) < 0:
+                ERROR(f"Invalid {name}: {getattr(self, name)}")
+                raise ValueError(f"{name} must be >= 0")
+
+    def _validate_stream(self) -> None:
+        if self.stream_buffer < 0:
+            ERROR(f"Invalid stream_buffer: {self.stream_buffer}")
+            raise ValueError("stream_buffer must be >= 0")
+        if not self.output_file and self.rotating:
+            ERROR("Rotation needs an output file")
+            raise ValueError("rotation requires output_file")
+
+    def _validate_compression(self) -> None:
+        if self.compression not in COMPRESSION:
+            ERROR(f"Invalid compression: {self.compression}")
+            raise ValueError(f"compression must be one of {', '.join(COMPRESSION)}")
+        if self.compression_level < 0:
+            ERROR(f"Invalid compression_level: {self.compression_level}")
+            raise ValueError("compression_level must be >= 0")
+        if self.file_format not in FILE_FORMATS:
+            ERROR(f"Invalid file_format: {self.file_format}")
+            raise ValueError(f"file_format must be one of {', '.join(FILE_FORMATS)}")
+        if self.index_bucket < 0:
+            ERROR(f"Invalid index_bucket: {self.index_bucket}")
+            raise ValueError("index_bucket must be >= 0")
+        if self.index_bucket and not self.output_file:
+            ERROR("The index sidecar needs an output file")
+            raise ValueError("index_bucket requires output_file")
+
+    def _validate_flows(self) -> None:
+        for name in ("flow_max", "flow_idle", "flow_interval"):
+            if getattr(self, name) < 0:
+                ERROR(f"Invalid {name}: {getattr(self, name)}")
+                raise ValueError(f"{name} must be >= 0")
+
+    def _validate_sampling(self) -> None:
+        if self.sampling not in SAMPLING:
+            ERROR(f"Invalid sampling: {self.sampling}")
+            raise ValueError(f"sampling must be one of {', '.join(SAMPLING)}")
+        if self.sample_rate < 0 or (self.sampling != "none" and self.sample_rate < 1):
+            ERROR(f"Invalid sample_rate: {self.sample_rate}")
+            raise ValueError("sample_rate must be >= 1 when sampling")
+        if self.sampling != "none" and self.output_file and self.resolved_format != "pcapng":
+            WARNING("The sampling rate is only recorded in pcapng files")
+
+    def _validate_fanout(self) -> None:
+        if self.fanout < 0:
+            ERROR(f"Invalid fanout: {self.fanout}")
+            raise ValueError("fanout must be >= 0")
+        if self.fanout_mode not in FANOUT_MODES:
+            ERROR(f"Invalid fanout_mode: {self.fanout_mode}")
+            raise ValueError(f"fanout_mode must be one of {', '.join(FANOUT_MODES)}")
+        if not self.fanning_out:
+            return
+        # Every worker would replay, stream and count on its own.
+        for name in ("input_file", "stream_buffer", "count"):
+            if getattr(self, name):
+                ERROR(f"Fanout capture cannot be combined with {name}")
+                raise ValueError(f"fanout cannot be combined with {name}")
+
+    @property
+    def rotating(self) -> bool:
+        return self.rotate_size > 0 or self.rotate_seconds > 0
+
+    @property
+    def fanning_out(self) -> bool:
+        return self.fanout > 1
+
+    @property
+    def output_label(self) -> str:
+        """Output path as written by the backend.
+
+        Fanout workers write ``_wN`` shards and rotated files get a ``_NNNNN`` suffix.
+        """
+        if not self.output_file:
+            return self.flow_file or "(stream only)"
+        if not self.rotating and not self.fanning_out:
+            return self.output_file
+        base, suffix = os.path.splitext(self.output_file)
+        if suffix not in COMPRESSED_SUFFIXES:
+            base, suffix = self.output_file, ""
+        stem, ext = os.path.splitext(base)
+        tags = ("_wN" if self.fanning_out else "") + ("_NNNNN" if self.rotating else "")
+        return f"{stem}{tags}{ext}{suffix}"
+
+    @property
+    def resolved_compression(self) -> str:
+        """Compression the backend will use, with "auto" resolved from the file extension."""
+        if self.compression != "auto":
+            return self.compression
+        return COMPRESSED_SUFFIXES.get(os.path.splitext(self.output_file)[1], "none")
+
+    @property
+    def resolved_format(self) -> str:
+        """File format the backend will write, with "auto" resolved from the file name."""
+        if self.file_format != "auto":
+            return self.file_format
+        base, suffix = os.path.splitext(self.output_file)
+        if suffix not in COMPRESSED_SUFFIXES:
+            base = self.output_file
+        return "pcapng" if base.endswith(".pcapng") else "pcap"
+
+    def _flow_summary(self) -> str:
+        limit = f"up to {self.flow_max:,} flows" if self.flow_max else "up to 65,536 flows"
+        idle = f"evict after {self.flow_idle}s idle" if self.flow_idle else "no idle eviction"
+        export = f"export every {self.flow_interval}s" if self.flow_interval else "export at end"
+        return f"{limit}, {idle}, {export}"
+
+    def _sampling_summary(self) -> str:
+        if self.sampling == "budget":
+            return f"first {self.sample_rate:,} packets of every second"
+        unit = "flows" if self.sampling == "flow" else "packets"
+        return f"1 in {self.sample_rate:,} {unit}"
+
+    def _fanout_summary(self) -> str:
+        spread = "by flow hash" if self.fanout_mode == "hash" else "by receiving CPU"
+        pinned = ", pinned to CPUs" if self.fanout_pin else ""
+        return f"{self.fanout} workers, packets spread {spread}{pinned}"
+
+    def _replay_summary(self) -> str:
+        if not self.replay_speed:
+            return "as fast as possible"
+        return f"{self.replay_speed:g}x original timing"
+
+    def _timestamp_summary(self) -> str:
+        precision = "nanosecond" if self.nanosecond else "microsecond"
+        return f"{precision}, {self.tstamp_type or 'default'} clock"
+
+    def _compression_summary(self) -> str:
+        method = self.resolved_compression
+        if method == "none" or not self.compression_level:
+            return method
+        return f"{method} level {self.compression_level}"
+
+    def _rotation_summary(self) -> str:
+        limits = []
+        if self.rotate_size:
+            limits.append(f"{self.rotate_size} MB")
+        if self.rotate_seconds:
+            limits.append(f"{self.rotate_seconds}s")
+        ring = f"keep {self.rotate_files} files" if self.rotate_files else "keep all files"
+        return f"every {' / '.join(limits)}, {ring}"
+
     def start(self) -> None:
         if self.running:
             return
 
+        if self.stream_buffer:
+            self._open_stream()
+
         self.running = True
         self._stopped = False
+        self._stop_event.clear()
+        # Drop a stop left from the last run; one from now on ends the new run even if it
+        # lands before the capture thread reaches the backend.
+        _traffic_lib.traffic_capture_rearm(self._handle)
 
         self.capture_thread = threading.Thread(
             target=self._run_capture, name="TrafficCaptureThread", daemon=True
         )
         self.capture_thread.start()
-        INFO(f"🚀 Capture started → {BOLD}{BRIGHT_CYAN}{self.output_file}{RESET}")
+        INFO(f"🚀 Capture started → {BOLD}{BRIGHT_CYAN}{self.output_label}{RESET}")
 
-        if self.duration > 0:
-            self.timer_thread = threading.Thread(
-                target=self._stop_after_delay, name="TrafficTimerThread", daemon=True
-            )
-            self.timer_thread.start()
+        self.stats_thread = threading.Thread(
+            target=self._poll_stats, name="TrafficStatsThread", daemon=True
+        )
+        self.stats_thread.start()
+
+        # The backend ends the capture at the deadline itself; a replay's duration is
+        # measured in capture time, not wall time.
+        if self.duration > 0 and not self.input_file:
             INFO(f"  Auto-stop in {BOLD}{BRIGHT_YELLOW}{self.duration}s{RESET}")
 
-    def _stop_after_delay(self) -> None:
-        time.sleep(self.duration)
-        self.stop()
+    def _open_stream(self) -> None:
+        size = self.stream_buffer * BYTES_PER_KIB
+        base = _traffic_lib.traffic_stream_open(self._handle, size)
+        if not base:
+            err = _traffic_lib.traffic_get_last_error(self._handle)
+            raise RuntimeError(f"Cannot open stream buffer: {err.decode() if err else 'unknown'}")
+        # The ring is owned by the C handle; this view aliases it without copying.
+        self._stream = memoryview((ctypes.c_ubyte * size).from_address(base)).cast("B")
+
+    def iter_batches(self) -> Iterator[List[Tuple[memoryview, memoryview]]]:
+        """Yield captured packets as batches of ``(header, data)`` memoryviews.
+
+        Both views alias the shared stream ring, nothing is copied. ``header`` unpacks with
+        ``STREAM_RECORD`` into ``(ts_sec, ts_usec, caplen, len)``. Views are only valid until
+        the next batch is requested; copy anything that must outlive it. Ends once the
+        capture has stopped and the ring is drained.
+        """
+        if self._stream is None:
+            raise RuntimeError("iter_batches() needs stream_buffer and a started capture")
+
+        ring = self._stream
+        offset = ctypes.c_size_t()
+        length = ctypes.c_size_t()
+        while True:
+            ret = _traffic_lib.traffic_stream_acquire(
+                self._handle, ctypes.byref(offset), ctypes.byref(length), self.STREAM_POLL_MS
+            )
+            if ret < 0:
+                return
+            if ret == 0:
+                if self._stopped:
+                    return
+                continue
+
+            batch = []
+            pos, end = offset.value, offset.value + length.value
+            while pos < end:
+                caplen = STREAM_RECORD.unpack_from(ring, pos)[2]
+                data = pos + STREAM_RECORD.size
+                batch.append((ring[pos:data], ring[data : data + caplen]))
+                pos = data + caplen
+            try:
+                yield batch
+            finally:
+                _traffic_lib.traffic_stream_release(self._handle, length.value)
+
+    def set_filter(self, bpf_filter: str, timeout: float = 1.0) -> bool:
+        """Replace the BPF filter of the running capture without reopening the handle.
+
+        The capture thread compiles the expression (compiled programs are cached per
+        expression and link type, so switching back to an earlier filter is free) and
+        installs it between two packet batches, so no packets are lost to a reopen. Returns
+        True once the filter is installed and False if that took longer than ``timeout``
+        seconds (it is then installed as soon as the capture thread wakes). Raises
+        ValueError for an expression libpcap rejects, keeping the current filter, and
+        RuntimeError when no capture is running. pcapng files keep the filter of the start
+        in their interface description.
+        """
+        err = ctypes.create_string_buffer(self.FILTER_ERROR_SIZE)
+        ret = _traffic_lib.traffic_capture_set_filter(
+            self._handle, bpf_filter.encode("utf-8"), int(timeout * 1000), err, len(err)
+        )
+        if ret == -2:
+            raise RuntimeError(f"Cannot change the filter: {err.value.decode()}")
+        if ret < 0:
+            ERROR(f"Filter {bpf_filter!r} rejected: {err.value.decode()}")
+            raise ValueError(err.value.decode())
+        self.bpf_filter = bpf_filter
+        INFO(f"  BPF filter → {BOLD}{BRIGHT_CYAN}{bpf_filter or '(none)'}{RESET}")
+        return ret == 0
+
+    def get_stats(self) -> Dict[str, int]:
+        """Counters of the running (or last finished) capture from the C backend."""
+        stats = TrafficCaptureStats()
+        _traffic_lib.traffic_get_stats(self._handle, ctypes.byref(stats))
+        return {name: getattr(stats, name) for name, _ in TrafficCaptureStats._fields_}
+
+    def get_worker_stats(self) -> List[Dict[str, int]]:
+        """Counters of each fanout worker; get_stats() holds their sums. Empty without fanout."""
+        workers: List[Dict[str, int]] = []
+        stats = TrafficCaptureStats()
+        index = 0
+        while _traffic_lib.traffic_get_worker_stats(self._handle, index, ctypes.byref(stats)) == 0:
+            workers.append({name: getattr(stats, name) for name, _ in TrafficCaptureStats._fields_})
+            index += 1
+        return workers
+
+    def _poll_stats(self) -> None:
+        last = self.get_stats()
+        last_time = time.monotonic()
+        while self.running:
+            if self._stop_event.wait(self.STATS_INTERVAL):
+                break
+            stats = self.get_stats()
+            now = time.monotonic()
+            elapsed = now - last_time
+            pps = (stats["ps_recv"] - last["ps_recv"]) / elapsed if elapsed > 0 else 0.0
+            INFO(
+                f"  Live: {BOLD}{BRIGHT_YELLOW}{pps:,.0f}{RESET} pps  |  "
+                f"written {BRIGHT_CYAN}{stats['packets_written']:,}{RESET}  |  "
+                f"queued {BRIGHT_CYAN}{stats['writer_queued_bytes'] // BYTES_PER_KIB:,} KiB{RESET}  |  "
+                f"drops {BRIGHT_WHITE}{stats['ps_drop']:,}{RESET} kernel / "
+                f"{BRIGHT_WHITE}{stats['ps_ifdrop']:,}{RESET} iface   ",
+                end="\r",
+            )
+            last, last_time = stats, now
+
+    def _report_stats(self) -> None:
+        stats = self.get_stats()
+        INFO("")  # newline after the live stats line
+        INFO(
+            f"  Packets written: {BOLD}{BRIGHT_WHITE}{stats['packets_written']:,}{RESET}  "
+            f"({stats['bytes_written']:,} bytes)"
+        )
+        INFO(f"  Packets received by filter: {BOLD}{BRIGHT_WHITE}{stats['ps_recv']:,}{RESET}")
+        workers = self.get_worker_stats()
+        if workers:
+            shares = " / ".join(f"{worker['packets_written']:,}" for worker in workers)
+            INFO(f"  Packets written per worker: {BRIGHT_CYAN}{shares}{RESET}")
+        if self.sampling != "none":
+            INFO(
+                f"  Sampling ({self._sampling_summary()}): "
+                f"{BOLD}{BRIGHT_WHITE}{stats['sampled_out']:,}{RESET} matched packets left out"
+            )
+        dropped = stats["ps_drop"] + stats["ps_ifdrop"]
+        if dropped:
+            # ps_recv already includes the packets the kernel had to drop.
+            ratio = stats["ps_drop"] / stats["ps_recv"] if stats["ps_recv"] else 0.0
+            WARNING(
+                f"Dropped {stats['ps_drop']:,} packets in the kernel ({ratio:.2%}) and "
+                f"{stats['ps_ifdrop']:,} at the interface"
+            )
+        else:
+            SUCCESS("No packets dropped")
+        if stats["writer_overflows"]:
+            WARNING(
+                f"{stats['writer_overflows']:,} packets found the disk writer queue full "
+                f"(peak {stats['writer_peak_bytes']:,} bytes); "
+                f"{stats['writer_drops']:,} of them were not written"
+            )
+        if stats["stream_drops"]:
+            WARNING(f"Stream consumer fell behind: {stats['stream_drops']:,} packets not streamed")
+        if self.flow_file:
+            INFO(
+                f"  Flows: {BOLD}{BRIGHT_WHITE}{stats['flows_active']:,}{RESET} open at the end, "
+                f"{stats['flows_evicted']:,} evicted idle → {BRIGHT_CYAN}{self.flow_file}{RESET}"
+            )
+        if stats["flow_overflows"]:
+            WARNING(
+                f"Flow table full: {stats['flow_overflows']:,} packets of new flows not counted"
+            )
+        if stats["stop_latency_ns"]:
+            INFO(
+                f"  Stop latency: {BRIGHT_WHITE}"
+                f"{stats['stop_latency_ns'] / self.NS_PER_MS:.3f} ms{RESET}"
+            )
 
     def _run_capture(self) -> None:
         INFO("  Initialising pcap capture engine")
         DEBUG(
-            f"  iface={self.interface} filter={self.bpf_filter!r} "
-            f"out={self.output_file} max={self.count} snaplen={self.snaplen} promisc={self.promisc}"
+            f"  iface={self.interface} input={self.input_file!r}@{self.replay_speed:g}x "
+            f"filter={self.bpf_filter!r} "
+            f"out={self.output_file} max={self.count} snaplen={self.snaplen} promisc={self.promisc} "
+            f"rotate={self.rotate_size}MB/{self.rotate_seconds}s/{self.rotate_files} "
+            f"buffer={self.buffer_size}KiB immediate={self.immediate_mode} timeout={self.timeout_ms}ms "
+            f"stream={self.stream_buffer}KiB writer={self.writer_buffer}KiB/"
+            f"{'block' if self.writer_block else 'drop'} "
+            f"compression={self.compression}/{self.compression_level} "
+            f"format={self.file_format} nanosecond={self.nanosecond} tstamp={self.tstamp_type!r} "
+            f"index={self.index_bucket}s flows={self.flow_file!r}/{self.flow_max}/"
+            f"{self.flow_idle}s/{self.flow_interval}s "
+            f"sampling={self.sampling}/{self.sample_rate} headers_only={self.headers_only} "
+            f"fanout={self.fanout}/{self.fanout_mode}/{'pinned' if self.fanout_pin else 'free'} "
+            f"stats={self.stats_file!r}"
         )
         try:
             cfg = TrafficCaptureConfig(
@@ -110,11 +575,38 @@ class TrafficLogger:
                 max_packets=self.count,
                 snaplen=self.snaplen,
                 promisc=self.promisc,
+                rotate_bytes=self.rotate_size * BYTES_PER_MB,
+                rotate_seconds=self.rotate_seconds,
+                rotate_max_files=self.rotate_files,
+                buffer_size=self.buffer_size * BYTES_PER_KIB,
+                immediate_mode=self.immediate_mode,
+                timeout_ms=self.timeout_ms,
+                writer_buffer_size=self.writer_buffer * BYTES_PER_KIB,
+                writer_block=self.writer_block,
+                compression=COMPRESSION[self.compression],
+                compression_level=self.compression_level,
+                format=FILE_FORMATS[self.file_format],
+                nanosecond=self.nanosecond,
+                tstamp_type=self.tstamp_type.encode("utf-8"),
+                input_file=self.input_file.encode("utf-8"),
+                replay_speed=self.replay_speed,
+                index_bucket_seconds=self.index_bucket,
+                flow_file=self.flow_file.encode("utf-8"),
+                flow_max=self.flow_max,
+                flow_idle_seconds=self.flow_idle,
+                flow_export_seconds=self.flow_interval,
+                sampling=SAMPLING[self.sampling],
+                sample_rate=self.sample_rate,
+                headers_only=self.headers_only,
+                fanout_workers=self.fanout,
+                fanout_mode=FANOUT_MODES[self.fanout_mode],
+                fanout_pin=self.fanout_pin,
+                stats_file=self.stats_file.encode("utf-8"),
             )
-            ret = _traffic_lib.traffic_capture_start(ctypes.byref(cfg))
+            ret = _traffic_lib.traffic_capture_start(self._handle, ctypes.byref(cfg))
 
             if ret != 0:
-                err = _traffic_lib.traffic_get_last_error()
+                err = _traffic_lib.traffic_get_last_error(self._handle)
                 msg = err.decode() if err else "unknown"
                 ERROR(f"Capture error from C backend: {msg}")
             elif self.count > 0:
@@ -131,7 +623,8 @@ class TrafficLogger:
 
         DEBUG("Initiating capture shutdown")
         self.running = False
-        _traffic_lib.traffic_capture_stop()
+        self._stop_event.set()
+        _traffic_lib.traffic_capture_stop(self._handle)
 
         current = threading.current_thread()
 
@@ -141,13 +634,14 @@ class TrafficLogger:
                 if self.capture_thread.is_alive():
                     WARNING("Capture thread shutdown delayed")
 
-        if self.timer_thread and self.timer_thread.is_alive():
-            if current is not self.timer_thread:
-                self.timer_thread.join(timeout=1)
+        if self.stats_thread and self.stats_thread.is_alive():
+            if current is not self.stats_thread:
+                self.stats_thread.join(timeout=self.STATS_INTERVAL + 1)
 
+        self._report_stats()
         duration = time.time() - self.start_time
         INFO(f"  Total duration: {BOLD}{BRIGHT_WHITE}{duration:.1f}s{RESET}")
-        SUCCESS(f"Traffic capture complete → {BOLD}{BRIGHT_CYAN}{self.output_file}{RESET}")
+        SUCCESS(f"Traffic capture complete → {BOLD}{BRIGHT_CYAN}{self.output_label}{RESET}")
         self._stopped = True
 
     def user_abort(self) -> None:
@@ -0,0 +1,156 @@
+// Replay a large synthetic pcap through the per-packet pcap_next_ex() loop that
+// traffic_capture_start() used to run and through the current pcap_dispatch() batch
+// loop, and report the cost per packet of each. Both loops read the same offline handle
+// and count the packets without writing them anywhere, so the difference is the batching
+// and the clock reads alone, not the output path.
+//
+// Usage: bench_dispatch [packets] [rounds]
+
+#define _GNU_SOURCE  // must precede the first system header, as in traffic.c
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <time.h>
+
+// Built against the implementation directly so the real static loop is measured.
+#include "../traffic.c"
+
+#define BENCH_PCAP "bench_input.pcap"
+#define BENCH_PACKETS 2000000
+#define BENCH_ROUNDS 5
+#define BENCH_FRAME_LEN 74
+#define BENCH_SNAPLEN 65535
+
+static double now_seconds(void) {
+    struct timespec ts;
+    clock_gettime(CLOCK_MONOTONIC, &ts);
+    return (double)ts.tv_sec + (double)ts.tv_nsec / 1e9;
+}
+
+static int write_input(int packets) {
+    pcap_t *dead = pcap_open_dead(DLT_EN10MB, BENCH_SNAPLEN);
+    pcap_dumper_t *out = pcap_dump_open(dead, BENCH_PCAP);
+    u_char frame[BENCH_FRAME_LEN];
+    struct pcap_pkthdr hdr = {.caplen = BENCH_FRAME_LEN, .len = BENCH_FRAME_LEN};
+
+    if (!out) {
+        fprintf(stderr, "cannot write %s: %s\n", BENCH_PCAP, pcap_geterr(dead));
+        pcap_close(dead);
+        return -1;
+    }
+    memset(frame, 0xab, sizeof(frame));
+    gettimeofday(&hdr.ts, NULL);
+    for (int i = 0; i < packets; i++) {
+        hdr.ts.tv_usec = i % 1000000;
+        pcap_dump((u_char *)out, &hdr, frame);
+    }
+    pcap_dump_close(out);
+    pcap_close(dead);
+    return 0;
+}
+
+static int open_replay(traffic_capture_t *cap) {
+    char errbuf[PCAP_ERRBUF_SIZE];
+
+    cap->pcap = pcap_open_offline(BENCH_PCAP, errbuf);
+    if (!cap->pcap) {
+        fprintf(stderr, "pcap_open_offline: %s\n", errbuf);
+        return -1;
+    }
+    return 0;
+}
+
+static void close_replay(traffic_capture_t *cap) {
+    pcap_close(cap->pcap);
+    cap->pcap = NULL;
+}
+
+// The loop as it was before batching: one pcap_next_ex(), one gettimeofday() and a
+// floating-point elapsed computation per packet.
+static unsigned long long legacy_loop(traffic_capture_t *cap,
+                                      const traffic_capture_config_t *config) {
+    unsigned long long packets = 0;
+    struct timeval start_tv;
+    struct timeval now_tv;
+
+    gettimeofday(&start_tv, NULL);
+    while (cap->running) {
+        struct pcap_pkthdr *hdr;
+        const u_char *pkt;
+        int ret = pcap_next_ex(cap->pcap, &hdr, &pkt);
+
+        gettimeofday(&now_tv, NULL);
+        double elapsed = (double)(now_tv.tv_sec - start_tv.tv_sec) +
+                         (double)(now_tv.tv_usec - start_tv.tv_usec) / 1000000.0;
+        if (config->duration > 0 && elapsed >= config->duration) {
+            break;
+        }
+        if (ret == 1) {
+            packets++;
+            if (config->max_packets > 0 && packets >= (unsigned long long)config->max_packets) {
+                break;
+            }
+        } else if (ret < 0) {
+            break;
+        }
+    }
+    return packets;
+}
+
+static unsigned long long batched_loop(traffic_capture_t *cap,
+                                       const traffic_capture_config_t *config) {
+    capture_loop_t loop = {.cap = cap, .config = config, .ts_unit_ns = NSEC_PER_USEC};
+
+    // A savefile: REPLAY_BATCH batches and no poll() on its descriptor, as in a real replay.
+    cap->offline = true;
+    run_capture_loop(&loop);
+    return loop.packets;
+}
+
+static double run(const char *name,
+                  unsigned long long (*fn)(traffic_capture_t *, const traffic_capture_config_t *),
+                  const traffic_capture_config_t *config, int rounds) {
+    traffic_capture_t *cap = traffic_capture_create();
+    double best = 0.0;
+
+    for (int r = 0; r < rounds; r++) {
+        if (!cap || open_replay(cap) < 0) {
+            exit(EXIT_FAILURE);
+        }
+        cap->running = 1;
+        double t0 = now_seconds();
+        unsigned long long packets = fn(cap, config);
+        double ns = (now_seconds() - t0) * 1e9 / (double)packets;
+        close_replay(cap);
+
+        if (packets != (unsigned long long)config->max_packets) {
+            fprintf(stderr, "%s: replayed %llu of %d packets\n", name, packets,
+                    config->max_packets);
+            exit(EXIT_FAILURE);
+        }
+        if (r == 0 || ns < best) {
+            best = ns;
+        }
+    }
+    printf("%-8s %8.1f ns/packet  %6.2f Mpps\n", name, best, 1e3 / best);
+    traffic_capture_destroy(cap);
+    return best;
+}
+
+int main(int argc, char **argv) {
+    int packets = argc > 1 ? atoi(argv[1]) : BENCH_PACKETS;
+    int rounds = argc > 2 ? atoi(argv[2]) : BENCH_ROUNDS;
+    traffic_capture_config_t config = {.max_packets = packets};
+
+    if (packets <= 0 || rounds <= 0 || write_input(packets) < 0) {
+        fprintf(stderr, "usage: %s [packets] [rounds]\n", argv[0]);
+        return EXIT_FAILURE;
+    }
+    printf("replaying %d packets, best of %d rounds\n", packets, rounds);
+    double before = run("before", legacy_loop, &config, rounds);
+    double after = run("after", batched_loop, &config, rounds);
+    printf("speedup  %8.2fx\n", before / after);
+    remove(BENCH_PCAP);
+    return EXIT_SUCCESS;
+}
@@ -0,0 +1,92 @@
+#include "bpfcache.h"
+
+#include <stdint.h>
+#include <stdlib.h>
+#include <string.h>
+
+typedef struct {
+    char *expr;  // NULL = empty slot
+    int linktype;
+    int snaplen;
+    struct bpf_program prog;
+    uint64_t used;  // value of the use counter at the last lookup
+} bpf_entry_t;
+
+struct bpfcache {
+    bpf_entry_t *entries;
+    size_t capacity;
+    uint64_t uses;
+    unsigned long long compiles;
+};
+
+bpfcache_t *bpfcache_create(size_t capacity) {
+    bpfcache_t *cache = calloc(1, sizeof(*cache));
+    if (cache) {
+        cache->entries = calloc(capacity, sizeof(*cache->entries));
+        if (!cache->entries) {
+            free(cache);
+            return NULL;
+        }
+        cache->capacity = capacity;
+    }
+    return cache;
+}
+
+static void free_entry(bpf_entry_t *entry) {
+    if (entry->expr) {
+        pcap_freecode(&entry->prog);
+        free(entry->expr);
+        entry->expr = NULL;
+    }
+}
+
+const struct bpf_program *bpfcache_get(bpfcache_t *cache, pcap_t *pcap, const char *expr) {
+    int linktype = pcap_datalink(pcap);
+    int snaplen = pcap_snapshot(pcap);
+    bpf_entry_t *victim = &cache->entries[0];
+    struct bpf_program prog;
+    char *copy = NULL;
+
+    // A few dozen entries at most, so a linear scan beats maintaining a hash.
+    for (size_t i = 0; i < cache->capacity; i++) {
+        bpf_entry_t *entry = &cache->entries[i];
+        if (entry->expr && entry->linktype == linktype && entry->snaplen == snaplen &&
+            strcmp(entry->expr, expr) == 0) {
+            entry->used = ++cache->uses;
+            return &entry->prog;
+        }
+        if (victim->expr && (!entry->expr || entry->used < victim->used)) {
+            victim = entry;
+        }
+    }
+
+    cache->compiles++;
+    if (pcap_compile(pcap, &prog, expr, 1, 0) < 0) {
+        return NULL;
+    }
+    copy = strdup(expr);
+    if (!copy) {
+        pcap_freecode(&prog);
+        return NULL;
+    }
+    free_entry(victim);
+    *victim = (bpf_entry_t){.expr = copy,
+                            .linktype = linktype,
+                            .snaplen = snaplen,
+                            .prog = prog,
+                            .used = ++cache->uses};
+    return &victim->prog;
+}
+
+unsigned long long bpfcache_compiles(const bpfcache_t *cache) { return cache->compiles; }
+
+void bpfcache_destroy(bpfcache_t *cache) {
+    if (!cache) {
+        return;
+    }
+    for (size_t i = 0; i < cache->capacity; i++) {
+        free_entry(&cache->entries[i]);
+    }
+    free(cache->entries);
+    free(cache);
+}
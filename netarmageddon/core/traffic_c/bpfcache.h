@@ -0,0 +1,23 @@
+#ifndef BPFCACHE_H
+#define BPFCACHE_H
+
+#include <pcap/pcap.h>
+#include <stddef.h>
+
+// Compiled BPF programs of one capture handle, keyed by filter expression, link type and
+// snapshot length (a program's accept value is the snaplen), so switching back and forth
+// between filters compiles each expression once. Beyond `capacity` entries the least
+// recently used program is freed; pcap_setfilter() keeps its own copy, so that is safe
+// even for the installed filter. Not thread-safe: the capture thread owns it.
+typedef struct bpfcache bpfcache_t;
+
+bpfcache_t *bpfcache_create(size_t capacity);
+// The program for `expr` on pcap's link type and snaplen, compiled with pcap_compile() on a
+// miss. Returns NULL when the expression does not compile, with the message in
+// pcap_geterr(pcap). The program is valid until the next call or bpfcache_destroy().
+const struct bpf_program *bpfcache_get(bpfcache_t *cache, pcap_t *pcap, const char *expr);
+// Number of pcap_compile() calls so far (cache misses).
+unsigned long long bpfcache_compiles(const bpfcache_t *cache);
+void bpfcache_destroy(bpfcache_t *cache);
+
+#endif  // BPFCACHE_H
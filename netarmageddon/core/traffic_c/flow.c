@@ -0,0 +1,217 @@
+#include "flow.h"
+
+#include <string.h>
+
+enum {
+    // Link types (pcap LINKTYPE_* values; DLT_RAW is 12 or 14 depending on the platform)
+    LINK_NULL = 0,
+    LINK_ETHERNET = 1,
+    LINK_RAW_BSD = 12,
+    LINK_RAW_OPENBSD = 14,
+    LINK_RAW = 101,
+    LINK_LINUX_SLL = 113,
+    LINK_IPV4 = 228,
+    LINK_IPV6 = 229,
+    LINK_LINUX_SLL2 = 276,
+
+    ETH_HEADER_LEN = 14,
+    VLAN_TAG_LEN = 4,
+    SLL_HEADER_LEN = 16,
+    SLL2_HEADER_LEN = 20,
+    NULL_HEADER_LEN = 4,
+    ETHERTYPE_IPV4 = 0x0800,
+    ETHERTYPE_IPV6 = 0x86DD,
+    ETHERTYPE_VLAN = 0x8100,
+    ETHERTYPE_QINQ = 0x88A8,
+    BSD_AF_INET = 2,
+    BSD_AF_INET6_BSD = 24,  // NetBSD/OpenBSD
+    BSD_AF_INET6_FREEBSD = 28,
+    BSD_AF_INET6_DARWIN = 30,
+
+    IPV4_MIN_HEADER_LEN = 20,
+    IPV6_HEADER_LEN = 40,
+    IPV6_ADDR_LEN = 16,
+    IPV4_ADDR_LEN = 4,
+    IPV4_FRAG_OFFSET_MASK = 0x1FFF,
+    PROTO_TCP = 6,
+    PROTO_UDP = 17,
+    PROTO_SCTP = 132,
+    PORTS_LEN = 4,
+    IPV4_MAX_HEADER_LEN = 60,
+    TCP_MAX_HEADER_LEN = 60,  // the longest transport header of the protocols above
+    HEADER_VLAN_TAGS = 2,     // QinQ
+};
+static const uint64_t FNV_OFFSET = 0xcbf29ce484222325ULL;
+static const uint64_t FNV_PRIME = 0x100000001b3ULL;
+static const uint8_t V4_MAPPED_PREFIX[12] = {0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0xff, 0xff};
+
+static uint16_t read_be16(const uint8_t *p) { return (uint16_t)(p[0] << 8 | p[1]); }
+
+// Offset of the IP header and its version (4 or 6), or -1 when this is not IP.
+static int locate_ip(int linktype, const uint8_t *pkt, uint32_t caplen, int *version) {
+    uint32_t off = 0;
+    uint16_t ethertype = 0;
+
+    switch (linktype) {
+        case LINK_ETHERNET:
+            off = ETH_HEADER_LEN;
+            if (caplen < off) {
+                return -1;
+            }
+            ethertype = read_be16(pkt + off - 2);
+            while ((ethertype == ETHERTYPE_VLAN || ethertype == ETHERTYPE_QINQ) &&
+                   caplen >= off + VLAN_TAG_LEN) {
+                ethertype = read_be16(pkt + off + 2);
+                off += VLAN_TAG_LEN;
+            }
+            break;
+        case LINK_LINUX_SLL:
+            if (caplen < SLL_HEADER_LEN) {
+                return -1;
+            }
+            off = SLL_HEADER_LEN;
+            ethertype = read_be16(pkt + SLL_HEADER_LEN - 2);
+            break;
+        case LINK_LINUX_SLL2:
+            if (caplen < SLL2_HEADER_LEN) {
+                return -1;
+            }
+            off = SLL2_HEADER_LEN;
+            ethertype = read_be16(pkt);
+            break;
+        case LINK_NULL: {
+            uint32_t family;
+            if (caplen < NULL_HEADER_LEN) {
+                return -1;
+            }
+            memcpy(&family, pkt, sizeof(family));  // host byte order of the capturing machine
+            off = NULL_HEADER_LEN;
+            ethertype = family == BSD_AF_INET ? ETHERTYPE_IPV4
+                        : (family == BSD_AF_INET6_BSD || family == BSD_AF_INET6_FREEBSD ||
+                           family == BSD_AF_INET6_DARWIN)
+                            ? ETHERTYPE_IPV6
+                            : 0;
+            break;
+        }
+        case LINK_RAW:
+        case LINK_RAW_BSD:
+        case LINK_RAW_OPENBSD:
+        case LINK_IPV4:
+        case LINK_IPV6:
+            if (caplen < 1) {
+                return -1;
+            }
+            ethertype = (pkt[0] >> 4) == 6 ? ETHERTYPE_IPV6 : ETHERTYPE_IPV4;
+            break;
+        default:
+            return -1;
+    }
+
+    if (ethertype == ETHERTYPE_IPV4) {
+        *version = 4;
+    } else if (ethertype == ETHERTYPE_IPV6) {
+        *version = 6;
+    } else {
+        return -1;
+    }
+    return (int)off;
+}
+
+uint32_t flow_headers_len(int linktype) {
+    uint32_t link = 0;
+    switch (linktype) {
+        case LINK_ETHERNET:
+            link = ETH_HEADER_LEN + HEADER_VLAN_TAGS * VLAN_TAG_LEN;
+            break;
+        case LINK_LINUX_SLL:
+            link = SLL_HEADER_LEN;
+            break;
+        case LINK_LINUX_SLL2:
+            link = SLL2_HEADER_LEN;
+            break;
+        case LINK_NULL:
+            link = NULL_HEADER_LEN;
+            break;
+        case LINK_RAW:
+        case LINK_RAW_BSD:
+        case LINK_RAW_OPENBSD:
+        case LINK_IPV4:
+        case LINK_IPV6:
+            break;
+        default:
+            return 0;
+    }
+    return link + IPV4_MAX_HEADER_LEN + TCP_MAX_HEADER_LEN;
+}
+
+bool flow_key_from_packet(int linktype, const uint8_t *pkt, uint32_t caplen, flow_key_t *key) {
+    int version = 0;
+    int ip = locate_ip(linktype, pkt, caplen, &version);
+    uint32_t l4 = 0;
+    bool has_ports = true;
+    uint8_t addr[2][IPV6_ADDR_LEN];
+    uint16_t port[2] = {0, 0};
+
+    if (ip < 0) {
+        return false;
+    }
+    const uint8_t *hdr = pkt + ip;
+    uint32_t left = caplen - (uint32_t)ip;
+
+    memset(key, 0, sizeof(*key));
+    if (version == 4) {
+        uint32_t ihl = (uint32_t)(hdr[0] & 0x0f) * 4;
+        if (left < IPV4_MIN_HEADER_LEN || (hdr[0] >> 4) != 4 || ihl < IPV4_MIN_HEADER_LEN) {
+            return false;
+        }
+        key->proto = hdr[9];
+        for (int i = 0; i < 2; i++) {
+            memcpy(addr[i], V4_MAPPED_PREFIX, sizeof(V4_MAPPED_PREFIX));
+            memcpy(addr[i] + sizeof(V4_MAPPED_PREFIX), hdr + 12 + i * IPV4_ADDR_LEN, IPV4_ADDR_LEN);
+        }
+        has_ports = (read_be16(hdr + 6) & IPV4_FRAG_OFFSET_MASK) == 0;
+        l4 = ihl;
+    } else {
+        if (left < IPV6_HEADER_LEN || (hdr[0] >> 4) != 6) {
+            return false;
+        }
+        key->proto = hdr[6];  // extension headers are not followed
+        memcpy(addr[0], hdr + 8, IPV6_ADDR_LEN);
+        memcpy(addr[1], hdr + 8 + IPV6_ADDR_LEN, IPV6_ADDR_LEN);
+        l4 = IPV6_HEADER_LEN;
+    }
+
+    if (has_ports &&
+        (key->proto == PROTO_TCP || key->proto == PROTO_UDP || key->proto == PROTO_SCTP) &&
+        left >= l4 + PORTS_LEN) {
+        port[0] = read_be16(hdr + l4);
+        port[1] = read_be16(hdr + l4 + 2);
+    }
+
+    int order = memcmp(addr[0], addr[1], IPV6_ADDR_LEN);
+    int lower = order < 0 || (order == 0 && port[0] <= port[1]) ? 0 : 1;
+    memcpy(key->addr[0], addr[lower], IPV6_ADDR_LEN);
+    memcpy(key->addr[1], addr[1 - lower], IPV6_ADDR_LEN);
+    key->port[0] = port[lower];
+    key->port[1] = port[1 - lower];
+    return true;
+}
+
+static uint64_t fnv1a(uint64_t hash, const uint8_t *data, size_t len) {
+    for (size_t i = 0; i < len; i++) {
+        hash ^= data[i];
+        hash *= FNV_PRIME;
+    }
+    return hash;
+}
+
+uint64_t flow_hash(const flow_key_t *key) {
+    uint8_t ports[2][2] = {{(uint8_t)(key->port[0] >> 8), (uint8_t)key->port[0]},
+                           {(uint8_t)(key->port[1] >> 8), (uint8_t)key->port[1]}};
+    uint64_t hash = fnv1a(FNV_OFFSET, &key->proto, 1);
+    hash = fnv1a(hash, key->addr[0], sizeof(key->addr[0]));
+    hash = fnv1a(hash, ports[0], sizeof(ports[0]));
+    hash = fnv1a(hash, key->addr[1], sizeof(key->addr[1]));
+    hash = fnv1a(hash, ports[1], sizeof(ports[1]));
+    return hash ? hash : 1;
+}
@@ -0,0 +1,29 @@
+#ifndef FLOW_H
+#define FLOW_H
+
+#include <stdbool.h>
+#include <stdint.h>
+
+// Direction-independent 5-tuple of an IPv4/IPv6 packet. IPv4 addresses are stored
+// IPv4-mapped (::ffff:a.b.c.d) and the endpoints are ordered so that (addr[0], port[0])
+// is the lower one, so both directions of a conversation share one key.
+typedef struct {
+    uint8_t addr[2][16];
+    uint16_t port[2];  // host byte order; 0 for protocols without ports and for fragments
+    uint8_t proto;
+} flow_key_t;
+
+// Parse the link and IP headers of a captured packet. Returns false for non-IP packets,
+// unsupported link types and truncated headers.
+bool flow_key_from_packet(int linktype, const uint8_t *pkt, uint32_t caplen, flow_key_t *key);
+
+// Bytes that hold the link, IP and transport headers of any IPv4/IPv6 packet of this link
+// type (the longest IPv4 and TCP headers, two VLAN tags on Ethernet), or 0 for link types
+// flow_key_from_packet() does not parse.
+uint32_t flow_headers_len(int linktype);
+
+// 64-bit FNV-1a over proto, addr[0], port[0] (big-endian), addr[1], port[1]; never 0.
+// Mirrored by netarmageddon.core.capture_index.flow_hash().
+uint64_t flow_hash(const flow_key_t *key);
+
+#endif  // FLOW_H
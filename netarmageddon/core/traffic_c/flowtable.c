@@ -0,0 +1,299 @@
+#include "flowtable.h"
+
+#include <arpa/inet.h>
+#include <errno.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+
+#include "flow.h"
+
+enum {
+    TIME_SIZE = 32,
+    ADDR_SIZE = INET6_ADDRSTRLEN,
+    V4_MAPPED_PREFIX_LEN = 12,
+    HASH_SHIFT = 32,
+};
+static const uint64_t NSEC_PER_SEC = 1000000000ULL;
+static const uint64_t NSEC_PER_USEC = 1000ULL;
+static const uint64_t HASH_SEED = 0x9e3779b97f4a7c15ULL;
+static const uint64_t HASH_MULTIPLIER = 0xff51afd7ed558ccdULL;
+static const uint64_t SWEEP_NS = 1000000000ULL;  // idle sweeps run at most once a second
+static const uint8_t V4_MAPPED_PREFIX[V4_MAPPED_PREFIX_LEN] = {0, 0, 0, 0, 0,    0,
+                                                               0, 0, 0, 0, 0xff, 0xff};
+
+typedef struct {
+    uint64_t hash;  // 0 = empty slot
+    flow_key_t key;
+    bool dirty;  // updated since the last export
+    uint64_t first_ns;
+    uint64_t last_ns;
+    uint64_t packets;
+    uint64_t bytes;
+} flow_entry_t;
+
+struct flowtable {
+    FILE *file;
+    int linktype;
+    bool nanosecond;
+    uint64_t idle_ns;
+    uint64_t export_ns;
+
+    // Open addressing with linear probing; the capacity is a power of two with at least a
+    // quarter of the slots free, and removals shift later entries back instead of leaving
+    // tombstones.
+    flow_entry_t *slots;
+    size_t capacity;
+    size_t max_flows;
+    size_t used;
+
+    uint64_t now_ns;  // newest packet timestamp seen
+    bool scheduled;   // sweep_at/export_at are set (from the first packet)
+    uint64_t sweep_at;
+    uint64_t export_at;
+    uint64_t due_at;  // the earlier of the two that is enabled
+    unsigned long long evicted;
+    unsigned long long overflows;
+};
+
+flowtable_t *flowtable_open(const flowtable_config_t *config, char *err, size_t err_size) {
+    flowtable_t *table = NULL;
+    size_t capacity = 1;
+
+    if (config->max_flows == 0) {
+        snprintf(err, err_size, "flow table size must be positive");  // NOLINT
+        return NULL;
+    }
+    while (capacity < config->max_flows + config->max_flows / 3 + 1) {
+        capacity *= 2;
+    }
+    table = calloc(1, sizeof(*table));
+    if (table) {
+        table->slots = calloc(capacity, sizeof(*table->slots));
+    }
+    if (!table || !table->slots) {
+        snprintf(err, err_size, "cannot allocate a table of %zu flows",
+                 config->max_flows);  // NOLINT
+        free(table);
+        return NULL;
+    }
+    table->file = fopen(config->path, "w");
+    if (!table->file ||
+        fputs("exported,first_seen,last_seen,proto,addr_a,port_a,addr_b,port_b,packets,bytes,"
+              "state\n",
+              table->file) < 0) {
+        snprintf(err, err_size, "%s: %s", config->path, strerror(errno));  // NOLINT
+        if (table->file) {
+            fclose(table->file);
+        }
+        free(table->slots);
+        free(table);
+        return NULL;
+    }
+    table->capacity = capacity;
+    table->max_flows = config->max_flows;
+    table->linktype = config->linktype;
+    table->nanosecond = config->nanosecond;
+    table->idle_ns = (uint64_t)config->idle_seconds * NSEC_PER_SEC;
+    table->export_ns = (uint64_t)config->export_seconds * NSEC_PER_SEC;
+    return table;
+}
+
+// The table's own hash: a few multiply-rotate rounds over the key words, much cheaper per
+// packet than the byte-wise flow_hash() the index sidecar needs for a stable file format.
+static uint64_t key_hash(const flow_key_t *key) {
+    uint64_t words[5] = {0};
+    uint64_t hash = HASH_SEED;
+
+    memcpy(words, key->addr, sizeof(key->addr));
+    words[4] = (uint64_t)key->port[0] << 24 | (uint64_t)key->port[1] << 8 | key->proto;
+    for (size_t i = 0; i < sizeof(words) / sizeof(words[0]); i++) {
+        hash = (hash ^ words[i]) * HASH_MULTIPLIER;
+        hash ^= hash >> HASH_SHIFT;
+    }
+    return hash ? hash : 1;
+}
+
+static flow_entry_t *find_slot(const flowtable_t *table, uint64_t hash, const flow_key_t *key) {
+    size_t mask = table->capacity - 1;
+    size_t i = (size_t)hash & mask;
+    while (table->slots[i].hash != 0 &&
+           (table->slots[i].hash != hash || memcmp(&table->slots[i].key, key, sizeof(*key)) != 0)) {
+        i = (i + 1) & mask;
+    }
+    return &table->slots[i];
+}
+
+// Empty slot i and shift back the entries of its probe run that may now sit closer to
+// their home slot.
+static void remove_slot(flowtable_t *table, size_t i) {
+    size_t mask = table->capacity - 1;
+    size_t j = i;
+    while (true) {
+        j = (j + 1) & mask;
+        if (table->slots[j].hash == 0) {
+            break;
+        }
+        size_t home = (size_t)table->slots[j].hash & mask;
+        // Entry j stays put if its home lies cyclically in (i, j].
+        bool stays = i <= j ? (i < home && home <= j) : (i < home || home <= j);
+        if (!stays) {
+            table->slots[i] = table->slots[j];
+            i = j;
+        }
+    }
+    table->slots[i].hash = 0;
+    table->used--;
+}
+
+static void schedule(flowtable_t *table) {
+    table->due_at = UINT64_MAX;
+    if (table->idle_ns > 0) {
+        table->due_at = table->sweep_at;
+    }
+    if (table->export_ns > 0 && table->export_at < table->due_at) {
+        table->due_at = table->export_at;
+    }
+}
+
+static void format_time(char *buf, size_t size, uint64_t ns, bool nanosecond) {
+    if (nanosecond) {
+        snprintf(buf, size, "%llu.%09llu", (unsigned long long)(ns / NSEC_PER_SEC),  // NOLINT
+                 (unsigned long long)(ns % NSEC_PER_SEC));
+    } else {
+        snprintf(buf, size, "%llu.%06llu", (unsigned long long)(ns / NSEC_PER_SEC),  // NOLINT
+                 (unsigned long long)(ns % NSEC_PER_SEC / NSEC_PER_USEC));
+    }
+}
+
+static void format_addr(char *buf, const uint8_t addr[16]) {
+    if (memcmp(addr, V4_MAPPED_PREFIX, V4_MAPPED_PREFIX_LEN) == 0) {
+        inet_ntop(AF_INET, addr + V4_MAPPED_PREFIX_LEN, buf, ADDR_SIZE);
+    } else {
+        inet_ntop(AF_INET6, addr, buf, ADDR_SIZE);
+    }
+}
+
+static int export_flow(flowtable_t *table, flow_entry_t *flow, const char *state) {
+    char exported[TIME_SIZE];
+    char first[TIME_SIZE];
+    char last[TIME_SIZE];
+    char addr_a[ADDR_SIZE];
+    char addr_b[ADDR_SIZE];
+
+    format_time(exported, sizeof(exported), table->now_ns, table->nanosecond);
+    format_time(first, sizeof(first), flow->first_ns, table->nanosecond);
+    format_time(last, sizeof(last), flow->last_ns, table->nanosecond);
+    format_addr(addr_a, flow->key.addr[0]);
+    format_addr(addr_b, flow->key.addr[1]);
+    flow->dirty = false;
+    return fprintf(table->file, "%s,%s,%s,%u,%s,%u,%s,%u,%llu,%llu,%s\n", exported, first, last,
+                   flow->key.proto, addr_a, flow->key.port[0], addr_b, flow->key.port[1],
+                   (unsigned long long)flow->packets, (unsigned long long)flow->bytes, state) < 0
+               ? -1
+               : 0;
+}
+
+// Evict idle flows and export updated ones, whichever is due at now_ns.
+static int run_due(flowtable_t *table) {
+    int ret = 0;
+    bool sweep = table->idle_ns > 0 && table->now_ns >= table->sweep_at;
+    bool export = table->export_ns > 0 && table->now_ns >= table->export_at;
+
+    // A removal may shift a later entry into slot i, so i only advances past kept entries.
+    for (size_t i = 0; i < table->capacity && ret == 0;) {
+        flow_entry_t *flow = &table->slots[i];
+        if (flow->hash == 0) {
+            i++;
+        } else if (sweep && flow->last_ns + table->idle_ns <= table->now_ns) {
+            ret = export_flow(table, flow, "idle");
+            table->evicted++;
+            remove_slot(table, i);
+        } else {
+            if (export && flow->dirty) {
+                ret = export_flow(table, flow, "active");
+            }
+            i++;
+        }
+    }
+    if (sweep) {
+        table->sweep_at = table->now_ns + SWEEP_NS;
+    }
+    if (export) {
+        table->export_at = table->now_ns + table->export_ns;
+    }
+    schedule(table);
+    if (fflush(table->file) != 0) {
+        ret = -1;
+    }
+    return ret;
+}
+
+int flowtable_add(flowtable_t *table, uint32_t ts_sec, uint32_t ts_frac, uint32_t caplen,
+                  uint32_t len, const uint8_t *pkt) {
+    int ret = 0;
+    flow_key_t key;
+    uint64_t ts_ns = (uint64_t)ts_sec * NSEC_PER_SEC +
+                     (table->nanosecond ? ts_frac : (uint64_t)ts_frac * NSEC_PER_USEC);
+
+    if (!table->scheduled) {
+        // Both schedules start from the first packet of the capture.
+        table->scheduled = true;
+        table->sweep_at = ts_ns + SWEEP_NS;
+        table->export_at = ts_ns + table->export_ns;
+        schedule(table);
+    }
+    if (ts_ns > table->now_ns) {
+        table->now_ns = ts_ns;
+        if (ts_ns >= table->due_at) {
+            ret = run_due(table);
+        }
+    }
+    if (!flow_key_from_packet(table->linktype, pkt, caplen, &key)) {
+        return ret;
+    }
+    uint64_t hash = key_hash(&key);
+    flow_entry_t *flow = find_slot(table, hash, &key);
+    if (flow->hash == 0) {
+        if (table->used >= table->max_flows) {
+            table->overflows++;
+            return ret;
+        }
+        flow->hash = hash;
+        flow->key = key;
+        flow->first_ns = ts_ns;
+        flow->packets = 0;
+        flow->bytes = 0;
+        table->used++;
+    }
+    flow->dirty = true;
+    flow->last_ns = ts_ns;
+    flow->packets++;
+    flow->bytes += len;
+    return ret;
+}
+
+void flowtable_counts(const flowtable_t *table, unsigned long long *active,
+                      unsigned long long *evicted, unsigned long long *overflows) {
+    *active = table->used;
+    *evicted = table->evicted;
+    *overflows = table->overflows;
+}
+
+int flowtable_close(flowtable_t *table) {
+    int ret = 0;
+    if (!table) {
+        return 0;
+    }
+    for (size_t i = 0; i < table->capacity; i++) {
+        if (table->slots[i].hash != 0 && export_flow(table, &table->slots[i], "end") < 0) {
+            ret = -1;
+        }
+    }
+    if (fclose(table->file) != 0) {
+        ret = -1;
+    }
+    free(table->slots);
+    free(table);
+    return ret;
+}
@@ -0,0 +1,44 @@
+#ifndef FLOWTABLE_H
+#define FLOWTABLE_H
+
+#include <stdbool.h>
+#include <stddef.h>
+#include <stdint.h>
+
+// Per-flow packet/byte counters kept on the capture thread, exported as CSV instead of (or
+// next to) the packets themselves. One line per flow and export:
+//
+//   exported,first_seen,last_seen,proto,addr_a,port_a,addr_b,port_b,packets,bytes,state
+//
+// Times are capture timestamps in seconds. Endpoints are ordered as in flow_key_t, so both
+// directions of a conversation are one flow. Counters are cumulative since the flow was
+// first seen; `state` is "active" for a periodic export of a flow that is still open,
+// "idle" when the flow was evicted after flowtable_config_t.idle_seconds without packets
+// and "end" when the capture finished. The last line of a flow holds its totals.
+typedef struct flowtable flowtable_t;
+
+typedef struct {
+    const char *path;         // CSV output, truncated on open
+    size_t max_flows;         // table size limit; packets of further flows are counted only
+    uint32_t idle_seconds;    // evict flows without packets for this long (0 = never)
+    uint32_t export_seconds;  // append every flow updated since the last export this often
+                              // (0 = only when the capture ends)
+    int linktype;
+    bool nanosecond;  // tv_usec of packet headers holds nanoseconds
+} flowtable_config_t;
+
+// Allocate the table and create the output file. On failure returns NULL with a message
+// in err.
+flowtable_t *flowtable_open(const flowtable_config_t *config, char *err, size_t err_size);
+// Count one packet (its wire length as bytes); non-IP packets are ignored. Idle sweeps
+// (at most once a second) and periodic exports run from here when the packet's timestamp
+// makes them due, so they follow capture time. Returns -1 when writing the file failed.
+int flowtable_add(flowtable_t *table, uint32_t ts_sec, uint32_t ts_frac, uint32_t caplen,
+                  uint32_t len, const uint8_t *pkt);
+// Flows in the table, flows evicted as idle so far, and packets that found the table full.
+void flowtable_counts(const flowtable_t *table, unsigned long long *active,
+                      unsigned long long *evicted, unsigned long long *overflows);
+// Export every remaining flow as "end" and close the file.
+int flowtable_close(flowtable_t *table);
+
+#endif  // FLOWTABLE_H
@@ -0,0 +1,197 @@
+#include "ring.h"
+
+#include <stdint.h>
+#include <stdlib.h>
+#include <string.h>
+#include <time.h>
+
+enum { RECORD_LEN = sizeof(traffic_stream_record_t) };
+static const uint32_t WRAP_MARKER = UINT32_MAX;  // caplen of the end-of-buffer marker
+static const long NSEC_PER_MSEC = 1000000;
+static const long NSEC_PER_SEC = 1000000000;
+static const int MSEC_PER_SEC = 1000;
+
+int ring_init(record_ring_t *ring, size_t size) {
+    memset(ring, 0, sizeof(*ring));
+    ring->buf = malloc(size);
+    if (!ring->buf) {
+        return -1;
+    }
+    ring->size = size;
+    pthread_mutex_init(&ring->lock, NULL);
+    pthread_cond_init(&ring->cond, NULL);
+    return 0;
+}
+
+void ring_free(record_ring_t *ring) {
+    if (!ring->buf) {
+        return;
+    }
+    pthread_cond_destroy(&ring->cond);
+    pthread_mutex_destroy(&ring->lock);
+    free(ring->buf);
+    ring->buf = NULL;
+}
+
+void ring_reset(record_ring_t *ring) {
+    pthread_mutex_lock(&ring->lock);
+    ring->head = 0;
+    ring->tail = 0;
+    ring->peak = 0;
+    ring->done = false;
+    pthread_mutex_unlock(&ring->lock);
+}
+
+static void deadline_after(struct timespec *until, int timeout_ms) {
+    clock_gettime(CLOCK_REALTIME, until);
+    until->tv_sec += timeout_ms / MSEC_PER_SEC;
+    until->tv_nsec += (long)(timeout_ms % MSEC_PER_SEC) * NSEC_PER_MSEC;
+    if (until->tv_nsec >= NSEC_PER_SEC) {
+        until->tv_sec++;
+        until->tv_nsec -= NSEC_PER_SEC;
+    }
+}
+
+// Bytes a record of `need` bytes takes at `head`, including the skipped end of the buffer
+// when it would not fit before the wrap point.
+static size_t footprint(const record_ring_t *ring, unsigned long long head, size_t need) {
+    size_t contiguous = ring->size - head % ring->size;
+    return need > contiguous ? contiguous + need : need;
+}
+
+bool ring_push(record_ring_t *ring, const struct pcap_pkthdr *hdr, const u_char *pkt) {
+    size_t need = RECORD_LEN + hdr->caplen;
+    unsigned long long head = ring->head;
+    unsigned long long tail = __atomic_load_n(&ring->tail, __ATOMIC_SEQ_CST);
+    size_t off = head % ring->size;
+    size_t contiguous = ring->size - off;
+
+    if (head + footprint(ring, head, need) - tail > ring->size) {
+        return false;
+    }
+    if (need > contiguous) {
+        if (contiguous >= RECORD_LEN) {
+            traffic_stream_record_t marker = {.caplen = WRAP_MARKER};
+            memcpy(ring->buf + off, &marker, sizeof(marker));
+        }
+        head += contiguous;
+        off = 0;
+    }
+
+    traffic_stream_record_t record = {.ts_sec = (uint32_t)hdr->ts.tv_sec,
+                                      .ts_usec = (uint32_t)hdr->ts.tv_usec,
+                                      .caplen = hdr->caplen,
+                                      .len = hdr->len};
+    memcpy(ring->buf + off, &record, sizeof(record));
+    memcpy(ring->buf + off + RECORD_LEN, pkt, hdr->caplen);
+    head += need;
+    __atomic_store_n(&ring->head, head, __ATOMIC_SEQ_CST);
+    if (head - tail > ring->peak) {
+        ring->peak = head - tail;
+    }
+    return true;
+}
+
+bool ring_wait_space(record_ring_t *ring, size_t caplen, int timeout_ms) {
+    size_t need = RECORD_LEN + caplen;
+    unsigned long long head = ring->head;
+    struct timespec until;
+    bool fits = false;
+
+    deadline_after(&until, timeout_ms);
+    pthread_mutex_lock(&ring->lock);
+    for (;;) {
+        __atomic_store_n(&ring->producer_waiting, true, __ATOMIC_SEQ_CST);
+        unsigned long long tail = __atomic_load_n(&ring->tail, __ATOMIC_SEQ_CST);
+        fits = head + footprint(ring, head, need) - tail <= ring->size;
+        if (fits || pthread_cond_timedwait(&ring->cond, &ring->lock, &until) != 0) {
+            break;
+        }
+    }
+    ring->producer_waiting = false;
+    pthread_mutex_unlock(&ring->lock);
+    return fits;
+}
+
+void ring_notify(record_ring_t *ring, bool done) {
+    if (!done && !__atomic_load_n(&ring->consumer_waiting, __ATOMIC_SEQ_CST)) {
+        return;
+    }
+    pthread_mutex_lock(&ring->lock);
+    ring->consumer_waiting = false;
+    if (done) {
+        ring->done = true;
+    }
+    pthread_cond_broadcast(&ring->cond);
+    pthread_mutex_unlock(&ring->lock);
+}
+
+int ring_acquire(record_ring_t *ring, size_t *offset, size_t *len, int timeout_ms) {
+    unsigned long long tail = ring->tail;
+    unsigned long long head;
+    struct timespec until;
+
+    deadline_after(&until, timeout_ms);
+    pthread_mutex_lock(&ring->lock);
+    for (;;) {
+        head = __atomic_load_n(&ring->head, __ATOMIC_SEQ_CST);
+        if (head != tail) {
+            size_t off = tail % ring->size;
+            size_t contiguous = ring->size - off;
+            traffic_stream_record_t record;
+            if (contiguous >= RECORD_LEN) {
+                memcpy(&record, ring->buf + off, sizeof(record));
+            }
+            if (contiguous < RECORD_LEN || record.caplen == WRAP_MARKER) {
+                tail += contiguous;  // skip the unused end of the buffer
+                __atomic_store_n(&ring->tail, tail, __ATOMIC_SEQ_CST);
+                continue;
+            }
+            break;
+        }
+        if (ring->done) {
+            pthread_mutex_unlock(&ring->lock);
+            return -1;
+        }
+        __atomic_store_n(&ring->consumer_waiting, true, __ATOMIC_SEQ_CST);
+        if (__atomic_load_n(&ring->head, __ATOMIC_SEQ_CST) != tail) {
+            continue;
+        }
+        if (pthread_cond_timedwait(&ring->cond, &ring->lock, &until) != 0) {
+            ring->consumer_waiting = false;
+            pthread_mutex_unlock(&ring->lock);
+            return 0;
+        }
+    }
+    pthread_mutex_unlock(&ring->lock);
+
+    // Hand out every complete record up to the next wrap point in one go.
+    size_t start = tail % ring->size;
+    size_t limit = start + (head - tail) < ring->size ? start + (head - tail) : ring->size;
+    size_t pos = start;
+    while (pos + RECORD_LEN <= limit) {
+        traffic_stream_record_t record;
+        memcpy(&record, ring->buf + pos, sizeof(record));
+        if (record.caplen == WRAP_MARKER) {
+            break;
+        }
+        pos += RECORD_LEN + record.caplen;
+    }
+    *offset = start;
+    *len = pos - start;
+    return 1;
+}
+
+void ring_release(record_ring_t *ring, size_t len) {
+    __atomic_store_n(&ring->tail, ring->tail + len, __ATOMIC_SEQ_CST);
+    if (__atomic_load_n(&ring->producer_waiting, __ATOMIC_SEQ_CST)) {
+        pthread_mutex_lock(&ring->lock);
+        pthread_cond_broadcast(&ring->cond);
+        pthread_mutex_unlock(&ring->lock);
+    }
+}
+
+size_t ring_used(const record_ring_t *ring) {
+    return (size_t)(__atomic_load_n(&ring->head, __ATOMIC_RELAXED) -
+                    __atomic_load_n(&ring->tail, __ATOMIC_RELAXED));
+}
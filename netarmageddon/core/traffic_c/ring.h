@@ -0,0 +1,48 @@
+#ifndef RING_H
+#define RING_H
+
+#include <pcap/pcap.h>
+#include <pthread.h>
+#include <stdbool.h>
+#include <stddef.h>
+
+#include "traffic.h"
+
+// Single-producer/single-consumer ring of packet records. Records are a
+// traffic_stream_record_t followed by caplen bytes and never straddle the end of the
+// buffer: the producer writes a wrap marker (when it fits) and restarts at offset 0, so
+// the consumer always sees whole records in one contiguous span.
+//
+// head/tail are running byte counts; only the producer moves head and only the consumer
+// moves tail. The lock and condition variable are only touched when one side has to wait.
+typedef struct {
+    pthread_mutex_t lock;
+    pthread_cond_t cond;
+    unsigned char *buf;
+    size_t size;
+    unsigned long long head;
+    unsigned long long tail;
+    unsigned long long peak;  // highest occupancy in bytes since ring_reset() (producer only)
+    bool consumer_waiting;
+    bool producer_waiting;
+    bool done;  // producer finished; the consumer drains what is left and stops
+} record_ring_t;
+
+int ring_init(record_ring_t *ring, size_t size);
+void ring_free(record_ring_t *ring);
+void ring_reset(record_ring_t *ring);
+
+// Producer side. ring_push() never blocks and returns false when the record does not fit;
+// ring_wait_space() waits up to timeout_ms for room for a caplen-byte record.
+bool ring_push(record_ring_t *ring, const struct pcap_pkthdr *hdr, const u_char *pkt);
+bool ring_wait_space(record_ring_t *ring, size_t caplen, int timeout_ms);
+void ring_notify(record_ring_t *ring, bool done);
+
+// Consumer side. ring_acquire() returns 1 with [offset, offset + len) covering whole
+// records, 0 on timeout and -1 once the producer is done and the ring is drained.
+int ring_acquire(record_ring_t *ring, size_t *offset, size_t *len, int timeout_ms);
+void ring_release(record_ring_t *ring, size_t len);
+
+size_t ring_used(const record_ring_t *ring);
+
+#endif  // RING_H
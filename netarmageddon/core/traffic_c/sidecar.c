@@ -0,0 +1,172 @@
+#include "sidecar.h"
+
+#include <errno.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+
+#include "flow.h"
+
+enum {
+    PATH_SIZE = 4096,
+    FLOWS_INITIAL = 4096,
+    FLOWS_MAX = 1 << 20,  // beyond this, packets of new flows are only counted
+    TSRESOL_USEC = 6,
+    TSRESOL_NSEC = 9,
+};
+
+typedef struct {
+    uint64_t hash;  // 0 = empty slot
+    uint64_t first;
+    uint64_t last;
+    uint64_t packets;
+} flow_span_t;
+
+struct sidecar {
+    FILE *file;
+    int linktype;
+    uint64_t bucket_seconds;
+    uint64_t bucket;  // current TIME bucket
+    uint64_t packets;
+    flow_span_t *flows;  // open addressing, linear probing, capacity is a power of two
+    size_t capacity;
+    size_t used;
+    uint64_t unindexed;
+};
+
+static int put_entry(sidecar_t *index, uint32_t type, uint64_t a, uint64_t b, uint64_t c,
+                     uint64_t d) {
+    sidecar_entry_t entry = {.type = type, .a = a, .b = b, .c = c, .d = d};
+    return fwrite(&entry, sizeof(entry), 1, index->file) == 1 ? 0 : -1;
+}
+
+sidecar_t *sidecar_open(const char *capture_path, int linktype, traffic_format_t format,
+                        bool nanosecond, int bucket_seconds, char *err, size_t err_size) {
+    char path[PATH_SIZE];
+    sidecar_t *index = calloc(1, sizeof(*index));
+    sidecar_header_t header = {.magic = {'N', 'A', 'I', 'X'},
+                               .version = SIDECAR_VERSION,
+                               .tsresol = nanosecond ? TSRESOL_NSEC : TSRESOL_USEC,
+                               .format = (uint8_t)format,
+                               .linktype = (uint32_t)linktype,
+                               .bucket_seconds = (uint32_t)bucket_seconds};
+
+    if (index) {
+        index->flows = calloc(FLOWS_INITIAL, sizeof(*index->flows));
+    }
+    if (!index || !index->flows) {
+        snprintf(err, err_size, "out of memory");  // NOLINT
+        free(index);
+        return NULL;
+    }
+    index->capacity = FLOWS_INITIAL;
+    index->linktype = linktype;
+    index->bucket_seconds = (uint64_t)bucket_seconds;
+    index->bucket = UINT64_MAX;
+
+    snprintf(path, sizeof(path), "%s.idx", capture_path);  // NOLINT
+    index->file = fopen(path, "wb");
+    if (!index->file || fwrite(&header, sizeof(header), 1, index->file) != 1) {
+        snprintf(err, err_size, "%s: %s", path, strerror(errno));  // NOLINT
+        if (index->file) {
+            fclose(index->file);
+        }
+        free(index->flows);
+        free(index);
+        return NULL;
+    }
+    return index;
+}
+
+static flow_span_t *find_slot(flow_span_t *flows, size_t capacity, uint64_t hash) {
+    size_t mask = capacity - 1;
+    size_t i = (size_t)hash & mask;
+    while (flows[i].hash != 0 && flows[i].hash != hash) {
+        i = (i + 1) & mask;
+    }
+    return &flows[i];
+}
+
+// Double the table; keeps the old one when memory runs out.
+static void grow(sidecar_t *index) {
+    size_t capacity = index->capacity * 2;
+    flow_span_t *flows = calloc(capacity, sizeof(*flows));
+    if (!flows) {
+        return;
+    }
+    for (size_t i = 0; i < index->capacity; i++) {
+        if (index->flows[i].hash != 0) {
+            *find_slot(flows, capacity, index->flows[i].hash) = index->flows[i];
+        }
+    }
+    free(index->flows);
+    index->flows = flows;
+    index->capacity = capacity;
+}
+
+static void add_flow(sidecar_t *index, uint64_t hash, uint64_t offset) {
+    flow_span_t *slot = find_slot(index->flows, index->capacity, hash);
+    if (slot->hash == 0) {
+        // Keep the load factor under 3/4 so probes stay short.
+        if ((index->used + 1) * 4 > index->capacity * 3) {
+            if (index->capacity >= FLOWS_MAX) {
+                index->unindexed++;
+                return;
+            }
+            grow(index);
+            slot = find_slot(index->flows, index->capacity, hash);
+            if ((index->used + 1) * 4 > index->capacity * 3) {
+                index->unindexed++;
+                return;
+            }
+        }
+        slot->hash = hash;
+        slot->first = offset;
+        index->used++;
+    }
+    slot->last = offset;
+    slot->packets++;
+}
+
+int sidecar_add(sidecar_t *index, uint64_t offset, const traffic_stream_record_t *record,
+                const uint8_t *pkt) {
+    uint64_t bucket = record->ts_sec - record->ts_sec % index->bucket_seconds;
+    flow_key_t key;
+
+    if (bucket != index->bucket) {
+        index->bucket = bucket;
+        if (put_entry(index, SIDECAR_TIME, bucket, offset, index->packets, 0) < 0) {
+            return -1;
+        }
+    }
+    if (flow_key_from_packet(index->linktype, pkt, record->caplen, &key)) {
+        add_flow(index, flow_hash(&key), offset);
+    }
+    index->packets++;
+    return 0;
+}
+
+int sidecar_flush(sidecar_t *index) { return fflush(index->file) == 0 ? 0 : -1; }
+
+int sidecar_close(sidecar_t *index) {
+    int ret = 0;
+    if (!index) {
+        return 0;
+    }
+    for (size_t i = 0; i < index->capacity && ret == 0; i++) {
+        const flow_span_t *flow = &index->flows[i];
+        if (flow->hash != 0) {
+            ret =
+                put_entry(index, SIDECAR_FLOW, flow->hash, flow->first, flow->last, flow->packets);
+        }
+    }
+    if (ret == 0) {
+        ret = put_entry(index, SIDECAR_END, index->used, index->unindexed, index->packets, 0);
+    }
+    if (fclose(index->file) != 0) {
+        ret = -1;
+    }
+    free(index->flows);
+    free(index);
+    return ret;
+}
@@ -0,0 +1,61 @@
+#ifndef SIDECAR_H
+#define SIDECAR_H
+
+#include <stdbool.h>
+#include <stddef.h>
+#include <stdint.h>
+
+#include "traffic.h"
+
+// "<capture>.idx": a compact index of one output file so readers can seek to a time range
+// or a flow without scanning. All integers are in host byte order.
+//
+//   header   sidecar_header_t
+//   entries  sidecar_entry_t, appended as the capture runs:
+//     TIME  a = bucket start (seconds), b = file offset of the first packet in that bucket,
+//           c = packet number; written whenever the bucket changes
+//     FLOW  a = flow_hash(), b = offset of the first packet, c = offset of the last packet,
+//           d = packets; written when the file is closed
+//     END   a = flows, b = packets whose flow did not fit in the table, c = packets
+//
+// Offsets are positions in the uncompressed capture file. TIME entries reach the disk with
+// every sink_flush(); FLOW and END entries only on a clean close.
+enum {
+    SIDECAR_VERSION = 1,
+    SIDECAR_TIME = 1,
+    SIDECAR_FLOW = 2,
+    SIDECAR_END = 3,
+};
+
+typedef struct {
+    char magic[4];  // "NAIX"
+    uint16_t version;
+    uint8_t tsresol;  // 6 = microsecond, 9 = nanosecond record timestamps
+    uint8_t format;   // traffic_format_t of the capture
+    uint32_t linktype;
+    uint32_t bucket_seconds;
+    uint32_t reserved;
+} sidecar_header_t;
+
+typedef struct {
+    uint32_t type;
+    uint32_t reserved;
+    uint64_t a;
+    uint64_t b;
+    uint64_t c;
+    uint64_t d;
+} sidecar_entry_t;
+
+typedef struct sidecar sidecar_t;
+
+// Create "<capture_path>.idx". On failure returns NULL with a message in err.
+sidecar_t *sidecar_open(const char *capture_path, int linktype, traffic_format_t format,
+                        bool nanosecond, int bucket_seconds, char *err, size_t err_size);
+// Index one record that starts at `offset` in the capture file.
+int sidecar_add(sidecar_t *index, uint64_t offset, const traffic_stream_record_t *record,
+                const uint8_t *pkt);
+int sidecar_flush(sidecar_t *index);
+// Write the flow table and the END entry, then close.
+int sidecar_close(sidecar_t *index);
+
+#endif  // SIDECAR_H
@@ -0,0 +1,503 @@
+#include "sink.h"
+
+#include <errno.h>
+#include <pcap/pcap.h>
+#include <stdbool.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <zlib.h>
+#ifdef HAVE_ZSTD
+#include <zstd.h>
+#endif
+
+#include "sidecar.h"
+
+enum {
+    SINK_ERR_SIZE = 160,
+    GZIP_OUT_SIZE = 256 * 1024,
+    GZIP_WINDOW_BITS = 15 + 16,  // 32 KiB window with a gzip (not zlib) wrapper
+    GZIP_MEM_LEVEL = 8,
+    STAGE_SIZE = 256 * 1024,  // pcapng blocks are assembled here before sink_write()
+    RECORD_LEN = sizeof(traffic_stream_record_t),
+    PCAP_VERSION_MAJOR_2 = 2,
+    PCAP_VERSION_MINOR_4 = 4,
+    PCAP_HEADER_LEN = sizeof(struct pcap_file_header),
+    PCAP_RECORD_LEN = 16,
+    // pcapng (draft-ietf-opsawg-pcapng): block framing, option codes and block layouts
+    PCAPNG_SHB = 0x0A0D0D0A,
+    PCAPNG_IDB = 0x00000001,
+    PCAPNG_EPB = 0x00000006,
+    PCAPNG_VERSION_MAJOR = 1,
+    PCAPNG_OPT_END = 0,
+    PCAPNG_OPT_COMMENT = 1,
+    PCAPNG_SHB_USERAPPL = 4,
+    PCAPNG_IF_NAME = 2,
+    PCAPNG_IF_TSRESOL = 9,
+    PCAPNG_IF_FILTER = 11,
+    PCAPNG_SHB_LEN = 28,  // type, length, byte-order magic, version, section length, length
+    PCAPNG_IDB_LEN = 20,  // type, length, linktype, reserved, snaplen, length
+    PCAPNG_EPB_LEN = 32,  // type, length, interface, ts high/low, caplen, len, length
+    TSRESOL_USEC = 6,
+    TSRESOL_NSEC = 9,
+};
+static const bpf_u_int32 PCAP_MAGIC = 0xa1b2c3d4;       // microsecond timestamps
+static const bpf_u_int32 PCAP_MAGIC_NSEC = 0xa1b23c4d;  // nanosecond timestamps
+static const uint32_t PCAPNG_BYTE_ORDER = 0x1A2B3C4D;
+static const char PCAPNG_USERAPPL[] = "netarmageddon";
+static const uint64_t USEC_PER_SEC = 1000000;
+static const uint64_t NSEC_PER_SEC = 1000000000;
+
+struct sink {
+    FILE *file;
+    traffic_compression_t compression;
+    traffic_format_t format;
+    bool nanosecond;
+    size_t header_len;
+    uint64_t offset;   // uncompressed bytes written so far
+    sidecar_t *index;  // "<path>.idx", or NULL
+    bool dirty;        // bytes written since the last sink_flush()
+    z_stream gzip;
+#ifdef HAVE_ZSTD
+    ZSTD_CCtx *zstd;
+#endif
+    unsigned char *out;
+    size_t out_size;
+    unsigned char *stage;  // pcapng only
+    size_t stage_len;
+    char err[SINK_ERR_SIZE];
+};
+
+static bool has_suffix(const char *path, const char *suffix) {
+    size_t path_len = strlen(path);
+    size_t suffix_len = strlen(suffix);
+    return path_len > suffix_len && strcmp(path + path_len - suffix_len, suffix) == 0;
+}
+
+size_t sink_suffix_len(const char *path) {
+    if (has_suffix(path, ".gz")) {
+        return strlen(".gz");
+    }
+    if (has_suffix(path, ".zst")) {
+        return strlen(".zst");
+    }
+    return 0;
+}
+
+traffic_compression_t sink_resolve(traffic_compression_t compression, const char *path) {
+    if (compression != TRAFFIC_COMPRESS_AUTO) {
+        return compression;
+    }
+    if (has_suffix(path, ".gz")) {
+        return TRAFFIC_COMPRESS_GZIP;
+    }
+    if (has_suffix(path, ".zst")) {
+        return TRAFFIC_COMPRESS_ZSTD;
+    }
+    return TRAFFIC_COMPRESS_NONE;
+}
+
+traffic_format_t sink_resolve_format(traffic_format_t format, const char *path) {
+    if (format != TRAFFIC_FORMAT_AUTO) {
+        return format;
+    }
+    size_t len = strlen(path) - sink_suffix_len(path);
+    size_t ext_len = strlen(".pcapng");
+    if (len > ext_len && strncmp(path + len - ext_len, ".pcapng", ext_len) == 0) {
+        return TRAFFIC_FORMAT_PCAPNG;
+    }
+    return TRAFFIC_FORMAT_PCAP;
+}
+
+static int sink_fail(sink_t *sink, const char *what, const char *detail) {
+    snprintf(sink->err, sizeof(sink->err), "%s: %s", what, detail);  // NOLINT
+    return -1;
+}
+
+static int put(sink_t *sink, const unsigned char *data, size_t len) {
+    if (len && fwrite(data, 1, len, sink->file) != len) {
+        return sink_fail(sink, "write failed", strerror(errno));
+    }
+    return 0;
+}
+
+static int gzip_run(sink_t *sink, int flush) {
+    int ret;
+    do {
+        sink->gzip.next_out = sink->out;
+        sink->gzip.avail_out = (uInt)sink->out_size;
+        ret = deflate(&sink->gzip, flush);
+        if (ret == Z_STREAM_ERROR) {
+            return sink_fail(sink, "deflate failed", sink->gzip.msg ? sink->gzip.msg : "?");
+        }
+        if (put(sink, sink->out, sink->out_size - sink->gzip.avail_out) < 0) {
+            return -1;
+        }
+    } while (sink->gzip.avail_out == 0 || (flush == Z_FINISH && ret != Z_STREAM_END));
+    return 0;
+}
+
+#ifdef HAVE_ZSTD
+static int zstd_run(sink_t *sink, ZSTD_inBuffer *in, ZSTD_EndDirective mode) {
+    size_t remaining;
+    do {
+        ZSTD_outBuffer out = {sink->out, sink->out_size, 0};
+        remaining = ZSTD_compressStream2(sink->zstd, &out, in, mode);
+        if (ZSTD_isError(remaining)) {
+            return sink_fail(sink, "zstd compression failed", ZSTD_getErrorName(remaining));
+        }
+        if (put(sink, sink->out, out.pos) < 0) {
+            return -1;
+        }
+    } while (mode == ZSTD_e_end ? remaining != 0 : in->pos < in->size);
+    return 0;
+}
+#endif
+
+static int sink_write(sink_t *sink, const void *data, size_t len) {
+    if (!len) {
+        return 0;
+    }
+    sink->dirty = true;
+    sink->offset += len;
+    switch (sink->compression) {
+        case TRAFFIC_COMPRESS_GZIP:
+            sink->gzip.next_in = (Bytef *)data;
+            sink->gzip.avail_in = (uInt)len;
+            return gzip_run(sink, Z_NO_FLUSH);
+#ifdef HAVE_ZSTD
+        case TRAFFIC_COMPRESS_ZSTD: {
+            ZSTD_inBuffer in = {data, len, 0};
+            return zstd_run(sink, &in, ZSTD_e_continue);
+        }
+#endif
+        default:
+            return put(sink, data, len);
+    }
+}
+
+static int stage_flush(sink_t *sink) {
+    size_t len = sink->stage_len;
+    sink->stage_len = 0;
+    return sink_write(sink, sink->stage, len);
+}
+
+static int stage_put(sink_t *sink, const void *data, size_t len) {
+    if (sink->stage_len + len > STAGE_SIZE && stage_flush(sink) < 0) {
+        return -1;
+    }
+    if (len > STAGE_SIZE) {
+        return sink_write(sink, data, len);
+    }
+    memcpy(sink->stage + sink->stage_len, data, len);
+    sink->stage_len += len;
+    return 0;
+}
+
+static size_t pad4(size_t len) { return (len + 3) & ~(size_t)3; }
+
+size_t sink_record_len(const sink_t *sink, uint32_t caplen) {
+    if (sink->format == TRAFFIC_FORMAT_PCAPNG) {
+        return PCAPNG_EPB_LEN + pad4(caplen);
+    }
+    return PCAP_RECORD_LEN + caplen;
+}
+
+size_t sink_header_len(const sink_t *sink) { return sink->header_len; }
+
+static int index_record(sink_t *sink, uint64_t offset, const traffic_stream_record_t *record,
+                        const unsigned char *pkt) {
+    if (sidecar_add(sink->index, offset, record, pkt) < 0) {
+        return sink_fail(sink, "index write failed", strerror(errno));
+    }
+    return 0;
+}
+
+// One Enhanced Packet Block per record, all on interface 0.
+static int write_epbs(sink_t *sink, const unsigned char *records, size_t len) {
+    static const unsigned char padding[3] = {0};
+    uint64_t units = sink->nanosecond ? NSEC_PER_SEC : USEC_PER_SEC;
+    size_t pos = 0;
+
+    while (pos < len) {
+        traffic_stream_record_t record;
+        memcpy(&record, records + pos, sizeof(record));
+        uint32_t block_len = (uint32_t)sink_record_len(sink, record.caplen);
+        uint64_t ts = (uint64_t)record.ts_sec * units + record.ts_usec;
+
+        if (sink->index && index_record(sink, sink->offset + sink->stage_len, &record,
+                                        records + pos + RECORD_LEN) < 0) {
+            return -1;
+        }
+        uint32_t head[7] = {PCAPNG_EPB,   block_len,     0,         (uint32_t)(ts >> 32),
+                            (uint32_t)ts, record.caplen, record.len};
+
+        if (stage_put(sink, head, sizeof(head)) < 0 ||
+            stage_put(sink, records + pos + RECORD_LEN, record.caplen) < 0 ||
+            stage_put(sink, padding, pad4(record.caplen) - record.caplen) < 0 ||
+            stage_put(sink, &block_len, sizeof(block_len)) < 0) {
+            return -1;
+        }
+        pos += RECORD_LEN + record.caplen;
+    }
+    return stage_flush(sink);
+}
+
+int sink_write_records(sink_t *sink, const unsigned char *records, size_t len) {
+    if (sink->format == TRAFFIC_FORMAT_PCAPNG) {
+        return write_epbs(sink, records, len);
+    }
+    // traffic_stream_record_t has the classic pcap record layout.
+    for (size_t pos = 0; sink->index && pos < len;) {
+        traffic_stream_record_t record;
+        memcpy(&record, records + pos, sizeof(record));
+        if (index_record(sink, sink->offset + pos, &record, records + pos + RECORD_LEN) < 0) {
+            return -1;
+        }
+        pos += RECORD_LEN + record.caplen;
+    }
+    return sink_write(sink, records, len);
+}
+
+int sink_flush(sink_t *sink) {
+    if (!sink->dirty) {
+        return 0;
+    }
+    sink->dirty = false;
+    if (sink->compression == TRAFFIC_COMPRESS_GZIP) {
+        // Finish this gzip member; the next write starts a new one in the same file.
+        sink->gzip.avail_in = 0;
+        if (gzip_run(sink, Z_FINISH) < 0) {
+            return -1;
+        }
+        deflateReset(&sink->gzip);
+    }
+#ifdef HAVE_ZSTD
+    if (sink->compression == TRAFFIC_COMPRESS_ZSTD) {
+        ZSTD_inBuffer in = {NULL, 0, 0};
+        if (zstd_run(sink, &in, ZSTD_e_end) < 0) {
+            return -1;
+        }
+    }
+#endif
+    if (fflush(sink->file) != 0) {
+        return sink_fail(sink, "flush failed", strerror(errno));
+    }
+    if (sink->index && sidecar_flush(sink->index) < 0) {
+        return sink_fail(sink, "index flush failed", strerror(errno));
+    }
+    return 0;
+}
+
+static void sink_free(sink_t *sink) {
+    sidecar_close(sink->index);
+    if (sink->compression == TRAFFIC_COMPRESS_GZIP) {
+        deflateEnd(&sink->gzip);
+    }
+#ifdef HAVE_ZSTD
+    ZSTD_freeCCtx(sink->zstd);
+#endif
+    free(sink->out);
+    free(sink->stage);
+    free(sink);
+}
+
+int sink_close(sink_t *sink) {
+    if (!sink) {
+        return 0;
+    }
+    int ret = sink_flush(sink);
+    if (fclose(sink->file) != 0 && ret == 0) {
+        ret = -1;
+    }
+    if (sidecar_close(sink->index) < 0 && ret == 0) {
+        ret = -1;
+    }
+    sink->index = NULL;
+    sink_free(sink);
+    return ret;
+}
+
+const char *sink_error(const sink_t *sink) { return sink->err; }
+
+static int start_compressor(sink_t *sink, int level, char *err, size_t err_size) {
+    if (sink->compression == TRAFFIC_COMPRESS_GZIP) {
+        sink->out_size = GZIP_OUT_SIZE;
+        if (deflateInit2(&sink->gzip, level > 0 ? level : Z_DEFAULT_COMPRESSION, Z_DEFLATED,
+                         GZIP_WINDOW_BITS, GZIP_MEM_LEVEL, Z_DEFAULT_STRATEGY) != Z_OK) {
+            snprintf(err, err_size, "deflateInit2 failed");  // NOLINT
+            sink->compression = TRAFFIC_COMPRESS_NONE;
+            return -1;
+        }
+    } else if (sink->compression == TRAFFIC_COMPRESS_ZSTD) {
+#ifdef HAVE_ZSTD
+        sink->out_size = ZSTD_CStreamOutSize();
+        sink->zstd = ZSTD_createCCtx();
+        if (!sink->zstd || (level > 0 && ZSTD_isError(ZSTD_CCtx_setParameter(
+                                             sink->zstd, ZSTD_c_compressionLevel, level)))) {
+            snprintf(err, err_size, "cannot set up zstd compression");  // NOLINT
+            return -1;
+        }
+#else
+        (void)level;
+        snprintf(err, err_size,
+                 "zstd output requested but libtraffic was built without zstd");  // NOLINT
+        return -1;
+#endif
+    }
+    if (sink->out_size) {
+        sink->out = malloc(sink->out_size);
+        if (!sink->out) {
+            snprintf(err, err_size, "out of memory");  // NOLINT
+            return -1;
+        }
+    }
+    return 0;
+}
+
+// Append a pcapng option at buf + pos: code, length, then the value (the concatenation of
+// `lead` and `value`) padded to 4 bytes. With buf == NULL only the new position is computed.
+static size_t put_option(unsigned char *buf, size_t pos, uint16_t code, const void *lead,
+                         size_t lead_len, const void *value, size_t len) {
+    size_t total = lead_len + len;
+    if (buf) {
+        uint16_t head[2] = {code, (uint16_t)total};
+        unsigned char *p = buf + pos;
+        memcpy(p, head, sizeof(head));
+        memcpy(p + sizeof(head), lead, lead_len);
+        memcpy(p + sizeof(head) + lead_len, value, len);
+        memset(p + sizeof(head) + total, 0, pad4(total) - total);
+    }
+    return pos + sizeof(uint16_t) * 2 + pad4(total);
+}
+
+static size_t put_bytes(unsigned char *buf, size_t pos, const void *data, size_t len) {
+    if (buf) {
+        memcpy(buf + pos, data, len);
+    }
+    return pos + len;
+}
+
+static size_t put_u32(unsigned char *buf, size_t pos, uint32_t value) {
+    return put_bytes(buf, pos, &value, sizeof(value));
+}
+
+static size_t shb_options(unsigned char *buf, size_t pos) {
+    pos = put_option(buf, pos, PCAPNG_SHB_USERAPPL, NULL, 0, PCAPNG_USERAPPL,
+                     strlen(PCAPNG_USERAPPL));
+    return put_u32(buf, pos, PCAPNG_OPT_END);
+}
+
+static size_t idb_options(unsigned char *buf, size_t pos, const sink_config_t *config) {
+    static const unsigned char libpcap_filter = 0;  // if_filter: a libpcap filter string
+    unsigned char tsresol = config->nanosecond ? TSRESOL_NSEC : TSRESOL_USEC;
+
+    if (config->interface && config->interface[0] != '\0') {
+        pos = put_option(buf, pos, PCAPNG_IF_NAME, NULL, 0, config->interface,
+                         strlen(config->interface));
+    }
+    if (config->filter && config->filter[0] != '\0') {
+        pos = put_option(buf, pos, PCAPNG_IF_FILTER, &libpcap_filter, 1, config->filter,
+                         strlen(config->filter));
+    }
+    pos = put_option(buf, pos, PCAPNG_IF_TSRESOL, NULL, 0, &tsresol, sizeof(tsresol));
+    if (config->comment && config->comment[0] != '\0') {
+        pos = put_option(buf, pos, PCAPNG_OPT_COMMENT, NULL, 0, config->comment,
+                         strlen(config->comment));
+    }
+    return put_u32(buf, pos, PCAPNG_OPT_END);
+}
+
+// Section Header Block followed by one Interface Description Block. Returns the length;
+// with buf == NULL nothing is written.
+static size_t pcapng_header(unsigned char *buf, const sink_config_t *config) {
+    static const uint16_t version[2] = {PCAPNG_VERSION_MAJOR, 0};
+    static const int64_t unknown_section_len = -1;
+    uint32_t shb_len = (uint32_t)shb_options(NULL, PCAPNG_SHB_LEN);
+    uint32_t idb_len = (uint32_t)idb_options(NULL, PCAPNG_IDB_LEN, config);
+    uint16_t link[2] = {(uint16_t)config->linktype, 0};  // linktype, reserved
+    size_t pos = 0;
+
+    pos = put_u32(buf, pos, PCAPNG_SHB);
+    pos = put_u32(buf, pos, shb_len);
+    pos = put_u32(buf, pos, PCAPNG_BYTE_ORDER);
+    pos = put_bytes(buf, pos, version, sizeof(version));
+    pos = put_bytes(buf, pos, &unknown_section_len, sizeof(unknown_section_len));
+    pos = shb_options(buf, pos);
+    pos = put_u32(buf, pos, shb_len);
+
+    pos = put_u32(buf, pos, PCAPNG_IDB);
+    pos = put_u32(buf, pos, idb_len);
+    pos = put_bytes(buf, pos, link, sizeof(link));
+    pos = put_u32(buf, pos, (uint32_t)config->snaplen);
+    pos = idb_options(buf, pos, config);
+    return put_u32(buf, pos, idb_len);
+}
+
+static int write_header(sink_t *sink, const sink_config_t *config) {
+    if (sink->format == TRAFFIC_FORMAT_PCAPNG) {
+        sink->header_len = pcapng_header(NULL, config);
+        unsigned char *buf = malloc(sink->header_len);
+        if (!buf) {
+            return sink_fail(sink, "cannot write file header", "out of memory");
+        }
+        pcapng_header(buf, config);
+        int ret = sink_write(sink, buf, sink->header_len);
+        free(buf);
+        return ret;
+    }
+
+    struct pcap_file_header header = {.magic = config->nanosecond ? PCAP_MAGIC_NSEC : PCAP_MAGIC,
+                                      .version_major = PCAP_VERSION_MAJOR_2,
+                                      .version_minor = PCAP_VERSION_MINOR_4,
+                                      .snaplen = (bpf_u_int32)config->snaplen,
+                                      .linktype = (bpf_u_int32)config->linktype};
+    sink->header_len = PCAP_HEADER_LEN;
+    return sink_write(sink, &header, sizeof(header));
+}
+
+sink_t *sink_open(const char *path, const sink_config_t *config, char *err, size_t err_size) {
+    sink_t *sink = calloc(1, sizeof(*sink));
+    if (!sink) {
+        snprintf(err, err_size, "out of memory");  // NOLINT
+        return NULL;
+    }
+    sink->compression = sink_resolve(config->compression, path);
+    sink->format = sink_resolve_format(config->format, path);
+    sink->nanosecond = config->nanosecond;
+    if (start_compressor(sink, config->level, err, err_size) < 0) {
+        sink_free(sink);
+        return NULL;
+    }
+    if (sink->format == TRAFFIC_FORMAT_PCAPNG) {
+        sink->stage = malloc(STAGE_SIZE);
+        if (!sink->stage) {
+            snprintf(err, err_size, "out of memory");  // NOLINT
+            sink_free(sink);
+            return NULL;
+        }
+    }
+
+    sink->file = fopen(path, "wb");
+    if (!sink->file) {
+        snprintf(err, err_size, "%s: %s", path, strerror(errno));  // NOLINT
+        sink_free(sink);
+        return NULL;
+    }
+    if (config->index_bucket_seconds > 0) {
+        sink->index = sidecar_open(path, config->linktype, sink->format, config->nanosecond,
+                                   config->index_bucket_seconds, err, err_size);
+        if (!sink->index) {
+            fclose(sink->file);
+            sink_free(sink);
+            return NULL;
+        }
+    }
+    if (write_header(sink, config) < 0) {
+        snprintf(err, err_size, "%s", sink->err);  // NOLINT
+        fclose(sink->file);
+        sink_free(sink);
+        return NULL;
+    }
+    return sink;
+}
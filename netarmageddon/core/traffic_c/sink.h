@@ -0,0 +1,50 @@
+#ifndef SINK_H
+#define SINK_H
+
+#include <stdbool.h>
+#include <stddef.h>
+#include <stdint.h>
+
+#include "traffic.h"
+
+// One capture output file: classic pcap or pcapng, optionally compressed. Compressed
+// output is written as a series of complete gzip members / zstd frames, so a file cut
+// short by an unclean stop still decompresses up to the last sink_flush().
+typedef struct sink sink_t;
+
+// Everything that goes into the file header. AUTO values are resolved per path.
+typedef struct {
+    traffic_compression_t compression;
+    int level;
+    traffic_format_t format;
+    int linktype;
+    int snaplen;
+    bool nanosecond;           // record timestamps carry nanoseconds instead of microseconds
+    const char *interface;     // pcapng if_name (may be NULL)
+    const char *filter;        // pcapng if_filter (may be NULL or "")
+    const char *comment;       // pcapng opt_comment of the interface (may be NULL or "")
+    int index_bucket_seconds;  // also write a "<path>.idx" sidecar (0 = none), see sidecar.h
+} sink_config_t;
+
+// TRAFFIC_COMPRESS_AUTO resolves to gzip for "*.gz", zstd for "*.zst" and none otherwise.
+traffic_compression_t sink_resolve(traffic_compression_t compression, const char *path);
+// TRAFFIC_FORMAT_AUTO resolves to pcapng for "*.pcapng" (before any compression suffix).
+traffic_format_t sink_resolve_format(traffic_format_t format, const char *path);
+// Length of the compression suffix of `path` (".gz", ".zst") or 0.
+size_t sink_suffix_len(const char *path);
+
+// Create `path` and write the file header. On failure returns NULL with a message in err.
+sink_t *sink_open(const char *path, const sink_config_t *config, char *err, size_t err_size);
+// Append whole traffic_stream_record_t records (header + caplen bytes each), converting
+// them to the file's record format.
+int sink_write_records(sink_t *sink, const unsigned char *records, size_t len);
+// Uncompressed size of the file header and of one record with caplen bytes.
+size_t sink_header_len(const sink_t *sink);
+size_t sink_record_len(const sink_t *sink, uint32_t caplen);
+// Make everything written so far decodable on disk: end the current gzip member or zstd
+// frame and flush stdio. Cheap when nothing was written since the last flush.
+int sink_flush(sink_t *sink);
+int sink_close(sink_t *sink);
+const char *sink_error(const sink_t *sink);
+
+#endif  // SINK_H
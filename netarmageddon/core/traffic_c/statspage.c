@@ -0,0 +1,106 @@
+#include "statspage.h"
+
+#include <errno.h>
+#include <fcntl.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <time.h>
+#include <unistd.h>
+
+static const uint64_t NSEC_PER_SEC = 1000000000;
+
+// The header and the body, as they lie in the file.
+typedef struct {
+    statspage_header_t header;
+    statspage_body_t body;
+} statspage_layout_t;
+
+struct statspage {
+    statspage_layout_t *map;
+    uint32_t seq;  // the writer's copy of map->header.seq
+};
+
+static uint64_t realtime_ns(void) {
+    struct timespec now;
+    clock_gettime(CLOCK_REALTIME, &now);
+    return (uint64_t)now.tv_sec * NSEC_PER_SEC + (uint64_t)now.tv_nsec;
+}
+
+// Enter the write side: readers that see the odd seq (or a changed one) retry.
+static void write_begin(statspage_t *page) {
+    __atomic_store_n(&page->map->header.seq, ++page->seq, __ATOMIC_RELAXED);
+    __atomic_thread_fence(__ATOMIC_RELEASE);
+}
+
+static void write_end(statspage_t *page) {
+    __atomic_store_n(&page->map->header.seq, ++page->seq, __ATOMIC_RELEASE);
+}
+
+statspage_t *statspage_open(const char *path, char *err, size_t err_size) {
+    const size_t size = sizeof(statspage_layout_t);
+    statspage_t *page = calloc(1, sizeof(*page));
+    struct stat st;
+    int fd = -1;
+
+    if (!page) {
+        snprintf(err, err_size, "out of memory");  // NOLINT
+        return NULL;
+    }
+    fd = open(path, O_RDWR | O_CREAT | O_CLOEXEC, 0644);  // NOLINT
+    // Never shrink the file: a reader mapping more of it would fault past the new end.
+    if (fd < 0 || fstat(fd, &st) < 0 ||
+        ((size_t)st.st_size < size && ftruncate(fd, (off_t)size) < 0)) {
+        snprintf(err, err_size, "%s: %s", path, strerror(errno));  // NOLINT
+        if (fd >= 0) {
+            close(fd);
+        }
+        free(page);
+        return NULL;
+    }
+    page->map = mmap(NULL, size, PROT_READ | PROT_WRITE, MAP_SHARED, fd, 0);
+    close(fd);
+    if (page->map == MAP_FAILED) {
+        snprintf(err, err_size, "%s: %s", path, strerror(errno));  // NOLINT
+        free(page);
+        return NULL;
+    }
+
+    // Continue the sequence of an earlier capture so a reader across the restart notices.
+    page->seq = __atomic_load_n(&page->map->header.seq, __ATOMIC_RELAXED) | 1U;
+    __atomic_store_n(&page->map->header.seq, page->seq, __ATOMIC_RELAXED);
+    __atomic_thread_fence(__ATOMIC_RELEASE);
+    statspage_header_t *header = &page->map->header;
+    memcpy(header->magic, "NAST", sizeof(header->magic));
+    header->version = STATSPAGE_VERSION;
+    header->header_len = sizeof(statspage_header_t);
+    header->size = (uint32_t)size;
+    header->pid = (uint64_t)getpid();
+    header->started_ns = realtime_ns();
+    memset(&page->map->body, 0, sizeof(page->map->body));
+    write_end(page);
+    return page;
+}
+
+void statspage_update(statspage_t *page, const statspage_body_t *body) {
+    if (!page) {
+        return;
+    }
+    uint64_t updates = page->map->body.updates + 1;
+    uint64_t now = realtime_ns();
+    write_begin(page);
+    memcpy(&page->map->body, body, sizeof(*body));
+    page->map->body.updated_ns = now;
+    page->map->body.updates = updates;
+    write_end(page);
+}
+
+void statspage_close(statspage_t *page) {
+    if (!page) {
+        return;
+    }
+    munmap(page->map, sizeof(*page->map));
+    free(page);
+}
@@ -0,0 +1,66 @@
+#ifndef STATSPAGE_H
+#define STATSPAGE_H
+
+#include <stddef.h>
+#include <stdint.h>
+
+#include "traffic.h"
+
+// A small memory-mapped file with the live counters of one capture, so other processes
+// can watch it by reading memory instead of scraping logs. All integers are in host byte
+// order.
+//
+//   header  statspage_header_t, written once when the capture starts
+//   body    statspage_body_t, rewritten every time the capture publishes its stats
+//
+// Updates are a sequence lock: the single writer makes `seq` odd, rewrites the body and
+// makes `seq` even again. A reader copies the body between two reads of `seq` and keeps
+// the copy when both returned the same even value; otherwise it retries. Fields are only
+// ever appended (`stats` stays last), so `version` and `size` tell a reader which prefix
+// of the body it understands. The file is left in place after the capture.
+enum {
+    STATSPAGE_VERSION = 1,
+    STATSPAGE_PATH_SIZE = 256,
+};
+
+typedef enum {
+    STATSPAGE_STARTING = 0,
+    STATSPAGE_RUNNING = 1,
+    STATSPAGE_FINISHED = 2,
+    STATSPAGE_FAILED = 3,
+} statspage_state_t;
+
+typedef struct {
+    char magic[4];  // "NAST"
+    uint16_t version;
+    uint16_t header_len;  // sizeof(statspage_header_t)
+    uint32_t size;        // header plus body bytes
+    uint32_t seq;         // odd while the body is being rewritten
+    uint64_t pid;         // process running the capture
+    uint64_t started_ns;  // CLOCK_REALTIME when the capture started
+} statspage_header_t;
+
+typedef struct {
+    uint64_t updated_ns;                     // CLOCK_REALTIME of this update
+    uint64_t updates;                        // body rewrites since the capture started
+    uint32_t state;                          // statspage_state_t
+    uint32_t workers;                        // fanout workers (0 = one capture thread)
+    uint64_t stream_queued_bytes;            // records waiting in the stream ring
+    uint64_t stream_buffer_size;             // capacity of the stream ring (0 = not streaming)
+    char current_file[STATSPAGE_PATH_SIZE];  // output file being written, cut to fit; the
+                                             // base name with fanout
+    traffic_capture_stats_t stats;
+} statspage_body_t;
+
+typedef struct statspage statspage_t;
+
+// Create (or reuse) `path`, size it and write the header. An existing file is rewritten
+// in place rather than truncated, so a reader that still maps it never faults. On failure
+// returns NULL with a message in err.
+statspage_t *statspage_open(const char *path, char *err, size_t err_size);
+// Publish a new body. Only one thread may update a page.
+void statspage_update(statspage_t *page, const statspage_body_t *body);
+// Unmap the page; the file stays with the last body.
+void statspage_close(statspage_t *page);
+
+#endif  // STATSPAGE_H
@@ -1,18 +1,129 @@
+#include <arpa/inet.h>
 #include <check.h>
+#include <netinet/in.h>
 #include <pthread.h>
 #include <stdio.h>
 #include <stdlib.h>
+#include <string.h>
+#include <sys/socket.h>
+#include <time.h>
 #include <unistd.h>
+#include <zlib.h>
 
+#include "../sidecar.h"
+#include "../statspage.h"
 #include "../traffic.h"
 
 #define SNAPLEN 65535
 #define DELAY_MS 200000
+#define UDP_TEST_PORT 50000
+#define UDP_PAYLOAD_LEN 32
+#define UDP_SEND_GAP_US 20000
+#define REPLAY_FRAME_LEN 54
+
+static volatile int udp_sending = 0;
+
+// Fire small UDP datagrams at loopback until udp_sending is cleared.
+static void* udp_sender(void* arg) {
+    (void)arg;
+    int sock = socket(AF_INET, SOCK_DGRAM, 0);
+    struct sockaddr_in dst = {.sin_family = AF_INET, .sin_port = htons(UDP_TEST_PORT)};
+    char payload[UDP_PAYLOAD_LEN] = {0};
+
+    inet_pton(AF_INET, "127.0.0.1", &dst.sin_addr);
+    while (udp_sending) {
+        sendto(sock, payload, sizeof(payload), 0, (struct sockaddr*)&dst, sizeof(dst));
+        usleep(UDP_SEND_GAP_US);
+    }
+    close(sock);
+    return NULL;
+}
+
+// Send `count` UDP datagrams to loopback, UDP_SEND_GAP_US apart.
+static void udp_burst(int count) {
+    int sock = socket(AF_INET, SOCK_DGRAM, 0);
+    struct sockaddr_in dst = {.sin_family = AF_INET, .sin_port = htons(UDP_TEST_PORT)};
+    char payload[UDP_PAYLOAD_LEN] = {0};
+
+    inet_pton(AF_INET, "127.0.0.1", &dst.sin_addr);
+    for (int i = 0; i < count; i++) {
+        sendto(sock, payload, sizeof(payload), 0, (struct sockaddr*)&dst, sizeof(dst));
+        usleep(UDP_SEND_GAP_US);
+    }
+    close(sock);
+}
+
+static long long elapsed_ms(const struct timespec* from, const struct timespec* to) {
+    return (to->tv_sec - from->tv_sec) * 1000LL + (to->tv_nsec - from->tv_nsec) / 1000000;
+}
+
+static int file_exists(const char* path) { return access(path, F_OK) == 0; }
+
+// Write `packets` minimal Ethernet/IPv4 frames, alternating UDP and TCP, gap_us apart.
+static void write_replay_input(const char* path, int packets, long gap_us) {
+    pcap_t* dead = pcap_open_dead(DLT_EN10MB, SNAPLEN);
+    pcap_dumper_t* out = pcap_dump_open(dead, path);
+    u_char frame[REPLAY_FRAME_LEN] = {0};
+    struct pcap_pkthdr hdr = {
+        .ts = {.tv_sec = 1700000000}, .caplen = sizeof(frame), .len = sizeof(frame)};
+
+    ck_assert_ptr_nonnull(out);
+    frame[12] = 0x08;  // ethertype IPv4
+    frame[14] = 0x45;  // version 4, 20-byte header
+    for (int i = 0; i < packets; i++) {
+        frame[23] = i % 2 ? IPPROTO_TCP : IPPROTO_UDP;
+        pcap_dump((u_char*)out, &hdr, frame);
+        hdr.ts.tv_usec += gap_us;
+        hdr.ts.tv_sec += hdr.ts.tv_usec / 1000000;
+        hdr.ts.tv_usec %= 1000000;
+    }
+    pcap_dump_close(out);
+    pcap_close(dead);
+}
+
+// Flow A: 10 UDP packets 100 ms apart; then, after 5 s of silence, flow B: 10 TCP packets.
+static void write_two_flow_input(const char* path) {
+    pcap_t* dead = pcap_open_dead(DLT_EN10MB, SNAPLEN);
+    pcap_dumper_t* out = pcap_dump_open(dead, path);
+    u_char frame[REPLAY_FRAME_LEN] = {0};
+    struct pcap_pkthdr hdr = {
+        .ts = {.tv_sec = 1700000000}, .caplen = sizeof(frame), .len = sizeof(frame)};
+
+    ck_assert_ptr_nonnull(out);
+    frame[12] = 0x08;
+    frame[14] = 0x45;
+    for (int i = 0; i < 20; i++) {
+        frame[23] = i < 10 ? IPPROTO_UDP : IPPROTO_TCP;
+        hdr.ts.tv_sec = 1700000000 + (i < 10 ? 0 : 6);
+        hdr.ts.tv_usec = (i % 10) * 100000;
+        pcap_dump((u_char*)out, &hdr, frame);
+    }
+    pcap_dump_close(out);
+    pcap_close(dead);
+}
+
+// The header and body of a stats page, read in one go.
+typedef struct {
+    statspage_header_t header;
+    statspage_body_t body;
+} stats_page_file_t;
+
+static void read_stats_page(const char* path, stats_page_file_t* page) {
+    FILE* file = fopen(path, "rb");
+    ck_assert_ptr_nonnull(file);
+    ck_assert_uint_eq(fread(page, sizeof(*page), 1, file), 1);
+    fclose(file);
+}
+
+typedef struct {
+    traffic_capture_t* cap;
+    traffic_capture_config_t* cfg;
+} capture_job_t;
 
 static void* capture_thread_wrapper(void* arg) {
-    traffic_capture_config_t* cfg = (traffic_capture_config_t*)arg;
+    capture_job_t* job = (capture_job_t*)arg;
     int* result = malloc(sizeof(int));
-    *result = traffic_capture_start(cfg);
+    *result = traffic_capture_start(job->cap, job->cfg);
     return result;
 }
 
@@ -25,10 +136,12 @@ START_TEST(test_valid_capture_config) {
                                     .snaplen = SNAPLEN,
                                     .promisc = 1};
 
+    traffic_capture_t* cap = traffic_capture_create();
+    capture_job_t job = {.cap = cap, .cfg = &cfg};
     pthread_t capture_thread;
     int* result_ptr = NULL;
 
-    pthread_create(&capture_thread, NULL, capture_thread_wrapper, &cfg);
+    pthread_create(&capture_thread, NULL, capture_thread_wrapper, &job);
 
     usleep(DELAY_MS);
 
@@ -38,8 +151,9 @@ START_TEST(test_valid_capture_config) {
     int result = *result_ptr;
     free(result_ptr);
 
-    ck_assert_msg(result == 0, "Capture failed with error: %s", traffic_get_last_error());
-    traffic_capture_stop();
+    ck_assert_msg(result == 0, "Capture failed with error: %s", traffic_get_last_error(cap));
+    traffic_capture_stop(cap);
+    traffic_capture_destroy(cap);
 }
 END_TEST
 
@@ -52,11 +166,891 @@ START_TEST(test_invalid_interface) {
                                     .snaplen = SNAPLEN,
                                     .promisc = 0};
 
-    int result = traffic_capture_start(&cfg);
+    traffic_capture_t* cap = traffic_capture_create();
+
+    int result = traffic_capture_start(cap, &cfg);
     ck_assert_int_eq(result, -1);
-    const char* err = traffic_get_last_error();
+    const char* err = traffic_get_last_error(cap);
     ck_assert_ptr_nonnull(err);
     printf("Expected error: %s\n", err);
+    traffic_capture_destroy(cap);
+}
+END_TEST
+
+START_TEST(test_rotation_keeps_newest_files) {
+    // One 32-byte UDP datagram on lo is a 90-byte record, so every file holds a single packet.
+    traffic_capture_config_t cfg = {.interface = "lo",
+                                    .bpf_filter = "udp port 50000",
+                                    .output_file = "rot.pcap",
+                                    .duration = 5,
+                                    .max_packets = 6,
+                                    .snaplen = SNAPLEN,
+                                    .promisc = 0,
+                                    .rotate_bytes = 120,
+                                    .rotate_max_files = 2};
+    traffic_capture_t* cap = traffic_capture_create();
+    pthread_t sender;
+
+    udp_sending = 1;
+    pthread_create(&sender, NULL, udp_sender, NULL);
+    int result = traffic_capture_start(cap, &cfg);
+    udp_sending = 0;
+    pthread_join(sender, NULL);
+
+    ck_assert_msg(result == 0, "Capture failed with error: %s", traffic_get_last_error(cap));
+    ck_assert(!file_exists("rot_00003.pcap"));
+    ck_assert(file_exists("rot_00004.pcap"));
+    ck_assert(file_exists("rot_00005.pcap"));
+    ck_assert(!file_exists("rot_00006.pcap"));
+    remove("rot_00004.pcap");
+    remove("rot_00005.pcap");
+    traffic_capture_destroy(cap);
+}
+END_TEST
+
+START_TEST(test_tuned_handle_capture) {
+    traffic_capture_config_t cfg = {.interface = "lo",
+                                    .bpf_filter = "udp port 50000",
+                                    .output_file = "tuned.pcap",
+                                    .duration = 5,
+                                    .max_packets = 3,
+                                    .snaplen = SNAPLEN,
+                                    .promisc = 0,
+                                    .buffer_size = 4 * 1024 * 1024,
+                                    .immediate_mode = 1,
+                                    .timeout_ms = 100};
+    traffic_capture_t* cap = traffic_capture_create();
+    pthread_t sender;
+
+    udp_sending = 1;
+    pthread_create(&sender, NULL, udp_sender, NULL);
+    int result = traffic_capture_start(cap, &cfg);
+    udp_sending = 0;
+    pthread_join(sender, NULL);
+
+    ck_assert_msg(result == 0, "Capture failed with error: %s", traffic_get_last_error(cap));
+    ck_assert(file_exists("tuned.pcap"));
+    remove("tuned.pcap");
+    traffic_capture_destroy(cap);
+}
+END_TEST
+
+START_TEST(test_stats_after_capture) {
+    traffic_capture_config_t cfg = {.interface = "lo",
+                                    .bpf_filter = "udp port 50000",
+                                    .output_file = "stats.pcap",
+                                    .duration = 5,
+                                    .max_packets = 4,
+                                    .snaplen = SNAPLEN,
+                                    .promisc = 0};
+    traffic_capture_stats_t stats;
+    traffic_capture_t* cap = traffic_capture_create();
+    pthread_t sender;
+
+    udp_sending = 1;
+    pthread_create(&sender, NULL, udp_sender, NULL);
+    int result = traffic_capture_start(cap, &cfg);
+    udp_sending = 0;
+    pthread_join(sender, NULL);
+
+    ck_assert_msg(result == 0, "Capture failed with error: %s", traffic_get_last_error(cap));
+    ck_assert_int_eq(traffic_get_stats(cap, &stats), 0);
+    ck_assert_uint_eq(stats.packets_written, 4);
+    ck_assert_uint_ge(stats.ps_recv, 4);
+    // 24-byte file header plus four 16-byte record headers and 74-byte frames.
+    ck_assert_uint_eq(stats.bytes_written, 24 + 4 * (16 + 74));
+    ck_assert_int_eq(traffic_get_stats(cap, NULL), -1);
+    ck_assert_int_eq(traffic_get_stats(NULL, &stats), -1);
+    remove("stats.pcap");
+    traffic_capture_destroy(cap);
+}
+END_TEST
+
+START_TEST(test_concurrent_handles) {
+    traffic_capture_config_t open_cfg = {.interface = "lo",
+                                         .bpf_filter = "udp port 50000",
+                                         .output_file = "open.pcap",
+                                         .duration = 10,
+                                         .snaplen = SNAPLEN,
+                                         .promisc = 0};
+    traffic_capture_config_t counted_cfg = {.interface = "lo",
+                                            .bpf_filter = "udp port 50000",
+                                            .output_file = "counted.pcap",
+                                            .duration = 10,
+                                            .max_packets = 5,
+                                            .snaplen = SNAPLEN,
+                                            .promisc = 0};
+    capture_job_t open_job = {.cap = traffic_capture_create(), .cfg = &open_cfg};
+    capture_job_t counted_job = {.cap = traffic_capture_create(), .cfg = &counted_cfg};
+    traffic_capture_stats_t stats;
+    pthread_t open_thread;
+    pthread_t counted_thread;
+    pthread_t sender;
+    int* open_result = NULL;
+    int* counted_result = NULL;
+
+    pthread_create(&open_thread, NULL, capture_thread_wrapper, &open_job);
+    pthread_create(&counted_thread, NULL, capture_thread_wrapper, &counted_job);
+    udp_sending = 1;
+    pthread_create(&sender, NULL, udp_sender, NULL);
+
+    // Stopping one handle must leave the other capture running to its own limit.
+    usleep(DELAY_MS);
+    traffic_capture_stop(open_job.cap);
+    pthread_join(open_thread, (void**)&open_result);
+    pthread_join(counted_thread, (void**)&counted_result);
+    udp_sending = 0;
+    pthread_join(sender, NULL);
+
+    ck_assert_int_eq(*open_result, 0);
+    ck_assert_msg(*counted_result == 0, "Capture failed with error: %s",
+                  traffic_get_last_error(counted_job.cap));
+    ck_assert_int_eq(traffic_get_stats(counted_job.cap, &stats), 0);
+    ck_assert_uint_eq(stats.packets_written, 5);
+    ck_assert(file_exists("open.pcap"));
+    ck_assert(file_exists("counted.pcap"));
+
+    free(open_result);
+    free(counted_result);
+    remove("open.pcap");
+    remove("counted.pcap");
+    traffic_capture_destroy(open_job.cap);
+    traffic_capture_destroy(counted_job.cap);
+}
+END_TEST
+
+START_TEST(test_stream_without_file) {
+    // Room for two 90-byte records: the rest of the capture has to be counted as drops.
+    traffic_capture_config_t cfg = {.interface = "lo",
+                                    .bpf_filter = "udp port 50000",
+                                    .output_file = "",
+                                    .duration = 5,
+                                    .max_packets = 6,
+                                    .snaplen = SNAPLEN,
+                                    .promisc = 0};
+    traffic_capture_t* cap = traffic_capture_create();
+    traffic_capture_stats_t stats;
+    pthread_t sender;
+    size_t offset;
+    size_t len;
+    int records = 0;
+
+    unsigned char* ring = traffic_stream_open(cap, 200);
+    ck_assert_ptr_nonnull(ring);
+    udp_sending = 1;
+    pthread_create(&sender, NULL, udp_sender, NULL);
+    int result = traffic_capture_start(cap, &cfg);
+    udp_sending = 0;
+    pthread_join(sender, NULL);
+    ck_assert_msg(result == 0, "Capture failed with error: %s", traffic_get_last_error(cap));
+
+    while (traffic_stream_acquire(cap, &offset, &len, 100) == 1) {
+        size_t pos = offset;
+        while (pos < offset + len) {
+            traffic_stream_record_t record;
+            memcpy(&record, ring + pos, sizeof(record));
+            ck_assert_uint_eq(record.caplen, 74);
+            ck_assert_uint_eq(record.len, 74);
+            pos += sizeof(record) + record.caplen;
+            records++;
+        }
+        traffic_stream_release(cap, len);
+    }
+
+    ck_assert_int_eq(records, 2);
+    ck_assert_int_eq(traffic_get_stats(cap, &stats), 0);
+    ck_assert_uint_eq(stats.stream_drops, 4);
+    ck_assert_uint_eq(stats.bytes_written, 0);
+    traffic_capture_destroy(cap);
+}
+END_TEST
+
+START_TEST(test_writer_blocks_instead_of_dropping) {
+    // The writer queue is clamped to two full-size records; blocking must still lose nothing.
+    traffic_capture_config_t cfg = {.interface = "lo",
+                                    .bpf_filter = "udp port 50000",
+                                    .output_file = "writer.pcap",
+                                    .duration = 5,
+                                    .max_packets = 8,
+                                    .snaplen = 128,
+                                    .promisc = 0,
+                                    .writer_buffer_size = 1,
+                                    .writer_block = 1};
+    traffic_capture_t* cap = traffic_capture_create();
+    traffic_capture_stats_t stats;
+    pthread_t sender;
+
+    udp_sending = 1;
+    pthread_create(&sender, NULL, udp_sender, NULL);
+    int result = traffic_capture_start(cap, &cfg);
+    udp_sending = 0;
+    pthread_join(sender, NULL);
+
+    ck_assert_msg(result == 0, "Capture failed with error: %s", traffic_get_last_error(cap));
+    ck_assert_int_eq(traffic_get_stats(cap, &stats), 0);
+    ck_assert_uint_eq(stats.packets_written, 8);
+    ck_assert_uint_eq(stats.writer_drops, 0);
+    ck_assert_uint_eq(stats.writer_queued_bytes, 0);
+    ck_assert_uint_ge(stats.writer_peak_bytes, 16 + 74);
+    ck_assert_uint_le(stats.writer_peak_bytes, 2 * (16 + 128));
+    remove("writer.pcap");
+    traffic_capture_destroy(cap);
+}
+END_TEST
+
+START_TEST(test_gzip_output) {
+    // ".gz" selects gzip; the result must be a normal pcap once decompressed.
+    traffic_capture_config_t cfg = {.interface = "lo",
+                                    .bpf_filter = "udp port 50000",
+                                    .output_file = "gzip.pcap.gz",
+                                    .duration = 5,
+                                    .max_packets = 5,
+                                    .snaplen = SNAPLEN,
+                                    .promisc = 0};
+    traffic_capture_t* cap = traffic_capture_create();
+    pthread_t sender;
+
+    udp_sending = 1;
+    pthread_create(&sender, NULL, udp_sender, NULL);
+    int result = traffic_capture_start(cap, &cfg);
+    udp_sending = 0;
+    pthread_join(sender, NULL);
+    ck_assert_msg(result == 0, "Capture failed with error: %s", traffic_get_last_error(cap));
+    traffic_capture_destroy(cap);
+
+    gzFile in = gzopen("gzip.pcap.gz", "rb");
+    ck_assert_ptr_nonnull(in);
+    unsigned int header[6];
+    ck_assert_int_eq(gzread(in, header, sizeof(header)), (int)sizeof(header));
+    ck_assert_uint_eq(header[0], 0xa1b2c3d4);
+    int records = 0;
+    unsigned int record[4];
+    unsigned char packet[SNAPLEN];
+    while (gzread(in, record, sizeof(record)) == (int)sizeof(record)) {
+        ck_assert_int_eq(gzread(in, packet, record[2]), (int)record[2]);
+        records++;
+    }
+    gzclose(in);
+    ck_assert_int_eq(records, 5);
+    remove("gzip.pcap.gz");
+}
+END_TEST
+
+START_TEST(test_pcapng_nanosecond_output) {
+    traffic_capture_config_t cfg = {.interface = "lo",
+                                    .bpf_filter = "udp port 50000",
+                                    .output_file = "nano.pcapng",
+                                    .duration = 5,
+                                    .max_packets = 5,
+                                    .snaplen = SNAPLEN,
+                                    .promisc = 0,
+                                    .nanosecond = 1};
+    traffic_capture_t* cap = traffic_capture_create();
+    pthread_t sender;
+
+    udp_sending = 1;
+    pthread_create(&sender, NULL, udp_sender, NULL);
+    int result = traffic_capture_start(cap, &cfg);
+    udp_sending = 0;
+    pthread_join(sender, NULL);
+    ck_assert_msg(result == 0, "Capture failed with error: %s", traffic_get_last_error(cap));
+    traffic_capture_destroy(cap);
+
+    // libpcap reads pcapng too; the IDB says nanoseconds, so nothing is rounded here.
+    char errbuf[PCAP_ERRBUF_SIZE];
+    pcap_t* in =
+        pcap_open_offline_with_tstamp_precision("nano.pcapng", PCAP_TSTAMP_PRECISION_NANO, errbuf);
+    ck_assert_msg(in != NULL, "pcap_open_offline failed: %s", errbuf);
+    ck_assert_int_eq(pcap_datalink(in), DLT_EN10MB);
+    struct pcap_pkthdr* hdr;
+    const u_char* pkt;
+    int records = 0;
+    int sub_usec = 0;
+    while (pcap_next_ex(in, &hdr, &pkt) == 1) {
+        ck_assert_int_lt(hdr->ts.tv_usec, 1000000000);
+        sub_usec += hdr->ts.tv_usec % 1000 != 0;
+        records++;
+    }
+    pcap_close(in);
+    ck_assert_int_eq(records, 5);
+    ck_assert_int_gt(sub_usec, 0);
+    remove("nano.pcapng");
+}
+END_TEST
+
+START_TEST(test_tstamp_type_errors) {
+    traffic_capture_config_t cfg = {.interface = "lo",
+                                    .bpf_filter = "",
+                                    .output_file = "tstamp.pcap",
+                                    .max_packets = 1,
+                                    .snaplen = SNAPLEN,
+                                    .tstamp_type = "sundial"};
+    traffic_capture_t* cap = traffic_capture_create();
+
+    ck_assert_int_eq(traffic_capture_start(cap, &cfg), -1);
+    ck_assert_str_eq(traffic_get_last_error(cap), "unknown timestamp type 'sundial'");
+
+    // Loopback has no hardware clock.
+    cfg.tstamp_type = "adapter";
+    ck_assert_int_eq(traffic_capture_start(cap, &cfg), -1);
+    ck_assert_ptr_nonnull(strstr(traffic_get_last_error(cap), "not supported on lo"));
+    ck_assert(!file_exists("tstamp.pcap"));
+    traffic_capture_destroy(cap);
+}
+END_TEST
+
+START_TEST(test_offline_replay_limits) {
+    // 100 packets 100 ms apart: half are UDP, and the first two seconds hold 20.
+    traffic_capture_config_t cfg = {.bpf_filter = "udp",
+                                    .output_file = "replay_out.pcap",
+                                    .snaplen = SNAPLEN,
+                                    .input_file = "replay_in.pcap"};
+    traffic_capture_t* cap = traffic_capture_create();
+    traffic_capture_stats_t stats;
+
+    write_replay_input("replay_in.pcap", 100, 100000);
+    ck_assert_msg(traffic_capture_start(cap, &cfg) == 0, "Replay failed with error: %s",
+                  traffic_get_last_error(cap));
+    ck_assert_int_eq(traffic_get_stats(cap, &stats), 0);
+    ck_assert_uint_eq(stats.packets_written, 50);
+    ck_assert_uint_eq(stats.ps_recv, 50);
+
+    cfg.bpf_filter = "";
+    cfg.duration = 2;
+    ck_assert_int_eq(traffic_capture_start(cap, &cfg), 0);
+    ck_assert_int_eq(traffic_get_stats(cap, &stats), 0);
+    ck_assert_uint_eq(stats.packets_written, 20);
+
+    cfg.duration = 0;
+    cfg.max_packets = 7;
+    ck_assert_int_eq(traffic_capture_start(cap, &cfg), 0);
+    ck_assert_int_eq(traffic_get_stats(cap, &stats), 0);
+    ck_assert_uint_eq(stats.packets_written, 7);
+
+    cfg.input_file = "missing.pcap";
+    ck_assert_int_eq(traffic_capture_start(cap, &cfg), -1);
+    ck_assert_ptr_nonnull(strstr(traffic_get_last_error(cap), "cannot open input file"));
+    remove("replay_in.pcap");
+    remove("replay_out.pcap");
+    traffic_capture_destroy(cap);
+}
+END_TEST
+
+START_TEST(test_stats_page) {
+    // 100 packets of 70 bytes on disk: 1000-byte files hold 13 after the file header.
+    traffic_capture_config_t cfg = {.bpf_filter = "",
+                                    .output_file = "page_out.pcap",
+                                    .snaplen = SNAPLEN,
+                                    .rotate_bytes = 1000,
+                                    .input_file = "page_in.pcap",
+                                    .stats_file = "capture.stats"};
+    traffic_capture_t* cap = traffic_capture_create();
+    traffic_capture_stats_t stats;
+    stats_page_file_t page;
+    char name[64];
+
+    write_replay_input("page_in.pcap", 100, 1000);
+    ck_assert_msg(traffic_capture_start(cap, &cfg) == 0, "Replay failed with error: %s",
+                  traffic_get_last_error(cap));
+    ck_assert_int_eq(traffic_get_stats(cap, &stats), 0);
+    read_stats_page("capture.stats", &page);
+    ck_assert_mem_eq(page.header.magic, "NAST", 4);
+    ck_assert_uint_eq(page.header.version, STATSPAGE_VERSION);
+    ck_assert_uint_eq(page.header.header_len, sizeof(statspage_header_t));
+    ck_assert_uint_eq(page.header.size, sizeof(page));
+    ck_assert_uint_eq(page.header.pid, (uint64_t)getpid());
+    ck_assert_uint_eq(page.header.seq % 2, 0);
+    ck_assert_uint_eq(page.body.state, STATSPAGE_FINISHED);
+    ck_assert_uint_ge(page.body.updates, 2);  // starting, then finished
+    ck_assert_uint_ge(page.body.updated_ns, page.header.started_ns);
+    ck_assert_mem_eq(&page.body.stats, &stats, sizeof(stats));
+    ck_assert_uint_eq(stats.packets_written, 100);
+    ck_assert_uint_eq(stats.files_rotated, 7);
+    ck_assert_uint_gt(stats.writer_buffer_size, 0);
+    snprintf(name, sizeof(name), "page_out_%05llu.pcap", stats.files_rotated);
+    ck_assert_str_eq(page.body.current_file, name);
+
+    // The next run rewrites the page in place and keeps counting the sequence.
+    uint32_t seq = page.header.seq;
+    cfg.input_file = "missing.pcap";
+    ck_assert_int_eq(traffic_capture_start(cap, &cfg), -1);
+    read_stats_page("capture.stats", &page);
+    ck_assert_uint_eq(page.body.state, STATSPAGE_FAILED);
+    ck_assert_uint_gt(page.header.seq, seq);
+
+    cfg.stats_file = "missing_dir/capture.stats";
+    ck_assert_int_eq(traffic_capture_start(cap, &cfg), -1);
+    ck_assert_ptr_nonnull(strstr(traffic_get_last_error(cap), "cannot open stats file"));
+
+    for (unsigned long long i = 0; i <= stats.files_rotated; i++) {
+        snprintf(name, sizeof(name), "page_out_%05llu.pcap", i);
+        remove(name);
+    }
+    remove("page_in.pcap");
+    remove("capture.stats");
+    traffic_capture_destroy(cap);
+}
+END_TEST
+
+START_TEST(test_capture_index) {
+    // 100 packets 100 ms apart, alternating between a UDP and a TCP flow, in 1 s buckets.
+    traffic_capture_config_t cfg = {.bpf_filter = "",
+                                    .output_file = "indexed_out.pcap",
+                                    .snaplen = SNAPLEN,
+                                    .input_file = "indexed_in.pcap",
+                                    .index_bucket_seconds = 1};
+    traffic_capture_t* cap = traffic_capture_create();
+    sidecar_header_t header;
+    sidecar_entry_t entry;
+    int times = 0;
+    int flows = 0;
+    int ends = 0;
+
+    write_replay_input("indexed_in.pcap", 100, 100000);
+    ck_assert_int_eq(traffic_capture_start(cap, &cfg), 0);
+    FILE* index = fopen("indexed_out.pcap.idx", "rb");
+    ck_assert_ptr_nonnull(index);
+    ck_assert_uint_eq(fread(&header, sizeof(header), 1, index), 1);
+    ck_assert_int_eq(memcmp(header.magic, "NAIX", 4), 0);
+    ck_assert_uint_eq(header.linktype, DLT_EN10MB);
+    ck_assert_uint_eq(header.bucket_seconds, 1);
+    while (fread(&entry, sizeof(entry), 1, index) == 1) {
+        if (entry.type == SIDECAR_TIME) {
+            // 24-byte file header, then 16-byte record headers before each frame
+            ck_assert_uint_eq(entry.a, 1700000000 + times);
+            ck_assert_uint_eq(entry.b, 24 + entry.c * (16 + REPLAY_FRAME_LEN));
+            ck_assert_uint_eq(entry.c, times * 10);
+            times++;
+        } else if (entry.type == SIDECAR_FLOW) {
+            ck_assert_uint_eq(entry.d, 50);
+            flows++;
+        } else if (entry.type == SIDECAR_END) {
+            ck_assert_uint_eq(entry.a, 2);
+            ck_assert_uint_eq(entry.b, 0);
+            ck_assert_uint_eq(entry.c, 100);
+            ends++;
+        }
+    }
+    fclose(index);
+    ck_assert_int_eq(times, 10);
+    ck_assert_int_eq(flows, 2);
+    ck_assert_int_eq(ends, 1);
+    remove("indexed_in.pcap");
+    remove("indexed_out.pcap");
+    remove("indexed_out.pcap.idx");
+    traffic_capture_destroy(cap);
+}
+END_TEST
+
+START_TEST(test_flow_table) {
+    traffic_capture_config_t cfg = {.bpf_filter = "",
+                                    .snaplen = SNAPLEN,
+                                    .input_file = "flows_in.pcap",
+                                    .flow_file = "flows.csv",
+                                    .flow_idle_seconds = 2};
+    traffic_capture_t* cap = traffic_capture_create();
+    traffic_capture_stats_t stats;
+    char line[256];
+    int lines = 0;
+
+    // Without an output file: flow A goes idle while B is running.
+    write_two_flow_input("flows_in.pcap");
+    ck_assert_msg(traffic_capture_start(cap, &cfg) == 0, "Flow capture failed with error: %s",
+                  traffic_get_last_error(cap));
+    ck_assert_int_eq(traffic_get_stats(cap, &stats), 0);
+    ck_assert_uint_eq(stats.flows_evicted, 1);
+    ck_assert_uint_eq(stats.flows_active, 1);
+    ck_assert_uint_eq(stats.flow_overflows, 0);
+    ck_assert_int_eq(file_exists("flows_in.pcap.idx"), 0);
+
+    FILE* csv = fopen("flows.csv", "r");
+    ck_assert_ptr_nonnull(csv);
+    ck_assert_ptr_nonnull(fgets(line, sizeof(line), csv));
+    ck_assert_str_eq(line,
+                     "exported,first_seen,last_seen,proto,addr_a,port_a,addr_b,port_b,packets,"
+                     "bytes,state\n");
+    ck_assert_ptr_nonnull(fgets(line, sizeof(line), csv));
+    ck_assert_str_eq(line,
+                     "1700000006.000000,1700000000.000000,1700000000.900000,17,0.0.0.0,0,0.0.0.0,"
+                     "0,10,540,idle\n");
+    ck_assert_ptr_nonnull(fgets(line, sizeof(line), csv));
+    ck_assert_str_eq(line,
+                     "1700000006.900000,1700000006.000000,1700000006.900000,6,0.0.0.0,0,0.0.0.0,"
+                     "0,10,540,end\n");
+    ck_assert_ptr_null(fgets(line, sizeof(line), csv));
+    fclose(csv);
+
+    // Next to a pcap, with room for one flow and an export every second.
+    cfg.output_file = "flows_out.pcap";
+    cfg.flow_idle_seconds = 0;
+    cfg.flow_max = 1;
+    cfg.flow_export_seconds = 1;
+    ck_assert_int_eq(traffic_capture_start(cap, &cfg), 0);
+    ck_assert_int_eq(traffic_get_stats(cap, &stats), 0);
+    ck_assert_uint_eq(stats.packets_written, 20);
+    ck_assert_uint_eq(stats.flows_active, 1);
+    ck_assert_uint_eq(stats.flow_overflows, 10);
+    csv = fopen("flows.csv", "r");
+    ck_assert_ptr_nonnull(csv);
+    while (fgets(line, sizeof(line), csv)) {
+        lines++;
+    }
+    fclose(csv);
+    ck_assert_int_ge(lines, 3);  // header, at least one periodic export, the end line
+
+    cfg.flow_file = "/nonexistent/flows.csv";
+    ck_assert_int_eq(traffic_capture_start(cap, &cfg), -1);
+    ck_assert_ptr_nonnull(strstr(traffic_get_last_error(cap), "cannot open flow file"));
+    remove("flows_in.pcap");
+    remove("flows_out.pcap");
+    remove("flows.csv");
+    traffic_capture_destroy(cap);
+}
+END_TEST
+
+START_TEST(test_offline_replay_pacing) {
+    // 10 packets spanning 900 ms of capture time, replayed at 10x.
+    traffic_capture_config_t cfg = {.bpf_filter = "",
+                                    .output_file = "paced_out.pcap",
+                                    .snaplen = SNAPLEN,
+                                    .input_file = "paced_in.pcap",
+                                    .replay_speed = 10.0};
+    traffic_capture_t* cap = traffic_capture_create();
+    struct timespec start;
+    struct timespec end;
+
+    write_replay_input("paced_in.pcap", 10, 100000);
+    clock_gettime(CLOCK_MONOTONIC, &start);
+    ck_assert_int_eq(traffic_capture_start(cap, &cfg), 0);
+    clock_gettime(CLOCK_MONOTONIC, &end);
+    double elapsed =
+        (double)(end.tv_sec - start.tv_sec) + (double)(end.tv_nsec - start.tv_nsec) / 1e9;
+    ck_assert_msg(elapsed >= 0.09 && elapsed < 0.5, "10x replay of 900 ms took %.3f s", elapsed);
+    remove("paced_in.pcap");
+    remove("paced_out.pcap");
+    traffic_capture_destroy(cap);
+}
+END_TEST
+
+START_TEST(test_filter_swap) {
+    // Immediate mode, so packets are delivered within the short capture.
+    traffic_capture_config_t cfg = {.interface = "lo",
+                                    .bpf_filter = "udp port 50001",
+                                    .output_file = "swap.pcap",
+                                    .duration = 10,
+                                    .snaplen = SNAPLEN,
+                                    .promisc = 0,
+                                    .immediate_mode = true};
+    capture_job_t job = {.cap = traffic_capture_create(), .cfg = &cfg};
+    traffic_capture_stats_t stats;
+    char err[256] = "";
+    pthread_t capture;
+    pthread_t sender;
+    int* result = NULL;
+
+    ck_assert_int_eq(traffic_capture_set_filter(job.cap, "udp", 100, err, sizeof(err)), -2);
+    pthread_create(&capture, NULL, capture_thread_wrapper, &job);
+    udp_sending = 1;
+    pthread_create(&sender, NULL, udp_sender, NULL);
+    usleep(DELAY_MS);
+
+    ck_assert_int_eq(traffic_capture_set_filter(job.cap, "udp port", 1000, err, sizeof(err)), -1);
+    ck_assert_msg(strstr(err, "BPF filter error") != NULL, "unexpected error: %s", err);
+    ck_assert_int_eq(traffic_capture_set_filter(job.cap, "udp port 50000", 1000, err, sizeof(err)),
+                     0);
+    usleep(DELAY_MS);
+    // Switching back and forth reuses the compiled programs.
+    ck_assert_int_eq(traffic_capture_set_filter(job.cap, "udp port 50001", 1000, err, sizeof(err)),
+                     0);
+    ck_assert_int_eq(traffic_capture_set_filter(job.cap, "udp port 50000", 1000, err, sizeof(err)),
+                     0);
+    usleep(DELAY_MS);
+    traffic_capture_stop(job.cap);
+    pthread_join(capture, (void**)&result);
+    udp_sending = 0;
+    pthread_join(sender, NULL);
+
+    ck_assert_msg(*result == 0, "Capture failed with error: %s", traffic_get_last_error(job.cap));
+    ck_assert_int_eq(traffic_get_stats(job.cap, &stats), 0);
+    ck_assert_uint_gt(stats.packets_written, 0);
+    ck_assert_uint_eq(stats.filter_swaps, 3);
+    ck_assert_uint_eq(stats.filter_compiles, 3);  // 50001, the rejected one and 50000
+    ck_assert_int_eq(traffic_capture_set_filter(job.cap, "udp", 100, err, sizeof(err)), -2);
+
+    free(result);
+    remove("swap.pcap");
+    traffic_capture_destroy(job.cap);
+}
+END_TEST
+
+START_TEST(test_sampling) {
+    // 100 packets 100 ms apart (10 a second), alternating between a UDP and a TCP flow.
+    traffic_capture_config_t cfg = {.bpf_filter = "",
+                                    .output_file = "sampled.pcapng",
+                                    .snaplen = SNAPLEN,
+                                    .input_file = "sample_in.pcap",
+                                    .sampling = TRAFFIC_SAMPLE_COUNT,
+                                    .sample_rate = 10};
+    traffic_capture_t* cap = traffic_capture_create();
+    traffic_capture_stats_t stats;
+    static const char comment[] = "sampling=count rate=10";
+    char header[256] = {0};
+    bool recorded = false;
+
+    write_replay_input("sample_in.pcap", 100, 100000);
+    ck_assert_msg(traffic_capture_start(cap, &cfg) == 0, "Sampled replay failed with error: %s",
+                  traffic_get_last_error(cap));
+    ck_assert_int_eq(traffic_get_stats(cap, &stats), 0);
+    ck_assert_uint_eq(stats.ps_recv, 100);
+    ck_assert_uint_eq(stats.packets_written, 10);
+    ck_assert_uint_eq(stats.sampled_out, 90);
+    FILE* out = fopen("sampled.pcapng", "rb");
+    ck_assert_ptr_nonnull(out);
+    size_t len = fread(header, 1, sizeof(header), out);
+    fclose(out);
+    for (size_t i = 0; i + sizeof(comment) - 1 <= len; i++) {
+        recorded |= memcmp(header + i, comment, sizeof(comment) - 1) == 0;
+    }
+    ck_assert(recorded);
+
+    cfg.sampling = TRAFFIC_SAMPLE_BUDGET;
+    cfg.sample_rate = 3;
+    ck_assert_int_eq(traffic_capture_start(cap, &cfg), 0);
+    ck_assert_int_eq(traffic_get_stats(cap, &stats), 0);
+    ck_assert_uint_eq(stats.packets_written, 30);
+
+    // Flow sampling keeps each flow whole or not at all, by its hash.
+    u_char frame[REPLAY_FRAME_LEN] = {0};
+    unsigned long long expected = 0;
+    frame[12] = 0x08;
+    frame[14] = 0x45;
+    for (int proto = 0; proto < 2; proto++) {
+        frame[23] = proto ? IPPROTO_TCP : IPPROTO_UDP;
+        uint64_t hash = traffic_flow_hash(DLT_EN10MB, frame, sizeof(frame));
+        expected += (hash ^ hash >> 32) % 3 == 0 ? 50 : 0;
+    }
+    cfg.sampling = TRAFFIC_SAMPLE_FLOW;
+    ck_assert_int_eq(traffic_capture_start(cap, &cfg), 0);
+    ck_assert_int_eq(traffic_get_stats(cap, &stats), 0);
+    ck_assert_uint_eq(stats.packets_written, expected);
+    ck_assert_uint_eq(stats.sampled_out, 100 - expected);
+
+    cfg.sample_rate = 0;
+    ck_assert_int_eq(traffic_capture_start(cap, &cfg), -1);
+    ck_assert_ptr_nonnull(strstr(traffic_get_last_error(cap), "positive sample_rate"));
+
+    ck_assert_int_eq(traffic_headers_snaplen(DLT_EN10MB), 142);
+    ck_assert_int_eq(traffic_headers_snaplen(DLT_LINUX_SLL), 136);
+    ck_assert_int_eq(traffic_headers_snaplen(DLT_IEEE802_11_RADIO), 0);
+    remove("sample_in.pcap");
+    remove("sampled.pcapng");
+    traffic_capture_destroy(cap);
+}
+END_TEST
+
+START_TEST(test_fanout_totals) {
+    // Two workers after three filter changes, each installed by both.
+    traffic_capture_stats_t parts[2] = {{.ps_recv = 100,
+                                         .packets_written = 90,
+                                         .bytes_written = 9000,
+                                         .writer_queued_bytes = 300,
+                                         .writer_peak_bytes = 4000,
+                                         .writer_buffer_size = 1024,
+                                         .filter_swaps = 3,
+                                         .filter_compiles = 2,
+                                         .stop_latency_ns = 1500},
+                                        {.ps_recv = 50,
+                                         .packets_written = 45,
+                                         .bytes_written = 4500,
+                                         .writer_queued_bytes = 200,
+                                         .writer_peak_bytes = 7000,
+                                         .writer_buffer_size = 1024,
+                                         .filter_swaps = 3,
+                                         .filter_compiles = 3,
+                                         .stop_latency_ns = 900}};
+    traffic_capture_stats_t total;
+
+    traffic_sum_worker_stats(parts, 2, &total);
+    ck_assert_uint_eq(total.ps_recv, 150);
+    ck_assert_uint_eq(total.packets_written, 135);
+    ck_assert_uint_eq(total.bytes_written, 13500);
+    ck_assert_uint_eq(total.writer_queued_bytes, 500);
+    ck_assert_uint_eq(total.writer_buffer_size, 2048);
+    ck_assert_uint_eq(total.filter_compiles, 5);
+    ck_assert_uint_eq(total.writer_peak_bytes, 7000);  // not the sum of unrelated peaks
+    ck_assert_uint_eq(total.filter_swaps, 3);          // one per request
+    ck_assert_uint_eq(total.stop_latency_ns, 1500);    // the slowest worker
+
+    traffic_sum_worker_stats(parts, 0, &total);
+    ck_assert_uint_eq(total.ps_recv, 0);
+}
+END_TEST
+
+START_TEST(test_fanout) {
+    traffic_capture_config_t cfg = {.interface = "lo",
+                                    .bpf_filter = "udp port 50000",
+                                    .output_file = "fanout.pcap",
+                                    .duration = 10,
+                                    .snaplen = SNAPLEN,
+                                    .immediate_mode = true,
+                                    .fanout_workers = 2,
+                                    .fanout_mode = TRAFFIC_FANOUT_HASH,
+                                    .fanout_pin = true,
+                                    .stats_file = "fanout.stats"};
+    capture_job_t job = {.cap = traffic_capture_create(), .cfg = &cfg};
+    traffic_capture_stats_t stats;
+    traffic_capture_stats_t worker;
+    stats_page_file_t page;
+    unsigned long long written = 0;
+    unsigned long long received = 0;
+    pthread_t capture;
+    pthread_t sender;
+    int* result = NULL;
+
+    pthread_create(&capture, NULL, capture_thread_wrapper, &job);
+    udp_sending = 1;
+    pthread_create(&sender, NULL, udp_sender, NULL);
+    usleep(DELAY_MS * 2);
+    traffic_capture_stop(job.cap);  // one stop ends every worker
+    pthread_join(capture, (void**)&result);
+    udp_sending = 0;
+    pthread_join(sender, NULL);
+
+    ck_assert_msg(*result == 0, "Fanout capture failed with error: %s",
+                  traffic_get_last_error(job.cap));
+    ck_assert(file_exists("fanout_w0.pcap"));
+    ck_assert(file_exists("fanout_w1.pcap"));
+    ck_assert(!file_exists("fanout.pcap"));
+    for (int i = 0; i < 2; i++) {
+        ck_assert_int_eq(traffic_get_worker_stats(job.cap, i, &worker), 0);
+        written += worker.packets_written;
+        received += worker.ps_recv;
+    }
+    ck_assert_int_eq(traffic_get_worker_stats(job.cap, 2, &worker), -1);
+    ck_assert_int_eq(traffic_get_stats(job.cap, &stats), 0);
+    ck_assert_uint_gt(stats.packets_written, 0);
+    ck_assert_uint_eq(stats.packets_written, written);
+    ck_assert_uint_eq(stats.ps_recv, received);
+    read_stats_page("fanout.stats", &page);  // the totals, not a worker's shard
+    ck_assert_uint_eq(page.body.workers, 2);
+    ck_assert_uint_eq(page.body.stats.packets_written, stats.packets_written);
+    ck_assert_str_eq(page.body.current_file, "fanout.pcap");
+
+    // Workers share one interface, so replays and packet limits are refused.
+    cfg.max_packets = 10;
+    ck_assert_int_eq(traffic_capture_start(job.cap, &cfg), -1);
+    ck_assert_ptr_nonnull(strstr(traffic_get_last_error(job.cap), "max_packets"));
+    cfg.max_packets = 0;
+    cfg.input_file = "fanout_in.pcap";
+    ck_assert_int_eq(traffic_capture_start(job.cap, &cfg), -1);
+    ck_assert_ptr_nonnull(strstr(traffic_get_last_error(job.cap), "live interface"));
+
+    free(result);
+    remove("fanout_w0.pcap");
+    remove("fanout_w1.pcap");
+    remove("fanout.stats");
+    traffic_capture_destroy(job.cap);
+}
+END_TEST
+
+START_TEST(test_prompt_stop) {
+    // Without immediate mode the kernel hands over packets only when the buffer timeout
+    // retires a TPACKET_V3 block; that must not hold up a stop or the duration limit.
+    traffic_capture_config_t cfg = {.interface = "lo",
+                                    .bpf_filter = "udp port 50000",
+                                    .output_file = "stop.pcap",
+                                    .snaplen = SNAPLEN,
+                                    .timeout_ms = 1000};
+    capture_job_t job = {.cap = traffic_capture_create(), .cfg = &cfg};
+    traffic_capture_stats_t stats;
+    struct timespec start;
+    struct timespec end;
+    pthread_t capture;
+    int* result = NULL;
+
+    // Idle: the stop request wakes the poll() at once.
+    pthread_create(&capture, NULL, capture_thread_wrapper, &job);
+    usleep(DELAY_MS);
+    traffic_capture_stop(job.cap);
+    pthread_join(capture, (void**)&result);
+    ck_assert_msg(*result == 0, "Capture failed with error: %s", traffic_get_last_error(job.cap));
+    free(result);
+    ck_assert_int_eq(traffic_get_stats(job.cap, &stats), 0);
+    ck_assert_uint_gt(stats.stop_latency_ns, 0);
+    ck_assert_uint_lt(stats.stop_latency_ns, 10000000);
+
+    // In immediate mode a stop right behind the traffic still keeps every packet.
+    cfg.immediate_mode = true;
+    pthread_create(&capture, NULL, capture_thread_wrapper, &job);
+    usleep(DELAY_MS);
+    udp_burst(20);
+    traffic_capture_stop(job.cap);
+    pthread_join(capture, (void**)&result);
+    ck_assert_msg(*result == 0, "Capture failed with error: %s", traffic_get_last_error(job.cap));
+    free(result);
+    ck_assert_int_eq(traffic_get_stats(job.cap, &stats), 0);
+    ck_assert_uint_eq(stats.packets_written, 20);
+    ck_assert_uint_lt(stats.stop_latency_ns, 10000000);
+    cfg.immediate_mode = false;
+
+    // The duration timer ends an idle capture on time.
+    cfg.duration = 1;
+    clock_gettime(CLOCK_MONOTONIC, &start);
+    ck_assert_int_eq(traffic_capture_start(job.cap, &cfg), 0);
+    clock_gettime(CLOCK_MONOTONIC, &end);
+    ck_assert_int_ge(elapsed_ms(&start, &end), 1000);
+    ck_assert_int_lt(elapsed_ms(&start, &end), 1100);
+    ck_assert_int_eq(traffic_get_stats(job.cap, &stats), 0);
+    ck_assert_uint_lt(stats.stop_latency_ns, 10000000);
+
+    // A stop before the start is kept: the next start returns at once, opening nothing.
+    remove("stop.pcap");
+    cfg.duration = 0;
+    traffic_capture_stop(job.cap);
+    clock_gettime(CLOCK_MONOTONIC, &start);
+    ck_assert_int_eq(traffic_capture_start(job.cap, &cfg), 0);
+    clock_gettime(CLOCK_MONOTONIC, &end);
+    ck_assert_int_lt(elapsed_ms(&start, &end), 100);
+    ck_assert(!file_exists("stop.pcap"));
+    ck_assert_int_eq(traffic_get_stats(job.cap, &stats), 0);
+    ck_assert_uint_gt(stats.stop_latency_ns, 0);
+
+    // Rearming drops it, so the next run lasts until its own limit.
+    cfg.duration = 1;
+    traffic_capture_stop(job.cap);
+    traffic_capture_rearm(job.cap);
+    clock_gettime(CLOCK_MONOTONIC, &start);
+    ck_assert_int_eq(traffic_capture_start(job.cap, &cfg), 0);
+    clock_gettime(CLOCK_MONOTONIC, &end);
+    ck_assert_int_ge(elapsed_ms(&start, &end), 1000);
+
+    remove("stop.pcap");
+    traffic_capture_destroy(job.cap);
+}
+END_TEST
+
+START_TEST(test_scan_records) {
+    // Three 54-byte frames after the 24-byte file header, 70 bytes per record.
+    unsigned char buf[24 + 3 * (16 + REPLAY_FRAME_LEN)];
+    uint64_t offsets[3] = {0};
+    FILE* f;
+
+    write_replay_input("scan.pcap", 3, 1000);
+    f = fopen("scan.pcap", "rb");
+    ck_assert_ptr_nonnull(f);
+    ck_assert_uint_eq(fread(buf, 1, sizeof(buf), f), sizeof(buf));
+    fclose(f);
+
+    ck_assert_uint_eq(traffic_scan_records(buf, sizeof(buf), 24, false, NULL, 0), 3);
+    ck_assert_uint_eq(traffic_scan_records(buf, sizeof(buf), 24, false, offsets, 3), 3);
+    ck_assert_uint_eq(offsets[0], 24);
+    ck_assert_uint_eq(offsets[1], 94);
+    ck_assert_uint_eq(offsets[2], 164);
+    ck_assert_uint_eq(traffic_scan_records(buf, sizeof(buf), 24, false, offsets, 2), 2);
+    // A record cut short ends the walk; so does a start past the end.
+    ck_assert_uint_eq(traffic_scan_records(buf, sizeof(buf) - 1, 24, false, NULL, 0), 2);
+    ck_assert_uint_eq(traffic_scan_records(buf, sizeof(buf), sizeof(buf) + 1, false, NULL, 0), 0);
+    remove("scan.pcap");
 }
 END_TEST
 
@@ -69,6 +1063,26 @@ Suite* traffic_suite(void) {
 
     tcase_add_test(tc_core, test_valid_capture_config);
     tcase_add_test(tc_core, test_invalid_interface);
+    tcase_add_test(tc_core, test_rotation_keeps_newest_files);
+    tcase_add_test(tc_core, test_tuned_handle_capture);
+    tcase_add_test(tc_core, test_stats_after_capture);
+    tcase_add_test(tc_core, test_concurrent_handles);
+    tcase_add_test(tc_core, test_stream_without_file);
+    tcase_add_test(tc_core, test_writer_blocks_instead_of_dropping);
+    tcase_add_test(tc_core, test_gzip_output);
+    tcase_add_test(tc_core, test_pcapng_nanosecond_output);
+    tcase_add_test(tc_core, test_tstamp_type_errors);
+    tcase_add_test(tc_core, test_offline_replay_limits);
+    tcase_add_test(tc_core, test_offline_replay_pacing);
+    tcase_add_test(tc_core, test_capture_index);
+    tcase_add_test(tc_core, test_stats_page);
+    tcase_add_test(tc_core, test_flow_table);
+    tcase_add_test(tc_core, test_scan_records);
+    tcase_add_test(tc_core, test_filter_swap);
+    tcase_add_test(tc_core, test_sampling);
+    tcase_add_test(tc_core, test_fanout_totals);
+    tcase_add_test(tc_core, test_fanout);
+    tcase_add_test(tc_core, test_prompt_stop);
     suite_add_tcase(suite, tc_core);
 
     return suite;
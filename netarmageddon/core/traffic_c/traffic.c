@@ -1,107 +1,1949 @@
-
+#define _GNU_SOURCE  // pthread_setaffinity_np, CPU_SET
 #include "traffic.h"
 
+#include <errno.h>
 #include <pcap/pcap.h>
+#include <poll.h>
+#include <pthread.h>
+#include <sched.h>
 #include <stdarg.h>
+#include <stdint.h>
+#include <stdio.h>
 #include <stdlib.h>
 #include <string.h>
+#include <sys/eventfd.h>
+#include <sys/socket.h>
 #include <sys/time.h>
+#include <sys/timerfd.h>
 #include <sys/types.h>
+#include <time.h>
+#include <unistd.h>
+#ifdef __linux__
+#include <linux/if_packet.h>
+#endif
+
+#include "bpfcache.h"
+#include "flow.h"
+#include "flowtable.h"
+#include "ring.h"
+#include "sink.h"
+#include "statspage.h"
 
 enum {
     ERRBUF_SIZE = 256,
     PCAP_TIMEOUT_MS = 1000,
+    PATH_SIZE = 4096,
+    STATS_INTERVAL_US = 100000,
+    STREAM_RECORD_LEN = sizeof(traffic_stream_record_t),
+    WRITER_RING_DEFAULT = 8 * 1024 * 1024,
+    WRITER_WAIT_MS = 100,
+    REPLAY_BATCH = 1024,  // packets per pcap_dispatch() when reading a file
+    FLOW_TABLE_DEFAULT = 65536,
+    FILTER_CACHE_SIZE = 32,       // compiled BPF programs kept per handle
+    SCAN_RECORD_HEADER_LEN = 16,  // pcap record header: ts_sec, ts_frac, caplen, len
+    SCAN_BLOCK_HEADER_LEN = 12,   // smallest pcapng block: type, total length, total length
+    SCAN_PCAPNG_EPB = 6,
+    SAMPLE_COMMENT_SIZE = 64,
+    SAMPLE_HASH_SHIFT = 32,
+    FANOUT_MAX_WORKERS = 64,
+    FANOUT_ID_MASK = 0xffff,
+    FANOUT_TYPE_SHIFT = 16,
+    NAME_TAG_SIZE = 32,
+};
+static const long long WRITER_FLUSH_US = 1000000;
+static const long long USEC_PER_SEC = 1000000;
+static const long long NSEC_PER_USEC = 1000;
+static const long long NSEC_PER_SEC = 1000000000;
+static const long long MSEC_PER_SEC = 1000;
+static const long long USEC_PER_MSEC = 1000;
+static const long long NSEC_PER_MSEC = 1000000;
+static const char *const SAMPLING_NAMES[] = {"none", "count", "budget", "flow"};
+static unsigned int fanout_groups;  // fanout groups created by this process so far
+
+// Files retired by the writer thread, waiting to be closed off the hot path.
+typedef struct retired_file {
+    sink_t *sink;
+    long seq;
+    struct retired_file *next;
+} retired_file_t;
+
+// Ring-buffer rotation state shared between the writer thread and the janitor thread.
+typedef struct {
+    pthread_t thread;
+    pthread_mutex_t lock;
+    pthread_cond_t cond;
+    retired_file_t *retired;  // closed (and trimmed) by the janitor
+    sink_t *spare;            // next file, opened ahead of time by the janitor
+    long spare_seq;
+    long wanted_seq;  // sequence number the janitor should pre-open (-1 = none)
+    bool opening;     // janitor is currently opening wanted_seq
+    bool quit;
+} rotation_t;
+
+// Disk writer: the capture thread queues records into `ring` and a dedicated thread
+// fwrite()s them in whole spans, so a slow disk backs up the ring instead of the kernel.
+typedef struct {
+    pthread_t thread;
+    record_ring_t ring;
+    bool started;
+    bool block;  // wait for room when the ring is full instead of dropping
+    const traffic_capture_config_t *config;
+
+    // Capture thread only.
+    unsigned long long overflows;  // packets that found the ring full
+    unsigned long long drops;      // packets discarded because of that
+
+    // Writer thread only.
+    bool rotating;
+    bool failed;
+    long file_seq;
+    long long file_bytes;
+    unsigned long long packets;
+    unsigned long long bytes;
+    struct timespec file_start;
+    struct timespec synced_at;  // last writer_sync()
+    long long header_len;       // file header bytes at the start of every output file
+} writer_t;
+
+typedef struct fanout_worker fanout_worker_t;
+
+// Everything one capture needs. Each TrafficLogger owns one, so several captures can run
+// concurrently in one process.
+struct traffic_capture {
+    pthread_mutex_t lock;  // guards pcap against traffic_capture_stop() from other threads
+    pcap_t *pcap;
+    sink_t *sink;          // current output file (owned by the writer thread once started)
+    volatile int running;  // cleared by traffic_capture_stop()
+    bool active;           // traffic_capture_start() is executing on this handle
+    bool offline;          // reading config->input_file instead of an interface
+    bool to_file;          // this run writes an output file
+    char errbuf[ERRBUF_SIZE];
+
+    // Wake-ups: traffic_capture_stop() and filter changes write this eventfd, which the
+    // capture loop polls next to the pcap descriptor and the replay pacing sleeps on.
+    int wake_fd;
+    bool stop_requested;      // traffic_capture_stop() was called during this run
+    bool stop_pending;        // ... or before it started: the next run ends at once
+    struct timespec stop_at;  // CLOCK_MONOTONIC of that first call
+
+    // Published by the capture thread every STATS_INTERVAL_US, read lock-free by
+    // traffic_get_stats() from any thread.
+    traffic_capture_stats_t live_stats;
+    struct pcap_stat last_pcap_stat;
+
+    // Output file format, fixed for the whole run (rotated files included).
+    sink_config_t sink_config;
+
+    const char *rotate_base;
+    int rotate_max_files;
+    rotation_t rotation;
+
+    writer_t writer;
+    record_ring_t stream;
+    unsigned long long stream_drops;  // capture thread only
+    flowtable_t *flows;               // capture thread only
+    bool flows_failed;
+
+    // Sampling and headers-only truncation, applied on the capture thread.
+    uint32_t trim_len;                         // cut packets to this many bytes (0 = keep caplen)
+    unsigned long long sampled_out;            // capture thread only
+    char sample_comment[SAMPLE_COMMENT_SIZE];  // pcapng opt_comment of a sampled capture
+
+    // Filter changes: traffic_capture_set_filter() posts an expression under `lock` and the
+    // capture thread compiles (through `filters`) and installs it between batches, so the
+    // pcap handle is only ever used by the capture thread.
+    bpfcache_t *filters;  // capture thread only, kept across runs
+    pthread_cond_t filter_cond;
+    char *filter_request;       // expression waiting to be installed (NULL = none)
+    unsigned long filter_seq;   // requests posted
+    unsigned long filter_done;  // requests installed or rejected
+    int filter_result;          // of request filter_done: 0 or -1
+    char filter_error[ERRBUF_SIZE];
+    unsigned long long filter_swaps;  // capture thread only
+
+    // PACKET_FANOUT: the handle the caller holds runs one worker handle per thread and
+    // forwards stop, filter changes and stats to them.
+    traffic_capture_t *parent;  // worker handles only
+    fanout_worker_t *workers;   // kept after the run for the final stats
+    int worker_count;
+    int fanout_arg;  // worker handles only: PACKET_FANOUT socket option value (0 = none)
+
+    // config->stats_file, rewritten from the capture thread with every publish_stats()
+    // (from worker 0 with the totals of a fanout capture).
+    statspage_t *stats_page;
+    const char *output_file;  // config->output_file of this run (NULL = none)
 };
-static const double MICROSECONDS_IN_SECOND = 1000000.0;
 
-static pcap_t *pcap_handle = NULL;
-static pcap_dumper_t *pcap_dumper = NULL;
-static volatile int capture_running = 0;
-static char errbuf_global[ERRBUF_SIZE];
+struct fanout_worker {
+    traffic_capture_t *parent;
+    traffic_capture_t *cap;
+    traffic_capture_config_t config;  // the parent's, with shard file names
+    char output_file[PATH_SIZE];
+    char flow_file[PATH_SIZE];
+    int index;
+    int cpu;  // pinned to this CPU (-1 = not pinned)
+    pthread_t thread;
+    bool started;
+    int result;
+};
 
-static void set_error(const char *fmt, ...) {
+static void set_error(traffic_capture_t *cap, const char *fmt, ...) {
     va_list args;
     va_start(args, fmt);
-    vsnprintf(errbuf_global, ERRBUF_SIZE, fmt, args);  // NOLINT
+    vsnprintf(cap->errbuf, ERRBUF_SIZE, fmt, args);  // NOLINT
     va_end(args);
 }
 
-void traffic_capture_stop(void) {
-    capture_running = 0;
-    if (pcap_handle) {
-        pcap_breakloop(pcap_handle);
+traffic_capture_t *traffic_capture_create(void) {
+    traffic_capture_t *cap = calloc(1, sizeof(*cap));
+    if (cap) {
+        cap->filters = bpfcache_create(FILTER_CACHE_SIZE);
+        cap->wake_fd = eventfd(0, EFD_NONBLOCK | EFD_CLOEXEC);
+        if (!cap->filters || cap->wake_fd < 0) {
+            bpfcache_destroy(cap->filters);
+            free(cap);
+            return NULL;
+        }
+        pthread_mutex_init(&cap->lock, NULL);
+        pthread_cond_init(&cap->filter_cond, NULL);
     }
+    return cap;
 }
 
-const char *traffic_get_last_error(void) {
-    return (errbuf_global[0] != '\0') ? errbuf_global : NULL;
+// Destroy the worker handles of the last fanout run.
+static void free_workers(traffic_capture_t *cap) {
+    pthread_mutex_lock(&cap->lock);
+    fanout_worker_t *workers = cap->workers;
+    int count = cap->worker_count;
+    cap->workers = NULL;
+    cap->worker_count = 0;
+    pthread_mutex_unlock(&cap->lock);
+    for (int i = 0; i < count; i++) {
+        traffic_capture_destroy(workers[i].cap);
+    }
+    free(workers);
 }
 
-int traffic_capture_start(const traffic_capture_config_t *config) {
-    struct bpf_program filter_prog;
-    bpf_u_int32 net = 0;
-    bpf_u_int32 mask = 0;
-    char lib_err[PCAP_ERRBUF_SIZE] = {0};
-    int packet_count = 0;
-    struct timeval start_tv;
-    struct timeval now_tv;
+void traffic_capture_destroy(traffic_capture_t *cap) {
+    if (!cap) {
+        return;
+    }
+    free_workers(cap);
+    ring_free(&cap->stream);
+    bpfcache_destroy(cap->filters);
+    free(cap->filter_request);
+    close(cap->wake_fd);
+    pthread_cond_destroy(&cap->filter_cond);
+    pthread_mutex_destroy(&cap->lock);
+    free(cap);
+}
+
+// Interrupt the capture thread wherever it waits: in pcap_dispatch(), in poll() or in a
+// replay pacing sleep. Called with `lock` held.
+static void wake_loop(traffic_capture_t *cap) {
+    uint64_t one = 1;
+    if (cap->pcap) {
+        pcap_breakloop(cap->pcap);
+    }
+    // Only fails when the counter is about to overflow, and then it is readable anyway.
+    ssize_t ret = write(cap->wake_fd, &one, sizeof(one));
+    (void)ret;
+}
+
+static void clear_wakeups(traffic_capture_t *cap) {
+    uint64_t count;
+    ssize_t ret = read(cap->wake_fd, &count, sizeof(count));  // resets the counter
+    (void)ret;
+}
 
-    pcap_handle = pcap_open_live(config->interface, config->snaplen, config->promisc ? 1 : 0,
-                                 PCAP_TIMEOUT_MS, lib_err);
-    if (!pcap_handle) {
-        set_error("pcap_open_live failed: %s", lib_err);
+void traffic_capture_rearm(traffic_capture_t *cap) {
+    if (!cap) {
+        return;
+    }
+    pthread_mutex_lock(&cap->lock);
+    cap->stop_pending = false;
+    pthread_mutex_unlock(&cap->lock);
+}
+
+void traffic_capture_stop(traffic_capture_t *cap) {
+    if (!cap) {
+        return;
+    }
+    pthread_mutex_lock(&cap->lock);
+    if (cap->running && !cap->stop_requested) {
+        cap->stop_requested = true;
+        clock_gettime(CLOCK_MONOTONIC, &cap->stop_at);
+    } else if (!cap->active && !cap->stop_pending) {
+        // The capture thread has not reached traffic_capture_start() yet.
+        cap->stop_pending = true;
+        clock_gettime(CLOCK_MONOTONIC, &cap->stop_at);
+    }
+    cap->running = 0;
+    wake_loop(cap);
+    for (int i = 0; i < cap->worker_count; i++) {
+        traffic_capture_stop(cap->workers[i].cap);
+    }
+    pthread_mutex_unlock(&cap->lock);
+}
+
+int traffic_get_worker_stats(const traffic_capture_t *cap, int index,
+                             traffic_capture_stats_t *stats) {
+    if (!cap || index < 0) {
         return -1;
     }
+    // free_workers() swaps the array out under the lock; hold it while reading a worker.
+    pthread_mutex_t *lock = (pthread_mutex_t *)&cap->lock;
+    int ret = -1;
+    pthread_mutex_lock(lock);
+    if (index < cap->worker_count) {
+        ret = traffic_get_stats(cap->workers[index].cap, stats);
+    }
+    pthread_mutex_unlock(lock);
+    return ret;
+}
 
-    if (config->bpf_filter[0] != '\0') {
-        if (pcap_compile(pcap_handle, &filter_prog, config->bpf_filter, 1, net) < 0 ||
-            pcap_setfilter(pcap_handle, &filter_prog) < 0) {
-            set_error("BPF filter error: %s", pcap_geterr(pcap_handle));
-            pcap_freecode(&filter_prog);
-            pcap_close(pcap_handle);
+const char *traffic_get_last_error(const traffic_capture_t *cap) {
+    return (cap && cap->errbuf[0] != '\0') ? cap->errbuf : NULL;
+}
+
+static unsigned long long max_ull(unsigned long long a, unsigned long long b) {
+    return a > b ? a : b;
+}
+
+// Fold one worker's stats into the fanout total.
+static void add_worker_stats(traffic_capture_stats_t *total, const traffic_capture_stats_t *part) {
+    total->ps_recv += part->ps_recv;
+    total->ps_drop += part->ps_drop;
+    total->ps_ifdrop += part->ps_ifdrop;
+    total->packets_written += part->packets_written;
+    total->bytes_written += part->bytes_written;
+    total->stream_drops += part->stream_drops;
+    total->writer_queued_bytes += part->writer_queued_bytes;
+    total->writer_overflows += part->writer_overflows;
+    total->writer_drops += part->writer_drops;
+    total->flows_active += part->flows_active;
+    total->flows_evicted += part->flows_evicted;
+    total->flow_overflows += part->flow_overflows;
+    total->filter_compiles += part->filter_compiles;  // each worker has its own cache
+    total->sampled_out += part->sampled_out;
+    total->files_rotated += part->files_rotated;
+    total->writer_buffer_size += part->writer_buffer_size;
+    // Each worker queues on its own: the fullest queue, not a sum of peaks at other times.
+    total->writer_peak_bytes = max_ull(total->writer_peak_bytes, part->writer_peak_bytes);
+    // Every worker installs each filter request: count a request once.
+    total->filter_swaps = max_ull(total->filter_swaps, part->filter_swaps);
+    // The capture ends with its slowest worker.
+    total->stop_latency_ns = max_ull(total->stop_latency_ns, part->stop_latency_ns);
+}
+
+void traffic_sum_worker_stats(const traffic_capture_stats_t *parts, int count,
+                              traffic_capture_stats_t *total) {
+    memset(total, 0, sizeof(*total));
+    for (int i = 0; i < count; i++) {
+        add_worker_stats(total, &parts[i]);
+    }
+}
+
+int traffic_get_stats(const traffic_capture_t *cap, traffic_capture_stats_t *stats) {
+    if (!cap || !stats) {
+        return -1;
+    }
+    // The worker array may be freed by a concurrent teardown; it is read under the lock.
+    pthread_mutex_t *lock = (pthread_mutex_t *)&cap->lock;
+    pthread_mutex_lock(lock);
+    int worker_count = cap->worker_count;
+    if (worker_count > 0) {
+        memset(stats, 0, sizeof(*stats));
+        for (int i = 0; i < worker_count; i++) {
+            traffic_capture_stats_t part;
+            traffic_get_stats(cap->workers[i].cap, &part);
+            add_worker_stats(stats, &part);
+        }
+    }
+    pthread_mutex_unlock(lock);
+    if (worker_count > 0) {
+        return 0;
+    }
+    const traffic_capture_stats_t *live_stats = &cap->live_stats;
+    stats->ps_recv = __atomic_load_n(&live_stats->ps_recv, __ATOMIC_RELAXED);
+    stats->ps_drop = __atomic_load_n(&live_stats->ps_drop, __ATOMIC_RELAXED);
+    stats->ps_ifdrop = __atomic_load_n(&live_stats->ps_ifdrop, __ATOMIC_RELAXED);
+    stats->packets_written = __atomic_load_n(&live_stats->packets_written, __ATOMIC_RELAXED);
+    stats->bytes_written = __atomic_load_n(&live_stats->bytes_written, __ATOMIC_RELAXED);
+    stats->stream_drops = __atomic_load_n(&live_stats->stream_drops, __ATOMIC_RELAXED);
+    stats->writer_queued_bytes =
+        __atomic_load_n(&live_stats->writer_queued_bytes, __ATOMIC_RELAXED);
+    stats->writer_peak_bytes = __atomic_load_n(&live_stats->writer_peak_bytes, __ATOMIC_RELAXED);
+    stats->writer_overflows = __atomic_load_n(&live_stats->writer_overflows, __ATOMIC_RELAXED);
+    stats->writer_drops = __atomic_load_n(&live_stats->writer_drops, __ATOMIC_RELAXED);
+    stats->flows_active = __atomic_load_n(&live_stats->flows_active, __ATOMIC_RELAXED);
+    stats->flows_evicted = __atomic_load_n(&live_stats->flows_evicted, __ATOMIC_RELAXED);
+    stats->flow_overflows = __atomic_load_n(&live_stats->flow_overflows, __ATOMIC_RELAXED);
+    stats->filter_swaps = __atomic_load_n(&live_stats->filter_swaps, __ATOMIC_RELAXED);
+    stats->filter_compiles = __atomic_load_n(&live_stats->filter_compiles, __ATOMIC_RELAXED);
+    stats->sampled_out = __atomic_load_n(&live_stats->sampled_out, __ATOMIC_RELAXED);
+    stats->stop_latency_ns = __atomic_load_n(&live_stats->stop_latency_ns, __ATOMIC_RELAXED);
+    stats->files_rotated = __atomic_load_n(&live_stats->files_rotated, __ATOMIC_RELAXED);
+    stats->writer_buffer_size = __atomic_load_n(&live_stats->writer_buffer_size, __ATOMIC_RELAXED);
+    return 0;
+}
+
+static void reset_stats(traffic_capture_t *cap) {
+    traffic_capture_stats_t *live_stats = &cap->live_stats;
+
+    memset(&cap->last_pcap_stat, 0, sizeof(cap->last_pcap_stat));
+    __atomic_store_n(&live_stats->ps_recv, 0, __ATOMIC_RELAXED);
+    __atomic_store_n(&live_stats->ps_drop, 0, __ATOMIC_RELAXED);
+    __atomic_store_n(&live_stats->ps_ifdrop, 0, __ATOMIC_RELAXED);
+    __atomic_store_n(&live_stats->packets_written, 0, __ATOMIC_RELAXED);
+    __atomic_store_n(&live_stats->bytes_written, 0, __ATOMIC_RELAXED);
+    __atomic_store_n(&live_stats->stream_drops, 0, __ATOMIC_RELAXED);
+    __atomic_store_n(&live_stats->writer_queued_bytes, 0, __ATOMIC_RELAXED);
+    __atomic_store_n(&live_stats->writer_peak_bytes, 0, __ATOMIC_RELAXED);
+    __atomic_store_n(&live_stats->writer_overflows, 0, __ATOMIC_RELAXED);
+    __atomic_store_n(&live_stats->writer_drops, 0, __ATOMIC_RELAXED);
+    __atomic_store_n(&live_stats->flows_active, 0, __ATOMIC_RELAXED);
+    __atomic_store_n(&live_stats->flows_evicted, 0, __ATOMIC_RELAXED);
+    __atomic_store_n(&live_stats->flow_overflows, 0, __ATOMIC_RELAXED);
+    __atomic_store_n(&live_stats->filter_swaps, 0, __ATOMIC_RELAXED);
+    __atomic_store_n(&live_stats->filter_compiles, 0, __ATOMIC_RELAXED);
+    __atomic_store_n(&live_stats->sampled_out, 0, __ATOMIC_RELAXED);
+    __atomic_store_n(&live_stats->stop_latency_ns, 0, __ATOMIC_RELAXED);
+    __atomic_store_n(&live_stats->files_rotated, 0, __ATOMIC_RELAXED);
+    __atomic_store_n(&live_stats->writer_buffer_size, 0, __ATOMIC_RELAXED);
+}
+
+// Called from the capture thread only: pcap_stats() is not safe to call concurrently
+// with the read loop, so other threads only ever see the published copy. Packets and
+// bytes written are published by the writer thread when there is an output file.
+static void publish_stats(traffic_capture_t *cap, unsigned long long packets) {
+    traffic_capture_stats_t *live_stats = &cap->live_stats;
+    struct pcap_stat now;
+    if (cap->offline) {
+        // Savefiles have no kernel counters; count what passed the filter instead.
+        __atomic_store_n(&live_stats->ps_recv, packets, __ATOMIC_RELAXED);
+    } else if (pcap_stats(cap->pcap, &now) == 0) {
+        // Unsigned 32-bit deltas absorb counter wrap-around.
+        __atomic_fetch_add(&live_stats->ps_recv, (u_int)(now.ps_recv - cap->last_pcap_stat.ps_recv),
+                           __ATOMIC_RELAXED);
+        __atomic_fetch_add(&live_stats->ps_drop, (u_int)(now.ps_drop - cap->last_pcap_stat.ps_drop),
+                           __ATOMIC_RELAXED);
+        __atomic_fetch_add(&live_stats->ps_ifdrop,
+                           (u_int)(now.ps_ifdrop - cap->last_pcap_stat.ps_ifdrop),
+                           __ATOMIC_RELAXED);
+        cap->last_pcap_stat = now;
+    }
+    if (!cap->to_file) {
+        __atomic_store_n(&live_stats->packets_written, packets - cap->sampled_out,
+                         __ATOMIC_RELAXED);
+    }
+    __atomic_store_n(&live_stats->stream_drops, cap->stream_drops, __ATOMIC_RELAXED);
+    __atomic_store_n(&live_stats->writer_queued_bytes, ring_used(&cap->writer.ring),
+                     __ATOMIC_RELAXED);
+    __atomic_store_n(&live_stats->writer_peak_bytes, cap->writer.ring.peak, __ATOMIC_RELAXED);
+    __atomic_store_n(&live_stats->writer_overflows, cap->writer.overflows, __ATOMIC_RELAXED);
+    __atomic_store_n(&live_stats->writer_drops, cap->writer.drops, __ATOMIC_RELAXED);
+    if (cap->flows) {
+        unsigned long long active;
+        unsigned long long evicted;
+        unsigned long long overflows;
+        flowtable_counts(cap->flows, &active, &evicted, &overflows);
+        __atomic_store_n(&live_stats->flows_active, active, __ATOMIC_RELAXED);
+        __atomic_store_n(&live_stats->flows_evicted, evicted, __ATOMIC_RELAXED);
+        __atomic_store_n(&live_stats->flow_overflows, overflows, __ATOMIC_RELAXED);
+    }
+    __atomic_store_n(&live_stats->filter_swaps, cap->filter_swaps, __ATOMIC_RELAXED);
+    __atomic_store_n(&live_stats->filter_compiles, bpfcache_compiles(cap->filters),
+                     __ATOMIC_RELAXED);
+    __atomic_store_n(&live_stats->sampled_out, cap->sampled_out, __ATOMIC_RELAXED);
+}
+
+unsigned char *traffic_stream_open(traffic_capture_t *cap, size_t size) {
+    if (!cap) {
+        return NULL;
+    }
+    if (size <= STREAM_RECORD_LEN) {
+        set_error(cap, "stream buffer of %zu bytes is too small", size);
+        return NULL;
+    }
+
+    pthread_mutex_lock(&cap->lock);
+    if (cap->active) {
+        pthread_mutex_unlock(&cap->lock);
+        set_error(cap, "cannot resize the stream buffer while capturing");
+        return NULL;
+    }
+    ring_free(&cap->stream);
+    if (ring_init(&cap->stream, size) < 0) {
+        pthread_mutex_unlock(&cap->lock);
+        set_error(cap, "cannot allocate a %zu byte stream buffer", size);
+        return NULL;
+    }
+    pthread_mutex_unlock(&cap->lock);
+    return cap->stream.buf;
+}
+
+int traffic_stream_acquire(traffic_capture_t *cap, size_t *offset, size_t *len, int timeout_ms) {
+    if (!cap || !cap->stream.buf || !offset || !len) {
+        return -1;
+    }
+    return ring_acquire(&cap->stream, offset, len, timeout_ms);
+}
+
+void traffic_stream_release(traffic_capture_t *cap, size_t len) {
+    if (!cap || !cap->stream.buf) {
+        return;
+    }
+    ring_release(&cap->stream, len);
+}
+
+// Fanout: every worker installs the filter. A rejection wins over a pending install,
+// which wins over success; workers that already ended are skipped.
+static int set_worker_filters(traffic_capture_t *cap, const char *expr, int timeout_ms, char *err,
+                              size_t err_size) {
+    int ret = -2;
+    for (int i = 0; i < cap->worker_count; i++) {
+        char worker_err[ERRBUF_SIZE] = "";
+        int result = traffic_capture_set_filter(cap->workers[i].cap, expr, timeout_ms, worker_err,
+                                                sizeof(worker_err));
+        if (result == -1 || ret == -2 || (result == 1 && ret == 0)) {
+            ret = result;
+            snprintf(err, err_size, "%s", worker_err);  // NOLINT
+        }
+        if (ret == -1) {
+            break;  // the expression is the same for every worker
+        }
+    }
+    return ret;
+}
+
+int traffic_capture_set_filter(traffic_capture_t *cap, const char *expr, int timeout_ms, char *err,
+                               size_t err_size) {
+    struct timespec until;
+    char *copy = NULL;
+    int ret = 1;
+
+    if (!cap || !expr) {
+        return -1;
+    }
+    copy = strdup(expr);
+    if (!copy) {
+        snprintf(err, err_size, "out of memory");  // NOLINT
+        return -1;
+    }
+
+    pthread_mutex_lock(&cap->lock);
+    if (!cap->active) {
+        pthread_mutex_unlock(&cap->lock);
+        free(copy);
+        snprintf(err, err_size, "no capture is running");  // NOLINT
+        return -2;
+    }
+    if (cap->worker_count > 0) {
+        pthread_mutex_unlock(&cap->lock);
+        free(copy);
+        return set_worker_filters(cap, expr, timeout_ms, err, err_size);
+    }
+    // A request that was not picked up yet is superseded; its caller sees this one's result.
+    free(cap->filter_request);
+    cap->filter_request = copy;
+    unsigned long seq = ++cap->filter_seq;
+    wake_loop(cap);
+
+    clock_gettime(CLOCK_REALTIME, &until);
+    until.tv_sec += timeout_ms / MSEC_PER_SEC;
+    until.tv_nsec += (timeout_ms % MSEC_PER_SEC) * NSEC_PER_MSEC;
+    if (until.tv_nsec >= NSEC_PER_SEC) {
+        until.tv_sec++;
+        until.tv_nsec -= NSEC_PER_SEC;
+    }
+    while (cap->filter_done < seq) {
+        if (pthread_cond_timedwait(&cap->filter_cond, &cap->lock, &until) != 0) {
+            break;  // timed out: the request stays queued
+        }
+    }
+    if (cap->filter_done >= seq) {
+        ret = cap->filter_result;
+        if (ret < 0) {
+            snprintf(err, err_size, "%s", cap->filter_error);  // NOLINT
+        }
+    }
+    pthread_mutex_unlock(&cap->lock);
+    return ret;
+}
+
+// Install the filter posted by traffic_capture_set_filter(), if any. Capture thread only.
+static void apply_filter_request(traffic_capture_t *cap) {
+    const struct bpf_program *prog = NULL;
+    char *expr = NULL;
+    char error[ERRBUF_SIZE] = "";
+    int result = 0;
+
+    pthread_mutex_lock(&cap->lock);
+    unsigned long seq = cap->filter_seq;
+    expr = cap->filter_request;
+    cap->filter_request = NULL;
+    pthread_mutex_unlock(&cap->lock);
+    if (!expr) {
+        return;
+    }
+
+    prog = bpfcache_get(cap->filters, cap->pcap, expr);
+    if (!prog || pcap_setfilter(cap->pcap, (struct bpf_program *)prog) < 0) {
+        snprintf(error, sizeof(error), "BPF filter error: %s", pcap_geterr(cap->pcap));  // NOLINT
+        result = -1;
+    } else {
+        cap->filter_swaps++;
+    }
+    free(expr);
+
+    pthread_mutex_lock(&cap->lock);
+    cap->filter_done = seq;
+    cap->filter_result = result;
+    snprintf(cap->filter_error, sizeof(cap->filter_error), "%s", error);  // NOLINT
+    pthread_cond_broadcast(&cap->filter_cond);
+    pthread_mutex_unlock(&cap->lock);
+}
+
+int traffic_headers_snaplen(int linktype) { return (int)flow_headers_len(linktype); }
+
+uint64_t traffic_flow_hash(int linktype, const uint8_t *pkt, uint32_t caplen) {
+    flow_key_t key;
+    if (!pkt || !flow_key_from_packet(linktype, pkt, caplen, &key)) {
+        return 0;
+    }
+    return flow_hash(&key);
+}
+
+size_t traffic_scan_records(const uint8_t *data, size_t len, size_t start, bool pcapng,
+                            uint64_t *offsets, size_t max_offsets) {
+    size_t count = 0;
+    size_t pos = start;
+
+    while (data && (!offsets || count < max_offsets)) {
+        uint32_t field = 0;
+        size_t record_len = 0;
+        bool report = true;
+        if (pcapng) {
+            if (pos > len || len - pos < SCAN_BLOCK_HEADER_LEN) {
+                break;
+            }
+            memcpy(&field, data + pos + sizeof(uint32_t), sizeof(field));  // block total length
+            record_len = field;
+            if (record_len < SCAN_BLOCK_HEADER_LEN || record_len % sizeof(uint32_t) != 0) {
+                break;
+            }
+            memcpy(&field, data + pos, sizeof(field));  // block type
+            report = field == SCAN_PCAPNG_EPB;
+        } else {
+            if (pos > len || len - pos < SCAN_RECORD_HEADER_LEN) {
+                break;
+            }
+            memcpy(&field, data + pos + 2 * sizeof(uint32_t), sizeof(field));  // caplen
+            record_len = SCAN_RECORD_HEADER_LEN + (size_t)field;
+        }
+        if (record_len > len - pos) {
+            break;
+        }
+        if (report) {
+            if (offsets) {
+                offsets[count] = pos;
+            }
+            count++;
+        }
+        pos += record_len;
+    }
+    return count;
+}
+
+// "dir/capture.pcap" + "_w1" -> "dir/capture_w1.pcap", "capture.pcap.gz" -> "capture_w1.pcap.gz"
+static void tagged_name(char *buf, size_t size, const char *base, const char *tag) {
+    int stem_len = (int)(strlen(base) - sink_suffix_len(base));
+    const char *suffix = base + stem_len;
+    const char *slash = strrchr(base, '/');
+    const char *dot = NULL;
+    for (const char *p = base; p < suffix; p++) {
+        if (*p == '.') {
+            dot = p;
+        }
+    }
+    if (!dot || (slash && dot < slash) || dot == base || (slash && dot == slash + 1)) {
+        snprintf(buf, size, "%.*s%s%s", stem_len, base, tag, suffix);  // NOLINT
+        return;
+    }
+    snprintf(buf, size, "%.*s%s%s", (int)(dot - base), base, tag, dot);  // NOLINT
+}
+
+// "dir/capture.pcap" + 3 -> "dir/capture_00003.pcap", "capture.pcap.gz" -> "capture_00003.pcap.gz"
+static void rotated_name(char *buf, size_t size, const char *base, long seq) {
+    char tag[NAME_TAG_SIZE];
+    snprintf(tag, sizeof(tag), "_%05ld", seq);  // NOLINT
+    tagged_name(buf, size, base, tag);
+}
+
+static sink_t *open_output_file(traffic_capture_t *cap, const char *path, char *err,
+                                size_t err_size) {
+    return sink_open(path, &cap->sink_config, err, err_size);
+}
+
+static sink_t *open_rotated(traffic_capture_t *cap, long seq, char *err, size_t err_size) {
+    char path[PATH_SIZE];
+    rotated_name(path, sizeof(path), cap->rotate_base, seq);
+    return open_output_file(cap, path, err, err_size);
+}
+
+static void remove_rotated(const traffic_capture_t *cap, long seq) {
+    char path[PATH_SIZE];
+    rotated_name(path, sizeof(path), cap->rotate_base, seq);
+    unlink(path);
+    if (cap->sink_config.index_bucket_seconds > 0) {
+        char index_path[PATH_SIZE + sizeof(".idx")];
+        snprintf(index_path, sizeof(index_path), "%s.idx", path);  // NOLINT
+        unlink(index_path);
+    }
+}
+
+static void *rotation_janitor(void *arg) {
+    traffic_capture_t *cap = arg;
+    rotation_t *rotation = &cap->rotation;
+
+    pthread_mutex_lock(&rotation->lock);
+    for (;;) {
+        while (!rotation->quit && !rotation->retired && rotation->wanted_seq < 0) {
+            pthread_cond_wait(&rotation->cond, &rotation->lock);
+        }
+
+        if (rotation->retired) {
+            retired_file_t *file = rotation->retired;
+            rotation->retired = file->next;
+            pthread_mutex_unlock(&rotation->lock);
+
+            // The expensive part of a swap: flushing, closing and deleting old files.
+            sink_close(file->sink);
+            long expired = file->seq + 1 - cap->rotate_max_files;
+            if (cap->rotate_max_files > 0 && expired >= 0) {
+                remove_rotated(cap, expired);
+            }
+            free(file);
+
+            pthread_mutex_lock(&rotation->lock);
+            continue;
+        }
+
+        if (rotation->wanted_seq >= 0 && !rotation->quit) {
+            long seq = rotation->wanted_seq;
+            rotation->wanted_seq = -1;
+            rotation->opening = true;
+            pthread_mutex_unlock(&rotation->lock);
+
+            char err[ERRBUF_SIZE];
+            sink_t *spare = open_rotated(cap, seq, err, sizeof(err));
+
+            pthread_mutex_lock(&rotation->lock);
+            rotation->spare = spare;
+            rotation->spare_seq = seq;
+            rotation->opening = false;
+            pthread_cond_broadcast(&rotation->cond);
+            continue;
+        }
+
+        if (rotation->quit) {
+            break;
+        }
+    }
+
+    if (rotation->spare) {
+        sink_close(rotation->spare);
+        remove_rotated(cap, rotation->spare_seq);
+        rotation->spare = NULL;
+    }
+    pthread_mutex_unlock(&rotation->lock);
+    return NULL;
+}
+
+static int rotation_init(traffic_capture_t *cap, long first_seq) {
+    rotation_t *rotation = &cap->rotation;
+
+    memset(rotation, 0, sizeof(*rotation));
+    rotation->wanted_seq = first_seq;
+    rotation->spare_seq = -1;
+    pthread_mutex_init(&rotation->lock, NULL);
+    pthread_cond_init(&rotation->cond, NULL);
+    if (pthread_create(&rotation->thread, NULL, rotation_janitor, cap) != 0) {
+        set_error(cap, "failed to start rotation thread");
+        pthread_cond_destroy(&rotation->cond);
+        pthread_mutex_destroy(&rotation->lock);
+        return -1;
+    }
+    return 0;
+}
+
+static void rotation_shutdown(traffic_capture_t *cap) {
+    rotation_t *rotation = &cap->rotation;
+
+    pthread_mutex_lock(&rotation->lock);
+    rotation->quit = true;
+    pthread_cond_broadcast(&rotation->cond);
+    pthread_mutex_unlock(&rotation->lock);
+    pthread_join(rotation->thread, NULL);
+    pthread_cond_destroy(&rotation->cond);
+    pthread_mutex_destroy(&rotation->lock);
+}
+
+// Swap the active output for the next file in the ring. The janitor normally has the
+// next file open already, so the writer thread only exchanges pointers here.
+static int rotate_file(traffic_capture_t *cap, long *seq) {
+    rotation_t *rotation = &cap->rotation;
+    retired_file_t *file = malloc(sizeof(*file));
+    sink_t *next = NULL;
+    long next_seq = *seq + 1;
+
+    pthread_mutex_lock(&rotation->lock);
+    while (rotation->opening) {
+        pthread_cond_wait(&rotation->cond, &rotation->lock);
+    }
+    if (rotation->spare && rotation->spare_seq == next_seq) {
+        next = rotation->spare;
+        rotation->spare = NULL;
+    } else if (rotation->wanted_seq == next_seq) {
+        rotation->wanted_seq = -1;  // the janitor has not got to it yet; open it here instead
+    }
+    pthread_mutex_unlock(&rotation->lock);
+
+    if (!next) {
+        char err[ERRBUF_SIZE];
+        next = open_rotated(cap, next_seq, err, sizeof(err));
+        if (!next) {
+            set_error(cap, "cannot open output file: %s", err);
+            free(file);
             return -1;
         }
-        pcap_freecode(&filter_prog);
     }
 
-    pcap_dumper = pcap_dump_open(pcap_handle, config->output_file);
-    if (!pcap_dumper) {
-        set_error("pcap_dump_open failed: %s", pcap_geterr(pcap_handle));
-        pcap_close(pcap_handle);
+    if (file) {
+        file->sink = cap->sink;
+        file->seq = *seq;
+        file->next = NULL;
+    }
+
+    pthread_mutex_lock(&rotation->lock);
+    if (file) {
+        retired_file_t **tail = &rotation->retired;
+        while (*tail) {
+            tail = &(*tail)->next;
+        }
+        *tail = file;
+    }
+    rotation->wanted_seq = next_seq + 1;
+    pthread_cond_broadcast(&rotation->cond);
+    pthread_mutex_unlock(&rotation->lock);
+
+    if (!file) {
+        sink_close(cap->sink);
+    }
+    cap->sink = next;
+    *seq = next_seq;
+    return 0;
+}
+
+// Select the timestamp source by its libpcap name ("host", "adapter", ...). Hardware
+// types only work where the driver offers them; otherwise the error lists what does.
+static int set_tstamp_type(traffic_capture_t *cap, pcap_t *handle,
+                           const traffic_capture_config_t *config) {
+    int type = pcap_tstamp_type_name_to_val(config->tstamp_type);
+    if (type == PCAP_ERROR) {
+        set_error(cap, "unknown timestamp type '%s'", config->tstamp_type);
+        return -1;
+    }
+    if (pcap_set_tstamp_type(handle, type) == 0) {
+        return 0;
+    }
+
+    char available[ERRBUF_SIZE] = "host";
+    int *types = NULL;
+    int count = pcap_list_tstamp_types(handle, &types);
+    if (count > 0) {
+        size_t used = 0;
+        available[0] = '\0';
+        for (int i = 0; i < count && used < sizeof(available); i++) {
+            used += (size_t)snprintf(available + used, sizeof(available) - used,  // NOLINT
+                                     "%s%s", i ? ", " : "", pcap_tstamp_type_val_to_name(types[i]));
+        }
+    }
+    pcap_free_tstamp_types(types);
+    set_error(cap, "timestamp type '%s' is not supported on %s (available: %s)",
+              config->tstamp_type, config->interface, available);
+    return -1;
+}
+
+static pcap_t *open_offline_handle(traffic_capture_t *cap, const traffic_capture_config_t *config) {
+    char lib_err[PCAP_ERRBUF_SIZE] = {0};
+    u_int precision = config->nanosecond ? PCAP_TSTAMP_PRECISION_NANO : PCAP_TSTAMP_PRECISION_MICRO;
+
+    pcap_t *handle =
+        pcap_open_offline_with_tstamp_precision(config->input_file, precision, lib_err);
+    if (!handle) {
+        set_error(cap, "cannot open input file: %s", lib_err);
+    }
+    return handle;
+}
+
+// pcap_create/pcap_activate instead of pcap_open_live so the kernel buffer, immediate mode
+// and timeout can be tuned. On Linux this also gives the TPACKET_V3 memory-mapped ring.
+static pcap_t *open_live_handle(traffic_capture_t *cap, const traffic_capture_config_t *config,
+                                int snaplen) {
+    char lib_err[PCAP_ERRBUF_SIZE] = {0};
+    int timeout_ms = config->timeout_ms > 0 ? config->timeout_ms : PCAP_TIMEOUT_MS;
+
+    pcap_t *handle = pcap_create(config->interface, lib_err);
+    if (!handle) {
+        set_error(cap, "pcap_create failed: %s", lib_err);
+        return NULL;
+    }
+
+    if (pcap_set_snaplen(handle, snaplen) != 0 ||
+        pcap_set_promisc(handle, config->promisc ? 1 : 0) != 0 ||
+        pcap_set_timeout(handle, timeout_ms) != 0 ||
+        pcap_set_immediate_mode(handle, config->immediate_mode ? 1 : 0) != 0 ||
+        (config->buffer_size > 0 && pcap_set_buffer_size(handle, config->buffer_size) != 0)) {
+        set_error(cap, "pcap option error: %s", pcap_geterr(handle));
+        pcap_close(handle);
+        return NULL;
+    }
+    if (config->nanosecond && pcap_set_tstamp_precision(handle, PCAP_TSTAMP_PRECISION_NANO) != 0) {
+        set_error(cap, "nanosecond timestamps are not supported on %s", config->interface);
+        pcap_close(handle);
+        return NULL;
+    }
+    if (config->tstamp_type && config->tstamp_type[0] != '\0' &&
+        set_tstamp_type(cap, handle, config) < 0) {
+        pcap_close(handle);
+        return NULL;
+    }
+
+    int status = pcap_activate(handle);
+    if (status < 0) {
+        set_error(cap, "pcap_activate failed: %s (%s)", pcap_statustostr(status),
+                  pcap_geterr(handle));
+        pcap_close(handle);
+        return NULL;
+    }
+    if (status == PCAP_WARNING_TSTAMP_TYPE_NOTSUP) {
+        set_error(cap, "timestamp type '%s' is not supported on %s", config->tstamp_type,
+                  config->interface);
+        pcap_close(handle);
+        return NULL;
+    }
+    // The capture loop polls the descriptor itself, next to the wake-up eventfd and the
+    // duration timer, so reads must not block. Without a selectable descriptor it falls
+    // back to blocking reads.
+    if (pcap_get_selectable_fd(handle) >= 0 && pcap_setnonblock(handle, 1, lib_err) < 0) {
+        set_error(cap, "pcap_setnonblock failed: %s", lib_err);
+        pcap_close(handle);
+        return NULL;
+    }
+    return handle;
+}
+
+// Join the PACKET_FANOUT group of the other workers: the kernel then hands every packet of
+// the interface to exactly one socket of the group.
+static int join_fanout(traffic_capture_t *cap) {
+#ifdef PACKET_FANOUT
+    int arg = cap->fanout_arg;
+    if (setsockopt(pcap_fileno(cap->pcap), SOL_PACKET, PACKET_FANOUT, &arg, sizeof(arg)) < 0) {
+        set_error(cap, "cannot join fanout group: %s", strerror(errno));
         return -1;
     }
+    return 0;
+#else
+    set_error(cap, "fanout capture needs Linux PACKET_FANOUT");
+    return -1;
+#endif
+}
+
+static long long elapsed_ns(const struct timespec *from, const struct timespec *to) {
+    return (to->tv_sec - from->tv_sec) * NSEC_PER_SEC + (to->tv_nsec - from->tv_nsec);
+}
+
+static long long elapsed_us(const struct timespec *from, const struct timespec *to) {
+    return (to->tv_sec - from->tv_sec) * USEC_PER_SEC +
+           (to->tv_nsec - from->tv_nsec) / NSEC_PER_USEC;
+}
+
+// Writer thread: stop consuming input and take the capture down with it. The ring is
+// still drained so a producer blocked on a full ring is released.
+static void writer_fail(traffic_capture_t *cap) {
+    cap->writer.failed = true;
+    traffic_capture_stop(cap);
+}
+
+static bool writer_put(traffic_capture_t *cap, const unsigned char *data, size_t len) {
+    if (sink_write_records(cap->sink, data, len) < 0) {
+        set_error(cap, "%s", sink_error(cap->sink));
+        writer_fail(cap);
+        return false;
+    }
+    return true;
+}
+
+// Make the file decodable up to here. For compressed output this closes a gzip member or
+// zstd frame, so it runs when the queue goes idle and at least every WRITER_FLUSH_US.
+static void writer_sync(traffic_capture_t *cap, const struct timespec *now) {
+    writer_t *writer = &cap->writer;
+    writer->synced_at = *now;
+    if (!writer->failed && sink_flush(cap->sink) < 0) {
+        set_error(cap, "%s", sink_error(cap->sink));
+        writer_fail(cap);
+    }
+}
+
+// Runs of ring records go to the sink in one call (for pcap output they already have the
+// on-disk record layout). Runs are only split where the file has to rotate.
+static void writer_write_span(traffic_capture_t *cap, const unsigned char *span, size_t len) {
+    writer_t *writer = &cap->writer;
+    const traffic_capture_config_t *config = writer->config;
+    size_t run = 0;
+    size_t pos = 0;
+    struct timespec now;
+
+    clock_gettime(CLOCK_MONOTONIC, &now);
+    while (pos < len) {
+        traffic_stream_record_t record;
+        memcpy(&record, span + pos, sizeof(record));
+        long long record_len = (long long)sink_record_len(cap->sink, record.caplen);
+
+        if (writer->rotating && writer->file_bytes > writer->header_len &&
+            ((config->rotate_bytes > 0 && writer->file_bytes + record_len > config->rotate_bytes) ||
+             (config->rotate_seconds > 0 &&
+              elapsed_us(&writer->file_start, &now) >= config->rotate_seconds * USEC_PER_SEC))) {
+            if (!writer_put(cap, span + run, pos - run)) {
+                return;
+            }
+            if (rotate_file(cap, &writer->file_seq) < 0) {
+                writer_fail(cap);
+                return;
+            }
+            writer->file_bytes = writer->header_len;
+            writer->bytes += writer->header_len;
+            writer->file_start = now;
+            __atomic_store_n(&cap->live_stats.files_rotated, (unsigned long long)writer->file_seq,
+                             __ATOMIC_RELAXED);
+            run = pos;
+        }
+
+        writer->file_bytes += record_len;
+        writer->bytes += record_len;
+        writer->packets++;
+        pos += STREAM_RECORD_LEN + record.caplen;
+    }
+    if (!writer_put(cap, span + run, pos - run)) {
+        return;
+    }
+    if (elapsed_us(&writer->synced_at, &now) >= WRITER_FLUSH_US) {
+        writer_sync(cap, &now);
+    }
 
-    capture_running = 1;
-    gettimeofday(&start_tv, NULL);
+    __atomic_store_n(&cap->live_stats.packets_written, writer->packets, __ATOMIC_RELAXED);
+    __atomic_store_n(&cap->live_stats.bytes_written, writer->bytes, __ATOMIC_RELAXED);
+}
 
-    while (capture_running) {
-        struct pcap_pkthdr *hdr;
-        const u_char *pkt;
-        int ret = pcap_next_ex(pcap_handle, &hdr, &pkt);
+static void *writer_main(void *arg) {
+    traffic_capture_t *cap = arg;
+    writer_t *writer = &cap->writer;
+    size_t offset;
+    size_t len;
+    int ret;
+
+    while ((ret = ring_acquire(&writer->ring, &offset, &len, WRITER_WAIT_MS)) >= 0) {
+        if (ret == 0) {
+            struct timespec now;
+            clock_gettime(CLOCK_MONOTONIC, &now);
+            writer_sync(cap, &now);  // idle: nothing is lost if the process dies now
+            continue;
+        }
+        if (!writer->failed) {
+            writer_write_span(cap, writer->ring.buf + offset, len);
+        }
+        ring_release(&writer->ring, len);
+    }
+    return NULL;
+}
+
+static int writer_start(traffic_capture_t *cap, const traffic_capture_config_t *config) {
+    writer_t *writer = &cap->writer;
+    size_t size = config->writer_buffer_size > 0 ? (size_t)config->writer_buffer_size
+                                                 : (size_t)WRITER_RING_DEFAULT;
+    // Always room for two full-size records, otherwise a blocking writer could never drain.
+    size_t min_size = 2 * (STREAM_RECORD_LEN + (size_t)pcap_snapshot(cap->pcap));
+    if (size < min_size) {
+        size = min_size;
+    }
 
-        // Always check elapsed time first
-        gettimeofday(&now_tv, NULL);
-        double elapsed = (double)(now_tv.tv_sec - start_tv.tv_sec) +
-                         (double)(now_tv.tv_usec - start_tv.tv_usec) / MICROSECONDS_IN_SECOND;
+    memset(writer, 0, sizeof(*writer));
+    writer->config = config;
+    writer->block = config->writer_block || cap->offline;  // a file can always wait
+    writer->rotating = config->rotate_bytes > 0 || config->rotate_seconds > 0;
+    writer->header_len = (long long)sink_header_len(cap->sink);
+    writer->file_bytes = writer->header_len;
+    writer->bytes = writer->header_len;
+    clock_gettime(CLOCK_MONOTONIC, &writer->file_start);
+    writer->synced_at = writer->file_start;
 
-        if (config->duration > 0 && elapsed >= config->duration) {
+    if (ring_init(&writer->ring, size) < 0) {
+        set_error(cap, "cannot allocate a %zu byte writer buffer", size);
+        return -1;
+    }
+    if (pthread_create(&writer->thread, NULL, writer_main, cap) != 0) {
+        set_error(cap, "failed to start writer thread");
+        ring_free(&writer->ring);
+        return -1;
+    }
+    writer->started = true;
+    __atomic_store_n(&cap->live_stats.writer_buffer_size, (unsigned long long)size,
+                     __ATOMIC_RELAXED);
+    return 0;
+}
+
+// Drain everything still queued, then join the writer thread.
+static void writer_stop(traffic_capture_t *cap) {
+    writer_t *writer = &cap->writer;
+    if (!writer->started) {
+        return;
+    }
+    ring_notify(&writer->ring, true);
+    pthread_join(writer->thread, NULL);
+    ring_free(&writer->ring);
+    writer->started = false;
+}
+
+// Capture thread: queue one packet for the writer. On a full ring either drop it or,
+// with writer_block, wait for the writer to make room (unless the capture is stopping).
+static void writer_queue(traffic_capture_t *cap, const struct pcap_pkthdr *hdr, const u_char *pkt) {
+    writer_t *writer = &cap->writer;
+    if (ring_push(&writer->ring, hdr, pkt)) {
+        return;
+    }
+
+    writer->overflows++;
+    if (writer->block) {
+        ring_notify(&writer->ring, false);
+        while (cap->running) {
+            if (ring_wait_space(&writer->ring, hdr->caplen, WRITER_WAIT_MS) &&
+                ring_push(&writer->ring, hdr, pkt)) {
+                return;
+            }
+        }
+    }
+    writer->drops++;
+}
+
+// Per-run state shared between the dispatch loop and the per-packet callback.
+typedef struct {
+    traffic_capture_t *cap;
+    const traffic_capture_config_t *config;
+    unsigned long long packets;
+    struct timeval deadline;  // offline: end of a duration-limited replay, the first
+                              // packet's timestamp plus the duration, in the handle's
+                              // precision (tv_usec may hold nanoseconds)
+    struct timespec now;      // CLOCK_MONOTONIC, sampled once per batch
+    bool done;                // callback hit the duration limit
+    bool expired;             // the duration timer fired first
+
+    // Live captures wait in poll() on the pcap descriptor (-1 = blocking reads instead),
+    // the wake-up eventfd and a timerfd armed at the end of a duration-limited capture.
+    int pcap_fd;
+    int timer_fd;
+
+    // Offline replay: the duration limit and pacing are relative to the first packet.
+    bool replay_started;
+    struct timeval first_ts;
+    struct timespec replay_start;  // CLOCK_MONOTONIC when the first packet was read
+    long long ts_unit_ns;          // nanoseconds per tv_usec unit (1000 or 1)
+
+    // Sampling state.
+    int linktype;
+    unsigned long long sample_count;  // packets counted toward the current 1-in-N or budget
+    time_t sample_second;             // budget: the second sample_count belongs to
+} capture_loop_t;
+
+// Nanoseconds between two packet timestamps of the current handle.
+static long long ts_diff_ns(const capture_loop_t *loop, const struct timeval *from,
+                            const struct timeval *to) {
+    return (to->tv_sec - from->tv_sec) * NSEC_PER_SEC +
+           (to->tv_usec - from->tv_usec) * loop->ts_unit_ns;
+}
+
+// Sleep until this packet's offset from the first one, scaled by replay_speed, has passed
+// since the replay started. The sleep polls the wake-up eventfd, so a stop request ends it
+// at once.
+static void pace_packet(capture_loop_t *loop, const struct pcap_pkthdr *hdr) {
+    traffic_capture_t *cap = loop->cap;
+    long long offset_ns = (long long)((double)ts_diff_ns(loop, &loop->first_ts, &hdr->ts) /
+                                      loop->config->replay_speed);
+
+    while (cap->running) {
+        struct timespec now;
+        clock_gettime(CLOCK_MONOTONIC, &now);
+        long long wait_ns = offset_ns - elapsed_ns(&loop->replay_start, &now);
+        if (wait_ns <= 0) {
+            return;
+        }
+        struct timespec gap = {.tv_sec = wait_ns / NSEC_PER_SEC, .tv_nsec = wait_ns % NSEC_PER_SEC};
+        struct pollfd wake = {.fd = cap->wake_fd, .events = POLLIN};
+        if (ppoll(&wake, 1, &gap, NULL) > 0) {
+            clear_wakeups(cap);  // a filter change goes on pacing; a stop ends the loop
+        }
+    }
+}
+
+static void start_replay(capture_loop_t *loop, const struct pcap_pkthdr *hdr) {
+    loop->replay_started = true;
+    loop->first_ts = hdr->ts;
+    loop->deadline = hdr->ts;
+    loop->deadline.tv_sec += loop->config->duration;
+    clock_gettime(CLOCK_MONOTONIC, &loop->replay_start);
+}
+
+// Whether a matched packet goes to the file and the stream under config->sampling.
+static bool sample_packet(capture_loop_t *loop, const struct pcap_pkthdr *hdr, const u_char *pkt) {
+    const traffic_capture_config_t *config = loop->config;
+    unsigned long long rate = (unsigned long long)config->sample_rate;
+    flow_key_t key;
+
+    switch (config->sampling) {
+        case TRAFFIC_SAMPLE_NONE:
+            return true;
+        case TRAFFIC_SAMPLE_BUDGET:
+            if (hdr->ts.tv_sec != loop->sample_second) {
+                loop->sample_second = hdr->ts.tv_sec;
+                loop->sample_count = 0;
+            }
+            return loop->sample_count++ < rate;
+        case TRAFFIC_SAMPLE_FLOW:
+            if (flow_key_from_packet(loop->linktype, pkt, hdr->caplen, &key)) {
+                // FNV-1a mixes its low bits poorly; fold the high half in first.
+                uint64_t hash = flow_hash(&key);
+                return (hash ^ hash >> SAMPLE_HASH_SHIFT) % rate == 0;
+            }
+            break;  // not IP: sampled by count
+        case TRAFFIC_SAMPLE_COUNT:
             break;
+    }
+    return loop->sample_count++ % rate == 0;
+}
+
+static void handle_packet(u_char *user, const struct pcap_pkthdr *hdr, const u_char *pkt) {
+    capture_loop_t *loop = (capture_loop_t *)user;
+    traffic_capture_t *cap = loop->cap;
+    const traffic_capture_config_t *config = loop->config;
+    struct pcap_pkthdr trimmed;
+
+    if (cap->offline) {
+        if (!loop->replay_started) {
+            start_replay(loop, hdr);
         }
+        if (config->replay_speed > 0) {
+            pace_packet(loop, hdr);
+        }
+    }
 
-        if (ret == 1) {
-            pcap_dump((u_char *)pcap_dumper, hdr, pkt);
-            packet_count++;
-            if (config->max_packets > 0 && packet_count >= config->max_packets) {
-                break;
+    // A replay ends at the first packet stamped at or after the deadline. Live captures
+    // are timed on CLOCK_MONOTONIC (timerfd and the per-batch check) instead: packet
+    // timestamps follow the wall clock or the adapter's clock, which may step or drift.
+    if (cap->offline && config->duration > 0 && !timercmp(&hdr->ts, &loop->deadline, <)) {
+        loop->done = true;
+        pcap_breakloop(cap->pcap);
+        return;
+    }
+
+    if (cap->trim_len > 0 && hdr->caplen > cap->trim_len) {
+        trimmed = *hdr;
+        trimmed.caplen = cap->trim_len;
+        hdr = &trimmed;
+    }
+    if (!sample_packet(loop, hdr, pkt)) {
+        cap->sampled_out++;
+    } else {
+        if (cap->stream.buf && !ring_push(&cap->stream, hdr, pkt)) {
+            cap->stream_drops++;
+        }
+        if (cap->writer.started) {
+            writer_queue(cap, hdr, pkt);
+        }
+    }
+    if (cap->flows && flowtable_add(cap->flows, (uint32_t)hdr->ts.tv_sec, (uint32_t)hdr->ts.tv_usec,
+                                    hdr->caplen, hdr->len, pkt) < 0) {
+        cap->flows_failed = true;
+        pcap_breakloop(cap->pcap);
+    }
+    loop->packets++;
+}
+
+// Arm loop->timer_fd to fire at the end of a duration-limited live capture.
+static void arm_deadline(capture_loop_t *loop, const struct timespec *start) {
+    struct itimerspec deadline = {.it_value = *start};
+
+    deadline.it_value.tv_sec += loop->config->duration;
+    loop->timer_fd = timerfd_create(CLOCK_MONOTONIC, TFD_NONBLOCK | TFD_CLOEXEC);
+    if (loop->timer_fd >= 0 &&
+        timerfd_settime(loop->timer_fd, TFD_TIMER_ABSTIME, &deadline, NULL) < 0) {
+        close(loop->timer_fd);
+        loop->timer_fd = -1;  // the per-batch elapsed time check still ends the capture
+    }
+}
+
+static int check_poll_error(capture_loop_t *loop, short revents) {
+    int err = 0;
+    socklen_t len = sizeof(err);
+
+    if (revents & POLLNVAL) {
+        set_error(loop->cap, "invalid capture descriptor");
+        return -1;
+    }
+    if (revents & POLLHUP) {
+        set_error(loop->cap, "hangup on the capture socket");
+        return -1;
+    }
+    if ((revents & POLLERR) && getsockopt(loop->pcap_fd, SOL_SOCKET, SO_ERROR, &err, &len) == 0 &&
+        err != 0) {
+        set_error(loop->cap, "capture socket error: %s", strerror(err));
+        return -1;
+    }
+    return 0;
+}
+
+// Sleep until the handle has packets, traffic_capture_stop() or a filter change writes the
+// wake-up eventfd, the duration timer fires or the next stats publish is due.
+static int wait_for_packets(capture_loop_t *loop, const struct timespec *stats_at) {
+    traffic_capture_t *cap = loop->cap;
+    struct pollfd fds[] = {
+        {.fd = loop->pcap_fd, .events = POLLIN},
+        {.fd = cap->wake_fd, .events = POLLIN},
+        {.fd = loop->timer_fd, .events = POLLIN},  // ignored by poll() when -1
+    };
+    long long due_us = STATS_INTERVAL_US - elapsed_us(stats_at, &loop->now);
+    int timeout_ms = due_us > 0 ? (int)((due_us + USEC_PER_MSEC - 1) / USEC_PER_MSEC) : 0;
+
+    if (poll(fds, sizeof(fds) / sizeof(fds[0]), timeout_ms) <= 0) {
+        return 0;  // stats are due, or a signal
+    }
+    if (fds[1].revents & POLLIN) {
+        clear_wakeups(cap);
+    }
+    if (fds[2].revents & POLLIN) {
+        loop->expired = true;
+    }
+    return check_poll_error(loop, fds[0].revents);
+}
+
+// Pick up what the ring already holds after a stop request or the duration deadline, which
+// may have cut the last batch short. Without immediate mode (TPACKET_V3) the kernel only
+// hands over a ring block once it fills up or the buffer timeout retires it, so packets of
+// the block still open at the stop are not visible yet and are lost with the handle; a
+// capture that must keep everything up to the stop runs in immediate mode or with a short
+// buffer timeout.
+static void drain_capture(capture_loop_t *loop) {
+    traffic_capture_t *cap = loop->cap;
+    const traffic_capture_config_t *config = loop->config;
+    int budget = -1;
+
+    if (config->max_packets > 0) {
+        budget = config->max_packets - (int)loop->packets;
+        if (budget <= 0) {
+            return;
+        }
+    }
+    // A break posted while the loop was in poll() makes the first call return at once.
+    int ret = pcap_dispatch(cap->pcap, budget, handle_packet, (u_char *)loop);
+    if (ret == PCAP_ERROR_BREAK && !loop->done && !cap->flows_failed) {
+        ret = pcap_dispatch(cap->pcap, budget, handle_packet, (u_char *)loop);
+    }
+    if (ret != 0) {
+        if (cap->writer.started) {
+            ring_notify(&cap->writer.ring, false);
+        }
+        if (cap->stream.buf) {
+            ring_notify(&cap->stream, false);
+        }
+    }
+}
+
+// Nanoseconds from the stop request (or the duration deadline) to the end of the capture
+// loop; 0 when the capture ran out by itself.
+static void publish_stop_latency(capture_loop_t *loop, const struct timespec *start) {
+    traffic_capture_t *cap = loop->cap;
+    struct timespec end;
+    struct timespec from;
+
+    clock_gettime(CLOCK_MONOTONIC, &end);
+    pthread_mutex_lock(&cap->lock);
+    bool stopped = cap->stop_requested;
+    from = cap->stop_at;
+    pthread_mutex_unlock(&cap->lock);
+    if (!stopped) {
+        if (cap->offline || loop->config->duration <= 0 || !(loop->done || loop->expired)) {
+            return;
+        }
+        from = *start;
+        from.tv_sec += loop->config->duration;
+    }
+    long long latency_ns = elapsed_ns(&from, &end);
+    __atomic_store_n(&cap->live_stats.stop_latency_ns,
+                     latency_ns > 0 ? (unsigned long long)latency_ns : 0, __ATOMIC_RELAXED);
+}
+
+// Mirror the published stats into the stats page of this run, if it has one. A fanout
+// capture is published by worker 0 with the totals of all workers, as a page has one writer.
+static void publish_page(traffic_capture_t *cap, statspage_state_t state) {
+    traffic_capture_t *owner = cap;
+    statspage_body_t body;
+
+    if (cap->parent) {
+        if (cap != cap->parent->workers[0].cap) {
+            return;
+        }
+        owner = cap->parent;
+    }
+    if (!owner->stats_page) {
+        return;
+    }
+    memset(&body, 0, sizeof(body));
+    body.state = (uint32_t)state;
+    body.workers = (uint32_t)owner->worker_count;
+    traffic_get_stats(owner, &body.stats);
+    if (owner->stream.buf) {
+        body.stream_queued_bytes = ring_used(&owner->stream);
+        body.stream_buffer_size = owner->stream.size;
+    }
+    if (owner->output_file && owner->worker_count == 0 && owner->writer.rotating) {
+        rotated_name(body.current_file, sizeof(body.current_file), owner->rotate_base,
+                     (long)body.stats.files_rotated);
+    } else if (owner->output_file) {
+        snprintf(body.current_file, sizeof(body.current_file), "%s", owner->output_file);  // NOLINT
+    }
+    statspage_update(owner->stats_page, &body);
+}
+
+// Drain the handle in pcap_dispatch() batches. Clock reads, limit checks, consumer
+// wake-ups and stats publishing happen once per batch; the packet budget passed to
+// pcap_dispatch() keeps max_packets exact. Live handles are non-blocking: when a batch
+// comes back empty the loop sleeps in poll(), which a stop request or the duration timer
+// ends within microseconds instead of after the next packet or buffer timeout.
+static void run_capture_loop(capture_loop_t *loop) {
+    traffic_capture_t *cap = loop->cap;
+    const traffic_capture_config_t *config = loop->config;
+    long long duration_us = (long long)config->duration * USEC_PER_SEC;
+    struct timespec start;
+    struct timespec stats_at;
+
+    clock_gettime(CLOCK_MONOTONIC, &start);
+    loop->now = start;
+    stats_at = start;
+    loop->pcap_fd = cap->offline ? -1 : pcap_get_selectable_fd(cap->pcap);
+    loop->timer_fd = -1;
+    if (loop->pcap_fd >= 0 && duration_us > 0) {
+        arm_deadline(loop, &start);
+    }
+    clear_wakeups(cap);  // left over from an earlier run; running is checked below
+
+    while (cap->running) {
+        if (__atomic_load_n(&cap->filter_seq, __ATOMIC_RELAXED) != cap->filter_done) {
+            apply_filter_request(cap);
+        }
+        // A savefile would otherwise be read to the end in one call.
+        int budget = cap->offline ? REPLAY_BATCH : -1;
+        if (config->max_packets > 0 &&
+            (budget < 0 || config->max_packets - (int)loop->packets < budget)) {
+            budget = config->max_packets - (int)loop->packets;
+        }
+
+        int ret = pcap_dispatch(cap->pcap, budget, handle_packet, (u_char *)loop);
+        clock_gettime(CLOCK_MONOTONIC, &loop->now);
+        // A break (stop or filter change) may end a batch that already queued packets.
+        if (ret > 0 || ret == PCAP_ERROR_BREAK) {
+            if (cap->writer.started) {
+                ring_notify(&cap->writer.ring, false);
             }
-        } else if (ret < 0) {
-            set_error("pcap_next_ex error: %s", pcap_geterr(pcap_handle));
+            if (cap->stream.buf) {
+                ring_notify(&cap->stream, false);
+            }
+        }
+
+        if (cap->flows_failed) {
+            set_error(cap, "writing the flow file failed");
+            break;
+        }
+        if (ret == PCAP_ERROR) {
+            set_error(cap, "pcap_dispatch error: %s", pcap_geterr(cap->pcap));
+            break;
+        }
+        if (loop->done || (ret == 0 && cap->offline)) {
+            break;  // duration limit, or end of the input file
+        }
+        if (config->max_packets > 0 && loop->packets >= (unsigned long long)config->max_packets) {
+            break;
+        }
+        if (loop->expired ||
+            (duration_us > 0 && !cap->offline && elapsed_us(&start, &loop->now) >= duration_us)) {
+            loop->expired = true;
+            break;
+        }
+        if (elapsed_us(&stats_at, &loop->now) >= STATS_INTERVAL_US) {
+            publish_stats(cap, loop->packets);
+            publish_page(cap, STATSPAGE_RUNNING);
+            stats_at = loop->now;
+        }
+        if (ret == 0 && loop->pcap_fd >= 0 && wait_for_packets(loop, &stats_at) < 0) {
             break;
         }
     }
 
-    pcap_dump_close(pcap_dumper);
-    pcap_close(pcap_handle);
-    capture_running = 0;
+    if (loop->pcap_fd >= 0 && !loop->done && cap->errbuf[0] == '\0') {
+        drain_capture(loop);
+    }
+    publish_stop_latency(loop, &start);
+    if (loop->timer_fd >= 0) {
+        close(loop->timer_fd);
+    }
+}
+
+// Publish (or clear) the live handle so traffic_capture_stop() can break the loop.
+static void set_live_handle(traffic_capture_t *cap, pcap_t *handle) {
+    pthread_mutex_lock(&cap->lock);
+    cap->pcap = handle;
+    if (handle && !cap->running) {
+        pcap_breakloop(handle);  // stopped while the handle was being opened
+    }
+    pthread_mutex_unlock(&cap->lock);
+}
+
+static void close_live_handle(traffic_capture_t *cap) {
+    pcap_t *handle = cap->pcap;
+    set_live_handle(cap, NULL);
+    pcap_close(handle);
+}
+
+static void finish_capture(traffic_capture_t *cap) {
+    if (cap->stream.buf) {
+        ring_notify(&cap->stream, true);
+    }
+    pthread_mutex_lock(&cap->lock);
+    cap->running = 0;
+    cap->active = false;
+    if (cap->filter_done != cap->filter_seq) {
+        free(cap->filter_request);
+        cap->filter_request = NULL;
+        cap->filter_done = cap->filter_seq;
+        cap->filter_result = -2;
+        snprintf(cap->filter_error, sizeof(cap->filter_error),  // NOLINT
+                 "the capture ended before the filter was installed");
+        pthread_cond_broadcast(&cap->filter_cond);
+    }
+    pthread_mutex_unlock(&cap->lock);
+}
+
+// Open the first output file and start the rotation janitor and the writer thread.
+static int open_output(traffic_capture_t *cap, const traffic_capture_config_t *config) {
+    bool rotating = config->rotate_bytes > 0 || config->rotate_seconds > 0;
+    char err[ERRBUF_SIZE];
+
+    // The datalink type doubles as the file's link type for everything we capture on.
+    cap->sink_config = (sink_config_t){
+        .compression = config->compression,
+        .level = config->compression_level,
+        .format = config->format,
+        .linktype = pcap_datalink(cap->pcap),
+        .snaplen = cap->trim_len > 0 ? (int)cap->trim_len : pcap_snapshot(cap->pcap),
+        .nanosecond = pcap_get_tstamp_precision(cap->pcap) == PCAP_TSTAMP_PRECISION_NANO,
+        .interface = config->interface,
+        .filter = config->bpf_filter,
+        .comment = cap->sample_comment,
+        .index_bucket_seconds = config->index_bucket_seconds,
+    };
+    cap->sample_comment[0] = '\0';
+    if (config->sampling != TRAFFIC_SAMPLE_NONE) {
+        snprintf(cap->sample_comment, sizeof(cap->sample_comment),  // NOLINT
+                 "sampling=%s rate=%d", SAMPLING_NAMES[config->sampling], config->sample_rate);
+    }
+    if (rotating) {
+        cap->rotate_base = config->output_file;
+        cap->rotate_max_files = config->rotate_max_files;
+        cap->sink = open_rotated(cap, 0, err, sizeof(err));
+    } else {
+        cap->sink = open_output_file(cap, config->output_file, err, sizeof(err));
+    }
+    if (!cap->sink) {
+        set_error(cap, "cannot open output file: %s", err);
+        return -1;
+    }
+    if (rotating && rotation_init(cap, 1) < 0) {
+        sink_close(cap->sink);
+        cap->sink = NULL;
+        return -1;
+    }
+    if (writer_start(cap, config) < 0) {
+        if (rotating) {
+            rotation_shutdown(cap);
+        }
+        sink_close(cap->sink);
+        cap->sink = NULL;
+        return -1;
+    }
+    return 0;
+}
+
+// Flow aggregation runs on the capture thread: one table update per packet, idle sweeps
+// and periodic exports between batches.
+static int open_flows(traffic_capture_t *cap, const traffic_capture_config_t *config) {
+    char err[ERRBUF_SIZE];
+    flowtable_config_t flow_config = {
+        .path = config->flow_file,
+        .max_flows = config->flow_max > 0 ? (size_t)config->flow_max : FLOW_TABLE_DEFAULT,
+        .idle_seconds = config->flow_idle_seconds > 0 ? (uint32_t)config->flow_idle_seconds : 0,
+        .export_seconds =
+            config->flow_export_seconds > 0 ? (uint32_t)config->flow_export_seconds : 0,
+        .linktype = pcap_datalink(cap->pcap),
+        .nanosecond = pcap_get_tstamp_precision(cap->pcap) == PCAP_TSTAMP_PRECISION_NANO,
+    };
+
+    cap->flows = flowtable_open(&flow_config, err, sizeof(err));
+    if (!cap->flows) {
+        set_error(cap, "cannot open flow file: %s", err);
+        return -1;
+    }
+    return 0;
+}
+
+static void close_flows(traffic_capture_t *cap) {
+    if (flowtable_close(cap->flows) < 0 && !cap->flows_failed) {
+        set_error(cap, "writing the flow file failed");
+        cap->flows_failed = true;
+    }
+    cap->flows = NULL;
+}
+
+static void close_output(traffic_capture_t *cap, const traffic_capture_config_t *config) {
+    writer_stop(cap);
+    if (sink_close(cap->sink) < 0 && !cap->writer.failed) {
+        set_error(cap, "closing the output file failed");
+        cap->writer.failed = true;
+    }
+    cap->sink = NULL;
+    if (config->rotate_bytes > 0 || config->rotate_seconds > 0) {
+        rotation_shutdown(cap);
+    }
+}
+
+static void *fanout_worker_main(void *arg) {
+    fanout_worker_t *worker = arg;
+    traffic_capture_t *parent = worker->parent;
+
+    if (worker->cpu >= 0) {
+        cpu_set_t set;
+        CPU_ZERO(&set);
+        CPU_SET(worker->cpu, &set);
+        pthread_setaffinity_np(pthread_self(), sizeof(set), &set);  // best effort
+    }
+    worker->result = traffic_capture_start(worker->cap, &worker->config);
+    if (worker->result < 0) {
+        const char *err = traffic_get_last_error(worker->cap);
+        pthread_mutex_lock(&parent->lock);
+        if (parent->errbuf[0] == '\0') {
+            snprintf(parent->errbuf, sizeof(parent->errbuf), "worker %d: %s",  // NOLINT
+                     worker->index, err ? err : "unknown error");
+        }
+        pthread_mutex_unlock(&parent->lock);
+        traffic_capture_stop(parent);  // one capture: a failed worker ends them all
+    }
+    return NULL;
+}
+
+// Set up one handle per worker, each writing its own "<name>_w<N>" shards.
+static int create_workers(traffic_capture_t *cap, const traffic_capture_config_t *config,
+                          int fanout_arg) {
+    int count = config->fanout_workers;
+    int cpus[CPU_SETSIZE];
+    int cpu_count = 0;
+    cpu_set_t allowed;
+    fanout_worker_t *workers = calloc((size_t)count, sizeof(*workers));
+
+    if (!workers) {
+        set_error(cap, "cannot allocate %d fanout workers", count);
+        return -1;
+    }
+    if (config->fanout_pin && sched_getaffinity(0, sizeof(allowed), &allowed) == 0) {
+        for (int cpu = 0; cpu < CPU_SETSIZE; cpu++) {
+            if (CPU_ISSET(cpu, &allowed)) {
+                cpus[cpu_count++] = cpu;
+            }
+        }
+    }
+    for (int i = 0; i < count; i++) {
+        fanout_worker_t *worker = &workers[i];
+        char tag[NAME_TAG_SIZE];
+
+        worker->cap = traffic_capture_create();
+        if (!worker->cap) {
+            for (int j = 0; j < i; j++) {
+                traffic_capture_destroy(workers[j].cap);
+            }
+            free(workers);
+            set_error(cap, "cannot allocate %d fanout workers", count);
+            return -1;
+        }
+        worker->cap->parent = cap;
+        worker->cap->fanout_arg = fanout_arg;
+        worker->parent = cap;
+        worker->index = i;
+        worker->cpu = cpu_count > 0 ? cpus[i % cpu_count] : -1;
+        worker->config = *config;
+        worker->config.fanout_workers = 0;
+        worker->config.stats_file = NULL;       // the parent's page shows the totals
+        snprintf(tag, sizeof(tag), "_w%d", i);  // NOLINT
+        if (config->output_file && config->output_file[0] != '\0') {
+            tagged_name(worker->output_file, sizeof(worker->output_file), config->output_file, tag);
+            worker->config.output_file = worker->output_file;
+        }
+        if (config->flow_file && config->flow_file[0] != '\0') {
+            tagged_name(worker->flow_file, sizeof(worker->flow_file), config->flow_file, tag);
+            worker->config.flow_file = worker->flow_file;
+        }
+    }
+
+    pthread_mutex_lock(&cap->lock);
+    cap->workers = workers;
+    cap->worker_count = count;
+    pthread_mutex_unlock(&cap->lock);
     return 0;
 }
+
+// Fanout capture: fanout_workers threads, each with its own handle in one PACKET_FANOUT
+// group on the interface. Blocks until every worker has ended.
+static int run_fanout(traffic_capture_t *cap, const traffic_capture_config_t *config) {
+    int ret = 0;
+
+    if (config->input_file && config->input_file[0] != '\0') {
+        set_error(cap, "fanout needs a live interface");
+    } else if (cap->stream.buf) {
+        set_error(cap, "streaming is not supported with fanout");
+    } else if (config->max_packets > 0) {
+        set_error(cap, "max_packets is not supported with fanout");
+    } else if (config->fanout_workers > FANOUT_MAX_WORKERS) {
+        set_error(cap, "at most %d fanout workers", FANOUT_MAX_WORKERS);
+    }
+#ifndef PACKET_FANOUT
+    else {
+        set_error(cap, "fanout capture needs Linux PACKET_FANOUT");
+    }
+#else
+    else {
+        int type = config->fanout_mode == TRAFFIC_FANOUT_CPU
+                       ? PACKET_FANOUT_CPU
+                       : PACKET_FANOUT_HASH | PACKET_FANOUT_FLAG_DEFRAG;
+        // Group ids are per interface and system-wide; this keeps concurrent fanout
+        // captures of this and other processes apart.
+        unsigned int group =
+            ((unsigned int)getpid() + __atomic_fetch_add(&fanout_groups, 1, __ATOMIC_RELAXED)) &
+            FANOUT_ID_MASK;
+        ret = create_workers(cap, config, (int)group | type << FANOUT_TYPE_SHIFT);
+    }
+#endif
+    if (cap->errbuf[0] != '\0' || ret < 0) {
+        finish_capture(cap);
+        return -1;
+    }
+
+    for (int i = 0; i < cap->worker_count; i++) {
+        fanout_worker_t *worker = &cap->workers[i];
+        if (pthread_create(&worker->thread, NULL, fanout_worker_main, worker) != 0) {
+            set_error(cap, "failed to start fanout worker %d", i);
+            traffic_capture_stop(cap);
+            break;
+        }
+        worker->started = true;
+    }
+    for (int i = 0; i < cap->worker_count; i++) {
+        fanout_worker_t *worker = &cap->workers[i];
+        if (worker->started) {
+            pthread_join(worker->thread, NULL);
+        }
+        if (!worker->started || worker->result < 0) {
+            ret = -1;
+        }
+    }
+    finish_capture(cap);
+    return ret;
+}
+
+// Everything of traffic_capture_start() after the handle was claimed for this run. Every
+// path out of here ends with finish_capture().
+static int run_capture(traffic_capture_t *cap, const traffic_capture_config_t *config) {
+    capture_loop_t loop = {.cap = cap, .config = config};
+
+    bool to_file = config->output_file && config->output_file[0] != '\0';
+    bool to_flows = config->flow_file && config->flow_file[0] != '\0';
+    if (!to_file && !to_flows && !cap->stream.buf) {
+        set_error(cap, "no output file, flow file or stream buffer");
+        finish_capture(cap);
+        return -1;
+    }
+    if (!to_file && (config->rotate_bytes > 0 || config->rotate_seconds > 0)) {
+        set_error(cap, "rotation needs an output file");
+        finish_capture(cap);
+        return -1;
+    }
+    if (config->fanout_workers > 1) {
+        return run_fanout(cap, config);
+    }
+    if (cap->stream.buf) {
+        ring_reset(&cap->stream);
+    }
+    cap->to_file = to_file;
+    cap->stream_drops = 0;
+    cap->sampled_out = 0;
+    cap->flows_failed = false;
+    cap->offline = config->input_file && config->input_file[0] != '\0';
+    if (cap->offline && config->replay_speed < 0) {
+        set_error(cap, "replay_speed must not be negative");
+        finish_capture(cap);
+        return -1;
+    }
+
+    if (config->sampling < TRAFFIC_SAMPLE_NONE || config->sampling > TRAFFIC_SAMPLE_FLOW ||
+        (config->sampling != TRAFFIC_SAMPLE_NONE && config->sample_rate <= 0)) {
+        set_error(cap, "sampling needs a known mode and a positive sample_rate");
+        finish_capture(cap);
+        return -1;
+    }
+
+    pcap_t *handle = cap->offline ? open_offline_handle(cap, config)
+                                  : open_live_handle(cap, config, config->snaplen);
+    cap->trim_len = 0;
+    if (handle && config->headers_only) {
+        int headers = traffic_headers_snaplen(pcap_datalink(handle));
+        if (headers > 0 && headers < pcap_snapshot(handle)) {
+            if (cap->offline) {
+                cap->trim_len = (uint32_t)headers;  // the file's snaplen is fixed: cut here
+            } else {
+                // The link type is only known once activated: reopen with the short
+                // snaplen so the kernel copies no more than the headers.
+                pcap_close(handle);
+                handle = open_live_handle(cap, config, headers);
+            }
+        }
+    }
+    if (!handle) {
+        finish_capture(cap);
+        return -1;
+    }
+    set_live_handle(cap, handle);
+    if (cap->fanout_arg != 0 && join_fanout(cap) < 0) {
+        close_live_handle(cap);
+        finish_capture(cap);
+        return -1;
+    }
+
+    reset_stats(cap);
+    cap->filter_swaps = 0;
+    if (config->bpf_filter[0] != '\0') {
+        const struct bpf_program *filter_prog =
+            bpfcache_get(cap->filters, cap->pcap, config->bpf_filter);
+        if (!filter_prog || pcap_setfilter(cap->pcap, (struct bpf_program *)filter_prog) < 0) {
+            set_error(cap, "BPF filter error: %s", pcap_geterr(cap->pcap));
+            close_live_handle(cap);
+            finish_capture(cap);
+            return -1;
+        }
+    }
+
+    if (to_flows && open_flows(cap, config) < 0) {
+        close_live_handle(cap);
+        finish_capture(cap);
+        return -1;
+    }
+    if (to_file && open_output(cap, config) < 0) {
+        if (to_flows) {
+            close_flows(cap);
+        }
+        close_live_handle(cap);
+        finish_capture(cap);
+        return -1;
+    }
+
+    bool nano = pcap_get_tstamp_precision(cap->pcap) == PCAP_TSTAMP_PRECISION_NANO;
+    loop.ts_unit_ns = nano ? 1 : NSEC_PER_USEC;
+    loop.linktype = pcap_datalink(cap->pcap);
+    run_capture_loop(&loop);
+
+    if (to_file) {
+        writer_stop(cap);  // flush the queue first so the final stats count every packet
+    }
+    publish_stats(cap, loop.packets);
+    if (to_file) {
+        close_output(cap, config);
+    }
+    if (to_flows) {
+        close_flows(cap);
+    }
+    close_live_handle(cap);
+    finish_capture(cap);
+    return cap->writer.failed || cap->flows_failed ? -1 : 0;
+}
+
+int traffic_capture_start(traffic_capture_t *cap, const traffic_capture_config_t *config) {
+    if (!cap) {
+        return -1;
+    }
+    pthread_mutex_lock(&cap->lock);
+    if (cap->active) {
+        pthread_mutex_unlock(&cap->lock);
+        set_error(cap, "capture already running on this handle");
+        return -1;
+    }
+    cap->active = true;
+    cap->errbuf[0] = '\0';
+    bool stopped = cap->stop_pending;
+    cap->running = !stopped;
+    cap->stop_requested = stopped;
+    cap->stop_pending = false;
+    // A fanout worker must not start running after a stop already reached the parent.
+    if (cap->parent && !__atomic_load_n(&cap->parent->running, __ATOMIC_RELAXED)) {
+        cap->running = 0;
+    }
+    pthread_mutex_unlock(&cap->lock);
+    free_workers(cap);
+
+    if (stopped) {
+        // Stopped before it started: open nothing and count the wait as stop latency.
+        struct timespec now;
+        reset_stats(cap);
+        clock_gettime(CLOCK_MONOTONIC, &now);
+        long long latency_ns = elapsed_ns(&cap->stop_at, &now);
+        __atomic_store_n(&cap->live_stats.stop_latency_ns,
+                         latency_ns > 0 ? (unsigned long long)latency_ns : 1, __ATOMIC_RELAXED);
+        finish_capture(cap);
+        return 0;
+    }
+
+    bool to_file = config->output_file && config->output_file[0] != '\0';
+    cap->output_file = to_file ? config->output_file : NULL;
+    if (config->stats_file && config->stats_file[0] != '\0') {
+        char err[ERRBUF_SIZE];
+        cap->stats_page = statspage_open(config->stats_file, err, sizeof(err));
+        if (!cap->stats_page) {
+            set_error(cap, "cannot open stats file: %s", err);
+            finish_capture(cap);
+            return -1;
+        }
+        publish_page(cap, STATSPAGE_STARTING);
+    }
+
+    int ret = run_capture(cap, config);
+
+    if (cap->stats_page) {
+        publish_page(cap, ret < 0 ? STATSPAGE_FAILED : STATSPAGE_FINISHED);
+        statspage_close(cap->stats_page);
+        cap->stats_page = NULL;
+    }
+    return ret;
+}
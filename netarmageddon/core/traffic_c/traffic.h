@@ -3,19 +3,182 @@
 
 #include <pcap/pcap.h>
 #include <stdbool.h>
+#include <stddef.h>
+#include <stdint.h>
+
+typedef enum {
+    TRAFFIC_COMPRESS_AUTO = 0,  // by output file extension: .gz, .zst, otherwise none
+    TRAFFIC_COMPRESS_NONE,
+    TRAFFIC_COMPRESS_GZIP,
+    TRAFFIC_COMPRESS_ZSTD,  // only when libtraffic was built with HAVE_ZSTD
+} traffic_compression_t;
+
+typedef enum {
+    TRAFFIC_FORMAT_AUTO = 0,  // pcapng for *.pcapng (before any .gz/.zst), otherwise pcap
+    TRAFFIC_FORMAT_PCAP,
+    TRAFFIC_FORMAT_PCAPNG,
+} traffic_format_t;
+
+// Which matched packets go to the output file and the stream. The flow table and the
+// max_packets limit still see every packet that passed the filter.
+typedef enum {
+    TRAFFIC_SAMPLE_NONE = 0,
+    TRAFFIC_SAMPLE_COUNT,   // every sample_rate-th packet, starting with the first
+    TRAFFIC_SAMPLE_BUDGET,  // the first sample_rate packets of every second of capture time
+    TRAFFIC_SAMPLE_FLOW,    // whole flows, 1 in sample_rate by flow hash (non-IP packets by
+                            // count), the same flows in every run
+} traffic_sampling_t;
+
+// How PACKET_FANOUT spreads the packets of the interface over the workers.
+typedef enum {
+    TRAFFIC_FANOUT_HASH = 0,  // by flow hash (fragments reassembled first): a flow stays on
+                              // one worker
+    TRAFFIC_FANOUT_CPU,       // by the CPU that received the packet (pairs with RSS queues)
+} traffic_fanout_mode_t;
 
 typedef struct {
     const char *interface;
     const char *bpf_filter;
-    const char *output_file;
+    const char *output_file;  // NULL or "" when only streaming
     int duration;
     int max_packets;
     int snaplen;
     bool promisc;
+    long long rotate_bytes;        // start a new file once this many bytes are written (0 = off)
+    int rotate_seconds;            // start a new file after this many seconds (0 = off)
+    int rotate_max_files;          // keep at most this many rotated files, oldest first (0 = all)
+    int buffer_size;               // kernel capture buffer in bytes (0 = libpcap default)
+    bool immediate_mode;           // deliver packets as soon as they arrive instead of in blocks
+    int timeout_ms;                // packet buffer timeout in milliseconds (0 = 1000)
+    long long writer_buffer_size;  // bytes queued between capture and disk writer (0 = 8 MiB)
+    bool writer_block;             // wait for the writer when its queue is full instead of
+                                   // dropping the packet
+    traffic_compression_t compression;  // compress the output on the writer thread
+    int compression_level;              // gzip 1-9 / zstd 1-22 (0 = library default)
+    traffic_format_t format;            // pcap or pcapng output
+    bool nanosecond;                    // nanosecond timestamps (pcap_set_tstamp_precision)
+    const char *tstamp_type;   // pcap timestamp source by name, e.g. "adapter" (NULL/"" = default)
+    const char *input_file;    // replay this pcap/pcapng file instead of a live interface
+    double replay_speed;       // input_file pacing: 0 = as fast as possible, 1 = original timing
+    int index_bucket_seconds;  // write a "<file>.idx" time/flow index with buckets of this many
+                               // seconds next to each output file (0 = no index)
+    const char *flow_file;     // aggregate packets into per-flow counters exported to this CSV
+                               // file (NULL or "" = off), see flowtable.h
+    int flow_max;              // flow table size limit (0 = 65536)
+    int flow_idle_seconds;     // evict and export flows idle this long (0 = keep to the end)
+    int flow_export_seconds;   // export updated flows this often (0 = only at the end)
+    traffic_sampling_t sampling;  // pcapng output records it as "sampling=<mode> rate=<N>"
+                                  // in the interface's opt_comment
+    int sample_rate;              // count/flow: keep 1 in N; budget: packets per second
+    bool headers_only;            // snaplen from the link type, see traffic_headers_snaplen(); live
+                                  // captures truncate in the kernel, replays when writing
+    int fanout_workers;  // Linux: capture the interface with this many threads, each with its
+                         // own socket in one PACKET_FANOUT group and its own
+                         // "<name>_w<N>" output and flow file shards (0/1 = one thread).
+                         // Not with input_file, streaming or max_packets.
+    traffic_fanout_mode_t fanout_mode;
+    bool fanout_pin;         // pin worker N to the N-th CPU this process may run on
+    const char *stats_file;  // publish the stats to this memory-mapped file whenever they
+                             // change (NULL or "" = off), see statspage.h
 } traffic_capture_config_t;
 
-int traffic_capture_start(const traffic_capture_config_t *config);
-void traffic_capture_stop(void);
-const char *traffic_get_last_error(void);
+// Counters of the running (or last finished) capture. ps_* mirror pcap_stats(), widened
+// to 64 bits so they survive the 32-bit wrap of the kernel counters.
+typedef struct {
+    unsigned long long ps_recv;
+    unsigned long long ps_drop;
+    unsigned long long ps_ifdrop;
+    unsigned long long packets_written;
+    unsigned long long bytes_written;
+    unsigned long long stream_drops;         // packets not streamed because the ring was full
+    unsigned long long writer_queued_bytes;  // bytes waiting for the disk writer
+    unsigned long long writer_peak_bytes;    // most bytes ever waiting for the disk writer
+    unsigned long long writer_overflows;     // packets that found the writer queue full
+    unsigned long long writer_drops;         // packets not written because of that
+    unsigned long long flows_active;         // flows in the flow table
+    unsigned long long flows_evicted;        // flows exported and removed after going idle
+    unsigned long long flow_overflows;       // packets of new flows that found the table full
+    unsigned long long filter_swaps;         // filters installed by traffic_capture_set_filter()
+    unsigned long long filter_compiles;      // BPF programs compiled on this handle so far
+                                             // (filter cache misses, counted across runs)
+    unsigned long long sampled_out;          // matched packets left out by sampling
+    unsigned long long stop_latency_ns;      // stop request (or duration deadline) to the end
+                                             // of the capture loop; 0 = ran out by itself
+    unsigned long long files_rotated;        // output files finished by rotation
+    unsigned long long writer_buffer_size;   // capacity of the disk writer queue in bytes
+} traffic_capture_stats_t;
+
+// Header of one record in the stream ring; the same layout as a pcap file record header,
+// followed by caplen bytes of packet data. ts_usec holds nanoseconds when the capture runs
+// with `nanosecond` set.
+typedef struct {
+    uint32_t ts_sec;
+    uint32_t ts_usec;
+    uint32_t caplen;
+    uint32_t len;
+} traffic_stream_record_t;
+
+// Opaque per-capture context. Every call below takes the handle it acts on, so
+// independent captures can run in separate threads of one process.
+typedef struct traffic_capture traffic_capture_t;
+
+traffic_capture_t *traffic_capture_create(void);
+void traffic_capture_destroy(traffic_capture_t *cap);
+
+// Blocks until the capture ends; stop it from another thread with traffic_capture_stop().
+// A stop that arrives before the capture thread reaches traffic_capture_start() is kept,
+// and that start then returns 0 at once; traffic_capture_rearm() drops such a pending stop
+// (call it before handing the handle to a new run).
+int traffic_capture_start(traffic_capture_t *cap, const traffic_capture_config_t *config);
+void traffic_capture_stop(traffic_capture_t *cap);
+void traffic_capture_rearm(traffic_capture_t *cap);
+// Replace the BPF filter of the running capture without reopening the handle. Callable
+// from any thread: the capture thread compiles `expr` (or takes it from its cache of
+// compiled programs, see bpfcache.h) and installs it between two batches. Waits up to
+// timeout_ms for that and returns 0 once installed, 1 if the request is still pending (it
+// is installed later unless superseded), -1 with a message in err when the expression was
+// rejected (the old filter stays) and -2 when no capture is running or it ended first.
+int traffic_capture_set_filter(traffic_capture_t *cap, const char *expr, int timeout_ms, char *err,
+                               size_t err_size);
+const char *traffic_get_last_error(const traffic_capture_t *cap);
+// With fanout_workers the handle stands for all workers: stop and filter changes reach
+// each of them and the stats are their totals as formed by traffic_sum_worker_stats().
+// traffic_get_worker_stats() reads one worker of the current or last fanout run (-1 for
+// an index out of range).
+int traffic_get_stats(const traffic_capture_t *cap, traffic_capture_stats_t *stats);
+int traffic_get_worker_stats(const traffic_capture_t *cap, int index,
+                             traffic_capture_stats_t *stats);
+// Fanout totals of `count` per-worker stats: counters are summed; writer_peak_bytes and
+// stop_latency_ns are the largest of any worker, and filter_swaps counts each
+// traffic_capture_set_filter() request once although every worker installs it.
+void traffic_sum_worker_stats(const traffic_capture_stats_t *parts, int count,
+                              traffic_capture_stats_t *total);
+
+// Streaming: allocate a shared ring of `size` bytes that every captured packet is copied
+// into (in addition to, or instead of, the output file). Call before each
+// traffic_capture_start(); the ring lives until the next call or traffic_capture_destroy()
+// and its base address is returned.
+unsigned char *traffic_stream_open(traffic_capture_t *cap, size_t size);
+// Wait up to timeout_ms for records. Returns 1 with [offset, offset + len) covering whole
+// records, 0 on timeout and -1 once the capture has ended and the ring is drained.
+int traffic_stream_acquire(traffic_capture_t *cap, size_t *offset, size_t *len, int timeout_ms);
+// Give `len` bytes returned by traffic_stream_acquire() back to the producer.
+void traffic_stream_release(traffic_capture_t *cap, size_t len);
+
+// Flow hash of one captured packet as recorded in the index sidecar (see sidecar.h), or 0
+// when the packet carries no IPv4/IPv6 flow.
+uint64_t traffic_flow_hash(int linktype, const uint8_t *pkt, uint32_t caplen);
+
+// Snapshot length that keeps the link, IP and transport headers of every IPv4/IPv6
+// packet of this link type (142 bytes on Ethernet), or 0 when the link type is unknown.
+int traffic_headers_snaplen(int linktype);
+
+// Walk the records of a native byte order capture image (e.g. a memory-mapped file) from
+// byte `start`: pcap record headers, or pcapng blocks of which only Enhanced Packet Blocks
+// are reported. Stores the offset of each record's header in `offsets` (up to
+// max_offsets; pass NULL to only count) and returns the number of complete records. A
+// record cut short by the end of the image or a malformed block length ends the walk.
+size_t traffic_scan_records(const uint8_t *data, size_t len, size_t start, bool pcapng,
+                            uint64_t *offsets, size_t max_offsets);
 
 #endif  // TRAFFIC_H
@@ -57,6 +57,51 @@ def get_traffic_banner() -> str:
     )
 
 
+def get_analyze_banner() -> str:
+    return (
+        f"\n{DOUBLE_DELIM}\n"
+        f"{BRIGHT_CYAN}{BOLD}"
+        f"    █████╗ ███╗   ██╗ █████╗ ██╗     ██╗   ██╗███████╗███████╗\n"
+        f"   ██╔══██╗████╗  ██║██╔══██╗██║     ╚██╗ ██╔╝╚══███╔╝██╔════╝\n"
+        f"   ███████║██╔██╗ ██║███████║██║      ╚████╔╝   ███╔╝ █████╗\n"
+        f"   ██╔══██║██║╚██╗██║██╔══██║██║       ╚██╔╝   ███╔╝  ██╔══╝\n"
+        f"   ██║  ██║██║ ╚████║██║  ██║███████╗   ██║   ███████╗███████╗\n"
+        f"   ╚═╝  ╚═╝╚═╝  ╚═══╝╚═╝  ╚═╝╚══════╝   ╚═╝   ╚══════╝╚══════╝{RESET}\n"
+        f"     {DIM}{BRIGHT_WHITE}▤ Crunching captured packets into numbers{RESET}\n"
+        f"{DOUBLE_DELIM}\n"
+    )
+
+
+def get_merge_banner() -> str:
+    return (
+        f"\n{DOUBLE_DELIM}\n"
+        f"{BRIGHT_MAGENTA}{BOLD}"
+        f"     ███╗   ███╗███████╗██████╗  ██████╗ ███████╗\n"
+        f"     ████╗ ████║██╔════╝██╔══██╗██╔════╝ ██╔════╝\n"
+        f"     ██╔████╔██║█████╗  ██████╔╝██║  ███╗█████╗  \n"
+        f"     ██║╚██╔╝██║██╔══╝  ██╔══██╗██║   ██║██╔══╝  \n"
+        f"     ██║ ╚═╝ ██║███████╗██║  ██║╚██████╔╝███████╗\n"
+        f"     ╚═╝     ╚═╝╚══════╝╚═╝  ╚═╝ ╚═════╝ ╚══════╝{RESET}\n"
+        f"     {DIM}{BRIGHT_WHITE}⧉ Stitching scattered captures back into one timeline{RESET}\n"
+        f"{DOUBLE_DELIM}\n"
+    )
+
+
+def get_bench_banner() -> str:
+    return (
+        f"\n{DOUBLE_DELIM}\n"
+        f"{BRIGHT_YELLOW}{BOLD}"
+        f"     ██████╗ ███████╗███╗   ██╗ ██████╗██╗  ██╗\n"
+        f"     ██╔══██╗██╔════╝████╗  ██║██╔════╝██║  ██║\n"
+        f"     ██████╔╝█████╗  ██╔██╗ ██║██║     ███████║\n"
+        f"     ██╔══██╗██╔══╝  ██║╚██╗██║██║     ██╔══██║\n"
+        f"     ██████╔╝███████╗██║ ╚████║╚██████╗██║  ██║\n"
+        f"     ╚═════╝ ╚══════╝╚═╝  ╚═══╝ ╚═════╝╚═╝  ╚═╝{RESET}\n"
+        f"     {DIM}{BRIGHT_WHITE}⏱ Timing every packet the capture path can swallow{RESET}\n"
+        f"{DOUBLE_DELIM}\n"
+    )
+
+
 def get_deauth_banner() -> str:
     return (
         f"\n{DOUBLE_DELIM}\n"
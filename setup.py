@@ -5,5 +5,5 @@ setup(
     version="2.0.0",
     packages=find_packages(),
     python_requires=">=3.10",
-    install_requires=["scapy>=2.5.0", "PyYAML>=6.0.0"],
+    install_requires=["scapy>=2.5.0", "PyYAML>=6.0.0", "numpy>=1.22.0"],
 )
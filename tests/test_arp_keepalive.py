@@ -84,9 +84,9 @@ def test_generate_arp_packet(arp_instance):
     assert ether.src == arp.hwsrc
 
 
-@patch("netarmageddon.core.arp_keepalive.sendp", side_effect=PermissionError("perm"))
+@patch("netarmageddon.core.l2_sender.conf.L2socket", side_effect=PermissionError("perm"))
 @patch("netarmageddon.core.arp_keepalive.time.sleep", lambda x: None)
-def test_send_arp_announcements_permission_error(mock_send, arp_instance):
+def test_send_arp_announcements_permission_error(mock_socket, arp_instance):
     # Run announcements to trigger PermissionError
     arp_instance.running = True
     arp_instance.cycles = 1
@@ -97,9 +97,9 @@ def test_send_arp_announcements_permission_error(mock_send, arp_instance):
 
 
 def test_thread_start_stop(mock_interface):
-    # Patch sendp and sleep to avoid real network ops
+    # Patch the L2 socket and sleep to avoid real network ops
     with (
-        patch("netarmageddon.core.arp_keepalive.sendp"),
+        patch("netarmageddon.core.l2_sender.conf.L2socket"),
         patch("netarmageddon.core.arp_keepalive.time.sleep", lambda x: None),
     ):
         ka = ARPKeepAlive(interface="lo", base_ip="10.0.0.", num_devices=1, cycles=1)
@@ -124,7 +124,7 @@ def test_user_abort(mock_interface):
 
 def test_context_manager(mock_interface):
     with (
-        patch("netarmageddon.core.arp_keepalive.sendp"),
+        patch("netarmageddon.core.l2_sender.conf.L2socket"),
         patch("netarmageddon.core.arp_keepalive.time.sleep", lambda x: None),
     ):
         with ARPKeepAlive(interface="lo", base_ip="172.16.0.", num_devices=1, cycles=1) as ka:
@@ -184,17 +184,18 @@ def test_target_macs_empty_list_raises(mock_interface):
         ARPKeepAlive(interface="lo", base_ip="10.0.0.", target_macs=[])
 
 
-@patch("netarmageddon.core.arp_keepalive.sendp")
+@patch("netarmageddon.core.l2_sender.conf.L2socket")
 @patch("netarmageddon.core.arp_keepalive.time.sleep", lambda x: None)
-def test_target_macs_sends_correct_packets(mock_send, mock_interface):
-    """With target_macs, sendp must be called with the explicit MACs."""
+def test_target_macs_sends_correct_packets(mock_socket, mock_interface):
+    """With target_macs, the frames sent must carry the explicit MACs."""
     macs = ["11:22:33:44:55:01", "11:22:33:44:55:02"]
     ka = ARPKeepAlive(interface="lo", base_ip="10.1.2.", target_macs=macs, cycles=1, interval=0)
     ka.running = True
     ka._send_arp_announcements()
 
-    assert mock_send.call_count == len(macs)
-    sent_macs = [call.args[0].getlayer(Ether).src for call in mock_send.call_args_list]
+    send = mock_socket.return_value.send
+    assert send.call_count == len(macs)
+    sent_macs = [call.args[0].getlayer(Ether).src for call in send.call_args_list]
     assert sent_macs == macs
 
 
@@ -203,3 +204,34 @@ def test_target_macs_normalises_case(mock_interface):
     macs = ["AA:BB:CC:DD:EE:FF"]
     ka = ARPKeepAlive(interface="lo", base_ip="10.0.0.", target_macs=macs)
     assert ka.target_macs == ["aa:bb:cc:dd:ee:ff"]
+
+
+@patch("netarmageddon.core.arp_keepalive.getmacbyip", return_value="02:00:00:00:00:01")
+@patch("netarmageddon.core.arp_keepalive.ARPRetentionProbe.start")
+@patch("netarmageddon.core.l2_sender.conf.L2socket")
+def test_measure_announces_once_then_probes(mock_socket, mock_start, mock_arp, mock_interface):
+    """Measurement mode sends one announcement and one echo probe per device."""
+    ka = ARPKeepAlive(
+        interface="lo",
+        base_ip="10.0.0.",
+        num_devices=3,
+        measure=True,
+        probe_rate=100,
+        gateway="10.0.0.1",
+    )
+    ka.PROBE_SETTLE = 0
+    ka.running = True
+    ka._measure_retention()
+
+    sent = [call.args[0] for call in mock_socket.return_value.send.call_args_list]
+    assert [pkt.haslayer(ARP) for pkt in sent] == [True] * 3 + [False] * 3
+    assert [pkt[Ether].dst for pkt in sent[3:]] == ["02:00:00:00:00:01"] * 3
+    retention = ka.get_retention()
+    assert retention is not None
+    assert retention["probed"] == 3
+    assert not ka.running
+
+    with pytest.raises(ValueError):
+        ARPKeepAlive("lo", "10.0.0.", measure=True, probe_rate=0, gateway="10.0.0.1")
+    with pytest.raises(ValueError):
+        ARPKeepAlive("lo", "10.0.0.", measure=True, gateway="10.0.0")
@@ -0,0 +1,86 @@
+import time
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+import pytest
+from scapy.layers.inet import ICMP, IP
+from scapy.layers.l2 import ARP, Ether
+
+from netarmageddon.core.arp_retention import ARPRetentionProbe
+
+GATEWAY = "10.0.0.1"
+GATEWAY_MAC = "02:00:00:00:00:01"
+
+
+def mac(slot):
+    return f"de:ad:00:00:00:{slot:02x}"
+
+
+def who_has(slot, dst="ff:ff:ff:ff:ff:ff"):
+    return bytes(
+        Ether(src=GATEWAY_MAC, dst=dst)
+        / ARP(op=1, hwsrc=GATEWAY_MAC, psrc=GATEWAY, pdst=f"10.0.0.{slot}")
+    )
+
+
+def echo_reply(slot, dst=None):
+    return bytes(
+        Ether(src=GATEWAY_MAC, dst=dst or mac(slot))
+        / IP(src=GATEWAY, dst=f"10.0.0.{slot}")
+        / ICMP(type="echo-reply", id=slot)
+    )
+
+
+def probe(num_devices=10):
+    retention = ARPRetentionProbe("lo", "10.0.0.", num_devices, GATEWAY, GATEWAY_MAC, bins=2)
+    for slot in range(1, num_devices + 1):
+        retention.announced(slot, mac(slot), 1000.0)
+        retention.probed(slot, 1000.0 + slot * 10)
+    return retention
+
+
+def test_probe_packet():
+    pkt = probe().probe_packet(3, mac(3))
+    assert (pkt[Ether].src, pkt[Ether].dst) == (mac(3), GATEWAY_MAC)
+    assert (pkt[IP].src, pkt[IP].dst) == ("10.0.0.3", GATEWAY)
+    assert pkt[ICMP].type == 8 and pkt[ICMP].id == 3
+
+
+def test_classification_and_curve():
+    retention = probe()
+    # Young entries are answered straight to the device, old ones are resolved again
+    for slot in range(1, 5):
+        retention.handle_frame(echo_reply(slot), 1000.0 + slot * 10 + 0.01)
+    retention.handle_frame(who_has(5, dst=mac(5)), 1050.01)  # unicast re-check: still held
+    for slot in range(6, 10):
+        retention.handle_frame(who_has(slot), 1000.0 + slot * 10 + 0.01)
+    retention.handle_frame(echo_reply(6), 1060.02)  # answered after resolving: still evicted
+    retention.handle_frame(echo_reply(2, dst=mac(3)), 1020.0)  # not to the device's MAC
+    retention.handle_frame(who_has(42), 1000.0)  # not one of ours
+    retention.handle_frame(bytes(Ether() / IP() / ICMP()), 1000.0)
+
+    stats = retention.get_stats()
+    assert (stats["probed"], stats["retained"], stats["evicted"]) == (10, 5, 4)
+    assert stats["no_response"] == 1  # slot 10 got no answer
+    assert stats["first_eviction_age"] == pytest.approx(60.0)
+    assert stats["last_retained_age"] == pytest.approx(50.0)
+    assert [point["retained_share"] for point in stats["curve"]] == [1.0, 0.0]
+    assert [point["probed"] for point in stats["curve"]] == [5, 5]
+    assert retention.last_seen[3] == pytest.approx(1030.01) and np.isnan(retention.evicted_at[2])
+
+
+def test_receive_thread():
+    sock = MagicMock()
+    frames = [(Ether, who_has(1), 1010.5), (None, None, None)]
+    sock.select.side_effect = lambda socks, timeout: [sock] if frames else []
+    sock.recv_raw.side_effect = lambda: frames.pop(0)
+    with patch("netarmageddon.core.arp_retention.conf.L2socket", return_value=sock) as opener:
+        retention = probe(1)
+        retention.start()
+        deadline = time.time() + 2
+        while frames and time.time() < deadline:
+            time.sleep(0.01)
+        retention.stop()
+    assert opener.call_args.kwargs["filter"] == f"arp or (icmp and src host {GATEWAY})"
+    sock.close.assert_called_once()
+    assert retention.get_stats()["evicted"] == 1
@@ -0,0 +1,163 @@
+import json
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+from scapy.layers.dhcp import BOOTP, DHCP
+from scapy.layers.inet import IP, TCP, UDP
+from scapy.layers.l2 import ARP, Dot1Q, Ether
+from scapy.utils import wrpcap
+
+from netarmageddon.core.capture_analyzer import CaptureAnalyzer
+from netarmageddon.core.traffic import TrafficLogger
+
+START = 1700000000
+
+
+def dhcp(message_type):
+    return (
+        Ether()
+        / IP(src="0.0.0.0", dst="255.255.255.255")
+        / UDP(sport=68, dport=67)
+        / BOOTP(chaddr=b"\xde\xad\x00\x00\x00\x01")
+        / DHCP(options=[("message-type", message_type), "end"])
+    )
+
+
+@pytest.fixture
+def mixed_pcap(tmp_path):
+    """2 s of traffic: 10 UDP + 5 TCP in the first second, then ARP and DHCP in the second."""
+    packets = []
+    for i in range(10):
+        packets.append(Ether() / IP(dst="10.0.0.2") / UDP(sport=5000, dport=53) / (b"x" * 58))
+    for i in range(5):
+        packets.append(Ether() / IP(dst="10.0.0.2") / TCP(sport=40000, dport=443))
+    for i in range(15):
+        packets[i].time = START + i * 0.05
+    second = [
+        Ether() / ARP(op=1, pdst="10.0.0.9"),
+        Ether() / ARP(op=1, pdst="10.0.0.9"),
+        Ether() / ARP(op=2, psrc="10.0.0.9"),
+        dhcp("discover"),
+        dhcp("discover"),
+        dhcp("offer"),
+        Ether() / Dot1Q(vlan=7) / IP(dst="10.0.0.2") / UDP(sport=68, dport=67) / BOOTP(),
+    ]
+    for i, pkt in enumerate(second):
+        pkt.time = START + 1 + i * 0.1
+    path = str(tmp_path / "mixed.pcap")
+    wrpcap(path, packets + second)
+    return path
+
+
+def test_records_and_rates(mixed_pcap):
+    analyzer = CaptureAnalyzer(mixed_pcap)
+    assert analyzer.packets == 22
+    assert not analyzer.pcapng and not analyzer.nanosecond
+    assert analyzer.linktype == 1
+    assert analyzer.timestamps[0] == pytest.approx(START)
+    assert int(analyzer.records["length"][0]) == 100
+
+    start, pps, bps = analyzer.rate_series(1.0)
+    assert start.tolist() == [START, START + 1]
+    assert pps.tolist() == [15, 7]
+    assert bps[0] == 8 * int(analyzer.records["length"][:15].sum())
+
+    start, pps, _ = analyzer.rate_series(0.5)
+    assert pps.tolist() == [20, 10, 10, 4]
+
+    gaps = analyzer.inter_arrival()
+    assert gaps["p50"] == pytest.approx(0.05)
+    assert gaps["max"] == pytest.approx(0.3)
+    assert gaps["min"] == pytest.approx(0.05)
+
+
+def test_protocol_counts(mixed_pcap):
+    counts = CaptureAnalyzer(mixed_pcap).protocol_counts()
+    assert counts["ethertype"] == {"ipv4": 19, "ipv6": 0, "arp": 3, "other": 0}
+    assert counts["ip_proto"] == {"tcp": 5, "udp": 14}
+    assert counts["arp"] == {"request": 2, "reply": 1, "other": 0}
+    assert counts["dhcp"]["discover"] == 2
+    assert counts["dhcp"]["offer"] == 1
+    assert counts["dhcp"]["ack"] == 0
+    assert counts["dhcp"]["other"] == 1  # the VLAN-tagged BOOTP packet without options
+
+
+def test_truncated_last_record_is_ignored(mixed_pcap):
+    with open(mixed_pcap, "r+b") as capture:
+        capture.truncate(os.path.getsize(mixed_pcap) - 10)
+    analyzer = CaptureAnalyzer(mixed_pcap)
+    assert analyzer.packets == 21
+    assert analyzer.summary()["protocols"]["ethertype"]["ipv4"] == 18
+
+
+@pytest.mark.parametrize(
+    "output,nanosecond", [("out.pcap", True), ("out.pcapng", False), ("out.pcapng", True)]
+)
+def test_reads_traffic_logger_output(tmp_path, mixed_pcap, output, nanosecond):
+    path = str(tmp_path / output)
+    logger = TrafficLogger(
+        '', '', path, 0, 0, 65535, False, input_file=mixed_pcap, nanosecond=nanosecond
+    )
+    logger.start()
+    logger.capture_thread.join(timeout=10)
+
+    analyzer = CaptureAnalyzer(path)
+    reference = CaptureAnalyzer(mixed_pcap)
+    assert analyzer.pcapng == output.endswith(".pcapng")
+    assert analyzer.nanosecond == nanosecond
+    assert analyzer.packets == 22
+    assert np.array_equal(analyzer.records["timestamp_ns"], reference.records["timestamp_ns"])
+    assert analyzer.protocol_counts() == reference.protocol_counts()
+
+
+def test_empty_and_invalid_files(tmp_path):
+    empty = str(tmp_path / "empty.pcap")
+    wrpcap(empty, [])
+    summary = CaptureAnalyzer(empty).summary()
+    assert summary["packets"] == 0
+    assert summary["peak_pps"] == 0.0
+    assert summary["inter_arrival"]["max"] == 0.0
+
+    junk = tmp_path / "junk.pcap"
+    junk.write_bytes(b"not a capture")
+    with pytest.raises(ValueError):
+        CaptureAnalyzer(str(junk))
+    with pytest.raises(ValueError):
+        CaptureAnalyzer(str(tmp_path / "out.pcap.gz"))
+
+
+def test_analyze_command(tmp_path, mixed_pcap):
+    series = str(tmp_path / "series.csv")
+    cmd = [sys.executable, "-m", "netarmageddon", "analyze", mixed_pcap, "--json", "-s", series]
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    assert result.returncode == 0, result.stderr
+    summary = json.loads(result.stdout)
+    assert summary["packets"] == 22
+    assert summary["protocols"]["dhcp"]["discover"] == 2
+    with open(series) as csv_file:
+        assert csv_file.read().splitlines()[0] == "start,pps,bps"
+
+
+@pytest.mark.parametrize("sampling,rate,scale", [("count", 5, 5.0), ("budget", 5, None)])
+def test_sampled_capture(tmp_path, mixed_pcap, sampling, rate, scale):
+    path = str(tmp_path / "sampled.pcapng")
+    logger = TrafficLogger(
+        '', '', path, 0, 0, 65535, False, input_file=mixed_pcap, sampling=sampling, sample_rate=rate
+    )
+    logger.start()
+    logger.capture_thread.join(timeout=10)
+
+    analyzer = CaptureAnalyzer(path)
+    assert (analyzer.sampling, analyzer.sample_rate, analyzer.scale) == (sampling, rate, scale)
+    summary = analyzer.summary()
+    if scale is None:
+        assert analyzer.packets == 10  # 5 of the 15 packets in the first second, 5 of 7
+        assert summary["estimated_packets"] is None
+    else:
+        assert analyzer.packets == 5  # packets 0, 5, 10, 15 and 20 of 22
+        assert summary["estimated_packets"] == 25
+    assert summary["sampling"]["mode"] == sampling
+    assert CaptureAnalyzer(mixed_pcap).scale == 1.0
@@ -0,0 +1,103 @@
+import copy
+import json
+import subprocess
+import sys
+from typing import Any, Dict
+
+import pytest
+from scapy.layers.inet import IP, UDP
+from scapy.utils import rdpcap
+
+from netarmageddon.core.capture_bench import compare_results, run_benchmarks, write_bench_pcap
+
+
+def test_bench_pcap_frames(tmp_path):
+    path = str(tmp_path / "bench.pcap")
+    write_bench_pcap(path, 50, frame_len=100)
+    packets = rdpcap(path)
+    assert len(packets) == 50
+    assert {len(pkt) for pkt in packets} == {100}
+    assert len({pkt[UDP].sport for pkt in packets}) == 50
+    assert all(pkt[UDP].dport == 9 for pkt in packets)
+    # Scapy recomputes the checksum when the header is rebuilt from its fields.
+    rebuilt = IP(bytes(packets[0][IP]))
+    del rebuilt.chksum
+    assert IP(bytes(rebuilt)).chksum == packets[0][IP].chksum
+
+
+def test_offline_results(tmp_path):
+    output = str(tmp_path / "bench.json")
+    results = run_benchmarks(
+        output, packets=2000, rounds=1, live=False, modes=["pcap", "gzip", "sampled"]
+    )
+    with open(output) as results_file:
+        assert json.load(results_file) == results
+    assert results["version"] == 1
+    assert results["settings"]["packets"] == 2000
+    assert results["live"] == {"skipped": "disabled"}
+
+    offline = {result["mode"]: result for result in results["offline"]}
+    assert list(offline) == ["pcap", "gzip", "sampled"]
+    for result in offline.values():
+        assert result["packets"] == 2000
+        assert result["pps"] > 0 and result["cpu_ns_per_packet"] > 0
+        assert result["drop_rate"] == 0.0
+    assert offline["pcap"]["packets_written"] == 2000
+    assert offline["sampled"]["packets_written"] == 200
+    assert offline["gzip"]["disk_bytes_per_second"] > 0
+
+
+def test_invalid_settings(tmp_path):
+    output = str(tmp_path / "bench.json")
+    with pytest.raises(ValueError, match="unknown modes"):
+        run_benchmarks(output, live=False, modes=["pcap", "bogus"])
+    with pytest.raises(ValueError, match="must be positive"):
+        run_benchmarks(output, packets=0, live=False)
+
+
+def test_compare_results():
+    baseline: Dict[str, Any] = {
+        "offline": [
+            {"mode": "pcap", "pps": 1e6, "cpu_ns_per_packet": 500.0, "drop_rate": 0.0},
+            {"mode": "gzip", "pps": 2e5, "cpu_ns_per_packet": 4000.0, "drop_rate": 0.0},
+        ],
+        "live": {"modes": [{"mode": "pcap", "max_sustainable_pps": 300000.0}]},
+    }
+    current = copy.deepcopy(baseline)
+    current["offline"][0]["pps"] = 0.95e6  # within the tolerance
+    assert compare_results(baseline, current) == []
+
+    current["offline"][0]["pps"] = 0.8e6
+    current["offline"][1]["cpu_ns_per_packet"] = 5000.0
+    current["offline"][1]["drop_rate"] = 0.01
+    current["live"]["modes"][0]["max_sustainable_pps"] = 100000.0
+    current["offline"].append({"mode": "zstd", "error": "no zstd"})
+    regressions = compare_results(baseline, current)
+    assert len(regressions) == 4
+    assert regressions[0].startswith("offline pcap") and "-20.0%" in regressions[0]
+    assert "ns CPU per packet" in regressions[1]
+    assert "drop rate" in regressions[2]
+    assert regressions[3].startswith("live pcap")
+    assert compare_results(baseline, current, tolerance=0.5) == [regressions[2], regressions[3]]
+
+
+def test_bench_command(tmp_path):
+    output = str(tmp_path / "bench.json")
+    cmd = [sys.executable, "-m", "netarmageddon", "bench", "-o", output, "-n", "1000"]
+    cmd += ["--rounds", "1", "--live", "false", "--modes", "pcap"]
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    assert result.returncode == 0, result.stderr
+    assert "pcap" in result.stdout
+
+    with open(output) as results_file:
+        baseline = json.load(results_file)
+    baseline["offline"][0]["pps"] *= 100  # a baseline no machine keeps up with
+    regressed = str(tmp_path / "baseline.json")
+    with open(regressed, "w") as baseline_file:
+        json.dump(baseline, baseline_file)
+    cmd[cmd.index(output)] = str(tmp_path / "again.json")
+    result = subprocess.run(
+        cmd + ["--baseline", regressed], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
+    )
+    assert result.returncode == 1
+    assert "Regression" in result.stdout
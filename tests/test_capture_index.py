@@ -0,0 +1,85 @@
+import pytest
+from scapy.layers.inet import IP, TCP, UDP
+from scapy.layers.l2 import Ether
+from scapy.utils import wrpcap
+
+from netarmageddon.core.capture_index import CaptureIndex, flow_hash
+from netarmageddon.core.mapper import _lib
+from netarmageddon.core.traffic import TrafficLogger
+
+START = 1700000000
+
+
+@pytest.fixture
+def indexed_capture(tmp_path):
+    """Replay 60 packets over 6 s (two UDP flows and one TCP flow) into an indexed pcap."""
+    packets = []
+    for i in range(60):
+        if i % 3 == 0:
+            pkt = Ether() / IP(src="10.0.0.1", dst="10.0.0.2") / UDP(sport=5000, dport=53)
+        elif i % 3 == 1:
+            pkt = Ether() / IP(src="10.0.0.2", dst="10.0.0.1") / UDP(sport=53, dport=5000)
+        else:
+            pkt = Ether() / IP(src="10.0.0.3", dst="10.0.0.4") / TCP(sport=40000, dport=443)
+        pkt.time = START + i * 0.1
+        packets.append(pkt)
+    source = tmp_path / "in.pcap"
+    wrpcap(str(source), packets)
+
+    def replay(output, **kwargs):
+        path = str(tmp_path / output)
+        logger = TrafficLogger(
+            '', '', path, 0, 0, 65535, False, input_file=str(source), index_bucket=1, **kwargs
+        )
+        logger.start()
+        logger.capture_thread.join(timeout=10)
+        return path
+
+    return replay
+
+
+def test_flow_hash_is_direction_independent():
+    forward = flow_hash(17, "10.0.0.1", 5000, "10.0.0.2", 53)
+    assert forward == flow_hash(17, "10.0.0.2", 53, "10.0.0.1", 5000)
+    assert forward != flow_hash(6, "10.0.0.1", 5000, "10.0.0.2", 53)
+    pkt = bytes(Ether() / IP(src="10.0.0.2", dst="10.0.0.1") / UDP(sport=53, dport=5000))
+    assert _lib.traffic_flow_hash(1, pkt, len(pkt)) == forward
+    tcp = bytes(Ether() / IP(src="10.0.0.2", dst="10.0.0.1") / TCP(sport=1, dport=2))
+    assert _lib.traffic_flow_hash(1, tcp, len(tcp)) == flow_hash(6, "10.0.0.1", 2, "10.0.0.2", 1)
+    assert _lib.traffic_flow_hash(1, b"\x00" * 14, 14) == 0
+
+
+@pytest.mark.parametrize("output", ["out.pcap", "out.pcapng", "out.pcap.gz"])
+def test_index_seeks_time_range_and_flow(indexed_capture, output):
+    index = CaptureIndex(indexed_capture(output))
+    assert index.complete
+    assert index.packets == 60
+    assert len(index.time_buckets) == 6
+    assert len(index.flows) == 2
+
+    window = list(index.iter_time_range(START + 2, START + 3))
+    assert len(window) == 10
+    assert window[0][0] == pytest.approx(START + 2)
+
+    dns = list(index.iter_flow(17, "10.0.0.2", 53, "10.0.0.1", 5000))
+    assert len(dns) == 40
+    assert index.flows[flow_hash(17, "10.0.0.1", 5000, "10.0.0.2", 53)].packets == 40
+    assert len(list(index.iter_flow(6, "10.0.0.4", 443, "10.0.0.3", 40000))) == 20
+    assert list(index.iter_flow(6, "10.9.9.9", 1, "10.9.9.8", 2)) == []
+
+
+def test_truncated_index_falls_back_to_scan(indexed_capture):
+    path = indexed_capture("cut.pcap")
+    with open(path + ".idx", "r+b") as sidecar:
+        sidecar.truncate(20 + 3 * 40 + 7)  # header, three TIME entries, part of a fourth
+    index = CaptureIndex(path)
+    assert not index.complete
+    assert len(index.time_buckets) == 3
+    assert len(list(index.iter_flow(6, "10.0.0.3", 40000, "10.0.0.4", 443))) == 20
+
+
+def test_rejects_foreign_file(tmp_path):
+    capture = tmp_path / "x.pcap"
+    (tmp_path / "x.pcap.idx").write_bytes(b"\x00" * 64)
+    with pytest.raises(ValueError, match="not a version 1 capture index"):
+        CaptureIndex(str(capture))
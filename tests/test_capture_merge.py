@@ -0,0 +1,117 @@
+import subprocess
+import sys
+from decimal import Decimal
+
+import pytest
+from scapy.layers.inet import IP, UDP
+from scapy.layers.l2 import Ether
+from scapy.layers.dot11 import RadioTap
+from scapy.utils import PcapWriter, rdpcap, wrpcap, wrpcapng
+
+from netarmageddon.core.capture_analyzer import CaptureAnalyzer
+from netarmageddon.core.capture_merge import CaptureReader, merge_captures
+
+START = 1700000000
+
+
+def frames(times, port=5000):
+    packets = []
+    for i, offset in enumerate(times):
+        pkt = Ether() / IP(dst="10.0.0.2") / UDP(sport=port, dport=53) / bytes([i])
+        pkt.time = START + offset
+        packets.append(pkt)
+    return packets
+
+
+@pytest.fixture
+def shards(tmp_path):
+    """Three captures interleaved in time: a pcap, a gzip pcap and a big-endian pcap."""
+    paths = [str(tmp_path / name) for name in ("a.pcap", "b.pcap.gz", "c.pcap")]
+    wrpcap(paths[0], frames([0.0, 0.3, 0.6], port=1))
+    wrpcap(paths[1], frames([0.1, 0.4, 0.7], port=2), gz=True)
+    with PcapWriter(paths[2], endianness=">", sync=True) as writer:
+        writer.write(frames([0.2, 0.5, 0.8], port=3))
+    return paths
+
+
+def test_merge_orders_by_timestamp(tmp_path, shards):
+    output = str(tmp_path / "merged.pcap")
+    result = merge_captures(shards, output)
+    assert (result.files, result.packets_read, result.packets_written) == (3, 9, 9)
+    assert (result.duplicates, result.out_of_order) == (0, 0)
+
+    merged = rdpcap(output)
+    assert [pkt[UDP].sport for pkt in merged] == [1, 2, 3] * 3
+    assert [float(pkt.time) for pkt in merged] == pytest.approx([START + i / 10 for i in range(9)])
+
+
+def test_merge_to_pcapng_keeps_nanoseconds(tmp_path):
+    nano = str(tmp_path / "nano.pcap")
+    micro = str(tmp_path / "micro.pcapng")
+    fine = frames([0, 0])
+    for pkt, ns in zip(fine, (1, 1001)):
+        pkt.time = Decimal(START) + Decimal(ns) / 10**9  # beyond float precision
+    with PcapWriter(nano, nano=True, sync=True) as writer:
+        writer.write(fine)
+    wrpcapng(micro, frames([0.000001]))
+    output = str(tmp_path / "merged.pcapng")
+
+    assert CaptureReader(nano).nanosecond and not CaptureReader(micro).nanosecond
+    result = merge_captures([micro, nano], output)
+    assert result.packets_written == 3
+    analyzer = CaptureAnalyzer(output)
+    assert analyzer.pcapng and analyzer.nanosecond
+    first = START * 1_000_000_000
+    assert analyzer.records["timestamp_ns"].tolist() == [first + 1, first + 1000, first + 1001]
+
+    merge_captures([micro, nano], str(tmp_path / "truncated.pcap"), nanosecond=False)
+    assert not CaptureAnalyzer(str(tmp_path / "truncated.pcap")).nanosecond
+
+
+def test_dedup_drops_identical_consecutive_frames(tmp_path):
+    # The same two packets seen by two captures, plus a retransmission 10 ms later.
+    first, second = str(tmp_path / "eth0.pcap"), str(tmp_path / "eth1.pcap")
+    packets = frames([0.0, 0.5])
+    wrpcap(first, packets)
+    copies = frames([0.0002, 0.5002, 0.5102])
+    copies[2] = copies[1].copy()
+    copies[2].time = START + 0.5102
+    wrpcap(second, copies)
+
+    output = str(tmp_path / "merged.pcap")
+    assert merge_captures([first, second], output).packets_written == 5
+    result = merge_captures([first, second], output, dedup=True)
+    assert (result.packets_written, result.duplicates) == (3, 2)
+    result = merge_captures([first, second], output, dedup=True, dedup_window=0.1)
+    assert (result.packets_written, result.duplicates) == (2, 3)
+
+
+def test_out_of_order_input_is_counted(tmp_path):
+    path = str(tmp_path / "unsorted.pcap")
+    wrpcap(path, frames([0.2, 0.1, 0.3]))
+    result = merge_captures([path], str(tmp_path / "merged.pcap"))
+    assert (result.packets_written, result.out_of_order) == (3, 1)
+
+
+def test_invalid_inputs(tmp_path, shards):
+    wifi = str(tmp_path / "wifi.pcap")
+    wrpcap(wifi, [RadioTap()])
+    with pytest.raises(ValueError, match="different link types"):
+        merge_captures([shards[0], wifi], str(tmp_path / "merged.pcap"))
+    with pytest.raises(ValueError, match="also an input"):
+        merge_captures(shards, shards[0])
+    with pytest.raises(ValueError, match="cannot write zstd"):
+        merge_captures(shards, str(tmp_path / "merged.pcap.zst"))
+    junk = tmp_path / "junk.pcap"
+    junk.write_bytes(b"not a capture")
+    with pytest.raises(ValueError, match="not a pcap or pcapng file"):
+        merge_captures([str(junk)], str(tmp_path / "merged.pcap"))
+
+
+def test_merge_command(tmp_path, shards):
+    output = str(tmp_path / "merged.pcapng.gz")
+    cmd = [sys.executable, "-m", "netarmageddon", "merge", *shards, "-o", output]
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    assert result.returncode == 0, result.stderr
+    assert "9" in result.stdout
+    assert len(rdpcap(output)) == 9
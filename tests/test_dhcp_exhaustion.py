@@ -2,7 +2,7 @@ import subprocess
 import sys
 from netarmageddon.cli import parse_option_range
 import pytest
-from unittest.mock import patch
+from unittest.mock import MagicMock, patch
 import threading
 from netarmageddon.core.dhcp_exhaustion import DHCPExhaustion
 from scapy.layers.dhcp import BOOTP, DHCP
@@ -96,18 +96,30 @@ def test_mac_generation_random(mock_interface):
     assert len(random_macs) == 5
 
 
-@patch('netarmageddon.core.dhcp_exhaustion.sendp')
+@patch('netarmageddon.core.l2_sender.conf.L2socket')
 @patch('netarmageddon.core.dhcp_exhaustion.time.sleep', lambda x: None)
-def test_send_loop(mock_sendp, dhcp_instance):
+def test_send_loop(mock_socket, dhcp_instance):
     dhcp_instance.num_devices = 3
     dhcp_instance.running = True
     dhcp_instance._send_loop()
-    assert mock_sendp.call_count == 3
-
-
-@patch('netarmageddon.core.dhcp_exhaustion.sendp')
+    # One socket for the whole run, closed when the run ends
+    assert mock_socket.call_count == 1
+    assert mock_socket.return_value.send.call_count == 3
+    mock_socket.return_value.close.assert_called_once()
+    assert dhcp_instance.sender.sent == 3
+    frame = mock_socket.return_value.send.call_args[0][0]
+    pkt = Ether(frame)
+    assert pkt[UDP].dport == 67
+    assert pkt[DHCP].options[0] == ('message-type', 1)
+    # The patched UDP checksum is the one scapy computes for the same bytes
+    checksum = pkt[UDP].chksum
+    del pkt[UDP].chksum
+    assert Ether(bytes(pkt))[UDP].chksum == checksum
+
+
+@patch('netarmageddon.core.l2_sender.conf.L2socket')
 @patch('netarmageddon.core.dhcp_exhaustion.time.sleep', lambda x: None)
-def test_create_dhcp_packet(mock_sendp, dhcp_instance):
+def test_create_dhcp_packet(mock_socket, dhcp_instance):
     pkt = dhcp_instance._create_dhcp_packet()
     for layer in (Ether, IP, UDP, BOOTP, DHCP):
         assert pkt.haslayer(layer)
@@ -123,6 +135,42 @@ def test_create_dhcp_packet(mock_sendp, dhcp_instance):
     assert opts['client_id'] == '00:11:22:33:44:55'
 
 
+def test_dhcp_frame_matches_scapy(dhcp_instance, mock_interface):
+    full = DHCPExhaustion(interface='lo', num_devices=1)  # all 81 request options
+    macs = ['00:11:22:33:44:55', '66:77:88:99:aa:bb', 'de:ad:00:00:00:00', 'ff:ff:ff:ff:ff:ff']
+    for ex in (dhcp_instance, full):
+        for mac in macs:
+            for xid in (0, 1, 0x1234ABCD, 0xFFFFFFFF):
+                expected = bytes(ex._create_dhcp_packet(mac, xid))
+                assert ex.template.render(mac, xid) == expected
+    frame = dhcp_instance.template.render(dhcp_instance._generate_mac(), 7)
+    assert Ether(frame)[BOOTP].chaddr.startswith(b'00:11:22:33:44:5')
+    with pytest.raises(ValueError):
+        dhcp_instance.template.render('0:1:2:3:4:5', 0)
+
+
+@patch('netarmageddon.core.l2_sender.conf.L2socket')
+@patch('netarmageddon.core.dhcp_exhaustion.time.sleep', lambda x: None)
+def test_send_loop_tracks_replies(mock_socket, mock_interface):
+    ex = DHCPExhaustion(interface='lo', num_devices=3, track_responses=True, response_timeout=0.01)
+    with (
+        patch.object(ex.tracker, 'start') as start,
+        patch.object(ex.tracker, 'expect') as expect,
+        patch.object(ex.tracker, 'report') as report,
+    ):
+        ex.running = True
+        ex._send_loop()
+    start.assert_called_once()
+    report.assert_called_once()
+    # Every DISCOVER sent is announced with its xid and client MAC
+    sent = [Ether(call.args[0]) for call in mock_socket.return_value.send.call_args_list]
+    announced = [(call.args[0], call.args[1]) for call in expect.call_args_list]
+    assert announced == [(pkt[BOOTP].xid, pkt[Ether].src) for pkt in sent]
+    stats = ex.get_response_stats()
+    assert stats is not None
+    assert stats['discovers'] == 0  # expect() was mocked
+
+
 def test_rate_limit_below_max(dhcp_instance):
     """If pps ≤ MAX_PPS, _rate_limit should return pps and not log a warning."""
     before = dhcp_instance.MAX_PPS - 10
@@ -133,7 +181,7 @@ def test_rate_limit_below_max(dhcp_instance):
 def test_thread_lifecycle(mock_interface):
     # Verify thread creation and eventual stop without asserting mid-run state
     with (
-        patch('netarmageddon.core.dhcp_exhaustion.sendp'),
+        patch('netarmageddon.core.l2_sender.conf.L2socket'),
         patch('netarmageddon.core.dhcp_exhaustion.time.sleep', lambda x: None),
     ):
         ex = DHCPExhaustion(interface='lo', num_devices=1)
@@ -146,7 +194,7 @@ def test_thread_lifecycle(mock_interface):
 
 def test_context_manager(mock_interface):
     with (
-        patch('netarmageddon.core.dhcp_exhaustion.sendp'),
+        patch('netarmageddon.core.l2_sender.conf.L2socket'),
         patch('netarmageddon.core.dhcp_exhaustion.time.sleep', lambda x: None),
     ):
         with DHCPExhaustion(interface='lo', num_devices=2) as instance:
@@ -155,11 +203,10 @@ def test_context_manager(mock_interface):
 
 
 def test_exception_handling(dhcp_instance, monkeypatch):
-    # Arrange: make sendp always raise
-    monkeypatch.setattr(
-        'netarmageddon.core.dhcp_exhaustion.sendp',
-        lambda *args, **kwargs: (_ for _ in ()).throw(Exception("send failed")),
-    )
+    # Arrange: make every send raise something other than a refused frame
+    sock = MagicMock()
+    sock.send.side_effect = Exception("send failed")
+    monkeypatch.setattr('netarmageddon.core.l2_sender.conf.L2socket', lambda **kwargs: sock)
 
     # We’ll run _send_loop directly in the main thread to simplify synchronization
     dhcp = dhcp_instance
@@ -171,6 +218,7 @@ def test_exception_handling(dhcp_instance, monkeypatch):
     # Assert that on exception, stop() was called and _stopped is True
     assert not dhcp.running, "Expected running to be False after exception"
     assert getattr(dhcp, "_stopped", False) is True, "Expected _stopped to be True after exception"
+    sock.close.assert_called_once()
 
 
 def test_user_abort(dhcp_instance):
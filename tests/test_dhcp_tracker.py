@@ -0,0 +1,105 @@
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+from scapy.layers.dhcp import BOOTP, DHCP
+from scapy.layers.inet import IP, UDP
+from scapy.layers.l2 import Ether
+
+from netarmageddon.core.dhcp_tracker import DHCPOFFER, DHCPResponseTracker, parse_reply
+
+MAC = "de:ad:00:11:22:33"
+
+
+def reply(xid, message_type="offer", mac=MAC, yiaddr="10.0.0.10"):
+    # Our DISCOVERs carry the MAC text in chaddr; servers echo it back
+    return bytes(
+        Ether(dst="ff:ff:ff:ff:ff:ff", src="02:00:00:00:00:01")
+        / IP(src="10.0.0.1", dst="255.255.255.255")
+        / UDP(sport=67, dport=68)
+        / BOOTP(op=2, xid=xid, chaddr=mac, yiaddr=yiaddr)
+        / DHCP(options=[("server_id", "10.0.0.1"), ("message-type", message_type), "end"])
+    )
+
+
+def test_parse_reply():
+    message_type, xid, chaddr, yiaddr = parse_reply(reply(0xCAFE))
+    assert (message_type, xid) == (DHCPOFFER, 0xCAFE)
+    assert chaddr.startswith(MAC.encode()[:16])
+    assert yiaddr == bytes([10, 0, 0, 10])
+
+    request = Ether() / IP() / UDP(sport=68, dport=67) / BOOTP(op=1) / DHCP(options=["end"])
+    assert parse_reply(bytes(request)) is None  # not a reply
+    assert parse_reply(bytes(Ether() / IP() / UDP(sport=67, dport=68) / (b"x" * 10))) is None
+    assert parse_reply(b"\x00" * 20) is None
+
+
+def test_matching_and_latency():
+    tracker = DHCPResponseTracker("lo", timeout=1.0)
+    start = 1000.0
+    for n in range(10):
+        tracker.expect(n, MAC, start + n * 0.1)
+    for n in range(6):
+        tracker.handle_frame(
+            reply(n, yiaddr=f"10.0.0.{n + 10}"), start + n * 0.1 + 0.004 + n * 0.001
+        )
+    tracker.handle_frame(reply(6, "nak"), start + 0.62)
+    tracker.handle_frame(reply(0), start + 0.5)  # the server repeats an OFFER
+    tracker.handle_frame(reply(7, mac="00:00:00:00:00:01"), start + 0.71)  # another client
+    tracker.handle_frame(reply(8, mac="de:ad:00:99:99:99"), start + 0.72)  # same prefix
+    tracker.handle_frame(reply(999), start + 0.8)
+
+    stats = tracker.get_stats(now=start + 10)
+    assert (stats["discovers"], stats["offers"], stats["naks"]) == (10, 6, 1)
+    assert (stats["duplicates"], stats["unmatched"]) == (1, 3)
+    assert stats["offered_ips"] == 6
+    assert stats["answered_ratio"] == pytest.approx(0.7)
+    assert stats["latency_ms"]["p50"] == pytest.approx(6.5)
+    assert stats["latency_ms"]["max"] == pytest.approx(9.0)
+    assert stats["offer_rate"] == pytest.approx(6 / 0.509)
+    assert stats["series"][0]["discovers"] == 10 and stats["series"][0]["offers"] == 6
+    # Three unanswered DISCOVERs at the end are below SILENT_RUN: not a silent server
+    assert stats["stopped_answering"] is None
+
+
+def test_stopped_answering():
+    tracker = DHCPResponseTracker("lo", timeout=1.0, bucket=0.5)
+    start = 1000.0
+    for n in range(20):
+        tracker.expect(n, MAC, start + n * 0.1)
+    for n in range(8):
+        tracker.handle_frame(reply(n), start + n * 0.1 + 0.01)
+
+    stats = tracker.get_stats(now=start + 10)
+    assert stats["stopped_answering"] == {"after_discovers": 8, "seconds": pytest.approx(0.8)}
+    assert [point["offers"] for point in stats["series"]] == [5, 3, 0, 0]
+    # DISCOVERs younger than the timeout are not judged yet
+    assert tracker.get_stats(now=start + 2.0)["stopped_answering"] is None
+
+    silent = DHCPResponseTracker("lo")
+    for n in range(5):
+        silent.expect(n, MAC, start)
+    assert silent.get_stats(now=start + 10)["stopped_answering"] == {
+        "after_discovers": 0,
+        "seconds": 0.0,
+    }
+    with pytest.raises(ValueError):
+        DHCPResponseTracker("lo", timeout=0)
+
+
+def test_receive_thread():
+    sock = MagicMock()
+    frames = [(Ether, reply(1), 2000.5), (None, None, None)]
+    sock.select.side_effect = lambda socks, timeout: [sock] if frames else []
+    sock.recv_raw.side_effect = lambda: frames.pop(0)
+    with patch("netarmageddon.core.dhcp_tracker.conf.L2socket", return_value=sock) as opener:
+        tracker = DHCPResponseTracker("lo")
+        tracker.expect(1, MAC, 2000.0)
+        tracker.start()
+        deadline = time.time() + 2
+        while frames and time.time() < deadline:
+            time.sleep(0.01)
+        tracker.stop()
+    assert "src port 67" in opener.call_args.kwargs["filter"]
+    sock.close.assert_called_once()
+    assert tracker.get_stats()["latency_ms"]["p50"] == pytest.approx(500.0)
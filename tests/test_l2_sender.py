@@ -0,0 +1,54 @@
+from unittest.mock import patch
+
+import pytest
+
+from netarmageddon.core.l2_sender import L2Sender
+
+
+@pytest.fixture
+def mock_socket():
+    with patch("netarmageddon.core.l2_sender.conf.L2socket") as mock:
+        yield mock
+
+
+def test_one_socket_per_run(mock_socket):
+    with patch("netarmageddon.core.l2_sender.time.sleep"):
+        with L2Sender("lo") as sender:
+            for _ in range(5):
+                assert sender.send(b"frame")
+    mock_socket.assert_called_once_with(iface="lo", type=0)
+    assert mock_socket.return_value.send.call_count == 5
+    mock_socket.return_value.close.assert_called_once()
+    assert (sender.sent, sender.errors) == (5, 0)
+    sender.close()  # closing twice is a no-op
+    mock_socket.return_value.close.assert_called_once()
+
+
+def test_send_errors_are_counted(mock_socket):
+    mock_socket.return_value.send.side_effect = [OSError(105, "No buffer space"), 60]
+    with patch("netarmageddon.core.l2_sender.time.sleep"):
+        sender = L2Sender("lo")
+        assert not sender.send(b"frame")
+        assert sender.send(b"frame")
+    assert (sender.sent, sender.errors) == (1, 1)
+    assert "No buffer space" in sender.last_error
+
+    mock_socket.return_value.send.side_effect = PermissionError("perm")
+    with pytest.raises(PermissionError):
+        sender.send(b"frame")
+    sender.close()
+    mock_socket.return_value.send.side_effect = None
+    assert sender.send(b"frame")  # the next run opens a new socket
+    assert mock_socket.call_count == 2
+
+
+def test_rate_cap(mock_socket):
+    assert L2Sender.rate_limit(L2Sender.MAX_PPS + 50) == L2Sender.MAX_PPS
+    assert L2Sender.rate_limit(10) == 10
+    with patch("netarmageddon.core.l2_sender.time.sleep") as sleep:
+        sender = L2Sender("lo")
+        sender.send(b"frame")
+        sender.send(b"frame")
+    # The second frame waits for the rest of the 1 / MAX_PPS gap
+    assert sleep.call_count == 1
+    assert 0 < sleep.call_args[0][0] <= 1.0 / L2Sender.MAX_PPS
@@ -0,0 +1,115 @@
+import threading
+from unittest.mock import patch
+
+import pytest
+
+from netarmageddon.core.l2_sender import L2Sender
+from netarmageddon.core.pacer import Pacer
+
+
+class FakeClock:
+    """Monotonic clock whose sleep() advances time exactly, plus an optional overshoot."""
+
+    def __init__(self, overshoot=0.0):
+        self.now = 100.0
+        self.overshoot = overshoot
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds + self.overshoot
+
+
+@pytest.fixture
+def clock():
+    clock = FakeClock()
+    with (
+        patch("netarmageddon.core.pacer.time.monotonic", clock.monotonic),
+        patch("netarmageddon.core.pacer.time.sleep", clock.sleep),
+    ):
+        yield clock
+
+
+def test_deadlines_absorb_work(clock):
+    pacer = Pacer(10)
+    for _ in range(11):
+        pacer.wait()
+        clock.now += 0.03  # building, sending and printing take 30% of the slot
+    # Packet n goes out at start + n / pps: no drift from the work between packets
+    assert clock.now - 0.03 == pytest.approx(100.0 + 1.0)
+    stats = pacer.get_stats()
+    assert stats["achieved_pps"] == pytest.approx(10.0)
+    assert stats["jitter_max_ms"] == pytest.approx(0.0, abs=1e-6)
+    assert stats["sent"] == 11 and stats["slipped"] == 0
+
+
+def test_jitter_percentiles():
+    clock = FakeClock(overshoot=0.002)
+    with (
+        patch("netarmageddon.core.pacer.time.monotonic", clock.monotonic),
+        patch("netarmageddon.core.pacer.time.sleep", clock.sleep),
+    ):
+        pacer = Pacer(100)
+        for _ in range(101):
+            pacer.wait()
+    stats = pacer.get_stats()
+    # Every sleep oversleeps by 2 ms, the next one is shortened: no drift, 2 ms late
+    assert stats["achieved_pps"] == pytest.approx(100.0, rel=0.01)
+    assert stats["jitter_p50_ms"] == pytest.approx(0.0, abs=1e-6)
+    assert stats["jitter_max_ms"] == pytest.approx(2.0)
+
+
+def test_cap_and_slips(clock):
+    pacer = Pacer(L2Sender.MAX_PPS * 10)
+    assert pacer.pps == L2Sender.MAX_PPS
+    pacer.wait()
+    clock.now += 1.0  # a stall of 100 slots
+    pacer.wait()
+    pacer.wait()
+    # The stall is not made up for in a burst: the next packet keeps the full interval
+    assert pacer.slipped == 1
+    assert clock.sleeps[-1] == pytest.approx(1.0 / L2Sender.MAX_PPS)
+
+    pacer.start_burst()
+    clock.now += 5.0  # e.g. the pause between ARP cycles
+    pacer.wait()
+    assert pacer.slipped == 1
+    assert pacer.get_stats()["jitter_max_ms"] == pytest.approx(990.0)
+
+    with pytest.raises(ValueError):
+        Pacer(0)
+
+
+def test_fractional_rate_stops_early(clock):
+    pacer = Pacer(0.5)  # one probe every two seconds
+    assert pacer.interval == pytest.approx(2.0)
+    stop = threading.Event()
+    assert pacer.wait(stop)
+    stop.set()
+    # A set event ends the wait at once, without counting the packet
+    assert not pacer.wait(stop)
+    assert pacer.sent == 1 and not clock.sleeps
+
+
+def test_streaming_jitter_is_bounded():
+    clock = FakeClock()
+    with (
+        patch("netarmageddon.core.pacer.time.monotonic", clock.monotonic),
+        patch("netarmageddon.core.pacer.time.sleep", clock.sleep),
+    ):
+        pacer = Pacer(L2Sender.MAX_PPS)
+        for n in range(Pacer.RESERVOIR_SIZE * 4 + 1):
+            pacer.wait()
+            if n % 4 == 0:
+                clock.now += 0.015  # one late send in four, caught up by the next gap
+    # Gaps of 15, 5, 10, 10 ms: jitter 5, 5, 0, 0 ms
+    stats = pacer.get_stats()
+    # Memory stays at the reservoir size; mean and max still cover every gap
+    assert len(pacer._reservoir) == Pacer.RESERVOIR_SIZE
+    assert stats["jitter_max_ms"] == pytest.approx(5.0)
+    assert stats["jitter_mean_ms"] == pytest.approx(2.5)
+    assert stats["jitter_std_ms"] == pytest.approx(2.5)
+    assert stats["jitter_p99_ms"] == pytest.approx(5.0)
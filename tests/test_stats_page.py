@@ -0,0 +1,124 @@
+import ctypes
+import subprocess
+import sys
+
+import pytest
+from scapy.layers.inet import IP, UDP
+from scapy.layers.l2 import Ether
+from scapy.utils import wrpcap
+
+from netarmageddon.core.mapper import STATSPAGE_VERSION, StatsPageBody, StatsPageHeader
+from netarmageddon.core.stats_page import StatsPageReader
+from netarmageddon.core.traffic import TrafficLogger
+
+START = 1700000000
+
+
+@pytest.fixture
+def replay_input(tmp_path):
+    packets = [Ether() / IP(dst="10.0.0.2") / UDP(sport=5000, dport=53) for _ in range(50)]
+    for i, pkt in enumerate(packets):
+        pkt.time = START + i * 0.01
+    path = str(tmp_path / "in.pcap")
+    wrpcap(path, packets)
+    return path
+
+
+def write_page(path, seq=2, size=None, **stats):
+    header = StatsPageHeader(
+        magic=b"NAST",
+        version=STATSPAGE_VERSION,
+        header_len=ctypes.sizeof(StatsPageHeader),
+        size=size or ctypes.sizeof(StatsPageHeader) + ctypes.sizeof(StatsPageBody),
+        seq=seq,
+        pid=1,
+    )
+    body = StatsPageBody(state=1, current_file=b"out.pcap")
+    for name, value in stats.items():
+        setattr(body.stats, name, value)
+    with open(path, "wb") as page:
+        page.write(bytes(header) + bytes(body)[: header.size - header.header_len])
+
+
+def test_capture_publishes_page(tmp_path, replay_input):
+    page = str(tmp_path / "capture.stats")
+    logger = TrafficLogger(
+        '',
+        '',
+        str(tmp_path / "out.pcap"),
+        0,
+        0,
+        65535,
+        False,
+        input_file=replay_input,
+        stats_file=page,
+    )
+    logger.start()
+    logger.capture_thread.join(timeout=10)
+
+    with StatsPageReader(page) as reader:
+        snapshot = reader.read()
+    stats = logger.get_stats()
+    assert snapshot["state"] == "finished"
+    assert snapshot["current_file"] == str(tmp_path / "out.pcap")
+    assert snapshot["updates"] >= 2
+    assert snapshot["updated_ns"] >= snapshot["started_ns"]
+    assert snapshot["packets_written"] == stats["packets_written"] == 50
+    assert {name: snapshot[name] for name in stats} == stats
+
+
+def test_reader_versions_and_torn_pages(tmp_path):
+    path = str(tmp_path / "page.stats")
+    write_page(path, ps_recv=10, packets_written=9)
+    with StatsPageReader(path) as reader:
+        snapshot = reader.read()
+    assert snapshot["state"] == "running"
+    assert (snapshot["ps_recv"], snapshot["packets_written"]) == (10, 9)
+
+    # An older writer's body is a prefix of ours: the counters it lacks read as 0.
+    short = ctypes.sizeof(StatsPageHeader) + StatsPageBody.stats.offset + 8
+    write_page(path, size=short, ps_recv=10, packets_written=9)
+    with StatsPageReader(path) as reader:
+        snapshot = reader.read()
+    assert (snapshot["ps_recv"], snapshot["packets_written"]) == (10, 0)
+
+    write_page(path, seq=3)  # a writer that died inside an update
+    with StatsPageReader(path) as reader, pytest.raises(RuntimeError, match="consistent"):
+        reader.read()
+
+    junk = tmp_path / "junk.stats"
+    junk.write_bytes(b"not a stats page at all, just some bytes")
+    with pytest.raises(ValueError, match="not a stats page"):
+        StatsPageReader(str(junk))
+    junk.write_bytes(b"")
+    with pytest.raises(ValueError, match="not a stats page"):
+        StatsPageReader(str(junk))
+
+
+def test_traffic_stats_watcher(tmp_path, replay_input):
+    page = str(tmp_path / "capture.stats")
+    logger = TrafficLogger(
+        '',
+        '',
+        str(tmp_path / "out.pcap"),
+        0,
+        0,
+        65535,
+        False,
+        input_file=replay_input,
+        stats_file=page,
+    )
+    logger.start()
+    logger.capture_thread.join(timeout=10)
+
+    cmd = [sys.executable, "-m", "netarmageddon", "traffic", "--stats", page]
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    assert result.returncode == 0, result.stderr
+    assert "Capture finished" in result.stdout
+    assert "50" in result.stdout
+
+    # The --stats=FILE spelling is a watcher too (no root needed)
+    cmd = [sys.executable, "-m", "netarmageddon", "traffic", f"--stats={page}"]
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    assert result.returncode == 0, result.stderr
+    assert "Capture finished" in result.stdout
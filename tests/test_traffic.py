@@ -1,9 +1,14 @@
+import csv
 import subprocess
 import sys
 import pytest
 import threading
 import time
 from unittest.mock import patch
+from scapy.layers.inet import IP, TCP, UDP
+from scapy.layers.l2 import Ether
+from scapy.utils import rdpcap, wrpcap
+from netarmageddon.core.mapper import STREAM_RECORD, _lib as _traffic_lib
 from netarmageddon.core.traffic import TrafficLogger
 
 
@@ -68,28 +73,42 @@ def test_start_and_stop(mock_stop, mock_start, logger_instance):
     logger.stop()
 
 
-# Test duration timer
+def test_stop_before_backend_start(mock_interface, tmp_path):
+    # The capture thread reaches the backend only after stop(): the stop must not be lost.
+    real_start = _traffic_lib.traffic_capture_start
+
+    def late_start(handle, cfg):
+        time.sleep(0.2)
+        return real_start(handle, cfg)
+
+    logger = TrafficLogger('lo', '', str(tmp_path / 'early.pcap'), 0, 0, 128, False)
+    with patch('netarmageddon.core.traffic._traffic_lib.traffic_capture_start', late_start):
+        started = time.monotonic()
+        logger.start()
+        logger.stop()
+        logger.capture_thread.join(timeout=2)
+        assert not logger.capture_thread.is_alive()
+    assert time.monotonic() - started < 2
+    assert logger.get_stats()['stop_latency_ns'] > 0
+
+
+# The backend enforces the duration; no Python timer thread is involved
 @patch('netarmageddon.core.traffic._traffic_lib.traffic_capture_start', return_value=0)
-@pytest.mark.filterwarnings("ignore::pytest.PytestUnhandledThreadExceptionWarning")
 @patch('netarmageddon.core.traffic._traffic_lib.traffic_capture_stop')
-def test_timer_thread(mock_stop, mock_start, mock_interface):
+def test_duration_left_to_backend(mock_stop, mock_start, mock_interface):
     logger = TrafficLogger(
         interface='lo',
         bpf_filter='',
         output_file='',
-        duration=0.01,
+        duration=2,
         count=1,
         snaplen=128,
         promisc=False,
     )
     logger.start()
-    # Timer thread should have been spawned
-    assert isinstance(logger.timer_thread, threading.Thread)
-    # Wait longer than duration and for capture thread
-    time.sleep(0.02)
-    # Capture thread should have stopped after duration
-    assert not logger.capture_thread.is_alive()
-    # We expect that running may still be True due to exception in timer stop join()
+    logger.capture_thread.join(timeout=1)
+    assert mock_start.call_args.args[1]._obj.duration == 2
+    assert not any(thread.name == "TrafficTimerThread" for thread in threading.enumerate())
 
 
 # Context manager
@@ -115,3 +134,469 @@ def test_help_without_root_privileges(capsys):
     cmd = [sys.executable, "-m", "netarmageddon", "traffic", "-i", "dummy_intf"]
     result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
     assert "This script requires root privileges" in result.stdout
+
+
+def test_rotation_defaults_off(logger_instance):
+    assert logger_instance.rotate_size == 0
+    assert logger_instance.rotate_seconds == 0
+    assert logger_instance.rotate_files == 0
+    assert not logger_instance.rotating
+    assert logger_instance.output_label == "out.pcap"
+
+
+@patch('netarmageddon.core.traffic._traffic_lib.traffic_capture_start', return_value=0)
+@patch('netarmageddon.core.traffic._traffic_lib.traffic_capture_stop')
+def test_rotation_passed_to_backend(mock_stop, mock_start, mock_interface):
+    logger = TrafficLogger(
+        interface='lo',
+        bpf_filter='',
+        output_file='ring.pcap',
+        duration=0,
+        count=1,
+        snaplen=128,
+        promisc=False,
+        rotate_size=10,
+        rotate_seconds=30,
+        rotate_files=4,
+    )
+    assert logger.output_label == "ring_NNNNN.pcap"
+    logger.start()
+    logger.capture_thread.join(timeout=1)
+    cfg = mock_start.call_args.args[1]._obj
+    assert cfg.rotate_bytes == 10_000_000
+    assert cfg.rotate_seconds == 30
+    assert cfg.rotate_max_files == 4
+
+
+def test_rotation_validation(mock_interface):
+    with pytest.raises(ValueError, match="rotate_size must be >= 0"):
+        TrafficLogger('lo', '', 'out.pcap', 0, 1, 128, False, rotate_size=-1)
+    with pytest.raises(ValueError, match="rotate_files requires"):
+        TrafficLogger('lo', '', 'out.pcap', 0, 1, 128, False, rotate_files=3)
+
+
+@patch('netarmageddon.core.traffic._traffic_lib.traffic_capture_start', return_value=0)
+@patch('netarmageddon.core.traffic._traffic_lib.traffic_capture_stop')
+def test_pcap_tuning_passed_to_backend(mock_stop, mock_start, mock_interface):
+    logger = TrafficLogger(
+        interface='lo',
+        bpf_filter='',
+        output_file='out.pcap',
+        duration=0,
+        count=1,
+        snaplen=128,
+        promisc=False,
+        buffer_size=8192,
+        immediate_mode=True,
+        timeout_ms=50,
+    )
+    logger.start()
+    logger.capture_thread.join(timeout=1)
+    cfg = mock_start.call_args.args[1]._obj
+    assert cfg.buffer_size == 8192 * 1024
+    assert cfg.immediate_mode is True
+    assert cfg.timeout_ms == 50
+
+
+def test_pcap_tuning_validation(mock_interface):
+    with pytest.raises(ValueError, match="buffer_size must be >= 0"):
+        TrafficLogger('lo', '', 'out.pcap', 0, 1, 128, False, buffer_size=-1)
+
+
+def _fake_stats(values):
+    def fill(handle, ptr):
+        for name, value in values.items():
+            setattr(ptr._obj, name, value)
+        return 0
+
+    return fill
+
+
+def test_get_stats_reads_backend(logger_instance):
+    values = {
+        "ps_recv": 120,
+        "ps_drop": 3,
+        "ps_ifdrop": 1,
+        "packets_written": 117,
+        "bytes_written": 9000,
+        "stream_drops": 2,
+        "writer_queued_bytes": 0,
+        "writer_peak_bytes": 0,
+        "writer_overflows": 0,
+        "writer_drops": 0,
+        "flows_active": 7,
+        "flows_evicted": 4,
+        "flow_overflows": 0,
+        "filter_swaps": 2,
+        "filter_compiles": 3,
+        "sampled_out": 0,
+        "stop_latency_ns": 0,
+        "files_rotated": 1,
+        "writer_buffer_size": 8388608,
+    }
+    with patch(
+        'netarmageddon.core.traffic._traffic_lib.traffic_get_stats', side_effect=_fake_stats(values)
+    ):
+        assert logger_instance.get_stats() == values
+
+
+@patch('netarmageddon.core.traffic._traffic_lib.traffic_capture_start', return_value=0)
+@patch('netarmageddon.core.traffic._traffic_lib.traffic_capture_stop')
+def test_stop_reports_drops(mock_stop, mock_start, logger_instance):
+    values = {
+        "ps_recv": 10,
+        "ps_drop": 5,
+        "ps_ifdrop": 0,
+        "packets_written": 10,
+        "bytes_written": 1,
+        "stream_drops": 0,
+        "writer_queued_bytes": 0,
+        "writer_peak_bytes": 0,
+        "writer_overflows": 0,
+        "writer_drops": 0,
+    }
+    with (
+        patch(
+            'netarmageddon.core.traffic._traffic_lib.traffic_get_stats',
+            side_effect=_fake_stats(values),
+        ),
+        patch('netarmageddon.core.traffic.WARNING') as mock_warning,
+    ):
+        logger_instance.start()
+        logger_instance.capture_thread.join(timeout=1)
+    assert isinstance(logger_instance.stats_thread, threading.Thread)
+    assert any("Dropped 5 packets" in c.args[0] for c in mock_warning.call_args_list)
+
+
+@patch('netarmageddon.core.traffic._traffic_lib.traffic_capture_start', return_value=0)
+@patch('netarmageddon.core.traffic._traffic_lib.traffic_capture_stop')
+def test_each_logger_owns_a_handle(mock_stop, mock_start, mock_interface):
+    first = TrafficLogger('lo', '', 'a.pcap', 0, 1, 128, False)
+    second = TrafficLogger('eth0', '', 'b.pcap', 0, 1, 128, False)
+    assert first._handle and second._handle
+    assert first._handle != second._handle
+
+    first.start()
+    first.capture_thread.join(timeout=1)
+    assert mock_start.call_args.args[0] == first._handle
+    assert [c.args[0] for c in mock_stop.call_args_list] == [first._handle]
+
+
+def test_stream_validation(mock_interface):
+    with pytest.raises(ValueError, match="stream_buffer must be >= 0"):
+        TrafficLogger('lo', '', 'out.pcap', 0, 1, 128, False, stream_buffer=-1)
+    with pytest.raises(ValueError, match="rotation requires output_file"):
+        TrafficLogger('lo', '', '', 0, 1, 128, False, rotate_size=1, stream_buffer=64)
+    assert TrafficLogger('lo', '', '', 0, 1, 128, False, stream_buffer=64).output_label == (
+        "(stream only)"
+    )
+
+
+def test_iter_batches_views_stream_ring(mock_interface):
+    logger = TrafficLogger('lo', '', '', 0, 1, 128, False, stream_buffer=1)
+    with pytest.raises(RuntimeError):
+        next(logger.iter_batches())
+    logger._open_stream()
+
+    # Two records as the backend lays them out: header followed by caplen bytes.
+    ring = logger._stream
+    assert ring is not None
+    ring[0:16] = STREAM_RECORD.pack(1, 2, 3, 60)
+    ring[16:19] = b"abc"
+    ring[19:35] = STREAM_RECORD.pack(4, 5, 2, 2)
+    ring[35:37] = b"de"
+
+    calls = []
+
+    def acquire(handle, offset, length, timeout_ms):
+        if calls:
+            return -1
+        calls.append(handle)
+        offset._obj.value, length._obj.value = 0, 37
+        return 1
+
+    with (
+        patch(
+            'netarmageddon.core.traffic._traffic_lib.traffic_stream_acquire', side_effect=acquire
+        ),
+        patch('netarmageddon.core.traffic._traffic_lib.traffic_stream_release') as mock_release,
+    ):
+        batches = list(logger.iter_batches())
+
+    assert len(batches) == 1
+    (hdr1, data1), (hdr2, data2) = batches[0]
+    assert STREAM_RECORD.unpack(hdr1) == (1, 2, 3, 60)
+    assert bytes(data1) == b"abc"
+    assert STREAM_RECORD.unpack(hdr2) == (4, 5, 2, 2)
+    assert bytes(data2) == b"de"
+    assert isinstance(data2, memoryview) and data2.obj is ring.obj
+    mock_release.assert_called_once_with(logger._handle, 37)
+
+
+@patch('netarmageddon.core.traffic._traffic_lib.traffic_capture_start', return_value=0)
+@patch('netarmageddon.core.traffic._traffic_lib.traffic_capture_stop')
+def test_writer_options_passed_to_backend(mock_stop, mock_start, mock_interface):
+    logger = TrafficLogger(
+        'lo', '', 'out.pcap', 0, 1, 128, False, writer_buffer=2048, writer_block=True
+    )
+    logger.start()
+    logger.capture_thread.join(timeout=1)
+    cfg = mock_start.call_args.args[1]._obj
+    assert cfg.writer_buffer_size == 2048 * 1024
+    assert cfg.writer_block is True
+    with pytest.raises(ValueError, match="writer_buffer must be >= 0"):
+        TrafficLogger('lo', '', 'out.pcap', 0, 1, 128, False, writer_buffer=-1)
+
+
+@patch('netarmageddon.core.traffic._traffic_lib.traffic_capture_start', return_value=0)
+@patch('netarmageddon.core.traffic._traffic_lib.traffic_capture_stop')
+def test_compression_passed_to_backend(mock_stop, mock_start, mock_interface):
+    logger = TrafficLogger(
+        'lo', '', 'out.pcap', 0, 1, 128, False, compression="zstd", compression_level=19
+    )
+    logger.start()
+    logger.capture_thread.join(timeout=1)
+    cfg = mock_start.call_args.args[1]._obj
+    assert cfg.compression == 3
+    assert cfg.compression_level == 19
+    with pytest.raises(ValueError, match="compression must be one of"):
+        TrafficLogger('lo', '', 'out.pcap', 0, 1, 128, False, compression="bz2")
+
+
+def test_compressed_output_label(mock_interface):
+    gz = TrafficLogger('lo', '', 'ring.pcap.gz', 0, 1, 128, False, rotate_size=10)
+    assert gz.output_label == "ring_NNNNN.pcap.gz"
+    assert gz.resolved_compression == "gzip"
+    plain = TrafficLogger('lo', '', 'ring.pcap', 0, 1, 128, False, compression="gzip")
+    assert plain.resolved_compression == "gzip"
+    assert plain.output_label == "ring.pcap"
+
+
+@patch('netarmageddon.core.traffic._traffic_lib.traffic_capture_start', return_value=0)
+@patch('netarmageddon.core.traffic._traffic_lib.traffic_capture_stop')
+def test_timestamp_options_passed_to_backend(mock_stop, mock_start, mock_interface):
+    logger = TrafficLogger(
+        'lo', '', 'out.pcapng.gz', 0, 1, 128, False, nanosecond=True, tstamp_type="adapter"
+    )
+    assert logger.resolved_format == "pcapng"
+    logger.start()
+    logger.capture_thread.join(timeout=1)
+    cfg = mock_start.call_args.args[1]._obj
+    assert cfg.format == 0
+    assert cfg.nanosecond is True
+    assert cfg.tstamp_type == b"adapter"
+    assert TrafficLogger(
+        'lo', '', 'x.pcapng', 0, 1, 128, False, file_format="pcap"
+    ).resolved_format == ("pcap")
+    with pytest.raises(ValueError, match="file_format must be one of"):
+        TrafficLogger('lo', '', 'out.pcap', 0, 1, 128, False, file_format="erf")
+
+
+@patch('netarmageddon.core.traffic._traffic_lib.traffic_capture_start', return_value=0)
+@patch('netarmageddon.core.traffic._traffic_lib.traffic_capture_stop')
+def test_replay_passed_to_backend(mock_stop, mock_start, tmp_path):
+    source = tmp_path / "in.pcap"
+    source.write_bytes(b"")
+    # No interface needed (mock_interface is not used): the file replaces it.
+    logger = TrafficLogger(
+        '', 'udp', 'out.pcap', 5, 0, 128, False, input_file=str(source), replay_speed=2.0
+    )
+    logger.start()
+    logger.capture_thread.join(timeout=1)
+    cfg = mock_start.call_args.args[1]._obj
+    assert cfg.input_file == str(source).encode()
+    assert cfg.replay_speed == 2.0
+    assert cfg.duration == 5
+
+
+def test_replay_validation(tmp_path):
+    with pytest.raises(ValueError, match="not found"):
+        TrafficLogger('', '', 'out.pcap', 0, 0, 128, False, input_file=str(tmp_path / "x"))
+    source = tmp_path / "in.pcap"
+    source.write_bytes(b"")
+    with pytest.raises(ValueError, match="replay_speed must be >= 0"):
+        TrafficLogger('', '', 'out.pcap', 0, 0, 128, False, input_file=str(source), replay_speed=-1)
+
+
+@patch('netarmageddon.core.traffic._traffic_lib.traffic_capture_start', return_value=0)
+@patch('netarmageddon.core.traffic._traffic_lib.traffic_capture_stop')
+def test_index_passed_to_backend(mock_stop, mock_start, mock_interface):
+    logger = TrafficLogger('lo', '', 'out.pcap', 0, 1, 128, False, index_bucket=10)
+    logger.start()
+    logger.capture_thread.join(timeout=1)
+    assert mock_start.call_args.args[1]._obj.index_bucket_seconds == 10
+    with pytest.raises(ValueError, match="index_bucket must be >= 0"):
+        TrafficLogger('lo', '', 'out.pcap', 0, 1, 128, False, index_bucket=-1)
+    with pytest.raises(ValueError, match="index_bucket requires output_file"):
+        TrafficLogger('lo', '', '', 0, 1, 128, False, stream_buffer=64, index_bucket=10)
+
+
+@patch('netarmageddon.core.traffic._traffic_lib.traffic_capture_start', return_value=0)
+@patch('netarmageddon.core.traffic._traffic_lib.traffic_capture_stop')
+def test_flow_table_passed_to_backend(mock_stop, mock_start, mock_interface):
+    logger = TrafficLogger(
+        'lo', '', '', 0, 1, 128, False, flow_file='flows.csv', flow_max=1000, flow_idle=30
+    )
+    assert logger.output_label == 'flows.csv'
+    logger.start()
+    logger.capture_thread.join(timeout=1)
+    cfg = mock_start.call_args.args[1]._obj
+    assert cfg.output_file == b''
+    assert cfg.flow_file == b'flows.csv'
+    assert (cfg.flow_max, cfg.flow_idle_seconds, cfg.flow_export_seconds) == (1000, 30, 0)
+    with pytest.raises(ValueError, match="flow_idle must be >= 0"):
+        TrafficLogger('lo', '', '', 0, 1, 128, False, flow_file='flows.csv', flow_idle=-1)
+
+
+def test_flow_table_replay(tmp_path):
+    source = tmp_path / "in.pcap"
+    packets = [
+        Ether() / IP(src="10.0.0.1", dst="10.0.0.2") / UDP(sport=5000, dport=53),
+        Ether() / IP(src="10.0.0.2", dst="10.0.0.1") / UDP(sport=53, dport=5000),
+        Ether() / IP(src="10.0.0.3", dst="10.0.0.4") / TCP(sport=40000, dport=443),
+    ]
+    wrpcap(str(source), packets * 10)
+    flows = tmp_path / "flows.csv"
+    logger = TrafficLogger(
+        '', '', '', 0, 0, 65535, False, input_file=str(source), flow_file=str(flows)
+    )
+    logger.start()
+    logger.capture_thread.join(timeout=10)
+    assert logger.get_stats()["flows_active"] == 2
+    with open(flows, newline="") as f:
+        rows = {(row["proto"], row["addr_a"], row["addr_b"]): row for row in csv.DictReader(f)}
+    dns = rows[("17", "10.0.0.1", "10.0.0.2")]
+    assert (dns["port_a"], dns["port_b"], dns["packets"]) == ("5000", "53", "20")
+    assert dns["state"] == "end"
+    assert rows[("6", "10.0.0.3", "10.0.0.4")]["packets"] == "10"
+
+
+def test_set_filter_during_replay(tmp_path):
+    # 100 packets, alternately UDP and TCP, 100 ms apart, replayed at 10x (about 1 s).
+    source = tmp_path / "in.pcap"
+    packets = []
+    for i in range(100):
+        l4 = UDP(sport=5000, dport=53) if i % 2 == 0 else TCP(sport=40000, dport=443)
+        pkt = Ether() / IP(src="10.0.0.1", dst="10.0.0.2") / l4
+        pkt.time = 1700000000 + i * 0.1
+        packets.append(pkt)
+    wrpcap(str(source), packets)
+    output = tmp_path / "out.pcap"
+    logger = TrafficLogger(
+        '', 'udp', str(output), 0, 0, 65535, False, input_file=str(source), replay_speed=10
+    )
+
+    with pytest.raises(RuntimeError, match="no capture is running"):
+        logger.set_filter('tcp')
+    logger.start()
+    time.sleep(0.3)
+    assert logger.set_filter('tcp') is True
+    assert logger.bpf_filter == 'tcp'
+    with pytest.raises(ValueError, match="BPF filter error"):
+        logger.set_filter('tcp port')
+    time.sleep(0.3)
+    assert logger.set_filter('udp') is True
+    logger.capture_thread.join(timeout=10)
+
+    stats = logger.get_stats()
+    assert stats['filter_swaps'] == 2
+    assert stats['filter_compiles'] == 3  # udp, tcp and the rejected expression
+    written = rdpcap(str(output))
+    assert 0 < len(written) < 100
+    assert any(TCP in pkt for pkt in written)
+    assert sum(UDP in pkt for pkt in written) > sum(TCP in pkt for pkt in written)
+
+
+@patch('netarmageddon.core.traffic._traffic_lib.traffic_capture_start', return_value=0)
+@patch('netarmageddon.core.traffic._traffic_lib.traffic_capture_stop')
+def test_sampling_passed_to_backend(mock_stop, mock_start, mock_interface):
+    logger = TrafficLogger(
+        'lo', '', 'out.pcapng', 0, 1, 0, False, sampling='flow', sample_rate=8, headers_only=True
+    )
+    logger.start()
+    logger.capture_thread.join(timeout=1)
+    cfg = mock_start.call_args.args[1]._obj
+    assert (cfg.sampling, cfg.sample_rate, cfg.headers_only) == (3, 8, True)
+    with pytest.raises(ValueError, match="sampling must be one of"):
+        TrafficLogger('lo', '', 'out.pcap', 0, 1, 0, False, sampling='random', sample_rate=8)
+    with pytest.raises(ValueError, match="sample_rate must be >= 1"):
+        TrafficLogger('lo', '', 'out.pcap', 0, 1, 0, False, sampling='count')
+
+
+def test_sampled_headers_only_replay(tmp_path):
+    source = tmp_path / "in.pcap"
+    packets = []
+    for i in range(40):
+        pkt = (
+            Ether() / IP(src="10.0.0.1", dst="10.0.0.2") / UDP(sport=5000, dport=53) / (b"x" * 500)
+        )
+        pkt.time = 1700000000 + i * 0.01
+        packets.append(pkt)
+    wrpcap(str(source), packets)
+    output = tmp_path / "out.pcap"
+    logger = TrafficLogger(
+        '',
+        '',
+        str(output),
+        0,
+        0,
+        65535,
+        False,
+        input_file=str(source),
+        sampling='count',
+        sample_rate=4,
+        headers_only=True,
+    )
+    logger.start()
+    logger.capture_thread.join(timeout=10)
+
+    stats = logger.get_stats()
+    assert (stats['ps_recv'], stats['packets_written'], stats['sampled_out']) == (40, 10, 30)
+    written = rdpcap(str(output))
+    assert len(written) == 10
+    assert all(len(pkt) == 142 and pkt.wirelen == 542 for pkt in written)
+    assert written[0][UDP].dport == 53
+
+
+@patch('netarmageddon.core.traffic._traffic_lib.traffic_capture_start', return_value=0)
+@patch('netarmageddon.core.traffic._traffic_lib.traffic_capture_stop')
+def test_fanout_passed_to_backend(mock_stop, mock_start, mock_interface):
+    logger = TrafficLogger(
+        'lo', '', 'out.pcap.gz', 0, 0, 0, False, fanout=4, fanout_mode='cpu', fanout_pin=True
+    )
+    assert logger.output_label == 'out_wN.pcap.gz'
+    logger.start()
+    logger.capture_thread.join(timeout=1)
+    cfg = mock_start.call_args.args[1]._obj
+    assert (cfg.fanout_workers, cfg.fanout_mode, cfg.fanout_pin) == (4, 1, True)
+    assert logger.get_worker_stats() == []  # the mocked backend never ran the workers
+    with pytest.raises(ValueError, match="fanout cannot be combined with count"):
+        TrafficLogger('lo', '', 'out.pcap', 0, 10, 0, False, fanout=2)
+    with pytest.raises(ValueError, match="fanout_mode must be one of"):
+        TrafficLogger('lo', '', 'out.pcap', 0, 0, 0, False, fanout=2, fanout_mode='rss')
+
+
+def test_stop_interrupts_replay_pacing(tmp_path):
+    # Two packets 60 s apart: the replay sleeps on the second until stop() wakes it.
+    source = tmp_path / "in.pcap"
+    packets = [Ether() / IP(dst="10.0.0.2") / UDP(sport=5000, dport=53) for _ in range(2)]
+    packets[0].time, packets[1].time = 1700000000, 1700000060
+    wrpcap(str(source), packets)
+    logger = TrafficLogger(
+        '',
+        '',
+        str(tmp_path / "out.pcap"),
+        0,
+        0,
+        65535,
+        False,
+        input_file=str(source),
+        replay_speed=1,
+    )
+    logger.start()
+    time.sleep(0.2)
+    began = time.monotonic()
+    logger.stop()
+    assert time.monotonic() - began < 1
+    assert not logger.capture_thread.is_alive()
+    assert 0 < logger.get_stats()['stop_latency_ns'] < 50_000_000